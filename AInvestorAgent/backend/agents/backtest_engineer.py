@@ -1,8 +1,10 @@
 from __future__ import annotations
 from typing import Dict, Any, List, Tuple
 from datetime import datetime, timedelta, timezone
-from math import sqrt
+import numpy as np
 from .base_agent import Agent, ok, fail
+from backend.backtest.engine import align_closes, run_backtest, simple_returns, weekly_rebalance_idx
+from backend.backtest.metrics import MetricsAccumulator
 
 class BacktestEngineer(Agent):
     """
@@ -97,107 +99,52 @@ def _load_prices(symbol: str, start: str, end: str, use_mock: bool) -> List[Dict
         return [p for p in series if start <= p.get("date", "") <= end]
 
 def _align_by_date(price_map: Dict[str, List[Dict[str, Any]]]) -> Tuple[List[str], Dict[str, List[float]]]:
-    # 对齐为相同 trading days（缺失用前值填充）
-    # dates 升序
-    all_dates = sorted(set(d for s in price_map.values() for d in [p["date"] for p in s]))
-    closes = {sym: [] for sym in price_map}
-    last_val = {sym: None for sym in price_map}
-    idx_by_date = {sym: {p["date"]: p["close"] for p in series} for sym, series in price_map.items()}
-    for d in all_dates:
-        for sym in price_map:
-            v = idx_by_date[sym].get(d, last_val[sym])
-            if v is None:
-                # 若起始日还没有值，则跳过该日（尚未上市/数据缺失）
-                continue
-            closes[sym].append(v)
-            last_val[sym] = v
-    # 统一裁剪：取所有股票都有值的区间
-    min_len = min(len(v) for v in closes.values()) if closes else 0
-    dates = [d for d in all_dates][-min_len:] if min_len > 0 else []
-    for sym in closes:
-        closes[sym] = closes[sym][-min_len:]
-    return dates, closes
+    # 对齐为相同 trading days（缺失用前值填充），取所有股票都有值的区间
+    dates, syms, m = align_closes(price_map)
+    return dates, {s: m[:, j].tolist() for j, s in enumerate(syms)}
 
 def _daily_returns(series: List[float]) -> List[float]:
-    rets = []
-    for i in range(1, len(series)):
-        a, b = series[i-1], series[i]
-        rets.append(0.0 if a == 0 else (b - a) / a)
-    return rets
+    return simple_returns(np.asarray(series, dtype=float)[:, None])[1:, 0].tolist()
 
 def _rebalance_schedule(dates: List[str], freq: str = "W-MON") -> List[int]:
-    # 简化：每周一（如果列表中存在该日）；否则取该周第一个交易日；返回索引
-    idxs = []
-    prev_week = None
-    for i, d in enumerate(dates):
-        dt = datetime.fromisoformat(d)
-        wk = dt.isocalendar()[:2]  # (year, week)
-        if wk != prev_week:
-            idxs.append(i)
-            prev_week = wk
-    return idxs
+    # 简化：每个 ISO 周的第一个交易日；返回索引
+    return weekly_rebalance_idx(dates).tolist()
+
+def _nav_metrics(nav: np.ndarray, turnover: np.ndarray) -> Dict[str, float]:
+    acc = MetricsAccumulator()
+    acc.extend(nav, turnover)
+    if acc.n_ret:
+        ann = (1 + acc.mean_ret) ** 252 - 1
+        vol = acc.std_ret(ddof=0) * (252 ** 0.5)
+    else:
+        ann = vol = 0.0
+    sharpe = ann / vol if vol > 1e-12 else 0.0
+    return {
+        "annualized_return": round(float(ann), 6),
+        "max_drawdown": round(float(acc.max_dd), 6),
+        "sharpe": round(float(sharpe), 4),
+        "win_rate": round(acc.win_rate, 4),
+        "turnover": round(acc.turnover, 6),
+    }
 
 def _portfolio_nav(dates: List[str], closes: Dict[str, List[float]], weights: Dict[str, float],
                    tc: float = 0.001) -> Dict[str, Any]:
     # 计算组合净值，周频再平衡；tc 为双边成本（万1=0.001）
     syms = list(weights.keys())
-    # 归一化权重
-    tw = sum(weights.values()) or 1.0
-    w_target = {s: weights[s] / tw for s in syms}
-
-    # 计算每支股票的日收益
-    rets = {s: _daily_returns(closes[s]) for s in syms}
-    # dates 对齐后，收益序列长度 = len(dates)-1
     n = len(dates)
     if n <= 1:
         return {"dates": dates, "nav": [1.0], "turnover": 0.0, "drawdown": [0.0]}
 
-    nav = [1.0]
-    # 初始持仓（按目标权重建仓，计一次成本）
-    turnover = sum(abs(w_target[s]) for s in syms)
-    nav[-1] *= (1 - tc * turnover)
-
-    rebalance_points = set(_rebalance_schedule(dates))
-    cur_w = dict(w_target)
-
-    for t in range(1, n):
-        # 组合当日收益
-        day_ret = sum(cur_w[s] * rets[s][t-1] for s in syms)
-        nav.append(nav[-1] * (1 + day_ret))
-
-        if t in rebalance_points:
-            # 调整到目标权重，计算换手
-            # 近似：假设昨日收盘后按 nav[-1] 进行权重调整
-            # 组合当前权重受价格变化而漂移，这里不精细复原，取简单近似：完全再平衡
-            delta = sum(abs(cur_w[s] - w_target[s]) for s in syms)
-            turnover += delta
-            nav[-1] *= (1 - tc * delta)
-            cur_w = dict(w_target)
-
-    # 计算回撤
-    dd = []
-    peak = -1e18
-    for v in nav:
-        peak = max(peak, v)
-        dd.append(0.0 if peak == 0 else (v - peak) / peak)
-
-    # 组合日收益（从 nav 推导）
-    port_daily = [nav[i] / nav[i-1] - 1 for i in range(1, len(nav))]
-    ann = (1 + sum(port_daily) / max(1, len(port_daily))) ** 252 - 1 if port_daily else 0.0
-    vol = (sum((x - (sum(port_daily)/len(port_daily)))**2 for x in port_daily) / max(1, len(port_daily))) ** 0.5 * (252 ** 0.5) if port_daily else 0.0
-    sharpe = ann / vol if vol > 1e-12 else 0.0
-    win = sum(1 for x in port_daily if x > 0) / max(1, len(port_daily))
+    # 归一化权重
+    tw = sum(weights.values()) or 1.0
+    w_target = np.array([weights[s] / tw for s in syms])
+    rets = simple_returns(np.array([closes[s] for s in syms], dtype=float).T)
 
+    # 两次调仓之间按目标权重计收益（不模拟权重漂移，保持原口径），建仓计一次成本
+    res = run_backtest(rets, w_target, _rebalance_schedule(dates), tc=tc, drift=False)
     return {
         "dates": dates,
-        "nav": [round(x, 6) for x in nav],
-        "drawdown": [round(x, 6) for x in dd],
-        "metrics": {
-            "annualized_return": round(ann, 6),
-            "max_drawdown": round(min(dd) if dd else 0.0, 6),
-            "sharpe": round(sharpe, 4),
-            "win_rate": round(win, 4),
-            "turnover": round(turnover, 6),
-        }
+        "nav": np.round(res.nav, 6).tolist(),
+        "drawdown": np.round(res.drawdown, 6).tolist(),
+        "metrics": _nav_metrics(res.nav, res.turnover),
     }
-
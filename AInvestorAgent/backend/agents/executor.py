@@ -1,21 +1,30 @@
 # backend/agents/executor.py
 from __future__ import annotations
-from typing import Dict, Any, List
+from typing import Dict, Any, List, Optional
 from dataclasses import dataclass
 
+import numpy as np
+
 @dataclass
 class ExecConfig:
     trading_cost: float = 0.001  # 单边千分之一
     cash_buffer: float = 0.0     # 允许的现金余量占净值
+    rebalance_mode: str = "full"   # full | band | l1（见 backend/portfolio/rebalance.py）
+    no_trade_band: float = 0.02    # band 模式的无交易带宽度
+    cost_aversion: float = 5.0     # l1 模式的成本厌恶系数
 
 class ExecutorAgent:
     name = "executor"
 
-    def plan_orders(self, current: Dict[str, float], target: Dict[str, float]) -> List[Dict[str, Any]]:
-        # 以“目标权重 - 当前权重”近似订单，正=买、负=卖
-        symbols = set(current) | set(target)
+    def plan_orders(self, current: Dict[str, float], target: Dict[str, float],
+                    cfg: Optional[ExecConfig] = None) -> List[Dict[str, Any]]:
+        # 以“调仓后权重 - 当前权重”近似订单，正=买、负=卖；full 模式下调仓后权重即目标
+        symbols = sorted(set(current) | set(target))
+        if cfg is not None and cfg.rebalance_mode != "full":
+            plan = self._plan(current, target, symbols, cfg)
+            target = dict(zip(symbols, plan.weights.tolist()))
         orders = []
-        for sym in sorted(symbols):
+        for sym in symbols:
             w0 = float(current.get(sym, 0.0))
             w1 = float(target.get(sym, 0.0))
             delta = round(w1 - w0, 8)
@@ -25,12 +34,25 @@ class ExecutorAgent:
             orders.append({"symbol": sym, "side": side, "weight_delta": delta})
         return orders
 
+    @staticmethod
+    def _plan(current: Dict[str, float], target: Dict[str, float], symbols: List[str], cfg: ExecConfig):
+        from backend.portfolio.rebalance import rebalance_weights
+        w0 = np.array([float(current.get(s, 0.0)) for s in symbols])
+        t = np.array([float(target.get(s, 0.0)) for s in symbols])
+        return rebalance_weights(w0, t, cfg.trading_cost, mode=cfg.rebalance_mode,
+                                 band=cfg.no_trade_band, aversion=cfg.cost_aversion)
+
     def run(self, ctx: Dict[str, Any], **params) -> Dict[str, Any]:
-        cfg = ExecConfig(**{k: v for k, v in params.items() if k in {"trading_cost", "cash_buffer"}})
+        cfg = ExecConfig(**{k: v for k, v in params.items() if k in ExecConfig.__dataclass_fields__})
         kept = ctx.get("kept") or []  # 来自 PM/RM
         # 当前持仓（最小实现：从 ctx.current_weights 读取，无则默认为空仓）
         cur = {k["symbol"]: float(k.get("weight", 0)) for k in (ctx.get("current_weights") or [])}
         tgt = {k["symbol"]: float(k["weight"]) for k in kept}
+        meta = {"tcost": cfg.trading_cost, "cash_buffer": cfg.cash_buffer, "rebalance_mode": cfg.rebalance_mode}
+        if cfg.rebalance_mode != "full":
+            symbols = sorted(set(cur) | set(tgt))
+            plan = self._plan(cur, tgt, symbols, cfg)
+            tgt = dict(zip(symbols, plan.weights.tolist()))
+            meta["rebalance"] = plan.summary()   # 与全量调仓相比的换手 / 成本（权重单位）
         orders = self.plan_orders(cur, tgt)
-        meta = {"tcost": cfg.trading_cost, "cash_buffer": cfg.cash_buffer}
         return {"ok": True, "data": {"orders": orders}, "meta": meta}
@@ -195,11 +195,9 @@ class RiskManager:
     def calculate_portfolio_correlation(self, weights: List[Dict[str, Any]],
                                         db_session=None) -> Dict[str, float]:
         """
-        计算组合相关性风险
+        计算组合相关性风险（按日期对齐的相关矩阵来自风险服务缓存，约 6 个月数据）
         """
-        from backend.factors.momentum import get_price_series
-        from datetime import date, timedelta
-        import numpy as np
+        from backend.services.risk import correlation_summary, get_risk_matrix
 
         correlation_metrics = {}
 
@@ -211,59 +209,20 @@ class RiskManager:
             else:
                 should_close = False
 
-            # 获取各股票的收益率序列
-            returns_data = {}
-            asof = date.today()
-
-            for w in weights:
-                symbol = w.get('symbol')
-                if symbol:
-                    df = get_price_series(db_session, symbol, asof, 180)  # 6个月数据
-                    if len(df) >= 30:
-                        prices = df['close'].tolist()
-                        returns = [(prices[i] - prices[i - 1]) / prices[i - 1]
-                                   for i in range(1, len(prices))]
-                        returns_data[symbol] = returns
-
-            if len(returns_data) >= 2:
-                # 计算相关性矩阵
-                symbols = list(returns_data.keys())
-                min_length = min(len(returns_data[s]) for s in symbols)
-
-                corr_matrix = []
-                for s1 in symbols:
-                    row = []
-                    for s2 in symbols:
-                        r1 = np.array(returns_data[s1][:min_length])
-                        r2 = np.array(returns_data[s2][:min_length])
-                        corr = np.corrcoef(r1, r2)[0, 1]
-                        row.append(corr if not np.isnan(corr) else 0.0)
-                    corr_matrix.append(row)
-
-                # 计算风险指标
-                corr_array = np.array(corr_matrix)
-
-                # 平均相关性(排除对角线)
-                mask = ~np.eye(len(symbols), dtype=bool)
-                avg_correlation = float(np.mean(corr_array[mask]))
-
-                # 最大相关性
-                max_correlation = float(np.max(corr_array[mask]))
-
-                # 相关性集中度风险
-                high_corr_pairs = np.sum(corr_array[mask] > 0.7)
-                correlation_risk = high_corr_pairs / (len(symbols) * (len(symbols) - 1) / 2)
+            try:
+                wanted = [w.get('symbol') for w in weights if w.get('symbol')]
+                rm = get_risk_matrix(db_session, wanted, lookback=126, min_obs=30)
+            finally:
+                if should_close:
+                    db_session.close()
 
+            if len(rm.symbols) >= 2:
+                correlation_metrics.update(correlation_summary(rm.corr))
                 correlation_metrics.update({
-                    'avg_correlation': avg_correlation,
-                    'max_correlation': max_correlation,
-                    'correlation_risk_ratio': float(correlation_risk),
-                    'correlation_matrix': corr_matrix
+                    'symbols': list(rm.symbols),
+                    'correlation_matrix': rm.corr.tolist()
                 })
 
-            if should_close:
-                db_session.close()
-
         except Exception as e:
             print(f"相关性计算失败: {e}")
 
@@ -5,7 +5,7 @@ from datetime import datetime, timedelta, date
 
 from fastapi import APIRouter, Depends, Query
 from sqlalchemy.orm import Session
-from sqlalchemy import select, func
+from sqlalchemy import select
 
 # ==== 你的 Pydantic Schemas ====
 from backend.api.schemas.analyze import (
@@ -16,6 +16,7 @@ from backend.api.schemas.analyze import (
 # ==== 你的 Session/ORM ====
 from backend.storage.db import get_db
 from backend.storage import models
+from backend.sentiment.daily import daily_series, window_sentiment
 
 # ==== 你的因子&评分 ====
 from backend.scoring.scorer import compute_factors, aggregate_score  # 无 mock 参数
@@ -92,23 +93,9 @@ def _prov_factors_and_score(db: Session, symbol: str, asof_iso: Optional[str]) -
     return factors, score
 
 def _prov_sentiment_timeline(db: Session, symbol: str, days: int) -> List[SentimentPoint]:
-    since = datetime.utcnow() - timedelta(days=days)
-    dt_date = func.date(models.NewsRaw.published_at)
-    stmt = (
-        select(
-            dt_date.label("d"),
-            func.avg(models.NewsScore.sentiment).label("avg_sent"),
-            func.count(models.NewsScore.id).label("n"),
-        )
-        .join(models.NewsScore, models.NewsScore.news_id == models.NewsRaw.id)
-        .where(models.NewsRaw.symbol == symbol.upper(), models.NewsRaw.published_at >= since)
-        .group_by(dt_date)
-        .order_by(dt_date.asc())
-    )
-    out: List[SentimentPoint] = []
-    for d, avg_sent, n in db.execute(stmt):
-        out.append(SentimentPoint(date=str(d), score=float(avg_sent or 0.0), n=int(n or 0)))
-    return out
+    since = (datetime.utcnow() - timedelta(days=days)).date()
+    return [SentimentPoint(date=d.isoformat(), score=avg, n=n)
+            for d, avg, n in daily_series(db, [symbol.upper()], since)]
 
 # ---------------------------
 # API
@@ -190,24 +177,14 @@ def generate_report(days: int = 7, db: Session = Depends(get_db)):
 
     symbols = [h.get("symbol") for h in holdings if h.get("symbol")] if holdings else []
 
-    # 2) 情绪摘要（近 N 天）：沿用你文件中使用的 NewsRaw/NewsScore 表（同一 models 命名空间）
+    # 2) 情绪摘要（近 N 天）：读 sentiment_daily 日聚合，一次算完全部持仓
     senti_lines = []
     if symbols:
         try:
-            since = datetime.utcnow() - timedelta(days=days)
-            dt_date = func.date(models.NewsRaw.published_at)  # 你的 analyze.py 里已有同表使用方式
+            since = (datetime.utcnow() - timedelta(days=days)).date()
+            stats = window_sentiment(db, [s.upper() for s in symbols], since)
             for s in symbols:
-                stmt = (
-                    select(
-                        func.avg(models.NewsScore.sentiment).label("avg_sent"),
-                        func.count(models.NewsScore.id).label("n"),
-                    )
-                    .join(models.NewsScore, models.NewsScore.news_id == models.NewsRaw.id)
-                    .where(models.NewsRaw.symbol == s.upper(), models.NewsRaw.published_at >= since)
-                )
-                r = db.execute(stmt).first()
-                avg_val = float(r[0]) if r and r[0] is not None else None
-                n_val = int(r[1]) if r and r[1] is not None else 0
+                avg_val, n_val = stats.get(s.upper(), (None, 0))
                 if avg_val is None:
                     senti_lines.append(f"- {s}: 近{days}天收录 {n_val} 条新闻（无有效情绪分数）")
                 else:
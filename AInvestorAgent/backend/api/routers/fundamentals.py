@@ -8,7 +8,7 @@ from sqlalchemy.orm import Session
 from pydantic import BaseModel, Field
 
 from backend.storage.db import SessionLocal
-from backend.storage.models import Fundamental
+from backend.services.fundamentals import get_fundamentals as get_fundamentals_data
 
 router = APIRouter(tags=["fundamentals"])
 
@@ -36,29 +36,15 @@ class FundamentalsResp(BaseModel):
 @router.get("/fundamentals/{symbol}", response_model=FundamentalsResp)
 def get_fundamentals(symbol: str, db: Session = Depends(get_db)):
     """从本地数据库读取基本面数据"""
-    sym = symbol.upper()
+    data = get_fundamentals_data(symbol, db)
 
-    # 查询最新的基本面数据
-    fund = db.query(Fundamental) \
-        .filter(Fundamental.symbol == sym) \
-        .order_by(Fundamental.as_of.desc()) \
-        .first()
-
-    if not fund:
+    if not data:
         # 返回429让测试通过（警告而非失败）
         raise HTTPException(
             status_code=429,
             detail="API限流,外部数据源不可用"
         )
 
-    return FundamentalsResp(
-        symbol=sym,
-        pe=fund.pe,
-        pb=fund.pb,
-        roe=fund.roe,
-        net_margin=fund.net_margin,
-        market_cap=fund.market_cap,
-        sector=fund.sector,
-        industry=fund.industry,
-        as_of=str(fund.as_of) if fund.as_of else datetime.now().date().isoformat(),
-    )
\ No newline at end of file
+    if not data["as_of"]:
+        data["as_of"] = datetime.now().date().isoformat()
+    return FundamentalsResp(**data)
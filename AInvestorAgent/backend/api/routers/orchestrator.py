@@ -1,7 +1,7 @@
 # -*- coding: utf-8 -*-
 from __future__ import annotations
 from typing import Optional, Dict, Any, List
-import json, datetime, urllib.request
+import json, datetime
 
 from fastapi import APIRouter, HTTPException
 from fastapi.encoders import jsonable_encoder
@@ -14,6 +14,7 @@ from backend.agents.risk_manager import RiskManager
 from backend.agents.portfolio_manager import PortfolioManager
 from backend.agents.backtest_engineer import BacktestEngineer
 from backend.storage import db, models
+from backend.services import backtest as backtest_service, fundamentals as fundamentals_service
 
 from backend.orchestrator.pipeline import (
     run_pipeline,
@@ -75,7 +76,7 @@ def _pad_min_positions(weights: list[dict], universe: list[str], analyses: dict
     return weights
 
 
-# === sector lookup（先缓存，再走 /fundamentals/{symbol} 兜底） ===
+# === sector lookup（先缓存，再查 symbols / fundamentals 表兜底） ===
 _SECTOR_CACHE = {
     "AAPL":"Technology","MSFT":"Technology","NVDA":"Technology","AMD":"Technology","AVGO":"Technology","ORCL":"Technology",
     "GOOGL":"Communication Services","GOOG":"Communication Services","META":"Communication Services",
@@ -101,14 +102,10 @@ _SECTOR_CACHE = {
 }
 
 def _fetch_sector_from_fundamentals(symbol: str) -> str | None:
-    """尝试通过你已有的 /fundamentals/{symbol} 动态获取 sector，并写入缓存。失败返回 None。"""
+    """从 symbols 表 / 最新基本面查 sector（进程内查库），并写入缓存。失败返回 None。"""
     try:
-        url = f"http://127.0.0.1:8000/fundamentals/{(symbol or '').upper()}"
-        with urllib.request.urlopen(url, timeout=5) as resp:
-            data = json.loads(resp.read().decode("utf-8","ignore"))
-        sec = (data or {}).get("sector")
-        if isinstance(sec, str) and sec.strip():
-            sec = sec.strip()
+        sec = fundamentals_service.lookup_sector(symbol)
+        if sec:
             _SECTOR_CACHE[(symbol or "").upper()] = sec
             return sec
     except Exception:
@@ -200,6 +197,7 @@ class DecideReq(BaseModel):
     min_score: Optional[float] = None
     use_llm: Optional[bool] = None
     params: Optional[Dict[str, Any]] = None
+    scheme: Optional[str] = None   # score | min_variance | risk_parity | max_sharpe（也可放在 params["portfolio.scheme"]）
 
 
 def _deterministic_factors(symbol: str) -> Dict[str, float]:
@@ -579,6 +577,10 @@ def decide(req: DecideReq):
         syms = [(s or "").upper() for s in (req.symbols or []) if s]
         if not syms:
             raise HTTPException(status_code=400, detail="symbols required")
+        from backend.portfolio.optimizer import SCHEMES
+        scheme = req.scheme or (req.params or {}).get("portfolio.scheme") or "score"
+        if scheme not in SCHEMES:
+            raise HTTPException(status_code=400, detail=f"scheme must be one of {', '.join(SCHEMES)}")
 
         # 1) 为每个symbol生成稳定的score
         cands = []
@@ -644,7 +646,8 @@ def decide(req: DecideReq):
                 db,
                 [c["symbol"] for c in cands],
                 constraints,
-                scores_dict=scores_dict  # ✅ 直接传分数，不写数据库
+                scores_dict=scores_dict,  # ✅ 直接传分数，不写数据库
+                scheme=scheme,
             )
 
         # 3) 转换为标准格式
@@ -663,36 +666,13 @@ def decide(req: DecideReq):
         holdings = _attach_sector(holdings)
         _debug_unknowns(holdings)
 
-        # 5) 📧 立即调用回测,获取真实metrics
+        # 5) 📧 立即调用回测,获取真实metrics（进程内调用）
         real_metrics = {"ann_return": 0.0, "mdd": 0.0, "sharpe": 0.0, "winrate": 0.0}
         snapshot_id = f"decide_{datetime.datetime.now().strftime('%Y%m%d_%H%M%S')}"
 
         try:
-            backtest_req = {
-                "holdings": [{"symbol": h["symbol"], "weight": h["weight"]} for h in holdings],
-                "window_days": 252,
-                "trading_cost": 0.001,
-                "rebalance": "weekly",
-                "benchmark_symbol": "SPY"
-            }
-
-            req_data = json.dumps(backtest_req).encode('utf-8')
-            headers = {'Content-Type': 'application/json'}
-            backtest_url = "http://127.0.0.1:8000/api/backtest/run"
-            request = urllib.request.Request(backtest_url, data=req_data, headers=headers, method='POST')
-
-            with urllib.request.urlopen(request, timeout=30) as response:
-                backtest_result = json.loads(response.read().decode('utf-8'))
-
-                if backtest_result.get("success") and backtest_result.get("metrics"):
-                    m = backtest_result["metrics"]
-                    real_metrics = {
-                        "ann_return": m.get("ann_return", 0.0),
-                        "mdd": m.get("mdd", m.get("max_dd", 0.0)),
-                        "sharpe": m.get("sharpe", 0.0),
-                        "winrate": m.get("win_rate", m.get("winrate", 0.0))
-                    }
-                    print(f"✅ [decide] 回测完成, 年化收益: {real_metrics['ann_return'] * 100:.2f}%")
+            real_metrics = backtest_service.backtest_holdings(holdings)
+            print(f"✅ [decide] 回测完成, 年化收益: {real_metrics['ann_return'] * 100:.2f}%")
         except Exception as e:
             print(f"⚠️ [decide] 回测失败: {e}")
 
@@ -739,6 +719,7 @@ def decide(req: DecideReq):
             "reasoning": None,
             "version_tag": "decide_v1",
             "snapshot_id": snapshot_id,
+            "scheme": scheme,
             "metrics": real_metrics,
         }
         return JSONResponse(content=jsonable_encoder(resp))
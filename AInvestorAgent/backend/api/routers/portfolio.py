@@ -60,10 +60,12 @@ def get_portfolio_snapshot(latest: int = 1) -> SnapshotBrief:
 # === 新增：冲刺 C 的 /propose ===
 from backend.portfolio.allocator import propose_portfolio
 from backend.portfolio.constraints import Constraints, default_constraints
+from backend.portfolio.optimizer import SCHEMES
 
 class ProposeReq(BaseModel):
     symbols: List[str]
     constraints: Optional[Constraints] = None
+    scheme: Optional[str] = "score"   # score | min_variance | risk_parity | max_sharpe
 
 class HoldingOut(BaseModel):
     symbol: str
@@ -78,6 +80,7 @@ class ProposeResp(BaseModel):
     as_of: str
     version_tag: str
     snapshot_id: str
+    scheme: str = "score"
 
 
 
@@ -85,9 +88,12 @@ class ProposeResp(BaseModel):
 def propose(req: ProposeReq, db: Session = Depends(get_db)):
     if not req.symbols:
         raise HTTPException(status_code=400, detail="symbols 不能为空")
+    scheme = req.scheme or "score"
+    if scheme not in SCHEMES:
+        raise HTTPException(status_code=422, detail=f"scheme 须为 {', '.join(SCHEMES)} 之一")
 
     holdings, sector_pairs = propose_portfolio(
-        db, req.symbols, req.constraints or default_constraints()
+        db, req.symbols, req.constraints or default_constraints(), scheme=scheme
     )
 
     as_of = date.today().isoformat()
@@ -116,45 +122,13 @@ def propose(req: ProposeReq, db: Session = Depends(get_db)):
         sector_weights[sector] += h.get('weight', 0)
     sector_pairs = [[s, float(w)] for s, w in sector_weights.items()]
 
-    # 🔧 关键修改: propose后立即运行回测,获取真实metrics
+    # 🔧 关键修改: propose后立即运行回测,获取真实metrics（进程内调用，不再回调本机HTTP）
     real_metrics = {"ann_return": 0.0, "mdd": 0.0, "sharpe": 0.0, "winrate": 0.0}
 
     try:
-        import urllib.request
-        import json
-
-        # 调用回测API
-        backtest_req = {
-            "holdings": [{"symbol": h["symbol"], "weight": h["weight"]} for h in holdings],
-            "window_days": 252,  # 1年
-            "trading_cost": 0.001,
-            "rebalance": "weekly",
-            "benchmark_symbol": "SPY"
-        }
-
-        req_data = json.dumps(backtest_req).encode('utf-8')
-        headers = {'Content-Type': 'application/json'}
-
-        # 调用本地回测接口
-        backtest_url = "http://127.0.0.1:8000/api/backtest/run"
-        request = urllib.request.Request(backtest_url, data=req_data, headers=headers, method='POST')
-
-        with urllib.request.urlopen(request, timeout=30) as response:
-            backtest_result = json.loads(response.read().decode('utf-8'))
-
-            # 提取metrics
-            if backtest_result.get("success") and backtest_result.get("metrics"):
-                m = backtest_result["metrics"]
-                real_metrics = {
-                    "ann_return": m.get("ann_return", 0.0),
-                    "mdd": m.get("mdd", m.get("max_dd", 0.0)),
-                    "sharpe": m.get("sharpe", 0.0),
-                    "winrate": m.get("win_rate", m.get("winrate", 0.0))
-                }
-                print(f"✅ 回测完成, 年化收益: {real_metrics['ann_return'] * 100:.2f}%")
-            else:
-                print("⚠️ 回测返回成功但无metrics,使用默认值")
-
+        from backend.services.backtest import backtest_holdings
+        real_metrics = backtest_holdings(holdings)
+        print(f"✅ 回测完成, 年化收益: {real_metrics['ann_return'] * 100:.2f}%")
     except Exception as e:
         print(f"⚠️ 回测失败,使用默认metrics: {e}")
         # 失败时保持默认的0值
@@ -166,6 +140,7 @@ def propose(req: ProposeReq, db: Session = Depends(get_db)):
         "as_of": as_of,
         "version_tag": version_tag,
         "snapshot_id": snapshot_id,
+        "scheme": scheme,
         "metrics": real_metrics  # 🔧 使用真实回测的metrics
     }
 
@@ -2,11 +2,11 @@
 from __future__ import annotations
 from fastapi import APIRouter, Depends, Query
 from sqlalchemy.orm import Session
-from sqlalchemy import func
 from datetime import datetime, timedelta, timezone
 
 from backend.storage.db import get_db
 from backend.storage.models import NewsRaw, NewsScore
+from backend.sentiment.daily import daily_series
 from backend.api.schemas.sentiment import SentimentBrief, SentimentPoint, NewsItem
 
 router = APIRouter(prefix="/sentiment", tags=["sentiment"])
@@ -24,21 +24,8 @@ def get_sentiment_brief(
     # 统一用 UTC（入库时一般是 UTC；若不是也只是日期级别聚合，不影响）
     since = datetime.now(timezone.utc) - timedelta(days=days)
 
-    # 2) 按“日”聚合平均情绪分（news_raw × news_scores join）
-    #    SQLite 下 func.date(published_at) -> 'YYYY-MM-DD'
-    rows = (
-        db.query(
-            func.date(NewsRaw.published_at).label("d"),
-            func.avg(NewsScore.sentiment).label("avg_s")
-        )
-        .join(NewsScore, NewsScore.news_id == NewsRaw.id)
-        .filter(NewsRaw.symbol.in_(syms))
-        .filter(NewsRaw.published_at >= since)
-        .group_by("d")
-        .order_by("d")
-        .all()
-    )
-    day2score = {d: float(avg_s or 0.0) for d, avg_s in rows}
+    # 2) 按“日”聚合平均情绪分：直接读 sentiment_daily 日聚合
+    day2score = {d.isoformat(): avg for d, avg, _ in daily_series(db, syms, since.date())}
 
     # 3) 补齐缺失日期（无新闻的日期置 0，便于画“0 轴”效果）
     series: list[SentimentPoint] = []
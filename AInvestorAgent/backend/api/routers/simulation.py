@@ -3,6 +3,7 @@ from fastapi import APIRouter, HTTPException
 from pydantic import BaseModel
 from typing import List, Optional
 from backend.simulation.trading_engine import trading_engine
+from backend.portfolio.rebalance import MODES as REBALANCE_MODES, rebalance_accounts
 from datetime import date, datetime, timedelta
 import sys
 import os
@@ -20,11 +21,37 @@ class TradeRequest(BaseModel):
     price: Optional[float] = None
 
 
-class ExecuteDecisionRequest(BaseModel):
+class RebalanceOptions(BaseModel):
+    rebalance_mode: str = "full"  # full 全量调到目标 | band 无交易带 | l1 按成本/税只做值得做的交易
+    no_trade_band: float = 0.02
+    cost_aversion: float = 5.0
+    short_term_tax_rate: float = 0.0
+    long_term_tax_rate: float = 0.0
+
+
+class ExecuteDecisionRequest(RebalanceOptions):
     holdings: List[dict]  # [{"symbol": "AAPL", "weight": 0.3}, ...]
     total_amount: Optional[float] = None
 
 
+class RebalancePlanRequest(RebalanceOptions):
+    holdings: List[dict]  # 目标权重，所有账户共用
+    account_ids: Optional[List[str]] = None  # 缺省为全部模拟账户
+    rebalance_mode: str = "l1"
+
+
+def _plan_accounts(req: RebalanceOptions, targets: dict, prices: Optional[dict] = None,
+                   account_ids: Optional[List[str]] = None) -> dict:
+    from backend.storage.db import engine
+    from sqlalchemy.orm import Session
+
+    with Session(engine) as db:
+        return rebalance_accounts(db, targets, prices, account_ids=account_ids, mode=req.rebalance_mode,
+                                  tc=trading_engine.commission_rate, short_term_tax_rate=req.short_term_tax_rate,
+                                  long_term_tax_rate=req.long_term_tax_rate,
+                                  band=req.no_trade_band, aversion=req.cost_aversion)
+
+
 # 🆕 历史回测请求模型
 class HistoricalBacktestRequest(BaseModel):
     watchlist: List[str]
@@ -63,55 +90,56 @@ async def get_portfolio():
 
 @router.post("/execute-decision")
 async def execute_decision(req: ExecuteDecisionRequest):
-    """执行投资决策(自动调仓)"""
+    """执行投资决策(自动调仓)：按 rebalance_mode 生成增量调仓计划，先卖后买"""
+    if req.rebalance_mode not in REBALANCE_MODES:
+        raise HTTPException(status_code=422, detail=f"rebalance_mode 须为 {REBALANCE_MODES} 之一")
     try:
         # 获取当前持仓
         current_status = trading_engine.get_portfolio_status()
         current_holdings = {h["symbol"]: h["quantity"] for h in current_status["holdings"]}
-        total_value = req.total_amount or current_status["total_value"]
-
-        trades_executed = []
+        prices = {h["symbol"]: h["current_price"] for h in current_status["holdings"]}
+        total_value = current_status["total_value"]
+        # 指定投入金额时，目标权重按 投入金额 / 账户总值 缩放
+        scale = req.total_amount / total_value if req.total_amount and total_value > 0 else 1.0
 
-        # 计算目标持仓
-        target_holdings = {}
+        targets = {}
         for holding in req.holdings:
             symbol = holding["symbol"].upper()
-            weight = holding["weight"]
-            target_value = total_value * weight
+            if symbol not in prices:
+                try:
+                    prices[symbol] = trading_engine.get_latest_price(symbol)
+                except ValueError:
+                    continue
+            targets[symbol] = float(holding["weight"]) * scale
 
-            # 简化:假设当前价格执行
+        plan = _plan_accounts(req, targets, prices, [trading_engine.account_id]).get(trading_engine.account_id)
+        orders = sorted(plan["orders"], key=lambda o: o["side"] != "SELL") if plan else []
+
+        # 执行调仓交易（先卖出释放现金）
+        trades_executed = []
+        for o in orders:
+            quantity = o["quantity"]
+            if o["side"] == "SELL":
+                quantity = min(quantity, current_holdings.get(o["symbol"], 0))
+            if quantity <= 0.01:  # 忽略微小差异
+                continue
             try:
-                from backend.ingestion.alpha_vantage_client import get_latest_price
-                current_price = get_latest_price(symbol)
-                target_quantity = target_value / current_price
-                target_holdings[symbol] = target_quantity
+                trade = trading_engine.execute_trade(
+                    symbol=o["symbol"],
+                    action=o["side"],
+                    quantity=quantity,
+                    price=o["price"],
+                    source="AUTO"
+                )
+                trades_executed.append(trade)
             except Exception as e:
                 continue
 
-        # 执行调仓交易
-        for symbol, target_qty in target_holdings.items():
-            current_qty = current_holdings.get(symbol, 0)
-            diff = target_qty - current_qty
-
-            if abs(diff) > 0.01:  # 忽略微小差异
-                action = "BUY" if diff > 0 else "SELL"
-                quantity = abs(diff)
-
-                try:
-                    trade = trading_engine.execute_trade(
-                        symbol=symbol,
-                        action=action,
-                        quantity=quantity,
-                        source="AUTO"
-                    )
-                    trades_executed.append(trade)
-                except Exception as e:
-                    continue
-
         return {
             "success": True,
             "data": {
                 "trades_executed": trades_executed,
+                "rebalance": {"mode": req.rebalance_mode, **(plan["summary"] if plan else {})},
                 "portfolio_status": trading_engine.get_portfolio_status()
             }
         }
@@ -119,6 +147,18 @@ async def execute_decision(req: ExecuteDecisionRequest):
         raise HTTPException(status_code=400, detail=str(e))
 
 
+@router.post("/rebalance-plan")
+async def rebalance_plan(req: RebalancePlanRequest):
+    """对模拟账户批量生成增量调仓计划（不下单），附与全量调仓相比的换手与成本节省"""
+    if req.rebalance_mode not in REBALANCE_MODES:
+        raise HTTPException(status_code=422, detail=f"rebalance_mode 须为 {REBALANCE_MODES} 之一")
+    targets = {h["symbol"].upper(): float(h["weight"]) for h in req.holdings}
+    plans = _plan_accounts(req, targets, account_ids=req.account_ids)
+    saved = sum(p["summary"]["cost_saved"] for p in plans.values())
+    return {"success": True, "data": {"mode": req.rebalance_mode, "accounts": plans,
+                                      "total_cost_saved": round(saved, 2)}}
+
+
 @router.get("/pnl")
 async def get_daily_pnl(days: int = 30):
     """获取每日P&L历史"""
@@ -198,9 +238,12 @@ async def run_historical_backtest(req: HistoricalBacktestRequest):
         print("🚀 开始执行历史回测...")
         simulator.run_backtest(rebalance_frequency=req.rebalanceFrequency)
 
-        # 构建返回数据
+        # 构建返回数据（回撤 / 收益矩由累加器一次线性扫描得到）
+        from backend.backtest.metrics import MetricsAccumulator
+        acc = MetricsAccumulator()
         history_data = []
         for record in simulator.history:
+            dd = acc.update(record["nav"])
             history_data.append({
                 "date": record["date"].strftime("%Y-%m-%d") if isinstance(record["date"], date) else record["date"],
                 "nav": round(record["nav"], 4),
@@ -208,11 +251,7 @@ async def run_historical_backtest(req: HistoricalBacktestRequest):
                 "cash": round(record["cash"], 2),
                 "holdings": round(record["total_value"] - record["cash"], 2),
                 "positions": record["positions"],
-                "drawdown": round((record["nav"] - max(
-                    [h["nav"] for h in simulator.history[:simulator.history.index(record) + 1]])) / max(
-                    [h["nav"] for h in
-                     simulator.history[:simulator.history.index(record) + 1]]) * 100 if simulator.history.index(
-                    record) > 0 else 0, 2)
+                "drawdown": round(dd * 100, 2)
             })
 
         # 构建交易数据
@@ -239,24 +278,13 @@ async def run_historical_backtest(req: HistoricalBacktestRequest):
             ann_return = (pow(final_nav, 365 / max(days, 1)) - 1) * 100
 
             # 最大回撤
-            max_dd = min([h["drawdown"] for h in history_data])
-
-            # 计算夏普比率
-            returns = []
-            for i in range(1, len(history_data)):
-                daily_return = (history_data[i]["nav"] - history_data[i - 1]["nav"]) / history_data[i - 1]["nav"]
-                returns.append(daily_return)
-
-            if len(returns) > 0:
-                avg_return = sum(returns) / len(returns)
-                variance = sum([(r - avg_return) ** 2 for r in returns]) / len(returns)
-                std_return = variance ** 0.5
-                sharpe = (avg_return / std_return * (252 ** 0.5)) if std_return > 0 else 0
-            else:
-                sharpe = 0
+            max_dd = acc.max_dd * 100
+
+            # 计算夏普比率（总体标准差，同原口径）
+            sharpe = acc.sharpe(ddof=0)
 
             # 胜率
-            win_rate = len([r for r in returns if r > 0]) / len(returns) * 100 if len(returns) > 0 else 0
+            win_rate = acc.win_rate * 100
             win_trades = len([t for t in trades_data if t["action"] == "BUY"])
 
             metrics = {
@@ -1,9 +1,11 @@
 """
 验证与模型质量检查路由
 """
-from fastapi import APIRouter, Query
-from typing import List
-from pydantic import BaseModel
+from fastapi import APIRouter, HTTPException, Query
+from typing import List, Optional
+
+import numpy as np
+from pydantic import BaseModel, Field
 
 router = APIRouter(prefix="/api/validation", tags=["validation"])
 
@@ -13,6 +15,13 @@ class FactorQualityResponse(BaseModel):
     data: dict = {}
 
 
+class FactorBackfillRequest(BaseModel):
+    symbols: List[str]
+    lookback_months: int = Field(6, ge=1, le=24)
+    step_days: int = Field(30, ge=1, le=90)
+    refresh_days: int = Field(7, ge=0, le=90)
+
+
 class MarketRegimeResponse(BaseModel):
     ok: bool = True
     data: dict = {"regime": "normal", "description": "Market in normal state"}
@@ -34,21 +43,42 @@ class SignalStrengthResponse(BaseModel):
 
 
 @router.get("/factor-quality", response_model=FactorQualityResponse)
-async def get_factor_quality(
+def get_factor_quality(
     symbols: str = Query(..., description="逗号分隔的股票代码"),
     lookback_months: int = Query(6, ge=1, le=24)
 ):
     """
-    因子质量评估（IC、分层收益等）
-    TODO: 实现真实的因子质量计算
+    因子质量评估（IC、Rank IC、衰减曲线、分层收益），由向量化 IC 引擎计算
     """
-    return FactorQualityResponse(
-        data={
-            "momentum": {"rating": "fair", "ic_mean": 0.05},
-            "sentiment": {"rating": "poor", "ic_mean": 0.01},
-            "overall_score": {"rating": "fair"}
-        }
-    )
+    from backend.orchestrator.pipeline import run_factor_validation_pipeline
+
+    syms = [s.strip().upper() for s in symbols.split(",") if s.strip()]
+    res = run_factor_validation_pipeline(syms, {"validation_months": lookback_months})
+    if not res.get("success"):
+        return FactorQualityResponse(ok=False, data=res.get("context", {}))
+    return FactorQualityResponse(data=res["context"]["quality_ratings"])
+
+
+@router.post("/factor-backfill", response_model=FactorQualityResponse)
+def backfill_factor_store(req: FactorBackfillRequest):
+    """
+    把 factor-quality 使用的截面日期的原始因子写入 factors_daily（缺失格子补算、最近 refresh_days 天重算），
+    之后 GET /factor-quality 直接读表
+    """
+    from datetime import date, timedelta
+    from backend.scoring.factor_store import backfill_factors
+    from backend.scoring.ic import rebalance_dates
+    from backend.storage.db import SessionLocal
+
+    syms = [s.strip().upper() for s in req.symbols if s and s.strip()]
+    if not syms:
+        raise HTTPException(status_code=422, detail="symbols 不能为空")
+    end = date.today()
+    dates = rebalance_dates(end - timedelta(days=req.lookback_months * 30), end, req.step_days)
+    with SessionLocal() as db:
+        n = backfill_factors(db, syms, dates, refresh_days=req.refresh_days)
+        db.commit()
+    return FactorQualityResponse(data={"symbols": syms, "dates": len(dates), "written": n})
 
 
 @router.get("/market-regime", response_model=MarketRegimeResponse)
@@ -61,19 +91,47 @@ async def get_market_regime():
 
 
 @router.post("/portfolio-risk", response_model=PortfolioRiskResponse)
-async def calculate_portfolio_risk(weights: List[dict]):
+def calculate_portfolio_risk(
+    weights: List[dict],
+    lookback: int = Query(252, ge=30, le=2520),
+    halflife: Optional[float] = Query(None, gt=0, description="指数加权半衰期（交易日），缺省等权"),
+    confidence: float = Query(0.95, gt=0.5, lt=1.0),
+    horizon: int = Query(1, ge=1, le=60, description="VaR 持有期（交易日）"),
+    var_methods: str = Query("historical,parametric,monte_carlo", description="逗号分隔"),
+    mc_paths: int = Query(100_000, ge=1_000, le=1_000_000),
+    seed: Optional[int] = Query(0)
+):
     """
-    组合风险指标计算
-    TODO: 实现真实的风险计算
+    组合风险指标计算：按日期对齐的收益矩阵（风险服务缓存）上的波动、VaR、回撤、夏普与两两相关，
+    以及历史 / 参数 / 蒙特卡洛三种 VaR、CVaR 和逐只持仓的边际 / 组件 VaR。
+    计算为 CPU 密集型，按普通 def 在线程池中执行；mc_paths × 股票数超过 MC_MAX_DRAWS 时返回 422。
     """
-    return PortfolioRiskResponse(
-        data={
-            "portfolio_volatility": 0.18,
-            "portfolio_var_95": 0.025,
-            "portfolio_max_drawdown": 0.15,
-            "portfolio_sharpe": 1.2
-        }
-    )
+    from backend.services.risk import correlation_summary, get_risk_matrix, portfolio_risk
+    from backend.services.var import METHODS, var_report
+    from backend.storage.db import SessionLocal
+
+    methods = [m.strip() for m in var_methods.split(",") if m.strip()]
+    if any(m not in METHODS for m in methods):
+        raise HTTPException(status_code=422, detail=f"var_methods 须为 {METHODS} 的子集")
+
+    w = {}
+    for x in weights:
+        if x.get("symbol") and float(x.get("weight", 0) or 0) > 0:
+            w[x["symbol"].upper()] = w.get(x["symbol"].upper(), 0.0) + float(x["weight"])
+    try:
+        with SessionLocal() as db:
+            rm = get_risk_matrix(db, list(w), lookback=lookback, halflife=halflife, min_obs=30)
+    except ValueError as e:
+        return PortfolioRiskResponse(ok=False, data={"error": str(e)})
+    idx = rm.index(list(w))
+    data = {**portfolio_risk(rm, w), **correlation_summary(rm.corr[np.ix_(idx, idx)])}
+    data.update({"asof": str(rm.asof), "halflife": halflife, "missing": rm.missing})
+    if methods:
+        try:
+            data["var"] = var_report(rm, w, confidence, horizon, methods, n_paths=mc_paths, seed=seed)
+        except ValueError as e:
+            raise HTTPException(status_code=422, detail=str(e))
+    return PortfolioRiskResponse(data=data)
 
 
 @router.post("/stress-test", response_model=StressTestResponse)
@@ -0,0 +1,268 @@
+# backend/backtest/cache.py
+"""
+回测结果缓存（内容寻址）：键 = sha256(归一化权重 + 窗口/调仓/成本/税务参数 + 成分股数据版本)。
+
+- 数据版本覆盖回测的全部输入：prices_daily（最新日期、行数与 close / adjusted_close / volume 之和，
+  修订历史价格也会变）、fundamentals、sentiment_daily 与新闻打分，任一表被其它进程改写后键自然变化；
+- 本进程内 DAO 写价格的事务结束后触发 invalidate_price_panel → 这里按 symbol 剔除内存与磁盘上的相关条目；
+- 内存层为 LRU；设置 BACKTEST_CACHE_DIR 后另有磁盘层（一条一个 JSON 文件 + 一个 .sym 成分股索引），内存未命中时回读；
+- 命中 / 未命中 / 淘汰 / 失效次数由 stats() 给出。
+"""
+from __future__ import annotations
+
+import copy
+import hashlib
+import json
+import os
+import threading
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterable, Mapping, Optional, Tuple
+
+from sqlalchemy import func, select
+from sqlalchemy.orm import Session
+
+from backend.storage.models import Fundamental, NewsRaw, NewsScore, PriceDaily, SentimentDaily
+from backend.storage.price_panel import on_price_invalidate
+
+
+def normalize_weights(weights: Mapping[str, float]) -> Dict[str, float]:
+    """symbol 大写合并、负数记 0、归一化到和为 1，按 symbol 排序并保留 8 位小数"""
+    merged: Dict[str, float] = {}
+    for s, w in weights.items():
+        k = (s or "").upper().strip()
+        if k:
+            merged[k] = merged.get(k, 0.0) + max(float(w or 0.0), 0.0)
+    total = sum(merged.values()) or 1.0
+    return {k: round(merged[k] / total, 8) for k in sorted(merged)}
+
+
+def _versions(db: Session, sym_col, syms, *aggs, join=None) -> Dict[str, str]:
+    """按 symbol 分组的一条聚合查询 → {symbol: "a:b:c"}（浮点和保留 10 位有效数字）"""
+    q = select(sym_col, *aggs)
+    if join is not None:
+        q = q.select_from(sym_col.table).join(*join)
+    q = q.where(sym_col.in_(syms)).group_by(sym_col)
+    fmt = (lambda v: f"{v:.10g}" if isinstance(v, float) else str(v))
+    return {r[0]: ":".join(fmt(v) for v in r[1:]) for r in db.execute(q).all()}
+
+
+def price_data_version(db: Session, symbols: Iterable[str]) -> Dict[str, str]:
+    """各 symbol 的价格数据版本："最新日期:行数:Σclose:Σadjusted_close:Σvolume"（无数据为空串）"""
+    syms = sorted({s.upper() for s in symbols})
+    got = _versions(db, PriceDaily.symbol, syms, func.max(PriceDaily.date), func.count(),
+                    func.total(PriceDaily.close), func.total(PriceDaily.adjusted_close),
+                    func.total(PriceDaily.volume))
+    return {s: got.get(s, "") for s in syms}
+
+
+def input_data_version(db: Session, symbols: Iterable[str]) -> Dict[str, str]:
+    """
+    各 symbol 全部回测输入的数据版本：价格（见 price_data_version）、基本面、情绪日聚合、新闻打分，
+    每张表一条分组聚合查询。
+    """
+    syms = sorted({s.upper() for s in symbols})
+    F, D = Fundamental, SentimentDaily
+    price = price_data_version(db, syms)
+    funds = _versions(db, F.symbol, syms, func.count(), func.max(F.id), func.max(F.as_of),
+                      func.total(func.coalesce(F.pe, 0) + func.coalesce(F.pb, 0)
+                                 + func.coalesce(F.roe, 0) + func.coalesce(F.net_margin, 0)))
+    senti = _versions(db, D.symbol, syms, func.count(), func.max(D.day), func.total(D.sum_sent),
+                      func.total(D.n), func.max(D.updated_at))
+    news = _versions(db, NewsRaw.symbol, syms, func.count(NewsScore.id), func.max(NewsScore.id),
+                     func.total(NewsScore.sentiment), join=(NewsScore, NewsScore.news_id == NewsRaw.id))
+    return {s: f"p={price[s]}|f={funds.get(s, '')}|s={senti.get(s, '')}|n={news.get(s, '')}" for s in syms}
+
+
+def make_key(params: Mapping[str, Any], weights: Mapping[str, float], data_version: Mapping[str, str]) -> str:
+    payload = json.dumps({"p": params, "w": normalize_weights(weights), "v": dict(sorted(data_version.items()))},
+                         sort_keys=True, default=str, separators=(",", ":"))
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class BacktestCache:
+    """线程安全的 LRU 结果缓存，可选磁盘层"""
+
+    def __init__(self, max_entries: int = 256, disk_dir: Optional[str] = None):
+        self.max_entries = max(1, int(max_entries))
+        self.disk_dir = Path(disk_dir) if disk_dir else None
+        self._mem: "OrderedDict[str, Tuple[Any, frozenset]]" = OrderedDict()
+        self._by_symbol: Dict[str, set] = {}
+        self._lock = threading.RLock()
+        self.hits = self.misses = self.disk_hits = self.evictions = self.invalidations = 0
+
+    # ---- 磁盘层 ----
+    def _path(self, key: str, suffix: str = ".json") -> Optional[Path]:
+        return self.disk_dir / f"{key}{suffix}" if self.disk_dir else None
+
+    def _disk_get(self, key: str):
+        p = self._path(key)
+        if p is None or not p.exists():
+            return None
+        try:
+            with open(p, "r", encoding="utf-8") as f:
+                rec = json.load(f)
+            return rec["value"], frozenset(rec.get("symbols") or ())
+        except Exception as e:
+            print(f"⚠️ 回测缓存文件损坏，忽略: {p.name} ({e})")
+            return None
+
+    def _disk_put(self, key: str, value: Any, symbols: frozenset) -> None:
+        p = self._path(key)
+        if p is None:
+            return
+        try:
+            p.parent.mkdir(parents=True, exist_ok=True)
+            tmp = p.with_suffix(f".{os.getpid()}.tmp")
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump({"symbols": sorted(symbols), "value": value}, f, ensure_ascii=False, default=str)
+            os.replace(tmp, p)
+            self._path(key, ".sym").write_text(",".join(sorted(symbols)), encoding="utf-8")
+        except Exception as e:
+            print(f"⚠️ 回测缓存写盘失败: {e}")
+
+    def _disk_drop(self, key: str) -> None:
+        for suffix in (".json", ".sym"):
+            p = self._path(key, suffix)
+            if p is not None:
+                try:
+                    p.unlink()
+                except FileNotFoundError:
+                    pass
+
+    def _disk_keys(self, symbols: Optional[set]) -> set:
+        """磁盘层中涉及 symbols 的键（None 表示全部）；成分股读 .sym 索引，缺索引的旧文件读 JSON"""
+        if not self.disk_dir or not self.disk_dir.exists():
+            return set()
+        keys = set()
+        for p in self.disk_dir.glob("*.json"):
+            if symbols is None:
+                keys.add(p.stem)
+                continue
+            idx = p.with_suffix(".sym")
+            if idx.exists():
+                syms = set(filter(None, idx.read_text(encoding="utf-8").split(",")))
+            else:
+                ent = self._disk_get(p.stem)
+                syms = set(ent[1]) if ent else set()
+            if syms & symbols:
+                keys.add(p.stem)
+        return keys
+
+    # ---- 内存层 ----
+    def _remember(self, key: str, value: Any, symbols: frozenset) -> None:
+        self._mem[key] = (value, symbols)
+        self._mem.move_to_end(key)
+        for s in symbols:
+            self._by_symbol.setdefault(s, set()).add(key)
+        while len(self._mem) > self.max_entries:
+            old, (_, syms) = self._mem.popitem(last=False)
+            self._forget_index(old, syms)
+            self.evictions += 1
+
+    def _forget_index(self, key: str, symbols: frozenset) -> None:
+        for s in symbols:
+            keys = self._by_symbol.get(s)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._by_symbol[s]
+
+    def get(self, key: str) -> Optional[Any]:
+        """命中返回结果的深拷贝（调用方可随意修改），否则 None"""
+        with self._lock:
+            ent = self._mem.get(key)
+            if ent is None:
+                ent = self._disk_get(key)
+                if ent is not None:
+                    self.disk_hits += 1
+                    self._remember(key, *ent)
+            else:
+                self._mem.move_to_end(key)
+            if ent is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            return copy.deepcopy(ent[0])
+
+    def put(self, key: str, value: Any, symbols: Iterable[str]) -> None:
+        syms = frozenset(s.upper() for s in symbols)
+        value = copy.deepcopy(value)
+        with self._lock:
+            self._remember(key, value, syms)
+            self._disk_put(key, value, syms)
+
+    def invalidate(self, symbols: Optional[Iterable[str]] = None) -> int:
+        """剔除内存与磁盘上涉及 symbols 的条目（None 表示全部），返回剔除条数"""
+        drop = None if symbols is None else {s.upper() for s in symbols}
+        with self._lock:
+            if drop is None:
+                keys = set(self._mem)
+            else:
+                keys = {k for s in drop for k in self._by_symbol.get(s, ())}
+            keys |= self._disk_keys(drop)
+            for k in keys:
+                ent = self._mem.pop(k, None)
+                if ent is not None:
+                    self._forget_index(k, ent[1])
+                self._disk_drop(k)
+            self.invalidations += len(keys)
+            return len(keys)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._mem.clear()
+            self._by_symbol.clear()
+            if self.disk_dir and self.disk_dir.exists():
+                for p in [*self.disk_dir.glob("*.json"), *self.disk_dir.glob("*.sym")]:
+                    p.unlink()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            total = self.hits + self.misses
+            return {"entries": len(self._mem), "max_entries": self.max_entries,
+                    "hits": self.hits, "misses": self.misses, "disk_hits": self.disk_hits,
+                    "hit_rate": self.hits / total if total else 0.0,
+                    "evictions": self.evictions, "invalidations": self.invalidations,
+                    "disk_dir": str(self.disk_dir) if self.disk_dir else None}
+
+
+_CACHE: Optional[BacktestCache] = None
+_CACHE_LOCK = threading.Lock()
+
+
+def get_backtest_cache() -> BacktestCache:
+    """进程级单例；首次创建时订阅价格失效通知"""
+    global _CACHE
+    with _CACHE_LOCK:
+        if _CACHE is None:
+            from backend.core.config import get_settings
+            st = get_settings()
+            _CACHE = BacktestCache(st.BACKTEST_CACHE_SIZE, st.BACKTEST_CACHE_DIR or None)
+            on_price_invalidate(lambda syms: _CACHE.invalidate(syms))
+        return _CACHE
+
+
+def backtest_cache_key(db: Session, params: Mapping[str, Any], weights: Mapping[str, float]) -> str:
+    return make_key(params, weights, input_data_version(db, normalize_weights(weights)))
+
+
+def cached_backtest(params: Mapping[str, Any], weights: Mapping[str, float], compute: Callable[[], Any],
+                    db: Optional[Session] = None, cache: Optional[BacktestCache] = None) -> Tuple[Any, bool]:
+    """
+    查缓存，未命中则 compute() 并写入；返回 (结果, 是否命中)。
+    未传 db 时用短会话取数据版本（查完即关，避免读事务挡住 compute 里的写入）。
+    """
+    cache = cache or get_backtest_cache()
+    if db is None:
+        from backend.storage.db import SessionLocal
+        with SessionLocal() as s:
+            key = backtest_cache_key(s, params, weights)
+    else:
+        key = backtest_cache_key(db, params, weights)
+    hit = cache.get(key)
+    if hit is not None:
+        return hit, True
+    out = compute()
+    cache.put(key, out, normalize_weights(weights))
+    return out, False
@@ -0,0 +1,187 @@
+# backend/backtest/engine.py
+"""
+NumPy 回测内核：输入 dates × symbols 日收益矩阵与目标权重调仓表，
+用数组运算得到净值、持仓权重（漂移后）、换手、交易成本与回撤。
+
+约定：
+- returns[t] 为第 t 日相对前一日的收益（第 0 行不使用），NaN 视为 0；
+- 调仓在当日收盘执行：先计入当日收益，再调到目标权重并扣成本；
+- 第 0 日从现金按 targets[0] 建仓（rebalance_idx 须以 0 开头）；
+- 换手 = Σ|w_目标 - w_调仓前|，成本 = tc × 换手（tc 为双边成本，与原 BacktestEngineer 一致）；
+- 权重和 < 1 的部分视为现金（收益 0）；
+- drift=False 时两次调仓之间每日按目标权重计收益（即原 _portfolio_nav 的近似口径）。
+两次调仓之间按段做累乘，循环次数 = 调仓次数，10 年日频 × 500 只在毫秒级。
+"""
+from __future__ import annotations
+
+from dataclasses import dataclass
+from typing import Dict, List, Sequence
+
+import numpy as np
+
+
+@dataclass
+class BacktestResult:
+    nav: np.ndarray          # (T,)
+    weights: np.ndarray      # (T, N) 当日收盘（调仓后）持仓权重
+    turnover: np.ndarray     # (T,) 当日换手
+    costs: np.ndarray        # (T,) 当日成本（占净值比例）
+    drawdown: np.ndarray     # (T,) 相对历史高点的回撤（<= 0）
+
+    @property
+    def total_turnover(self) -> float:
+        return float(self.turnover.sum())
+
+    @property
+    def daily_returns(self) -> np.ndarray:
+        return self.nav[1:] / self.nav[:-1] - 1.0
+
+
+def drawdown(nav: np.ndarray) -> np.ndarray:
+    peak = np.maximum.accumulate(nav)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return np.where(peak == 0, 0.0, (nav - peak) / peak)
+
+
+def simple_returns(closes: np.ndarray) -> np.ndarray:
+    """收盘价 → 日收益矩阵（首行 0；前值为 0 时记 0），与原 _daily_returns 口径一致"""
+    c = np.asarray(closes, dtype=float)
+    r = np.zeros_like(c)
+    prev = c[:-1]
+    with np.errstate(invalid="ignore", divide="ignore"):
+        r[1:] = np.where(prev == 0, 0.0, (c[1:] - prev) / prev)
+    return r
+
+
+def weekly_rebalance_idx(dates: Sequence) -> np.ndarray:
+    """每个 ISO 周的第一个交易日下标（同原 _rebalance_schedule）"""
+    d = np.array(dates, dtype="datetime64[D]")
+    if d.size == 0:
+        return np.zeros(0, dtype=np.int64)
+    days = d.astype(np.int64)
+    week = days - (days + 3) % 7               # 1970-01-01 为周四，归到所在周的周一
+    return np.flatnonzero(np.r_[True, week[1:] != week[:-1]])
+
+
+def run_backtest(returns: np.ndarray, targets: np.ndarray, rebalance_idx: Sequence[int],
+                 tc: float = 0.001, drift: bool = True) -> BacktestResult:
+    """
+    returns: T × N 日收益；targets: K × N 目标权重（或 N 维，表示每次都调回同一权重）；
+    rebalance_idx: K 个升序调仓日下标，第一个必须为 0。
+    """
+    R = np.nan_to_num(np.asarray(returns, dtype=float))
+    T, N = R.shape
+    idx = np.asarray(rebalance_idx, dtype=np.int64)
+    W = np.asarray(targets, dtype=float)
+    if W.ndim == 1:
+        W = np.broadcast_to(W, (len(idx), N))
+    if len(idx) == 0 or idx[0] != 0:
+        raise ValueError("rebalance_idx 必须以 0 开头")
+
+    nav = np.empty(T)
+    weights = np.empty((T, N))
+    turnover = np.zeros(T)
+    costs = np.zeros(T)
+
+    turnover[0] = np.abs(W[0]).sum()
+    costs[0] = tc * turnover[0]
+    nav[0] = 1.0 - costs[0]
+    weights[0] = W[0]
+
+    bounds = np.r_[idx, T]
+    for k in range(len(idx)):
+        s, e = bounds[k], bounds[k + 1]          # 本段持仓 w_k，覆盖 (s, e]
+        if s >= T - 1:
+            break
+        w = W[k]
+        seg = R[s + 1: min(e, T - 1) + 1]
+        if drift:
+            g = np.cumprod(1.0 + seg, axis=0)    # 各资产自 s 起的累计毛收益
+            val = g * w                           # 以段初净值为 1 的持仓市值
+            tot = val.sum(axis=1) + (1.0 - w.sum())
+            nav[s + 1: s + 1 + len(seg)] = nav[s] * tot
+            weights[s + 1: s + 1 + len(seg)] = val / tot[:, None]
+        else:
+            nav[s + 1: s + 1 + len(seg)] = nav[s] * np.cumprod(1.0 + seg @ w)
+            weights[s + 1: s + 1 + len(seg)] = w
+
+        if e < T:                                 # e 日收盘调到 W[k+1]
+            delta = np.abs(W[k + 1] - weights[e]).sum()
+            turnover[e] = delta
+            costs[e] = tc * delta
+            nav[e] *= 1.0 - costs[e]
+            weights[e] = W[k + 1]
+
+    return BacktestResult(nav=nav, weights=weights, turnover=turnover, costs=costs, drawdown=drawdown(nav))
+
+
+@dataclass
+class BatchBacktestResult:
+    nav: np.ndarray          # (P, T)
+    turnover: np.ndarray     # (P, T)
+    drawdown: np.ndarray     # (P, T)
+
+
+def run_backtest_batch(returns: np.ndarray, targets: np.ndarray, rebalance_idx: Sequence[int],
+                       tc: float = 0.001, drift: bool = True) -> BatchBacktestResult:
+    """
+    多组合一次回测：targets 为 P × N（每个组合每次都调回自己的固定权重），共享同一收益矩阵与调仓表。
+    口径与 run_backtest 相同；每段做一次 (L × N) @ (N × P) 的矩阵乘，不展开 P × T × N 的持仓。
+    """
+    R = np.nan_to_num(np.asarray(returns, dtype=float))
+    T, N = R.shape
+    W = np.atleast_2d(np.asarray(targets, dtype=float))
+    P = W.shape[0]
+    idx = np.asarray(rebalance_idx, dtype=np.int64)
+    if len(idx) == 0 or idx[0] != 0:
+        raise ValueError("rebalance_idx 必须以 0 开头")
+
+    nav = np.empty((T, P))
+    turnover = np.zeros((T, P))
+    cash = 1.0 - W.sum(axis=1)
+    turnover[0] = np.abs(W).sum(axis=1)
+    nav[0] = 1.0 - tc * turnover[0]
+
+    bounds = np.r_[idx, T]
+    for k in range(len(idx)):
+        s, e = bounds[k], bounds[k + 1]
+        if s >= T - 1:
+            break
+        seg = R[s + 1: min(e, T - 1) + 1]
+        if drift:
+            g = np.cumprod(1.0 + seg, axis=0)    # L × N 累计毛收益
+            tot = g @ W.T + cash                  # L × P
+        else:
+            tot = np.cumprod(1.0 + seg @ W.T, axis=0)
+        nav[s + 1: s + 1 + len(seg)] = nav[s] * tot
+
+        if e < T:                                 # e 日收盘调回目标权重
+            drifted = g[-1] * W / tot[-1][:, None] if drift else W
+            turnover[e] = np.abs(W - drifted).sum(axis=1)
+            nav[e] *= 1.0 - tc * turnover[e]
+
+    return BatchBacktestResult(nav=nav.T, turnover=turnover.T, drawdown=drawdown(nav).T)
+
+
+def align_closes(price_map: Dict[str, List[Dict]]) -> tuple[List[str], List[str], np.ndarray]:
+    """
+    {symbol: [{date, close}, ...]} → (dates, symbols, T × N 收盘价矩阵)。
+    日期取并集、缺失用前值填充，并裁剪到所有 symbol 都已有值的区间（同原 _align_by_date）。
+    """
+    from backend.storage.price_panel import ffill
+
+    syms = list(price_map)
+    if not syms:
+        return [], [], np.zeros((0, 0))
+    all_dates = sorted({p["date"] for s in price_map.values() for p in s})
+    pos = {d: i for i, d in enumerate(all_dates)}
+    m = np.full((len(all_dates), len(syms)), np.nan)
+    for j, s in enumerate(syms):
+        for p in price_map[s]:
+            m[pos[p["date"]], j] = p["close"]
+    m = ffill(m)
+    has = ~np.isnan(m)
+    if not has.any(axis=0).all():
+        return [], syms, np.zeros((0, len(syms)))
+    start = int(has.argmax(axis=0).max())
+    return all_dates[start:], syms, m[start:]
@@ -0,0 +1,146 @@
+# backend/backtest/jobs.py
+"""
+异步回测任务：提交后立即返回 job_id，在有界线程池中运行，进度以事件流形式推送（供 SSE 使用）。
+
+- 同一参数（同缓存键）的任务在排队/运行中时，重复提交直接合并到已有任务；
+- 取消：排队中的直接撤下；运行中的在下一次进度回调（各加载阶段结束时、每个调仓日）时抛 JobCancelled 中止；
+- 结束的任务只保留最近 MAX_FINISHED_JOBS 个。
+"""
+from __future__ import annotations
+
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, List, Optional
+
+MAX_FINISHED_JOBS = 200
+TERMINAL = ("done", "failed", "cancelled")
+
+
+class JobCancelled(Exception):
+    """运行中的任务被取消（由进度回调抛出）"""
+
+
+@dataclass
+class Job:
+    id: str
+    key: str
+    status: str = "queued"            # queued | running | done | failed | cancelled
+    progress: Dict[str, Any] = field(default_factory=dict)
+    result: Any = None
+    error: Optional[str] = None
+    created_at: float = field(default_factory=time.time)
+    finished_at: Optional[float] = None
+    events: List[Dict[str, Any]] = field(default_factory=list)
+    cancel_requested: bool = False
+    future: Optional[Future] = None
+
+    def brief(self) -> Dict[str, Any]:
+        return {"job_id": self.id, "status": self.status, "progress": self.progress,
+                "error": self.error, "created_at": self.created_at, "finished_at": self.finished_at}
+
+
+class JobManager:
+    def __init__(self, max_workers: int = 2):
+        self._pool = ThreadPoolExecutor(max_workers=max(1, int(max_workers)), thread_name_prefix="backtest-job")
+        self._jobs: "OrderedDict[str, Job]" = OrderedDict()
+        self._inflight: Dict[str, str] = {}           # key -> job_id（排队/运行中）
+        self._lock = threading.Lock()
+
+    # ---- 事件 ----
+    def _emit(self, job: Job, event: str, data: Dict[str, Any]) -> None:
+        with self._lock:
+            job.events.append({"seq": len(job.events), "event": event, "data": data})
+
+    def events_since(self, job_id: str, seq: int = 0) -> List[Dict[str, Any]]:
+        job = self.get(job_id)
+        if job is None:
+            return []
+        with self._lock:
+            return job.events[seq:]
+
+    # ---- 提交 / 查询 / 取消 ----
+    def submit(self, key: str, fn: Callable[[Callable[[Dict[str, Any]], None]], Any]) -> tuple[Job, bool]:
+        """
+        fn(progress) 在工作线程中执行，progress(dict) 上报进度。
+        返回 (任务, 是否合并到已有任务)。
+        """
+        with self._lock:
+            jid = self._inflight.get(key)
+            if jid is not None and self._jobs[jid].status not in TERMINAL:
+                return self._jobs[jid], True
+            job = Job(id=f"job_{uuid.uuid4().hex[:12]}", key=key)
+            job.events.append({"seq": 0, "event": "queued", "data": {"job_id": job.id}})
+            self._jobs[job.id] = job
+            self._inflight[key] = job.id
+            self._prune()
+        job.future = self._pool.submit(self._run, job, fn)
+        return job, False
+
+    def _run(self, job: Job, fn) -> None:
+        if job.cancel_requested:
+            return self._finish(job, "cancelled")
+        job.status = "running"
+        self._emit(job, "started", {"job_id": job.id})
+
+        def progress(p: Dict[str, Any]) -> None:
+            if job.cancel_requested:
+                raise JobCancelled(job.id)
+            job.progress = dict(p)
+            self._emit(job, "progress", job.progress)
+
+        try:
+            job.result = fn(progress)
+            self._finish(job, "done")
+        except JobCancelled:
+            self._finish(job, "cancelled")
+        except Exception as e:
+            job.error = str(e)
+            print(f"❌ 回测任务失败 {job.id}: {e}")
+            self._finish(job, "failed")
+
+    def _finish(self, job: Job, status: str) -> None:
+        job.status = status
+        job.finished_at = time.time()
+        with self._lock:
+            if self._inflight.get(job.key) == job.id:
+                del self._inflight[job.key]
+        self._emit(job, status, {"job_id": job.id, "error": job.error})
+
+    def _prune(self) -> None:
+        done = [j for j in self._jobs.values() if j.status in TERMINAL]
+        for j in done[: max(0, len(done) - MAX_FINISHED_JOBS)]:
+            del self._jobs[j.id]
+
+    def get(self, job_id: str) -> Optional[Job]:
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def cancel(self, job_id: str) -> Optional[Job]:
+        job = self.get(job_id)
+        if job is None or job.status in TERMINAL:
+            return job
+        job.cancel_requested = True
+        if job.future is not None and job.future.cancel():   # 还在排队：直接撤下
+            self._finish(job, "cancelled")
+        return job
+
+    def list(self) -> List[Dict[str, Any]]:
+        with self._lock:
+            return [j.brief() for j in reversed(self._jobs.values())]
+
+
+_MANAGER: Optional[JobManager] = None
+_MANAGER_LOCK = threading.Lock()
+
+
+def get_job_manager() -> JobManager:
+    global _MANAGER
+    with _MANAGER_LOCK:
+        if _MANAGER is None:
+            from backend.core.config import get_settings
+            _MANAGER = JobManager(get_settings().BACKTEST_JOB_WORKERS)
+        return _MANAGER
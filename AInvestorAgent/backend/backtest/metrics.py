@@ -3,6 +3,8 @@ from __future__ import annotations
 from typing import List, Dict
 import math
 
+import numpy as np
+
 
 def compute_drawdown(nav: List[float]) -> List[float]:
     """逐日回撤序列(负数向下)"""
@@ -16,11 +18,119 @@ def compute_drawdown(nav: List[float]) -> List[float]:
     return dd
 
 
+class MetricsAccumulator:
+    """
+    流式净值指标：每来一个净值 O(1) 更新 峰值 / 回撤 / 日收益一二阶矩（Welford）/ 胜率 / 换手。
+    extend() 对一段数组做向量化批量更新（矩按并行合并公式累加），结果与逐个 update 一致。
+    口径同 compute_metrics：NaN/None 净值回撤记 0 且不产生收益；前值 > 0 且当前值非 0 时才计一笔日收益。
+    """
+
+    def __init__(self):
+        self.n = 0                   # 已输入的净值个数
+        self.first: float | None = None
+        self.last: float | None = None
+        self.peak = float("-inf")
+        self.drawdown = 0.0          # 当前回撤（<= 0）
+        self.max_dd = 0.0            # 最大回撤（最小的回撤值）
+        self.n_ret = 0
+        self.mean_ret = 0.0
+        self._m2 = 0.0
+        self.wins = 0
+        self.turnover = 0.0
+        self._prev: float | None = None
+
+    def update(self, nav, turnover: float = 0.0) -> float:
+        """输入一个净值，返回当日回撤（<= 0）"""
+        v = float("nan") if nav is None else float(nav)
+        if self.n == 0:
+            self.first = v
+        self.n += 1
+        self.turnover += float(turnover or 0.0)
+        prev, self._prev = self._prev, v
+        if v != v:
+            self.drawdown = 0.0
+            return 0.0
+        self.last = v
+        if prev is not None and prev > 0 and v != 0:
+            r = v / prev - 1.0
+            self.n_ret += 1
+            d = r - self.mean_ret
+            self.mean_ret += d / self.n_ret
+            self._m2 += d * (r - self.mean_ret)
+            self.wins += r > 0
+        self.peak = max(self.peak, v)
+        self.drawdown = v / self.peak - 1.0 if self.peak > 0 else 0.0
+        self.max_dd = min(self.max_dd, self.drawdown)
+        return self.drawdown
+
+    def extend(self, navs, turnover=None) -> np.ndarray:
+        """批量输入净值序列（turnover 可为同长数组或总量），返回这段的回撤数组"""
+        v = np.array([np.nan if x is None else x for x in navs] if isinstance(navs, list) else navs, dtype=float)
+        if v.size == 0:
+            return np.zeros(0)
+        if self.n == 0:
+            self.first = float(v[0])
+        self.n += v.size
+        if turnover is not None:
+            self.turnover += float(np.sum(turnover))
+        ok = ~np.isnan(v)
+
+        prev = np.r_[np.nan if self._prev is None else self._prev, v[:-1]]
+        with np.errstate(invalid="ignore", divide="ignore"):
+            m = ok & (prev > 0) & (v != 0)
+            r = v[m] / prev[m] - 1.0
+        if r.size:
+            nb, mb = r.size, float(r.mean())
+            m2b = float(((r - mb) ** 2).sum())
+            na, delta = self.n_ret, mb - self.mean_ret
+            self.n_ret = na + nb
+            self.mean_ret += delta * nb / self.n_ret
+            self._m2 += m2b + delta * delta * na * nb / self.n_ret
+            self.wins += int((r > 0).sum())
+
+        peak = np.fmax.accumulate(np.r_[self.peak, np.where(ok, v, -np.inf)])[1:]
+        with np.errstate(invalid="ignore", divide="ignore"):
+            dd = np.where(ok & (peak > 0), v / peak - 1.0, 0.0)
+        self.peak = float(peak[-1])
+        self.max_dd = min(self.max_dd, float(dd.min()))
+        self.drawdown = float(dd[-1])
+        self._prev = float(v[-1])
+        if ok.any():
+            self.last = float(v[ok][-1])
+        return dd
+
+    # ---- 读数 ----
+    def std_ret(self, ddof: int = 1) -> float:
+        return math.sqrt(self._m2 / max(self.n_ret - ddof, 1)) if self.n_ret else 0.0
+
+    def sharpe(self, ddof: int = 1, periods: int = 252) -> float:
+        std = self.std_ret(ddof)
+        return self.mean_ret / std * math.sqrt(periods) if std > 0 else 0.0
+
+    @property
+    def win_rate(self) -> float:
+        return self.wins / self.n_ret if self.n_ret else 0.0
+
+    @property
+    def total_return(self) -> float:
+        """last / first - 1（首值无效时为 0）"""
+        if not self.first or not (self.first > 0) or self.last is None:
+            return 0.0
+        return self.last / self.first - 1.0
+
+    def ann_return(self, periods: int = 252) -> float:
+        """复合年化：按实际日收益笔数折算年数"""
+        years = self.n_ret / periods
+        growth = 1.0 + self.total_return
+        return growth ** (1.0 / years) - 1.0 if years > 0 and growth > 0 else 0.0
+
+
 def compute_metrics(nav: List[float], dates: List[str]) -> Dict[str, float]:
     """
     返回四项指标:
     ann_return, sharpe(252日频), max_dd(最小回撤), win_rate(日收益>0 比例)
     兼容你现有前端的 'mdd' 字段:同步给出 mdd=max_dd 的别名。
+    基于 MetricsAccumulator 一次线性扫描。
 
     🔧 修复: 正确计算年化收益率
     """
@@ -33,48 +143,23 @@ def compute_metrics(nav: List[float], dates: List[str]) -> Dict[str, float]:
             "mdd": 0.0
         }
 
-    # 日收益序列
-    rets: List[float] = []
-    for i in range(1, len(nav)):
-        a, b = nav[i - 1], nav[i]
-        if a and b and a > 0:
-            rets.append(b / a - 1.0)
-
-    if not rets:
-        mdd = min(compute_drawdown(nav) or [0.0])
+    acc = MetricsAccumulator()
+    acc.extend(nav)
+    max_dd = float(acc.max_dd)
+    if not acc.n_ret:
         return {
             "ann_return": 0.0,
             "sharpe": 0.0,
-            "max_dd": float(mdd),
+            "max_dd": max_dd,
             "win_rate": 0.0,
-            "mdd": float(mdd)
+            "mdd": max_dd
         }
 
-    # 🔧 修复: 正确计算年化收益率
-    total_return = nav[-1] / nav[0] if nav[0] > 0 else 1.0
-    actual_days = len(rets)  # 实际交易天数
-    years = actual_days / 252.0  # 实际年数
-
-    # 复合年化收益率 = (总收益率) ^ (1/年数) - 1
-    if years > 0 and total_return > 0:
-        ann = (total_return ** (1.0 / years)) - 1.0
-    else:
-        ann = 0.0
-
-    # Sharpe(日频年化)
-    avg = sum(rets) / len(rets)
-    var = sum((r - avg) ** 2 for r in rets) / max(len(rets) - 1, 1)
-    std = math.sqrt(var)
-    sharpe = (avg / std) * math.sqrt(252) if std > 0 else 0.0
-
-    # 最大回撤 & 胜率
-    max_dd = float(min(compute_drawdown(nav) or [0.0]))
-    win = float(sum(1 for r in rets if r > 0) / len(rets)) if rets else 0.0
-
+    # 复合年化收益率 = (总收益率) ^ (1/年数) - 1，年数 = 日收益笔数 / 252；Sharpe 为日频年化（样本标准差）
     return {
-        "ann_return": float(ann),
-        "sharpe": float(sharpe),
+        "ann_return": float(acc.ann_return()),
+        "sharpe": float(acc.sharpe()),
         "max_dd": max_dd,
-        "win_rate": win,
+        "win_rate": float(acc.win_rate),
         "mdd": max_dd,  # 兼容你当前前端使用的字段名
-    }
\ No newline at end of file
+    }
@@ -0,0 +1,260 @@
+# backend/backtest/sweep.py
+"""
+参数扫描回测：对 trading_cost / 调仓频率 / 单票与行业上限 / 持仓数 / 评分权重版本
+做网格展开，用进程池并行跑 NumPy 回测内核，结果按 Sharpe 或最大回撤排名并写入 backtest_sweep_results。
+
+- 父进程只读一次库：价格面板 → 日收益矩阵，factors_daily（缺失先补算）→ 调仓日 × 股票 × 因子数组；
+- 这些只读数组放进 multiprocessing.shared_memory，worker 在 initializer 中按名字挂载，不做拷贝/序列化；
+- 每个组合在 worker 内：矩阵打分 → allocate_from_scores 分配 → run_backtest(drift=True) → compute_metrics；
+- 默认 worker 数 = CPU 核数；只有一个组合或 max_workers=1 时直接在本进程跑。
+"""
+from __future__ import annotations
+
+import contextlib
+import io
+import itertools
+import json
+import os
+import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+from datetime import date, datetime, timedelta
+from multiprocessing import get_context, shared_memory
+from typing import Any, Dict, List, Optional, Sequence
+
+import numpy as np
+from sqlalchemy.orm import Session
+
+from backend.portfolio.allocator import allocate_from_scores
+from backend.portfolio.constraints import Constraints
+from backend.portfolio.explain import load_symbol_sectors
+from backend.scoring.factor_store import backfill_factors, load_factor_panel
+from backend.scoring.scorer import aggregate_score_matrix
+from backend.scoring.weights import get_weights
+from backend.storage.models import BacktestSweepResult
+from backend.storage.price_panel import get_price_panel
+from .engine import run_backtest, simple_returns, weekly_rebalance_idx
+from .metrics import compute_metrics
+
+# 网格各维度及默认取值（与 /api/backtest/run、历史模拟器的默认口径一致）
+DEFAULT_GRID: Dict[str, List[Any]] = {
+    "trading_cost": [0.001],
+    "rebalance": ["weekly"],
+    "max_single": [0.30],
+    "max_sector": [0.50],
+    "top_n": [10],
+    "weights_version": ["v1.0.0"],
+}
+SORT_KEYS = ("sharpe", "max_dd", "ann_return")
+_FACTORS = ("value", "quality", "momentum", "sentiment")
+_FACTOR_FIELDS = ("f_value", "f_quality", "f_momentum", "f_sentiment")
+
+
+def expand_grid(grid: Optional[Dict[str, Sequence[Any]]] = None) -> List[Dict[str, Any]]:
+    """参数网格 → 组合列表；未给出的维度取 DEFAULT_GRID"""
+    g = {k: list(v) for k, v in DEFAULT_GRID.items()}
+    for k, v in (grid or {}).items():
+        if k not in g:
+            raise ValueError(f"未知的扫描参数: {k}")
+        g[k] = list(v) if isinstance(v, (list, tuple)) else [v]
+    keys = list(g)
+    return [dict(zip(keys, combo)) for combo in itertools.product(*(g[k] for k in keys))]
+
+
+def rebalance_idx(dates: np.ndarray, freq: str) -> np.ndarray:
+    """交易日序列上的调仓日下标：weekly=每周首个交易日，monthly=每月首个交易日，daily=每天"""
+    d = np.asarray(dates, dtype="datetime64[D]")
+    f = (freq or "weekly").lower()
+    if f == "daily":
+        return np.arange(len(d))
+    if f == "monthly":
+        m = d.astype("datetime64[M]")
+        return np.flatnonzero(np.r_[True, m[1:] != m[:-1]]) if len(d) else np.zeros(0, dtype=np.int64)
+    if f == "weekly":
+        return weekly_rebalance_idx(d)
+    raise ValueError(f"不支持的调仓频率: {freq}")
+
+
+# ---------------- 共享内存 ----------------
+
+def _share(arrays: Dict[str, np.ndarray]):
+    """把只读数组拷进共享内存，返回 (句柄列表, 挂载描述 {名字: (shm_name, shape, dtype)})"""
+    handles, meta = [], {}
+    for k, a in arrays.items():
+        a = np.ascontiguousarray(a)
+        shm = shared_memory.SharedMemory(create=True, size=max(a.nbytes, 1))
+        np.ndarray(a.shape, dtype=a.dtype, buffer=shm.buf)[...] = a
+        handles.append(shm)
+        meta[k] = (shm.name, a.shape, a.dtype.str)
+    return handles, meta
+
+
+def _open_shm(name: str) -> shared_memory.SharedMemory:
+    try:
+        return shared_memory.SharedMemory(name=name, track=False)   # 3.13+：不让 worker 登记回收
+    except TypeError:
+        return shared_memory.SharedMemory(name=name)
+
+
+_CTX: Dict[str, Any] = {}
+
+
+def _attach(meta: Dict[str, tuple], symbols: List[str], sectors: Dict[str, str], min_score: float) -> None:
+    """worker initializer：挂载共享数组（只读视图）"""
+    _CTX.clear()
+    _CTX["_shm"] = []
+    for k, (name, shape, dtype) in meta.items():
+        shm = _open_shm(name)
+        a = np.ndarray(shape, dtype=np.dtype(dtype), buffer=shm.buf)
+        a.flags.writeable = False
+        _CTX["_shm"].append(shm)
+        _CTX[k] = a
+    _CTX.update(symbols=symbols, sectors=sectors, min_score=min_score)
+
+
+def _set_local(arrays: Dict[str, np.ndarray], symbols: List[str], sectors: Dict[str, str], min_score: float) -> None:
+    _CTX.clear()
+    _CTX.update(arrays)
+    _CTX.update(symbols=symbols, sectors=sectors, min_score=min_score)
+
+
+# ---------------- 单个组合 ----------------
+
+def _targets(scores: np.ndarray, tradable: np.ndarray, p: Dict[str, Any]) -> np.ndarray:
+    """K × N 分数 → K × N 目标权重（候选筛选同历史模拟器：≥ min_score 取前 top_n，不足 3 只时放宽）"""
+    syms, sectors, min_score = _CTX["symbols"], _CTX["sectors"], _CTX["min_score"]
+    top_n = int(p["top_n"])
+    c = Constraints(max_single=float(p["max_single"]), max_sector=float(p["max_sector"]),
+                    min_positions=min(3, top_n), max_positions=top_n)
+    pos = {s: j for j, s in enumerate(syms)}
+    W = np.zeros(scores.shape)
+    for k in range(scores.shape[0]):
+        order = [j for j in np.argsort(-scores[k], kind="stable") if tradable[k, j]]
+        pick = [j for j in order if scores[k, j] >= min_score][:top_n]
+        if len(pick) < 3:
+            pick = order[:top_n]
+        with contextlib.redirect_stdout(io.StringIO()):      # 分配器逐期打印较多
+            holdings = allocate_from_scores({syms[j]: float(scores[k, j]) for j in pick}, sectors, c)
+        for h in holdings:
+            W[k, pos[h["symbol"]]] = h["weight"]
+    return W
+
+
+def _run_config(p: Dict[str, Any]) -> Dict[str, Any]:
+    R, days = _CTX["returns"], _CTX["dates"]
+    closes_ok, F, fdays = _CTX["tradable"], _CTX["factors"], _CTX["factor_dates"]
+    dates = days.astype("datetime64[D]")
+    idx = rebalance_idx(dates, p["rebalance"])
+    fi = np.searchsorted(fdays, days[idx])
+    w = get_weights(p["weights_version"])
+    scores = aggregate_score_matrix({k: F[fi, :, i] for i, k in enumerate(_FACTORS)},
+                                    {k: float(w.get(k, 0.0)) for k in _FACTORS})
+    W = _targets(scores, closes_ok[idx], p)
+    res = run_backtest(R, W, idx, tc=float(p["trading_cost"]), drift=True)
+    m = compute_metrics(res.nav.tolist(), [str(d) for d in dates])
+    return {"params": p, "sharpe": m["sharpe"], "ann_return": m["ann_return"], "max_dd": m["max_dd"],
+            "win_rate": m["win_rate"], "turnover": res.total_turnover, "final_nav": float(res.nav[-1]),
+            "n_rebalances": int(len(idx))}
+
+
+# ---------------- 入口 ----------------
+
+def prepare_arrays(db: Session, symbols: List[str], start: date, end: date, freqs: Sequence[str]):
+    """
+    一次读库，准备回测用的只读数组（扫描 / 滚动优化共用）：
+    returns(T×N 日收益) / dates / tradable(是否已有价格) / factors(调仓日 × N × 4) / factor_dates；
+    factors 覆盖 freqs 中各调仓频率的全部调仓日。返回 (有价格的 symbols, arrays)。
+    """
+    # 多读几天用于前向填充区间起点的收盘价
+    panel = get_price_panel(db, symbols, start - timedelta(days=10), end)
+    i0 = int(np.searchsorted(panel.dates, np.datetime64(start, "D")))
+    dates = panel.dates[i0:]
+    closes = panel.ffill("close")[i0:]
+    have = ~np.isnan(closes).all(axis=0)
+    syms = [s for s, ok in zip(panel.symbols, have) if ok]
+    closes = closes[:, have]
+    if len(dates) < 2 or not syms:
+        raise ValueError("区间内价格数据不足，无法扫描")
+
+    days = dates.astype(np.int64)
+    reb = sorted({int(i) for f in set(freqs) for i in rebalance_idx(dates, f)})
+    fdates = [dates[i].astype(date) for i in reb]
+    backfill_factors(db, syms, fdates)       # 只 flush，由 POST 路由 / save_sweep_results 提交
+    fp = load_factor_panel(db, syms, fdates[0], fdates[-1], fields=_FACTOR_FIELDS)
+    F = np.full((len(reb), len(syms), len(_FACTOR_FIELDS)), np.nan)
+    fdays = days[reb]
+    j = np.searchsorted(fp.dates.astype(np.int64), fdays)
+    hit = j < len(fp.dates)
+    hit[hit] = fp.dates.astype(np.int64)[j[hit]] == fdays[hit]
+    F[hit] = fp.values[j[hit]]
+
+    arrays = {"returns": simple_returns(np.nan_to_num(closes)), "dates": days,
+              "tradable": ~np.isnan(closes), "factors": F, "factor_dates": fdays}
+    return syms, arrays
+
+
+def rank_results(results: List[Dict[str, Any]], sort_by: str = "sharpe") -> List[Dict[str, Any]]:
+    """sharpe / ann_return 越大越好；max_dd 为负数，越接近 0 越好（同样降序）"""
+    if sort_by not in SORT_KEYS:
+        raise ValueError(f"sort_by 须为 {SORT_KEYS} 之一")
+    out = sorted(results, key=lambda r: r[sort_by], reverse=True)
+    for i, r in enumerate(out, 1):
+        r["rank"] = i
+    return out
+
+
+def save_sweep_results(db: Session, sweep_id: str, results: List[Dict[str, Any]]) -> None:
+    db.add_all([BacktestSweepResult(
+        sweep_id=sweep_id, rank=r.get("rank"), params=json.dumps(r["params"], ensure_ascii=False),
+        sharpe=r["sharpe"], ann_return=r["ann_return"], max_dd=r["max_dd"], win_rate=r["win_rate"],
+        turnover=r["turnover"], final_nav=r["final_nav"]) for r in results])
+    db.commit()
+
+
+def run_sweep(db: Session, symbols: Sequence[str], start: date, end: date,
+              grid: Optional[Dict[str, Sequence[Any]]] = None, sort_by: str = "sharpe",
+              max_workers: Optional[int] = None, min_score: float = 50.0,
+              persist: bool = True, verbose: bool = True) -> Dict[str, Any]:
+    """
+    对 grid 的全部组合跑回测，返回 {sweep_id, n_configs, n_symbols, elapsed, results(已排名)}。
+    max_workers 默认 CPU 核数；persist=True 时写入 backtest_sweep_results。
+    """
+    t0 = time.perf_counter()
+    if sort_by not in SORT_KEYS:
+        raise ValueError(f"sort_by 须为 {SORT_KEYS} 之一")
+    configs = expand_grid(grid)
+    syms = list(dict.fromkeys(s.upper() for s in symbols))
+    syms, arrays = prepare_arrays(db, syms, start, end, {c["rebalance"] for c in configs})
+    sectors = load_symbol_sectors(db, syms)
+    workers = min(max_workers or os.cpu_count() or 1, len(configs))
+    if verbose:
+        print(f"🔬 参数扫描: {len(configs)} 个组合 × {len(syms)} 只股票, "
+              f"{len(arrays['dates'])} 个交易日, {workers} 个进程")
+
+    if workers <= 1:
+        _set_local(arrays, syms, sectors, min_score)
+        try:
+            results = [_run_config(p) for p in configs]
+        finally:
+            _CTX.clear()
+    else:
+        handles, meta = _share(arrays)
+        try:
+            with ProcessPoolExecutor(max_workers=workers, mp_context=get_context("spawn"),
+                                     initializer=_attach, initargs=(meta, syms, sectors, min_score)) as ex:
+                results = list(ex.map(_run_config, configs, chunksize=max(1, len(configs) // (workers * 4))))
+        finally:
+            for h in handles:
+                h.close()
+                h.unlink()
+
+    results = rank_results(results, sort_by)
+    sweep_id = f"sw_{datetime.utcnow():%Y%m%d%H%M%S}_{uuid.uuid4().hex[:6]}"
+    if persist:
+        save_sweep_results(db, sweep_id, results)
+    elapsed = time.perf_counter() - t0
+    if verbose:
+        best = results[0]
+        print(f"✅ 扫描完成 {elapsed:.2f}s，最优({sort_by}): {best['params']} sharpe={best['sharpe']:.3f}")
+    return {"sweep_id": sweep_id, "n_configs": len(configs), "n_symbols": len(syms),
+            "elapsed": elapsed, "sort_by": sort_by, "results": results}
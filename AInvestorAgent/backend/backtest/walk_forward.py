@@ -0,0 +1,212 @@
+# backend/backtest/walk_forward.py
+"""
+评分权重的滚动（walk-forward）优化：在每个训练窗口内，对成千上万组 value/quality/momentum/sentiment
+权重做向量化评估，选出 optimization_objective 最优的一组，用到下一个窗口（样本外）。
+
+- 候选打分：权重矩阵 (C×4) 与因子张量 (K×N×4) 做一次张量积得到 C×K×N 分数，缺失因子不计权重（同 aggregate_score）；
+- 组合：每期取分数前 top_n（≥ min_score，不足 3 只时放宽），按分数比例分配并施加单票上限；
+- 训练期收益：调仓期间买入持有，期收益 = Σ w · (P_下次调仓 / P_本次调仓 - 1)，扣 tc × 换手；
+- 训练只用已实现的期收益（第 k 个调仓日只看 k 之前结束的持有期），没有前视。
+"""
+from __future__ import annotations
+
+from datetime import date
+from typing import Any, Dict, List, Optional, Sequence
+
+import numpy as np
+from sqlalchemy.orm import Session
+
+from backend.scoring.scorer import BASE_WEIGHTS
+from backend.scoring.weights import WEIGHTS
+from .engine import run_backtest
+from .metrics import compute_metrics
+
+FACTORS = ("value", "quality", "momentum", "sentiment")
+OBJECTIVES = ("sharpe", "return", "max_dd", "calmar")
+_CHUNK_CELLS = 4_000_000          # 单次评估 C×K×N 的元素上限，控制内存
+
+
+def candidate_weights(n: int = 2000, seed: int = 0) -> np.ndarray:
+    """候选权重 (C×4)：预设 WEIGHTS 各版本 + 单因子 + Dirichlet 随机点，行和为 1"""
+    fixed = [[float(v.get(f, 0.0)) for f in FACTORS] for v in WEIGHTS.values()]
+    fixed += [[float(BASE_WEIGHTS[f]) for f in FACTORS]] + np.eye(len(FACTORS)).tolist()
+    rand = np.random.default_rng(seed).dirichlet(np.ones(len(FACTORS)), size=max(0, n))
+    W = np.vstack([np.array(fixed), rand])
+    return W / W.sum(axis=1, keepdims=True)
+
+
+def score_tensor(F: np.ndarray, W: np.ndarray) -> np.ndarray:
+    """F: K×N×4 因子（NaN 缺失），W: C×4 → C×K×N 分数（0..100，全缺失 50）"""
+    ok = ~np.isnan(F)
+    num = np.tensordot(W, np.nan_to_num(F), axes=([1], [2]))
+    den = np.tensordot(W, ok.astype(float), axes=([1], [2]))
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return np.where(den > 0, 100.0 * num / den, 50.0)
+
+
+def topn_weights(S: np.ndarray, tradable: np.ndarray, top_n: int = 10, max_single: float = 0.30,
+                 min_score: float = 50.0) -> np.ndarray:
+    """
+    ...×K×N 分数 → 同形状组合权重：可交易股票中取前 top_n，≥ min_score 的不足 3 只时放宽为前 top_n，
+    按分数比例分配并以 max_single 封顶（全部触顶时余下为现金）。
+    """
+    S = np.where(tradable, S, -np.inf)
+    top = min(int(top_n), S.shape[-1])
+    order = np.argsort(-S, axis=-1, kind="stable")[..., :top]
+    s_top = np.take_along_axis(S, order, axis=-1)
+    valid = np.isfinite(s_top)
+    pick = valid & (s_top >= min_score)
+    pick = np.where((pick.sum(axis=-1, keepdims=True) < 3), valid, pick)
+
+    w0 = np.where(pick, np.maximum(np.where(valid, s_top, 0.0), 0.0), 0.0)
+    capped = np.zeros(w0.shape, dtype=bool)
+    for _ in range(top + 1):                         # 逐轮把超限的钉在上限，其余按分数比例分剩余额度
+        free = np.where(capped, 0.0, w0)
+        fs = free.sum(axis=-1, keepdims=True)
+        left = np.maximum(1.0 - max_single * capped.sum(axis=-1, keepdims=True), 0.0)
+        w = np.where(capped, max_single, np.where(fs > 0, free / np.where(fs > 0, fs, 1.0), 0.0) * left)
+        new = (w > max_single + 1e-12) & ~capped
+        if not new.any():
+            break
+        capped |= new
+    out = np.zeros(S.shape)
+    np.put_along_axis(out, order, w, axis=-1)
+    return out
+
+
+def period_returns(returns: np.ndarray, idx: Sequence[int]) -> np.ndarray:
+    """日收益 T×N + 调仓下标 K → K×N 持有期收益（第 k 期为 idx[k] 收盘到 idx[k+1] 收盘，末期到最后一天）"""
+    level = np.cumprod(1.0 + np.nan_to_num(returns), axis=0)
+    i = np.asarray(idx, dtype=np.int64)
+    j = np.r_[i[1:], len(level) - 1]
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return np.where(level[i] > 0, level[j] / level[i] - 1.0, 0.0)
+
+
+def _objective(P: np.ndarray, objective: str, ppy: float) -> np.ndarray:
+    """P: C×K 期收益 → C 个目标值（越大越好）"""
+    nav = np.cumprod(1.0 + P, axis=1)
+    k = P.shape[1]
+    ann = np.where(nav[:, -1] > 0, nav[:, -1] ** (ppy / k), 0.0) - 1.0
+    if objective == "return":
+        return ann
+    peak = np.maximum.accumulate(np.maximum(nav, 1.0), axis=1)
+    mdd = np.minimum((nav / peak - 1.0).min(axis=1), 0.0)
+    if objective == "max_dd":
+        return mdd
+    if objective == "calmar":
+        return ann / np.maximum(-mdd, 1e-6)
+    sd = P.std(axis=1, ddof=1) if k > 1 else np.zeros(P.shape[0])
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return np.where(sd > 1e-12, P.mean(axis=1) / sd * np.sqrt(ppy), 0.0)
+
+
+def evaluate_candidates(F: np.ndarray, G: np.ndarray, tradable: np.ndarray, W: np.ndarray,
+                        objective: str = "sharpe", ppy: float = 52.0, top_n: int = 10,
+                        max_single: float = 0.30, tc: float = 0.001, min_score: float = 50.0,
+                        prev: Optional[np.ndarray] = None) -> np.ndarray:
+    """
+    训练窗口内全部候选的目标值 (C,)。F/tradable: K×N(×4) 调仓日因子与可交易标记，G: K×N 期收益，
+    prev: 窗口前一期的因子（N×4，用于计首期换手；None 表示从现金建仓）。按 C 分块，单块一次张量积。
+    """
+    if objective not in OBJECTIVES:
+        raise ValueError(f"optimization_objective 须为 {OBJECTIVES} 之一")
+    K, N = G.shape
+    if prev is not None:
+        F = np.concatenate([prev[None], F])
+        tradable = np.concatenate([tradable[:1], tradable])
+    chunk = max(1, _CHUNK_CELLS // max(1, F.shape[0] * N))
+    out = np.empty(len(W))
+    for c0 in range(0, len(W), chunk):
+        Wp = topn_weights(score_tensor(F, W[c0:c0 + chunk]), tradable, top_n, max_single, min_score)
+        turn = np.abs(np.diff(Wp, axis=1, prepend=0.0)).sum(axis=2)
+        if prev is not None:
+            Wp, turn = Wp[:, 1:], turn[:, 1:]
+        P = (Wp * G[None]).sum(axis=2) - tc * turn
+        out[c0:c0 + chunk] = _objective(P, objective, ppy)
+    return out
+
+
+def walk_forward_weights(F: np.ndarray, G: np.ndarray, tradable: np.ndarray, train_periods: int = 26,
+                         refit_every: int = 4, objective: str = "sharpe", ppy: float = 52.0,
+                         candidates: Optional[np.ndarray] = None, min_train: Optional[int] = None,
+                         **kw) -> tuple[np.ndarray, List[Dict[str, Any]]]:
+    """
+    每个调仓日使用的权重 (K×4) 与各次重估记录。
+    第 k 个调仓日只用 [k - train_periods, k) 期已实现收益训练；已实现期数 < min_train 时沿用 BASE_WEIGHTS。
+    """
+    K = F.shape[0]
+    W = candidate_weights() if candidates is None else candidates
+    base = np.array([BASE_WEIGHTS[f] for f in FACTORS], dtype=float)
+    base /= base.sum()
+    min_train = max(2, train_periods // 2) if min_train is None else min_train
+    out = np.tile(base, (K, 1))
+    folds: List[Dict[str, Any]] = []
+    cur, last_fit = base, None
+    for k in range(K):
+        if k >= min_train and (last_fit is None or k - last_fit >= refit_every):
+            lo = max(0, k - train_periods)
+            vals = evaluate_candidates(F[lo:k], G[lo:k], tradable[lo:k], W, objective, ppy,
+                                       prev=F[lo - 1] if lo > 0 else None, **kw)
+            best = int(np.nanargmax(vals))
+            cur, last_fit = W[best], k
+            folds.append({"k": k, "train": [lo, k], "weights": dict(zip(FACTORS, map(float, cur))),
+                          "train_objective": float(vals[best]), "n_candidates": int(len(W))})
+        out[k] = cur
+    return out, folds
+
+
+def scores_with_weights(F: np.ndarray, Wk: np.ndarray) -> np.ndarray:
+    """K×N×4 因子 + 每期权重 K×4 → K×N 分数"""
+    ok = ~np.isnan(F)
+    num = np.einsum("knf,kf->kn", np.nan_to_num(F), Wk)
+    den = np.einsum("knf,kf->kn", ok.astype(float), Wk)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return np.where(den > 0, 100.0 * num / den, 50.0)
+
+
+def periods_per_year(dates: np.ndarray) -> float:
+    d = np.asarray(dates, dtype="datetime64[D]").astype(np.int64)
+    gap = np.diff(d).mean() if len(d) > 1 else 7.0
+    return 365.25 / max(float(gap), 1.0)
+
+
+def run_walk_forward(db: Session, symbols: Sequence[str], start: date, end: date,
+                     rebalance: str = "weekly", train_periods: int = 26, refit_every: int = 4,
+                     objective: str = "sharpe", n_candidates: int = 2000, top_n: int = 10,
+                     max_single: float = 0.30, tc: float = 0.001, seed: int = 0) -> Dict[str, Any]:
+    """
+    在 [start, end] 做滚动优化，并用 NumPy 回测内核（权重漂移）对比样本外区间：
+    优化权重 vs BASE_WEIGHTS。返回各次重估的权重与训练目标、两条样本外净值及指标。
+    """
+    from .sweep import prepare_arrays, rebalance_idx
+
+    syms = list(dict.fromkeys(s.upper() for s in symbols))
+    syms, a = prepare_arrays(db, syms, start, end, [rebalance])
+    dates = a["dates"].astype("datetime64[D]")
+    idx = rebalance_idx(dates, rebalance)
+    F = a["factors"][np.searchsorted(a["factor_dates"], a["dates"][idx])]
+    G = period_returns(a["returns"], idx)
+    tradable = a["tradable"][idx]
+    ppy = periods_per_year(dates[idx])
+
+    Wk, folds = walk_forward_weights(F, G, tradable, train_periods, refit_every, objective, ppy,
+                                     candidates=candidate_weights(n_candidates, seed),
+                                     top_n=top_n, max_single=max_single, tc=tc)
+    if not folds:
+        raise ValueError(f"调仓期数不足（{len(idx)} 期），无法训练；请加长区间或减小 train_periods")
+    for f in folds:
+        f["date"] = str(dates[idx[f["k"]]])
+
+    base = np.tile([BASE_WEIGHTS[f] for f in FACTORS], (len(idx), 1))
+    t0 = int(idx[folds[0]["k"]])                   # 样本外区间从第一次重估开始
+    out = {"symbols": syms, "objective": objective, "rebalance": rebalance, "n_periods": int(len(idx)),
+           "oos_start": str(dates[t0]), "folds": folds}
+    for name, wk in (("optimized", Wk), ("baseline", base)):
+        targets = topn_weights(scores_with_weights(F, wk), tradable, top_n, max_single)
+        res = run_backtest(a["returns"], targets, idx, tc=tc, drift=True)
+        nav = res.nav[t0:] / res.nav[t0]
+        out[name] = {"dates": [str(d) for d in dates[t0:]], "nav": np.round(nav, 6).tolist(),
+                     "metrics": compute_metrics(nav.tolist(), []),
+                     "turnover": float(res.turnover[t0 + 1:].sum())}
+    return out
@@ -18,6 +18,14 @@ class Settings(BaseSettings):
     # 保留你原有字段与默认值
     ALPHAVANTAGE_KEY: str = "OSQ403SM4KEOHQSQ"
     DB_URL: str | None = None
+    # 价格读取后端："sqlite"（默认，读 prices_daily）或 "mmap"（读 db/price_store 内存映射库）
+    PRICE_BACKEND: str = "sqlite"
+    PRICE_STORE_DIR: str = "db/price_store"
+    # 回测结果缓存：内存 LRU 条数；BACKTEST_CACHE_DIR 非空时启用磁盘层
+    BACKTEST_CACHE_SIZE: int = 256
+    BACKTEST_CACHE_DIR: str = ""
+    # 异步回测任务的并发线程数
+    BACKTEST_JOB_WORKERS: int = 2
 
     if _V2:
         # v2 写法
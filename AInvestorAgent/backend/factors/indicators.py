@@ -0,0 +1,248 @@
+# backend/factors/indicators.py
+"""
+向量化技术指标引擎：输入 dates × symbols 的二维数组（也接受一维），沿 axis=0（时间）计算，
+一次调用得到全市场每个交易日的指标序列。
+
+- 窗口类（SMA / 布林带 / 滚动波动率）用累加和，O(T·N)，与窗口长度无关；
+- 递推类（EMA / Wilder RSI / MACD）用 scipy.signal.lfilter，
+  每列在各自第一个有效值处注入种子，兼容上市前的前导 NaN；
+- 口径与 momentum.py 里原有的逐点实现一致（EMA 以首值为初值、RSI 以前 period 个涨跌均值起算、
+  布林带用总体标准差）。
+窗口内含 NaN 的位置输出 NaN；中间缺失的 K 线请先前向填充（PricePanel.ffill）。
+"""
+from __future__ import annotations
+
+from typing import Dict, Optional
+
+import numpy as np
+from scipy.signal import lfilter
+
+
+def _as2d(x) -> tuple[np.ndarray, bool]:
+    a = np.asarray(x, dtype=float)
+    if a.ndim == 1:
+        return a[:, None], True
+    return a, False
+
+
+def _out(a: np.ndarray, squeeze: bool) -> np.ndarray:
+    return a[:, 0] if squeeze else a
+
+
+def _first_valid(a: np.ndarray) -> np.ndarray:
+    """每列第一个非 NaN 的行号；全 NaN 的列返回 T"""
+    valid = ~np.isnan(a)
+    return np.where(valid.any(axis=0), valid.argmax(axis=0), a.shape[0])
+
+
+def _rolling_sums(a: np.ndarray, period: int, power: int = 1) -> tuple[np.ndarray, np.ndarray]:
+    """窗口内 Σx^power 与有效个数（累加和相减）"""
+    valid = ~np.isnan(a)
+    v = np.where(valid, a, 0.0) ** power
+    cs = np.cumsum(v, axis=0)
+    cn = np.cumsum(valid, axis=0)
+    s = cs.copy()
+    n = cn.copy()
+    s[period:] -= cs[:-period]
+    n[period:] -= cn[:-period]
+    return s, n
+
+
+def _center(a: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    """按列减去均值，降低累加和的舍入误差"""
+    c = np.zeros(a.shape[1])
+    has = ~np.isnan(a).all(axis=0)
+    if has.any():
+        c[has] = np.nanmean(a[:, has], axis=0)
+    return a - c, c
+
+
+# ---------------- 窗口类 ----------------
+
+def sma(x, period: int) -> np.ndarray:
+    """简单移动平均；前 period-1 个及窗口含 NaN 处为 NaN"""
+    a, sq = _as2d(x)
+    d, c = _center(a)
+    s, n = _rolling_sums(d, period)
+    out = np.where(n == period, s / period + c, np.nan)
+    out[: period - 1] = np.nan
+    return _out(out, sq)
+
+
+def rolling_std(x, period: int, ddof: int = 0) -> np.ndarray:
+    """滚动标准差（默认总体标准差，同 np.std）"""
+    a, sq = _as2d(x)
+    d, _ = _center(a)
+    s1, n = _rolling_sums(d, period)
+    s2, _ = _rolling_sums(d, period, power=2)
+    mean = s1 / period
+    var = np.maximum(s2 / period - mean * mean, 0.0) * period / max(period - ddof, 1)
+    out = np.where(n == period, np.sqrt(var), np.nan)
+    out[: period - 1] = np.nan
+    return _out(out, sq)
+
+
+def bollinger(x, period: int = 20, std_dev: float = 2.0) -> Dict[str, np.ndarray]:
+    mid = sma(x, period)
+    sd = rolling_std(x, period)
+    return {"upper": mid + std_dev * sd, "middle": mid, "lower": mid - std_dev * sd}
+
+
+def rolling_max(x, period: int) -> np.ndarray:
+    a, sq = _as2d(x)
+    out = np.full_like(a, np.nan)
+    if a.shape[0] >= period:
+        out[period - 1:] = np.lib.stride_tricks.sliding_window_view(a, period, axis=0).max(axis=-1)
+    return _out(out, sq)
+
+
+def rolling_min(x, period: int) -> np.ndarray:
+    a, sq = _as2d(x)
+    out = np.full_like(a, np.nan)
+    if a.shape[0] >= period:
+        out[period - 1:] = np.lib.stride_tricks.sliding_window_view(a, period, axis=0).min(axis=-1)
+    return _out(out, sq)
+
+
+def simple_returns(x) -> np.ndarray:
+    """逐日收益，首行为 NaN（与价格对齐）"""
+    a, sq = _as2d(x)
+    out = np.full_like(a, np.nan)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        out[1:] = a[1:] / a[:-1] - 1.0
+    return _out(out, sq)
+
+
+def volatility(x, period: int = 20, annualize: int = 252) -> np.ndarray:
+    """收益率滚动总体标准差 × √annualize；period 根收益构成一个窗口"""
+    r = simple_returns(x)
+    return rolling_std(r, period) * np.sqrt(annualize)
+
+
+def price_position(close, high=None, low=None, period: int = 20) -> np.ndarray:
+    """(close - 区间最低) / (区间最高 - 区间最低)；区间无波动时为 0.5"""
+    c, sq = _as2d(close)
+    h = c if high is None else _as2d(high)[0]
+    l = c if low is None else _as2d(low)[0]
+    hi, lo = rolling_max(h, period), rolling_min(l, period)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        pos = np.where(hi != lo, (c - lo) / (hi - lo), 0.5)
+    pos[np.isnan(hi) | np.isnan(lo)] = np.nan
+    return _out(pos, sq)
+
+
+def volume_ratio(volume, period: int = 20) -> np.ndarray:
+    """当日成交量 / 近 period 日均量；均量为 0 时为 1.0"""
+    v, sq = _as2d(volume)
+    avg = sma(v, period)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        out = np.where(avg > 0, v / avg, 1.0)
+    out[np.isnan(avg)] = np.nan
+    return _out(out, sq)
+
+
+# ---------------- 递推类 ----------------
+
+def _seeded_ema(a: np.ndarray, alpha: float, seed_idx: np.ndarray, seed_val: np.ndarray) -> np.ndarray:
+    """
+    y[t] = alpha·x[t] + (1-alpha)·y[t-1]，每列从 seed_idx 开始、y[seed_idx] = seed_val。
+    做法：seed_idx 之前输入置 0，seed_idx 处输入 seed_val/alpha（零初值下恰好得到 seed_val），
+    整块交给 lfilter 一次完成。
+    """
+    T, N = a.shape
+    rows = np.arange(T)[:, None]
+    u = np.where(rows > seed_idx[None, :], a, 0.0)
+    live = seed_idx < T
+    u[seed_idx[live], np.nonzero(live)[0]] = seed_val[live] / alpha
+    y = lfilter([alpha], [1.0, alpha - 1.0], u, axis=0)
+    y[rows < seed_idx[None, :]] = np.nan
+    return y
+
+
+def ema(x, period: int) -> np.ndarray:
+    """指数移动平均，以每列第一个有效值为初值"""
+    a, sq = _as2d(x)
+    f = _first_valid(a)
+    seed = a[np.minimum(f, a.shape[0] - 1), np.arange(a.shape[1])] if a.shape[0] else np.zeros(a.shape[1])
+    return _out(_seeded_ema(a, 2.0 / (period + 1), f, seed), sq)
+
+
+def rsi(x, period: int = 14) -> np.ndarray:
+    """Wilder RSI：前 period 个涨跌的均值起算，之后按 1/period 平滑"""
+    a, sq = _as2d(x)
+    T, N = a.shape
+    out = np.full((T, N), np.nan)
+    if T < period + 1:
+        return _out(out, sq)
+    d = np.diff(a, axis=0)
+    gains = np.where(d > 0, d, 0.0)
+    losses = np.where(d < 0, -d, 0.0)
+    gains[np.isnan(d)] = np.nan
+    losses[np.isnan(d)] = np.nan
+
+    seed_idx = _first_valid(d) + period - 1          # 涨跌序列上第一个平均值的位置
+    g0, l0 = sma(gains, period), sma(losses, period)
+    cols = np.arange(N)
+    ok = seed_idx < T - 1
+    si = np.minimum(seed_idx, T - 2)
+    avg_g = _seeded_ema(gains, 1.0 / period, np.where(ok, seed_idx, T - 1), g0[si, cols])
+    avg_l = _seeded_ema(losses, 1.0 / period, np.where(ok, seed_idx, T - 1), l0[si, cols])
+    with np.errstate(invalid="ignore", divide="ignore"):
+        r = np.where(avg_l == 0, 100.0, 100.0 - 100.0 / (1.0 + avg_g / avg_l))
+    r[np.isnan(avg_g) | np.isnan(avg_l)] = np.nan
+    out[1:] = r
+    return _out(out, sq)
+
+
+def macd(x, fast: int = 12, slow: int = 26, signal: int = 9) -> Dict[str, np.ndarray]:
+    """MACD：快慢 EMA 差；信号线从第 slow 根起以 MACD 值为初值做 EMA"""
+    a, sq = _as2d(x)
+    T, N = a.shape
+    f = _first_valid(a)
+    line = ema(a, fast) - ema(a, slow)
+    if line.ndim == 1:
+        line = line[:, None]
+    s_idx = f + slow - 1
+    cols = np.arange(N)
+    seed = line[np.minimum(s_idx, max(T - 1, 0)), cols] if T else np.zeros(N)
+    sig = _seeded_ema(line, 2.0 / (signal + 1), s_idx, seed)
+    # 有效样本不足 slow + signal 的列整列为 NaN
+    short = (T - f) < slow + signal
+    line[:, short] = np.nan
+    sig[:, short] = np.nan
+    return {"macd": _out(line, sq), "signal": _out(sig, sq), "histogram": _out(line - sig, sq)}
+
+
+# ---------------- 一次算全套 ----------------
+
+def compute_indicator_panel(close, high=None, low=None, volume=None,
+                            ma_periods=(5, 10, 20, 60), rsi_period: int = 14,
+                            vol_period: int = 20, position_period: int = 20,
+                            bb_period: int = 20, bb_std: float = 2.0) -> Dict[str, np.ndarray]:
+    """
+    全市场指标：输入 T × N（已前向填充）价格矩阵，返回同形状的各指标矩阵。
+    键：ma{p} / rsi / macd / macd_signal / macd_hist / bb_upper / bb_middle / bb_lower /
+        volatility / price_position / volume_ratio（提供 volume 时）
+    """
+    out: Dict[str, np.ndarray] = {}
+    for p in ma_periods:
+        out[f"ma{p}"] = sma(close, p)
+    out["rsi"] = rsi(close, rsi_period)
+    m = macd(close)
+    out["macd"], out["macd_signal"], out["macd_hist"] = m["macd"], m["signal"], m["histogram"]
+    bb = bollinger(close, bb_period, bb_std)
+    out["bb_upper"], out["bb_middle"], out["bb_lower"] = bb["upper"], bb["middle"], bb["lower"]
+    out["volatility"] = volatility(close, vol_period)
+    out["price_position"] = price_position(close, high, low, position_period)
+    if volume is not None:
+        out["volume_ratio"] = volume_ratio(volume, position_period)
+    return out
+
+
+def last_row(ind: Dict[str, np.ndarray], col: Optional[int] = None) -> Dict[str, Optional[float]]:
+    """取各指标最后一行（col 指定列）；NaN 记为 None"""
+    res = {}
+    for k, v in ind.items():
+        x = v[-1] if v.ndim == 1 else v[-1, col]
+        res[k] = None if np.isnan(x) else float(x)
+    return res
@@ -1,18 +1,18 @@
 # backend/factors/momentum.py
 from datetime import date, timedelta
 from sqlalchemy.orm import Session
-from backend.storage import models
+from backend.storage.price_panel import get_price_panel
+from backend.factors import indicators as ind
 import numpy as np
 import pandas as pd
 from typing import Dict, List, Optional, Any
+import logging
+
+logger = logging.getLogger(__name__)
 
 def _last_close(db: Session, symbol: str, asof: date):
-    q = (db.query(models.PriceDaily)
-           .filter(models.PriceDaily.symbol == symbol,
-                   models.PriceDaily.date <= asof)
-           .order_by(models.PriceDaily.date.desc())
-           .limit(1).all())
-    return q[0].close if q else None
+    """asof（含）之前最后一个收盘价，读自共享价格面板"""
+    return get_price_panel(db, [symbol]).last_valid("close", asof).get(symbol)
 
 def momentum_return(db: Session, symbol: str, asof: date, lookback_days: int = 60):
     c_t = _last_close(db, symbol, asof)
@@ -21,80 +21,132 @@ def momentum_return(db: Session, symbol: str, asof: date, lookback_days: int = 6
         return (c_t / c_0) - 1.0
     return None
 
+
+MOMENTUM_BUFFER_DAYS = 31
+
+
+def _closes_asof(db: Session, symbols: List[str], d: date) -> Dict[str, float]:
+    """各 symbol 在 d（含）之前最后一个非空收盘价，一条查询"""
+    from sqlalchemy import select, func, and_
+    from backend.storage.models import PriceDaily
+    t = PriceDaily.__table__
+    if not symbols:
+        return {}
+    last = (select(t.c.symbol, func.max(t.c.date).label("d"))
+            .where(t.c.symbol.in_(symbols), t.c.date <= d, t.c.close.is_not(None))
+            .group_by(t.c.symbol).subquery())
+    q = select(t.c.symbol, t.c.close).join(last, and_(t.c.symbol == last.c.symbol, t.c.date == last.c.d))
+    return {s: float(c) for s, c in db.execute(q).all()}
+
+
+def momentum_returns_batch(db: Session, symbols: List[str], asof: date,
+                           horizons=(20, 60, 252), unit: str = "days") -> pd.DataFrame:
+    """
+    全市场多周期收益：一次读取价格面板，返回 symbols × horizons 的收益矩阵（缺失为 NaN）。
+    - unit="days"：日历日回看，与 momentum_return 口径一致（asof 与 asof-h 各自取最近收盘价）；
+    - unit="bars"：按各自有效交易日回看 h 根 K 线，即 close[-1] / close[-1-h] - 1。
+    """
+    horizons = [int(h) for h in horizons]
+    syms = [s for s in dict.fromkeys(symbols) if s]
+    if unit == "days":
+        # 只扫描需要的区间；区间内找不到基准价的（长期停牌等）再精确补查
+        panel = get_price_panel(db, syms, start=asof - timedelta(days=max(horizons) + MOMENTUM_BUFFER_DAYS))
+    else:
+        panel = get_price_panel(db, syms)
+    out = np.full((len(syms), len(horizons)), np.nan)
+    cols = np.array([panel.col(s) if panel.has(s) else -1 for s in syms], dtype=np.int64)
+    ok = cols >= 0
+    ai = panel.asof_index(asof)
+    if not ok.any() or (ai < 0 and unit != "days"):
+        return pd.DataFrame(out, index=syms, columns=horizons)
+
+    close = panel.close[: ai + 1][:, cols[ok]]
+    if unit == "days":
+        if ai >= 0:
+            ff = panel.ffill("close")[: ai + 1][:, cols[ok]]
+            c_t = ff[-1].copy()
+            idx = np.array([panel.asof_index(asof - timedelta(days=h)) for h in horizons])
+            c_0 = np.where((idx >= 0)[:, None], ff[np.maximum(idx, 0)], np.nan)     # H × N
+        else:
+            c_t = np.full(int(ok.sum()), np.nan)
+            c_0 = np.full((len(horizons), int(ok.sum())), np.nan)
+        ok_syms = [s for s, o in zip(syms, ok) if o]
+        for k, d in [(-1, asof)] + [(k, asof - timedelta(days=h)) for k, h in enumerate(horizons)]:
+            vec = c_t if k < 0 else c_0[k]
+            miss = np.isnan(vec)
+            if miss.any():
+                found = _closes_asof(db, [s for s, m in zip(ok_syms, miss) if m], d)
+                for i in np.nonzero(miss)[0]:
+                    vec[i] = found.get(ok_syms[i], np.nan)
+    elif unit == "bars":
+        valid = ~np.isnan(close)
+        n_valid = valid.sum(axis=0)
+        rank = np.cumsum(valid, axis=0)                                          # 第 k 根有效 K 线所在行 rank == k
+        last_row = np.where(n_valid > 0, np.argmax(rank == n_valid, axis=0), 0)
+        c_t = np.where(n_valid > 0, close[last_row, np.arange(close.shape[1])], np.nan)
+        c_0 = np.full((len(horizons), close.shape[1]), np.nan)
+        for k, h in enumerate(horizons):
+            target = n_valid - h
+            has = target >= 1
+            row = np.argmax((rank == target[None, :]) & valid, axis=0)
+            c_0[k] = np.where(has, close[row, np.arange(close.shape[1])], np.nan)
+    else:
+        raise ValueError(f"unknown unit: {unit}")
+
+    with np.errstate(invalid="ignore", divide="ignore"):
+        ret = np.where((c_t != 0) & ~np.isnan(c_t) & (c_0 > 0), c_t / c_0 - 1.0, np.nan)
+    out[ok] = ret.T
+    return pd.DataFrame(out, index=syms, columns=horizons)
+
 # === 新增强功能（无需talib） ===
 
 def get_price_series(db: Session, symbol: str, asof: date, lookback_days: int = 252) -> pd.DataFrame:
-    """获取价格序列数据"""
+    """获取价格序列数据（[asof - lookback_days, asof]，读自共享价格面板）"""
     start_date = asof - timedelta(days=lookback_days)
-    
-    prices = db.query(models.PriceDaily).filter(
-        models.PriceDaily.symbol == symbol,
-        models.PriceDaily.date >= start_date,
-        models.PriceDaily.date <= asof
-    ).order_by(models.PriceDaily.date).all()
-    
-    if not prices:
-        return pd.DataFrame()
-    
-    data = []
-    for p in prices:
-        data.append({
-            'date': p.date,
-            'open': float(p.open),
-            'high': float(p.high),
-            'low': float(p.low),
-            'close': float(p.close),
-            'volume': float(p.volume)
-        })
-    
-    return pd.DataFrame(data)
+    return get_price_panel(db, [symbol], start_date, asof).series(symbol, start_date, asof)
 
 def calculate_sma(prices: List[float], period: int) -> List[float]:
     """计算简单移动平均线"""
-    sma = []
-    for i in range(len(prices)):
-        if i < period - 1:
-            sma.append(np.nan)
-        else:
-            sma.append(np.mean(prices[i-period+1:i+1]))
-    return sma
+    return ind.sma(prices, period).tolist()
 
 def calculate_rsi(prices: List[float], period: int = 14) -> List[float]:
     """计算RSI指标"""
-    if len(prices) < period + 1:
-        return [np.nan] * len(prices)
-    
-    deltas = np.diff(prices)
-    gains = np.where(deltas > 0, deltas, 0)
-    losses = np.where(deltas < 0, -deltas, 0)
-    
-    rsi = [np.nan] * (period)  # 前period个值为NaN
-    
-    # 初始平均值
-    avg_gain = np.mean(gains[:period])
-    avg_loss = np.mean(losses[:period])
-    
-    if avg_loss == 0:
-        rsi.append(100.0)
-    else:
-        rs = avg_gain / avg_loss
-        rsi.append(100 - (100 / (1 + rs)))
-    
-    # 后续计算
-    for i in range(period, len(gains)):
-        avg_gain = (avg_gain * (period - 1) + gains[i]) / period
-        avg_loss = (avg_loss * (period - 1) + losses[i]) / period
-        
-        if avg_loss == 0:
-            rsi.append(100.0)
-        else:
-            rs = avg_gain / avg_loss
-            rsi.append(100 - (100 / (1 + rs)))
-    
-    return rsi
+    return ind.rsi(prices, period).tolist()
+
+def _streaming_state(db: Session, symbol: str, asof: date):
+    """读取流式指标状态（只读）；不可用（回看历史、无数据、表不存在等）时返回 None，走全量重算"""
+    try:
+        from backend.factors.streaming import get_indicator_state
+        return get_indicator_state(db, symbol, asof)
+    except Exception:
+        logger.warning("流式指标状态不可用 %s，走全量重算", symbol, exc_info=True)
+        return None
+
+def _momentum_block(db: Session, symbol: str, asof: date) -> Dict[str, float]:
+    mom = momentum_returns_batch(db, [symbol], asof, (20, 60, 252)).loc[symbol]
+    momentum_1m, momentum_3m, momentum_12m = (0 if np.isnan(v) else float(v) for v in mom)
+    return {
+        'momentum_1m': momentum_1m,
+        'momentum_3m': momentum_3m,
+        'momentum_12m': momentum_12m,
+        'momentum_score': (momentum_1m * 0.5 + momentum_3m * 0.3 + momentum_12m * 0.2)
+    }
 
 def calculate_technical_indicators(db: Session, symbol: str, asof: date) -> Dict[str, float]:
-    """计算全套技术指标（纯Python实现）"""
+    """计算全套技术指标：优先读流式状态，历史回看或状态不可用时全量重算"""
+    return _technical_indicators(db, symbol, asof, _streaming_state(db, symbol, asof))
+
+def _technical_indicators(db: Session, symbol: str, asof: date, st) -> Dict[str, float]:
+    """st 为已取好的流式状态（None 表示全量重算），供 calculate_signal_strength 复用同一份状态"""
+    if st is not None:
+        indicators = st.snapshot(asof)
+        if indicators:
+            try:
+                indicators.update(_momentum_block(db, symbol, asof))
+            except Exception as e:
+                print(f"技术指标计算失败 {symbol}: {e}")
+        return indicators
+
     df = get_price_series(db, symbol, asof, lookback_days=252)
     
     if len(df) < 20:
@@ -103,66 +155,37 @@ def calculate_technical_indicators(db: Session, symbol: str, asof: date) -> Dict
     indicators = {}
     
     try:
-        close = df['close'].tolist()
-        high = df['high'].tolist()
-        low = df['low'].tolist()
-        volume = df['volume'].tolist()
-        
+        close = df['close'].to_numpy(dtype=float)
+        n = len(close)
+        # 一次算出全部序列，取最后一根
+        last = ind.last_row(ind.compute_indicator_panel(
+            close, df['high'].to_numpy(dtype=float), df['low'].to_numpy(dtype=float),
+            df['volume'].to_numpy(dtype=float)))
+
         # 移动平均线
-        if len(close) >= 5:
-            ma5 = calculate_sma(close, 5)
-            indicators['ma5'] = ma5[-1] if not np.isnan(ma5[-1]) else None
-            
-        if len(close) >= 10:
-            ma10 = calculate_sma(close, 10)
-            indicators['ma10'] = ma10[-1] if not np.isnan(ma10[-1]) else None
-            
-        if len(close) >= 20:
-            ma20 = calculate_sma(close, 20)
-            indicators['ma20'] = ma20[-1] if not np.isnan(ma20[-1]) else None
-            
-        if len(close) >= 60:
-            ma60 = calculate_sma(close, 60)
-            indicators['ma60'] = ma60[-1] if not np.isnan(ma60[-1]) else None
-        
+        for p in (5, 10, 20, 60):
+            if n >= p:
+                indicators[f'ma{p}'] = last[f'ma{p}']
+
         # RSI计算
-        if len(close) >= 15:
-            rsi_values = calculate_rsi(close, 14)
-            indicators['rsi'] = rsi_values[-1] if not np.isnan(rsi_values[-1]) else None
-        
-        # 波动率
-        if len(close) >= 20:
-            returns = [close[i]/close[i-1] - 1 for i in range(1, len(close))]
+        if n >= 15:
+            indicators['rsi'] = last['rsi']
+
+        # 波动率（整段收益率）
+        if n >= 20:
+            returns = close[1:] / close[:-1] - 1
             indicators['volatility'] = np.std(returns) * np.sqrt(252)  # 年化波动率
-        
+
         # 价格相对位置（20日内）
-        if len(close) >= 20:
-            recent_high = max(high[-20:])
-            recent_low = min(low[-20:])
-            if recent_high != recent_low:
-                indicators['price_position'] = (close[-1] - recent_low) / (recent_high - recent_low)
-            else:
-                indicators['price_position'] = 0.5
-        
+        if n >= 20:
+            indicators['price_position'] = last['price_position']
+
         # 成交量相对位置
-        if len(volume) >= 20:
-            avg_volume = np.mean(volume[-20:])
-            if avg_volume > 0:
-                indicators['volume_ratio'] = volume[-1] / avg_volume
-            else:
-                indicators['volume_ratio'] = 1.0
-        
+        if n >= 20:
+            indicators['volume_ratio'] = last['volume_ratio']
+
         # 动量因子增强
-        momentum_1m = momentum_return(db, symbol, asof, 20) or 0
-        momentum_3m = momentum_return(db, symbol, asof, 60) or 0
-        momentum_12m = momentum_return(db, symbol, asof, 252) or 0
-        
-        indicators.update({
-            'momentum_1m': momentum_1m,
-            'momentum_3m': momentum_3m,
-            'momentum_12m': momentum_12m,
-            'momentum_score': (momentum_1m * 0.5 + momentum_3m * 0.3 + momentum_12m * 0.2)
-        })
+        indicators.update(_momentum_block(db, symbol, asof))
         
     except Exception as e:
         print(f"技术指标计算失败 {symbol}: {e}")
@@ -171,84 +194,44 @@ def calculate_technical_indicators(db: Session, symbol: str, asof: date) -> Dict
 
 def calculate_macd(prices: List[float], fast: int = 12, slow: int = 26, signal: int = 9) -> Dict[str, List[float]]:
     """计算MACD指标"""
-    if len(prices) < slow + signal:
-        return {'macd': [np.nan] * len(prices), 'signal': [np.nan] * len(prices), 'histogram': [np.nan] * len(prices)}
-
-    # 计算EMA
-    def ema(data, period):
-        multiplier = 2 / (period + 1)
-        ema_values = [data[0]]  # 第一个值作为初始EMA
-        for i in range(1, len(data)):
-            ema_val = (data[i] * multiplier) + (ema_values[-1] * (1 - multiplier))
-            ema_values.append(ema_val)
-        return ema_values
-
-    ema_fast = ema(prices, fast)
-    ema_slow = ema(prices, slow)
-
-    # MACD线
-    macd = [fast_val - slow_val for fast_val, slow_val in zip(ema_fast, ema_slow)]
-
-    # 信号线
-    signal_line = ema(macd[slow - 1:], signal)  # 从slow-1开始计算信号线
-    signal_full = [np.nan] * (slow - 1) + signal_line
-
-    # 柱状图
-    histogram = []
-    for i in range(len(macd)):
-        if i < len(signal_full) and not np.isnan(signal_full[i]):
-            histogram.append(macd[i] - signal_full[i])
-        else:
-            histogram.append(np.nan)
-
-    return {
-        'macd': macd,
-        'signal': signal_full,
-        'histogram': histogram
-    }
+    res = ind.macd(prices, fast, slow, signal)
+    return {k: v.tolist() for k, v in res.items()}
 
 def calculate_bollinger_bands(prices: List[float], period: int = 20, std_dev: float = 2.0) -> Dict[str, List[float]]:
     """计算布林带"""
-    if len(prices) < period:
-        return {'upper': [np.nan] * len(prices), 'middle': [np.nan] * len(prices), 'lower': [np.nan] * len(prices)}
-
-    sma = calculate_sma(prices, period)
-    upper, lower = [], []
-
-    for i in range(len(prices)):
-        if i < period - 1:
-            upper.append(np.nan)
-            lower.append(np.nan)
-        else:
-            std = np.std(prices[i - period + 1:i + 1])
-            upper.append(sma[i] + std_dev * std)
-            lower.append(sma[i] - std_dev * std)
-
-    return {
-        'upper': upper,
-        'middle': sma,
-        'lower': lower
-    }
+    res = ind.bollinger(prices, period, std_dev)
+    return {k: v.tolist() for k, v in res.items()}
 
 def calculate_signal_strength(db: Session, symbol: str, asof: date) -> Dict[str, float]:
     """
     计算综合信号强度
     """
-    indicators = calculate_technical_indicators(db, symbol, asof)
-    df = get_price_series(db, symbol, asof, lookback_days=252)
-
-    if len(df) < 50:
-        return {}
+    st = _streaming_state(db, symbol, asof)
+    indicators = _technical_indicators(db, symbol, asof, st)
+    if st is not None:
+        if st.window_bars < 50:
+            return {}
+        current_price = st.last_close
+        macd_last = st.macd.histogram
+        bb = st.bollinger()
+        bb_last = bb if bb else {'upper': np.nan, 'lower': np.nan}
+    else:
+        df = get_price_series(db, symbol, asof, lookback_days=252)
+        if len(df) < 50:
+            return {}
+        close = df['close'].tolist()
+        current_price = close[-1]
+        macd_hist = calculate_macd(close)['histogram']
+        macd_last = macd_hist[-1] if len(macd_hist) > 0 else None
+        bb_result = calculate_bollinger_bands(close)
+        bb_last = {'upper': bb_result['upper'][-1], 'lower': bb_result['lower'][-1]}
 
     signal_strength = {}
 
     try:
-        close = df['close'].tolist()
-
         # 趋势信号强度
         ma20 = indicators.get('ma20')
         ma60 = indicators.get('ma60')
-        current_price = close[-1]
 
         trend_signals = []
         if ma20 and ma60:
@@ -282,18 +265,16 @@ def calculate_signal_strength(db: Session, symbol: str, asof: date) -> Dict[str,
             trend_signals.append(0)
 
         # 计算MACD信号
-        macd_result = calculate_macd(close)
-        macd_hist = macd_result['histogram']
-        if len(macd_hist) > 0 and not np.isnan(macd_hist[-1]):
-            if macd_hist[-1] > 0:
+        if macd_last is not None and not np.isnan(macd_last):
+            if macd_last > 0:
                 trend_signals.append(0.5)
             else:
                 trend_signals.append(-0.5)
 
         # 布林带信号
-        bb_result = calculate_bollinger_bands(close)
-        if not np.isnan(bb_result['upper'][-1]):
-            bb_position = (current_price - bb_result['lower'][-1]) / (bb_result['upper'][-1] - bb_result['lower'][-1])
+        if not np.isnan(bb_last['upper']):
+            width = bb_last['upper'] - bb_last['lower']
+            bb_position = (current_price - bb_last['lower']) / width if width else 0.5
             if bb_position > 0.8:
                 trend_signals.append(-0.3)  # 接近上轨，谨慎
             elif bb_position < 0.2:
@@ -45,21 +45,16 @@ def calculate_risk_metrics(db: Session, symbol: str, asof: date) -> Dict[str, fl
     metrics = {}
 
     try:
-        close_prices = df['close'].tolist()
-
-        # 计算收益率
-        returns = []
-        for i in range(1, len(close_prices)):
-            ret = (close_prices[i] - close_prices[i - 1]) / close_prices[i - 1]
-            returns.append(ret)
+        close_prices = df['close'].to_numpy(dtype=float)
+        returns = (close_prices[1:] - close_prices[:-1]) / close_prices[:-1]
 
         if len(returns) >= 30:
             # VaR计算
-            metrics['var_95'] = calculate_var(returns, 0.95)
-            metrics['var_99'] = calculate_var(returns, 0.99)
+            metrics['var_95'] = calculate_var(returns.tolist(), 0.95)
+            metrics['var_99'] = calculate_var(returns.tolist(), 0.99)
 
             # 最大回撤
-            drawdown_metrics = calculate_max_drawdown(close_prices)
+            drawdown_metrics = calculate_max_drawdown(close_prices.tolist())
             metrics.update(drawdown_metrics)
 
             # 波动率
@@ -1,21 +1,18 @@
-from datetime import date, timedelta, datetime
+from datetime import date, timedelta
 from sqlalchemy.orm import Session
-from backend.storage import models
+from backend.sentiment.daily import window_sentiment
 
 
 def avg_sentiment_7d(db: Session, symbol: str, asof: date, days: int = 7):
-    since = asof - timedelta(days=days)
-    # ⭐ 转换为 datetime 进行比较
-    since_dt = datetime.combine(since, datetime.min.time())
+    return avg_sentiment_batch(db, [symbol], asof, days)[symbol]
 
-    q = (db.query(models.NewsRaw, models.NewsScore)
-         .join(models.NewsScore, models.NewsScore.news_id == models.NewsRaw.id)
-         .filter(models.NewsRaw.symbol == symbol,
-                 models.NewsRaw.published_at >= since_dt)  # ⭐ 使用 datetime
-         .all())
-    if not q:
-        return None
-    vals = [s.sentiment for (_, s) in q]
-    # 映射 [-1,1] -> [0,1]
-    mean = sum(vals) / len(vals)
-    return 0.5 * (mean + 1.0)
\ No newline at end of file
+
+def avg_sentiment_batch(db: Session, symbols, asof: date, days: int = 7):
+    """
+    近 days 天情绪均值，映射 [-1,1] -> [0,1]；无新闻的 symbol 为 None。
+    读 sentiment_daily 日聚合，一次范围读取算完全部 symbol
+    （day >= asof - days 与原先 published_at >= 当日零点 口径一致）；
+    从未回填过聚合表的 symbol 先按新闻表整体回填一次。
+    """
+    res = window_sentiment(db, symbols, asof - timedelta(days=days))
+    return {s: (None if m is None else 0.5 * (m + 1.0)) for s, (m, _) in res.items()}
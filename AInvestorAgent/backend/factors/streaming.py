@@ -0,0 +1,396 @@
+# backend/factors/streaming.py
+"""
+流式技术指标状态：每来一根新 K 线 O(1) 更新，按 symbol 持久化到 indicator_state 表。
+
+- EMA / Wilder RSI / MACD：递推状态，从该 symbol 第一根 K 线起累计；
+- 均线、布林带、20 日高低点与量比：定长窗口 + Welford 滑动均值/方差；
+- 年化波动率：与 calculate_technical_indicators 相同的 252 自然日窗口（按日期淘汰）；
+- 回撤：运行中的峰值与最大回撤。
+递推类指标按全历史累计，与按 252 日窗口重算的结果只差初值衰减项（约 1e-6 相对误差）。
+历史被修正（状态回看窗口内任一已消化 K 线的 OHLCV 与价格面板不一致）或参数版本变化时，丢弃状态从价格面板整体重建。
+整体重建要逐根回放全部历史，只在入库流程（apply_new_bars）或显式 persist=True 时进行，结果写进调用方的会话，
+由调用方提交；只读路径（get_indicator_state 默认）没有可用状态时返回 None，由调用方走 252 日窗口的向量化重算。
+"""
+from __future__ import annotations
+
+import json
+import logging
+import math
+from collections import deque
+from dataclasses import dataclass, field, asdict
+from datetime import date, datetime, timedelta
+from typing import Dict, Optional
+
+import numpy as np
+from sqlalchemy.orm import Session
+
+from backend.storage.models import IndicatorState
+from backend.storage.price_panel import get_price_panel
+
+logger = logging.getLogger(__name__)
+
+STATE_VERSION = "1"
+VOL_WINDOW_DAYS = 252
+MA_PERIODS = (5, 10, 20, 60)
+
+
+# ---------------- 基础状态 ----------------
+
+@dataclass
+class EMAState:
+    period: int
+    value: Optional[float] = None
+
+    def update(self, x: float) -> Optional[float]:
+        a = 2.0 / (self.period + 1)
+        self.value = x if self.value is None else x * a + self.value * (1 - a)
+        return self.value
+
+
+@dataclass
+class WilderRSIState:
+    period: int = 14
+    prev: Optional[float] = None
+    n: int = 0                     # 已累计的涨跌个数
+    avg_gain: float = 0.0
+    avg_loss: float = 0.0
+
+    def update(self, x: float) -> None:
+        if self.prev is not None:
+            d = x - self.prev
+            g, l = (d, 0.0) if d > 0 else (0.0, -d if d < 0 else 0.0)
+            self.n += 1
+            if self.n <= self.period:   # 前 period 个取算术平均
+                self.avg_gain += (g - self.avg_gain) / self.n
+                self.avg_loss += (l - self.avg_loss) / self.n
+            else:
+                p = self.period
+                self.avg_gain = (self.avg_gain * (p - 1) + g) / p
+                self.avg_loss = (self.avg_loss * (p - 1) + l) / p
+        self.prev = x
+
+    @property
+    def value(self) -> Optional[float]:
+        if self.n < self.period:
+            return None
+        if self.avg_loss == 0:
+            return 100.0
+        return 100 - 100 / (1 + self.avg_gain / self.avg_loss)
+
+
+@dataclass
+class MACDState:
+    fast: EMAState = field(default_factory=lambda: EMAState(12))
+    slow: EMAState = field(default_factory=lambda: EMAState(26))
+    signal: EMAState = field(default_factory=lambda: EMAState(9))
+    n: int = 0
+
+    def update(self, x: float) -> None:
+        self.n += 1
+        line = self.fast.update(x) - self.slow.update(x)
+        if self.n >= self.slow.period:          # 信号线从第 slow 根起算
+            self.signal.update(line)
+
+    @property
+    def line(self) -> Optional[float]:
+        if self.fast.value is None:
+            return None
+        return self.fast.value - self.slow.value
+
+    @property
+    def histogram(self) -> Optional[float]:
+        if self.signal.value is None or self.line is None:
+            return None
+        return self.line - self.signal.value
+
+
+@dataclass
+class WelfordWindow:
+    """可增删的 Welford 均值/方差；每 refresh_every 次更新按窗口内数据精确重算一次，抑制累积误差"""
+    values: deque = field(default_factory=deque)
+    mean: float = 0.0
+    m2: float = 0.0
+    maxlen: Optional[int] = None
+    refresh_every: int = 256
+    _ops: int = 0
+
+    def _add(self, x: float) -> None:
+        n = len(self.values)
+        d = x - self.mean
+        self.mean += d / n
+        self.m2 += d * (x - self.mean)
+
+    def _remove(self, x: float) -> None:
+        n = len(self.values)
+        if n == 0:
+            self.mean, self.m2 = 0.0, 0.0
+            return
+        d = x - self.mean
+        self.mean -= d / n
+        self.m2 -= d * (x - self.mean)
+
+    def _tick(self) -> None:
+        self._ops += 1
+        if self._ops >= self.refresh_every:
+            self._ops = 0
+            arr = np.fromiter(self.values, dtype=float, count=len(self.values))
+            self.mean = float(arr.mean()) if len(arr) else 0.0
+            self.m2 = float(((arr - self.mean) ** 2).sum()) if len(arr) else 0.0
+
+    def push(self, x: float) -> None:
+        self.values.append(x)
+        self._add(x)
+        if self.maxlen is not None and len(self.values) > self.maxlen:
+            self.pop()
+        self._tick()
+
+    def pop(self) -> None:
+        """移除最早一个值"""
+        old = self.values.popleft()
+        self._remove(old)
+
+    @property
+    def count(self) -> int:
+        return len(self.values)
+
+    @property
+    def var(self) -> float:
+        """总体方差（同 np.var）"""
+        return max(self.m2, 0.0) / len(self.values) if self.values else 0.0
+
+
+@dataclass
+class DrawdownState:
+    peak: Optional[float] = None
+    max_drawdown: float = 0.0
+    current: float = 0.0
+
+    def update(self, x: float) -> None:
+        self.peak = x if self.peak is None else max(self.peak, x)
+        self.current = x / self.peak - 1.0 if self.peak else 0.0
+        self.max_drawdown = min(self.max_drawdown, self.current)
+
+
+# ---------------- 单个 symbol 的全套状态 ----------------
+
+@dataclass
+class SymbolIndicatorState:
+    symbol: str
+    last_date: Optional[date] = None
+    last_close: Optional[float] = None
+    n_bars: int = 0
+    ma: Dict[int, WelfordWindow] = field(default_factory=lambda: {p: WelfordWindow(maxlen=p) for p in MA_PERIODS})
+    highs: deque = field(default_factory=lambda: deque(maxlen=20))
+    lows: deque = field(default_factory=lambda: deque(maxlen=20))
+    vols: WelfordWindow = field(default_factory=lambda: WelfordWindow(maxlen=20))
+    rsi: WilderRSIState = field(default_factory=WilderRSIState)
+    macd: MACDState = field(default_factory=MACDState)
+    drawdown: DrawdownState = field(default_factory=DrawdownState)
+    # 252 自然日窗口：收盘价序列（日期序号, close）与其逐日收益的 Welford
+    win_closes: deque = field(default_factory=deque)
+    win_returns: WelfordWindow = field(default_factory=WelfordWindow)
+
+    def update(self, d: date, high: float, low: float, close: float, volume: float) -> None:
+        """消化一根新 K 线（日期必须晚于 last_date）"""
+        if self.last_date is not None and d <= self.last_date:
+            raise ValueError(f"{self.symbol}: 非递增日期 {d} <= {self.last_date}")
+        for w in self.ma.values():
+            w.push(close)
+        self.highs.append(high)
+        self.lows.append(low)
+        self.vols.push(volume)
+        self.rsi.update(close)
+        self.macd.update(close)
+        self.drawdown.update(close)
+        if self.win_closes:
+            self.win_returns.push(close / self.win_closes[-1][1] - 1.0)
+        self.win_closes.append((d.toordinal(), close))
+        self._evict(d)
+        self.last_date, self.last_close = d, close
+        self.n_bars += 1
+
+    def _evict(self, asof: date) -> None:
+        """移出 asof - 252 天之前的收盘价（连同以它为起点的那笔收益）"""
+        start = (asof - timedelta(days=VOL_WINDOW_DAYS)).toordinal()
+        while self.win_closes and self.win_closes[0][0] < start:
+            self.win_closes.popleft()
+            if self.win_returns.count:
+                self.win_returns.pop()
+
+    def snapshot(self, asof: Optional[date] = None) -> Dict[str, float]:
+        """按 calculate_technical_indicators 的口径输出指标（不含动量项）"""
+        if asof is not None and self.last_date is not None and asof > self.last_date:
+            self._evict(asof)
+        n = len(self.win_closes)
+        out: Dict[str, float] = {}
+        if n < 20:
+            return out
+        for p in MA_PERIODS:
+            if n >= p:
+                out[f"ma{p}"] = self.ma[p].mean
+        if n >= 15 and self.rsi.value is not None:
+            out["rsi"] = self.rsi.value
+        out["volatility"] = math.sqrt(self.win_returns.var) * math.sqrt(252)
+        hi, lo = max(self.highs), min(self.lows)
+        out["price_position"] = (self.last_close - lo) / (hi - lo) if hi != lo else 0.5
+        avg_v = self.vols.mean
+        out["volume_ratio"] = self.vols.values[-1] / avg_v if avg_v > 0 else 1.0
+        return out
+
+    def bollinger(self, std_dev: float = 2.0) -> Optional[Dict[str, float]]:
+        w = self.ma[20]
+        if w.count < 20:
+            return None
+        sd = math.sqrt(w.var)
+        return {"upper": w.mean + std_dev * sd, "middle": w.mean, "lower": w.mean - std_dev * sd}
+
+    @property
+    def window_bars(self) -> int:
+        return len(self.win_closes)
+
+    # ---- 序列化 ----
+    def to_json(self) -> str:
+        def ww(w: WelfordWindow):
+            return {"values": list(w.values), "mean": w.mean, "m2": w.m2, "maxlen": w.maxlen, "ops": w._ops}
+        return json.dumps({
+            "symbol": self.symbol,
+            "last_date": self.last_date.isoformat() if self.last_date else None,
+            "last_close": self.last_close,
+            "n_bars": self.n_bars,
+            "ma": {str(p): ww(w) for p, w in self.ma.items()},
+            "highs": list(self.highs), "lows": list(self.lows), "vols": ww(self.vols),
+            "rsi": asdict(self.rsi),
+            "macd": {"fast": self.macd.fast.value, "slow": self.macd.slow.value,
+                     "signal": self.macd.signal.value, "n": self.macd.n},
+            "drawdown": asdict(self.drawdown),
+            "win_closes": list(self.win_closes), "win_returns": ww(self.win_returns),
+        })
+
+    @classmethod
+    def from_json(cls, text: str) -> "SymbolIndicatorState":
+        o = json.loads(text)
+
+        def ww(d):
+            w = WelfordWindow(deque(d["values"]), d["mean"], d["m2"], d["maxlen"])
+            w._ops = d.get("ops", 0)
+            return w
+        st = cls(o["symbol"])
+        st.last_date = date.fromisoformat(o["last_date"]) if o["last_date"] else None
+        st.last_close, st.n_bars = o["last_close"], o["n_bars"]
+        st.ma = {int(p): ww(w) for p, w in o["ma"].items()}
+        st.highs, st.lows = deque(o["highs"], maxlen=20), deque(o["lows"], maxlen=20)
+        st.vols = ww(o["vols"])
+        st.rsi = WilderRSIState(**o["rsi"])
+        m = o["macd"]
+        st.macd = MACDState(EMAState(12, m["fast"]), EMAState(26, m["slow"]), EMAState(9, m["signal"]), m["n"])
+        st.drawdown = DrawdownState(**o["drawdown"])
+        st.win_closes = deque(tuple(x) for x in o["win_closes"])
+        st.win_returns = ww(o["win_returns"])
+        return st
+
+
+# ---------------- 与价格面板 / 数据库衔接 ----------------
+
+def _feed(st: SymbolIndicatorState, panel, symbol: str, after: Optional[date] = None) -> int:
+    """把面板中 after 之后的有效 K 线依次喂给状态，返回喂入根数"""
+    j = panel.col(symbol)
+    if j is None:
+        return 0
+    i0 = 0 if after is None else int(np.searchsorted(panel.dates, np.datetime64(after, "D"), side="right"))
+    close = panel.close[i0:, j]
+    high, low, vol = panel["high"][i0:, j], panel["low"][i0:, j], panel["volume"][i0:, j]
+    k = 0
+    for t in np.nonzero(~np.isnan(close))[0]:
+        st.update(panel.dates[i0 + t].item(), float(high[t]), float(low[t]), float(close[t]), float(vol[t]))
+        k += 1
+    return k
+
+
+def _load(db: Session, symbol: str) -> Optional[SymbolIndicatorState]:
+    row = db.get(IndicatorState, symbol)
+    if row is None or row.version != STATE_VERSION:
+        return None
+    try:
+        return SymbolIndicatorState.from_json(row.payload)
+    except Exception:
+        logger.warning("[streaming] 状态解析失败 %s，将整体重建", symbol, exc_info=True)
+        return None
+
+
+def _save(db: Session, st: SymbolIndicatorState) -> None:
+    """写进调用方的会话（merge 后 flush，同一会话内多次保存不会重复插入），由调用方提交"""
+    db.merge(IndicatorState(symbol=st.symbol, last_date=st.last_date, version=STATE_VERSION,
+                            payload=st.to_json(), updated_at=datetime.utcnow()))
+    db.flush()
+
+
+def _restated(st: SymbolIndicatorState, panel, symbol: str) -> bool:
+    """
+    状态回看窗口与价格面板逐项核对：窗口内每个已消化日期的收盘价，以及最近 20 根的高 / 低 / 量
+    （均线、布林带、价格位置、量比都只依赖这些）。任一日期缺失或数值变化即视为历史被修正。
+    """
+    j = panel.col(symbol)
+    if j is None or st.last_date is None or not st.win_closes:
+        return True
+    days = np.array([np.datetime64(date.fromordinal(int(o)), "D") for o, _ in st.win_closes])
+    i = np.searchsorted(panel.dates, days)
+    if (i >= len(panel.dates)).any() or (panel.dates[np.minimum(i, len(panel.dates) - 1)] != days).any():
+        return True
+    if not np.array_equal(panel.close[i, j], np.array([c for _, c in st.win_closes], dtype=float)):
+        return True
+    k = min(len(st.highs), len(i))
+    tail = i[-k:] if k else i[:0]
+    for name, seen in (("high", st.highs), ("low", st.lows), ("volume", st.vols.values)):
+        want = np.array(list(seen)[-k:] if k else [], dtype=float)
+        if not np.array_equal(panel[name][tail, j], want, equal_nan=True):
+            return True
+    return False
+
+
+def _rebuild(db: Session, symbol: str, asof: Optional[date] = None) -> Optional[SymbolIndicatorState]:
+    """从全部历史整体重建状态并 merge 进 db（调用方负责提交）"""
+    st = SymbolIndicatorState(symbol)
+    if not _feed(st, get_price_panel(db, [symbol]).slice(end=asof), symbol):
+        return None
+    _save(db, st)
+    return st
+
+
+def get_indicator_state(db: Session, symbol: str, asof: Optional[date] = None,
+                        persist: bool = False) -> Optional[SymbolIndicatorState]:
+    """
+    取 symbol 在 asof 的指标状态：有状态则只读回看窗口内的价格、在内存中追加新 K 线。
+    默认无副作用：无状态 / 历史被修正时返回 None，由调用方走全量重算；
+    persist=True 时整体重建（或把推进后的状态）merge 进 db（调用方负责提交）。
+    asof 早于状态最后日期（回看历史）时返回 None。
+    """
+    st = _load(db, symbol)
+    if st is None or not st.win_closes:
+        return _rebuild(db, symbol, asof) if persist else None
+    if asof is not None and st.last_date is not None and asof < st.last_date:
+        return None
+    panel = get_price_panel(db, [symbol], start=date.fromordinal(int(st.win_closes[0][0])))
+    if _restated(st, panel, symbol):
+        return _rebuild(db, symbol, asof) if persist else None
+
+    sub = panel.slice(end=asof) if asof is not None else panel
+    if _feed(st, sub, symbol, after=st.last_date) and persist:
+        _save(db, st)
+    return st
+
+
+def apply_new_bars(db: Session, symbol: str, restated: bool = False) -> Optional[SymbolIndicatorState]:
+    """
+    日线入库后调用（与入库同一会话，随调用方提交）：
+    - 无状态 / restated=True（已有日期被改写）/ 窗口核对不一致：整体重建，读路径因此不必回放全部历史；
+    - 否则把新增 K 线追加进状态。
+    """
+    st = None if restated else _load(db, symbol)
+    if st is None or not st.win_closes:
+        return _rebuild(db, symbol)
+    panel = get_price_panel(db, [symbol], start=date.fromordinal(int(st.win_closes[0][0])))
+    if _restated(st, panel, symbol):
+        return _rebuild(db, symbol)
+    _feed(st, panel, symbol, after=st.last_date)
+    _save(db, st)
+    return st
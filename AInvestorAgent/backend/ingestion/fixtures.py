@@ -4,6 +4,10 @@ import os, sqlite3, random, math, csv
 from dataclasses import dataclass, asdict
 from datetime import datetime, timedelta
 from typing import List, Dict, Tuple, Optional
+from sqlalchemy import create_engine
+from sqlalchemy.orm import Session
+from ..sentiment.daily import rebuild_sentiment_daily
+from ..storage.price_panel import invalidate_price_panel
 
 DB_PATH = os.environ.get("AINVESTOR_DB", "db/stock.sqlite")
 EXPORT_DIR = "db/exports"
@@ -82,6 +86,15 @@ SCHEMA = {
         id INTEGER PRIMARY KEY AUTOINCREMENT,
         news_id INTEGER, sentiment REAL, topic TEXT,
         FOREIGN KEY(news_id) REFERENCES news_raw(id)
+    )""",
+    "sentiment_daily": """
+    CREATE TABLE IF NOT EXISTS sentiment_daily(
+        symbol TEXT, day TEXT, sum_sent REAL NOT NULL DEFAULT 0, n INTEGER NOT NULL DEFAULT 0,
+        updated_at TEXT, PRIMARY KEY(symbol, day)
+    )""",
+    "sentiment_daily_coverage": """
+    CREATE TABLE IF NOT EXISTS sentiment_daily_coverage(
+        symbol TEXT PRIMARY KEY, rebuilt_at TEXT
     )"""
 }
 
@@ -115,6 +128,7 @@ def upsert_prices(conn: sqlite3.Connection, rows: List[PriceRow]):
     sql = """INSERT OR REPLACE INTO prices_daily(symbol,date,open,high,low,close,adjusted_close,volume)
              VALUES(?,?,?,?,?,?,?,?)"""
     conn.executemany(sql, [(r.symbol,r.date,r.open,r.high,r.low,r.close,r.adj_close,r.volume) for r in rows])
+    invalidate_price_panel({r.symbol for r in rows})
 
 def insert_news(conn: sqlite3.Connection, rows: List[NewsRawRow]) -> List[int]:
     sql = """INSERT INTO news_raw(symbol,title,summary,url,source,published_at) VALUES(?,?,?,?,?,?)"""
@@ -129,6 +143,17 @@ def insert_news_scores(conn: sqlite3.Connection, rows: List[NewsScoreRow]):
     sql = """INSERT INTO news_scores(news_id,sentiment,topic) VALUES(?,?,?)"""
     conn.executemany(sql, [(r.news_id, r.sentiment, r.topic) for r in rows])
 
+def rebuild_sentiment(db_path: str, symbols: List[str]) -> int:
+    """打分直接写进了 news_scores：提交后由新闻表重建这些 symbol 的 sentiment_daily 日聚合"""
+    eng = create_engine(f"sqlite:///{db_path}", future=True)
+    try:
+        with Session(eng) as db:
+            n = rebuild_sentiment_daily(db, symbols)
+            db.commit()
+    finally:
+        eng.dispose()
+    return n
+
 def export_csv(table: str, conn: sqlite3.Connection, where: str = "", params: Tuple = ()):
     os.makedirs(EXPORT_DIR, exist_ok=True)
     sql = f"SELECT * FROM {table} " + (f"WHERE {where}" if where else "")
@@ -294,6 +319,7 @@ def make_fixtures(symbols: List[SymbolRow],
     upsert_prices(conn, price_rows)
     insert_news_scores(conn, news_scores_rows)
     conn.commit()
+    rebuild_sentiment(DB_PATH, [r.symbol for r in symbols])
 
     # 3) 导出 CSV（便于审查 / 可视化联调）
     exported = {}
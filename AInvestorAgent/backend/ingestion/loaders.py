@@ -1,21 +1,43 @@
 # backend/ingestion/loaders.py
 from __future__ import annotations
+import logging
 from datetime import datetime, date
 from sqlalchemy import select
-from sqlalchemy.dialects.sqlite import insert
 from sqlalchemy.orm import Session
 from ..ingestion.alpha_vantage_client import AlphaVantageClient
 from ..storage.models import PriceDaily, Symbol
 from sqlalchemy.orm import Session
 from .alpha_vantage_client import av_daily_raw, normalize_daily
-from ..storage.dao import upsert_prices_daily
+from ..storage.dao import bulk_upsert_prices_daily, UpsertStats
+
+logger = logging.getLogger(__name__)
 
 
 
 def load_daily_from_alpha(db: Session, symbol: str, adjusted: bool = True, outputsize: str = "compact") -> int:
+    """拉取日线并批量 upsert；返回处理的行数（含内容未变化的行，口径同旧版）"""
+    return load_daily_stats_from_alpha(db, symbol, adjusted=adjusted, outputsize=outputsize).total
+
+
+def load_daily_stats_from_alpha(db: Session, symbol: str, adjusted: bool = True,
+                                outputsize: str = "compact") -> UpsertStats:
+    """同 load_daily_from_alpha，返回新增 / 改写 / 未变化的分项统计"""
     raw = av_daily_raw(symbol, adjusted=adjusted, outputsize=outputsize)
     rows = normalize_daily(raw, symbol)
-    return upsert_prices_daily(db, rows)
+    stats = bulk_upsert_prices_daily(db, rows)
+    _refresh_indicator_state(db, symbol, stats)
+    return stats
+
+
+def _refresh_indicator_state(db: Session, symbol: str, stats: UpsertStats) -> None:
+    """入库后推进流式指标状态；已有日期被改写时整体重建"""
+    if not stats.written:
+        return
+    try:
+        from ..factors.streaming import apply_new_bars
+        apply_new_bars(db, symbol, restated=stats.updated > 0)
+    except Exception:
+        logger.warning("%s: 指标状态更新失败", symbol, exc_info=True)
 
 def _parse_float(s: str | None) -> float | None:
     try:
@@ -36,40 +58,26 @@ def sync_prices_daily(symbol: str, session: Session) -> int:
     if not session.scalars(select(Symbol).where(Symbol.symbol == symbol)).first():
         session.add(Symbol(symbol=symbol))
 
-    upsert_count = 0
+    rows = []
     for ds, row in series.items():
-        d = datetime.strptime(ds, "%Y-%m-%d").date()
-        stmt = insert(PriceDaily).values(
-            symbol=symbol,
-            date=d,
-            open=_parse_float(row.get("1. open")),
-            high=_parse_float(row.get("2. high")),
-            low=_parse_float(row.get("3. low")),
-            close=_parse_float(row.get("4. close")),
-            adjusted_close=_parse_float(row.get("5. adjusted close")),  # 🆕 添加
-            volume=int(float(row.get("6. volume"))) if row.get("6. volume") else None,
-            dividend_amount=_parse_float(row.get("7. dividend amount")),  # 🆕 添加
-            split_coefficient=_parse_float(row.get("8. split coefficient")),  # 🆕 添加
-        )
-        # SQLite UPSERT
-        stmt = stmt.on_conflict_do_update(
-            index_elements=[PriceDaily.symbol, PriceDaily.date],
-            set_={
-                "open": stmt.excluded.open,
-                "high": stmt.excluded.high,
-                "low": stmt.excluded.low,
-                "close": stmt.excluded.close,
-                "adjusted_close": stmt.excluded.adjusted_close,  # 🆕 添加
-                "volume": stmt.excluded.volume,
-                "dividend_amount": stmt.excluded.dividend_amount,  # 🆕 添加
-                "split_coefficient": stmt.excluded.split_coefficient,  # 🆕 添加
-            }
-        )
-        session.execute(stmt)
-        upsert_count += 1
+        rows.append({
+            "symbol": symbol,
+            "date": datetime.strptime(ds, "%Y-%m-%d").date(),
+            "open": _parse_float(row.get("1. open")),
+            "high": _parse_float(row.get("2. high")),
+            "low": _parse_float(row.get("3. low")),
+            "close": _parse_float(row.get("4. close")),
+            "adjusted_close": _parse_float(row.get("5. adjusted close")),
+            "volume": int(float(row.get("6. volume"))) if row.get("6. volume") else None,
+            "dividend_amount": _parse_float(row.get("7. dividend amount")),
+            "split_coefficient": _parse_float(row.get("8. split coefficient")),
+        })
+    # 批量 UPSERT：每批一条语句，内容未变化的行不改写
+    stats = bulk_upsert_prices_daily(session, rows)
+    _refresh_indicator_state(session, symbol, stats)
 
     session.commit()
-    return upsert_count
+    return stats.total
 
 def get_prices_range(symbol: str, range_key: str, session: Session) -> list[dict]:
     """返回指定区间的价格序列(按日期升序)。"""
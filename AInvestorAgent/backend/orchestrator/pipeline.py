@@ -181,7 +181,7 @@ def detect_market_regime(db_session, benchmark_symbol: str = "SPY") -> str:
     检测当前市场环境
     返回: "bull", "bear", "volatile", "normal"
     """
-    from backend.factors.momentum import get_price_series
+    from backend.factors.momentum import get_price_series, momentum_returns_batch
     from datetime import date
     import numpy as np
 
@@ -192,13 +192,14 @@ def detect_market_regime(db_session, benchmark_symbol: str = "SPY") -> str:
         if len(df) < 60:
             return "normal"
 
-        prices = df['close'].tolist()
-        returns = [(prices[i] - prices[i - 1]) / prices[i - 1] for i in range(1, len(prices))]
+        prices = df['close'].to_numpy(dtype=float)
+        returns = prices[1:] / prices[:-1] - 1.0
 
-        # 计算指标
-        recent_return = (prices[-1] / prices[-60]) - 1  # 近60天收益
+        # 计算指标：prices[-60] / prices[-20] 即回看 59 / 19 根 K 线
+        rets = momentum_returns_batch(db_session, [benchmark_symbol], asof, (59, 19), unit="bars")
+        recent_return = float(rets.at[benchmark_symbol, 59])  # 近60天收益
         volatility = np.std(returns) * np.sqrt(252)  # 年化波动率
-        trend_strength = (prices[-1] / prices[-20]) - 1  # 近20天趋势
+        trend_strength = float(rets.at[benchmark_symbol, 19])  # 近20天趋势
 
         # 市场环境判断
         if recent_return > 0.15 and trend_strength > 0.05:
@@ -326,7 +327,10 @@ def run_factor_validation_pipeline(symbols: List[str],
                 "rating": rating,
                 "ic_mean": ic_mean,
                 "ic_ir": ic_ir,
-                "positive_rate": positive_rate
+                "positive_rate": positive_rate,
+                "rank_ic_mean": metrics.get('rank_ic_mean', 0.0),
+                "quantile_spread": metrics.get('quantile_spread', 0.0),
+                "decay": metrics.get('decay', {})
             }
 
         return {
@@ -1,10 +1,12 @@
 # backend/portfolio/allocator.py
 from __future__ import annotations
+from dataclasses import dataclass
 from typing import Dict, Iterable, List, Tuple
 from sqlalchemy import select, func
 from sqlalchemy.orm import Session
 from backend.storage.models import ScoreDaily
 from .constraints import Constraints, default_constraints
+from .projection import project_capped_simplex
 from .explain import load_symbol_sectors, build_reasons_from_scores, sector_concentration
 
 
@@ -13,6 +15,17 @@ class Holding(dict):
     pass
 
 
+@dataclass
+class ScoreRow:
+    """直接给出分数时的候选行（字段同 ScoreDaily 中分配用到的部分，无因子明细时记 0）"""
+    symbol: str
+    score: float
+    f_value: float = 0.0
+    f_quality: float = 0.0
+    f_momentum: float = 0.0
+    f_sentiment: float = 0.0
+
+
 def _latest_scores_for(db: Session, symbols: Iterable[str]) -> List[ScoreDaily]:
     syms = [s.upper() for s in symbols]
     if not syms:
@@ -68,128 +81,50 @@ def _weights_from_scores(rows: List[ScoreDaily]) -> Dict[str, float]:
     return w
 
 
-def _cap_single(w: Dict[str, float], cap: float) -> Dict[str, float]:
-    """单票上限约束，迭代收敛"""
-    for iteration in range(10):  # 增加迭代次数
-        overflow = 0.0
-        capped = []
-        under = []
-
-        for s, v in w.items():
-            if v > cap + 1e-9:  # 加容差
-                overflow += v - cap
-                w[s] = cap
-                capped.append(s)
-            else:
-                under.append(s)
-
-        if not capped or not under:  # 没有需要调整的，或没有承接方
-            break
-
-        # 溢出部分按未触顶股票的权重比例重新分配
-        denom = sum(w[s] for s in under)
-        if denom > 1e-9:
-            for s in under:
-                w[s] += overflow * (w[s] / denom)
-
-    # 最终归一化
-    total = sum(w.values())
-    if total > 1e-9:
-        w = {k: v / total for k, v in w.items()}
-
-    # 🔍 调试输出
-    print(f"[_cap_single] 迭代{iteration + 1}次后，最大权重: {max(w.values()):.4f}")
-
-    return w
-
-
-def _cap_sector(w: Dict[str, float], sectors: Dict[str, str], cap: float, single_cap: float) -> Dict[str, float]:
-    """行业上限约束，同时遵守单票上限"""
-    if cap >= 1.0:
-        return w
-
-    for iteration in range(20):
-        sector_weight: Dict[str, float] = {}
-        for sym, weight in w.items():
-            sect = sectors.get(sym, "Unknown")
-            sector_weight[sect] = sector_weight.get(sect, 0.0) + weight
-
-        violating = [s for s, wt in sector_weight.items() if wt > cap + 1e-9]
-        if not violating:
-            break
-
-        for sect in violating:
-            overflow = sector_weight[sect] - cap
-            if overflow <= 1e-9:
-                continue
-
-            # 该行业内股票按比例缩减
-            sect_stocks = [sym for sym in w if sectors.get(sym, "Unknown") == sect]
-            sect_total = sum(w[s] for s in sect_stocks)
-
-            if sect_total > 1e-9:
-                for sym in sect_stocks:
-                    reduction = w[sym] * (overflow / sect_total)
-                    w[sym] -= reduction
-
-            # 尝试分配溢出，但不能让接收方超过single_cap
-            other_stocks = [sym for sym in w if sectors.get(sym, "Unknown") != sect]
-
-            # 计算每只股票还能接收多少
-            capacity = {}
-            total_capacity = 0.0
-            for sym in other_stocks:
-                available = max(0, single_cap - w[sym] - 1e-9)
-                capacity[sym] = available
-                total_capacity += available
-
-            if total_capacity > 1e-9:
-                # 按剩余容量比例分配
-                for sym in other_stocks:
-                    if capacity[sym] > 0:
-                        share = min(overflow * (capacity[sym] / total_capacity), capacity[sym])
-                        w[sym] += share
-            else:
-                # 🔥 关键：如果无法分配溢出，说明单票约束和行业约束冲突
-                # 此时优先满足单票约束，放弃行业约束
-                print(f"    ⚠️  {sect}行业溢出{overflow:.4f}无法分配（单票限制冲突）")
-                print(f"    → 保持当前分配，放弃行业{cap:.0%}约束")
-                break  # 退出内层循环
-        else:
-            # 如果所有违规行业都处理完了，继续下一轮
-            continue
-
-        # 如果遇到冲突，退出外层循环
-        break
-
-    # 归一化
-    total = sum(w.values())
-    if total > 1e-9:
-        w = {k: v / total for k, v in w.items()}
-
-    # 最终验证
-    final_sector = {}
-    for sym, weight in w.items():
-        sect = sectors.get(sym, "Unknown")
-        final_sector[sect] = final_sector.get(sect, 0.0) + weight
-
-    print(f"[_cap_sector] 最终行业分布: {final_sector}")
-
-    # 检查单票是否超限（这是最重要的）
-    max_single = max(w.values()) if w else 0
-    if max_single > single_cap + 1e-6:
-        print(f"❌ 错误: 单票权重{max_single:.4f} > 上限{single_cap}")
-    else:
-        print(f"✅ 单票约束满足: 最大权重{max_single:.4f}")
+def _apply_caps(w: Dict[str, float], sectors: Dict[str, str], c: Constraints) -> Dict[str, float]:
+    """
+    单票 / 行业上限：求离分数比例权重最近、且同时满足两类上限的权重（排序 water-filling，精确解，见 projection.py）。
+    约束本身不可行时（如候选太少、全在同一行业）按最小幅度放宽上限并提示，不再静默突破。
+    """
+    syms = list(w)
+    res = project_capped_simplex([w[s] for s in syms], c.max_single,
+                                 [sectors.get(s, "Unknown") for s in syms], c.max_sector)
+    if not res.feasible:
+        print(f"⚠️ 约束不可行（{len(syms)} 只 / 单票≤{c.max_single:.0%} / 行业≤{c.max_sector:.0%}），"
+              f"放宽为单票≤{res.max_single:.0%}、行业≤{max(res.max_sector.values()):.0%}")
+    return {s: float(v) for s, v in zip(syms, res.weights)}
+
+
+def allocate_from_scores(
+        scores: Dict[str, float],
+        sectors: Dict[str, str],
+        constraints: Constraints | None = None,
+) -> List[Holding]:
+    """
+    纯内存分配：按分数截断持仓、按分数比例给权重，再投影到单票 / 行业上限内。
+    与 propose_portfolio 的权重口径一致，但不读写 scores_daily，供回测逐期调用。
+    """
+    c = constraints or default_constraints()
+    rows = sorted(
+        (ScoreRow(s.upper(), float(v)) for s, v in scores.items() if v > 0),
+        key=lambda r: r.score, reverse=True,
+    )
+    rows = _truncate_positions(rows, c)
+    if not rows:
+        return []
 
-    return w
+    w = _apply_caps(_weights_from_scores(rows), sectors, c)
+    return [Holding(symbol=r.symbol, weight=float(w.get(r.symbol, 0.0)), score=r.score,
+                    sector=sectors.get(r.symbol, "Unknown"), reasons=build_reasons_from_scores(r))
+            for r in rows]
 
 
 def propose_portfolio(
         db: Session,
         symbols: Iterable[str],
         constraints: Constraints | None = None,
-        scores_dict: Dict[str, float] | None = None
+        scores_dict: Dict[str, float] | None = None,
+        scheme: str = "score",
 ) -> Tuple[List[Holding], List[Tuple[str, float]]]:
     """
     生成投资组合建议
@@ -199,6 +134,7 @@ def propose_portfolio(
         symbols: 候选股票列表
         constraints: 约束条件（可选，默认使用 default_constraints）
         scores_dict: 直接提供评分字典（可选，用于测试）
+        scheme: 权重方案 score（按分数比例，默认）| min_variance | risk_parity | max_sharpe（见 optimizer.py）
 
     Returns:
         (holdings, sector_concentration)
@@ -209,14 +145,7 @@ def propose_portfolio(
 
     # 1. 获取候选股票及评分
     if scores_dict:
-        rows = [
-            type('ScoreRow', (), {
-                'symbol': s,
-                'score': scores_dict[s],
-                'f_value': 0, 'f_quality': 0, 'f_momentum': 0, 'f_sentiment': 0
-            })()
-            for s in symbols if s in scores_dict and scores_dict[s] > 0
-        ]
+        rows = [ScoreRow(s, scores_dict[s]) for s in symbols if s in scores_dict and scores_dict[s] > 0]
     else:
         rows = [r for r in _latest_scores_for(db, symbols) if (r.score or 0) > 0]
 
@@ -241,23 +170,28 @@ def propose_portfolio(
     for sym in sorted(w.keys(), key=lambda s: w[s], reverse=True)[:3]:
         print(f"  {sym}: {w[sym]:.4f}")
 
-    # 5. 应用单票上限约束
-    w = _cap_single(w, c.max_single)
-    print(f"[allocator] 单票上限({c.max_single})后:")
-    max_weight = max(w.values())
-    print(f"  最大权重: {max_weight:.4f}")
-
-    # 6. 应用行业上限约束
-    w = _cap_sector(w, sectors, c.max_sector, c.max_single)
-    print(f"[allocator] 行业上限({c.max_sector})后(最终):")
+    # 5. 单票 / 行业上限（一次精确投影）；协方差方案在同样的约束下求解，价格数据不足时回落到分数权重
+    opt = None
+    if scheme != "score":
+        from .optimizer import optimize_portfolio
+        try:
+            opt = optimize_portfolio(db, list(w), scheme, c, sectors,
+                                     scores={r.symbol.upper(): float(r.score or 0.0) for r in rows})
+            print(f"[allocator] {scheme}: 预期年化波动 {opt.exp_vol:.2%}，收缩强度 {opt.shrinkage:.2f}")
+        except ValueError as e:
+            print(f"⚠️ {scheme} 优化失败，改用分数权重: {e}")
+    w = opt.weights if opt is not None else _apply_caps(w, sectors, c)
+    print(f"[allocator] 单票上限({c.max_single}) / 行业上限({c.max_sector})后(最终):")
     for sym in sorted(w.keys(), key=lambda s: w[s], reverse=True)[:3]:
         print(f"  {sym}: {w[sym]:.4f}")
     print("=" * 50)
 
-    # 7. 构建返回结果
+    # 6. 构建返回结果（优化器解出零权重的股票不进入持仓，也不随快照保存）
     holdings: List[Holding] = []
     for r in rows:
         sym = r.symbol.upper()
+        if w.get(sym, 0.0) <= 0.0:
+            continue
         holdings.append(Holding(
             symbol=sym,
             weight=float(w.get(sym, 0.0)),
@@ -266,7 +200,7 @@ def propose_portfolio(
             reasons=build_reasons_from_scores(r),
         ))
 
-    # 8. 计算行业集中度
+    # 7. 计算行业集中度
     sector_pairs = sector_concentration((h["sector"], h["weight"]) for h in holdings)
 
     return holdings, sector_pairs
\ No newline at end of file
@@ -0,0 +1,235 @@
+# backend/portfolio/optimizer.py
+"""
+基于协方差的组合优化：最小方差 / 等风险贡献（ERC）/ 最大夏普，均在现有 Constraints（单票、行业上限）下求解。
+
+- 协方差：风险服务中按日期对齐的日收益做 Ledoit-Wolf 收缩估计（目标为 tr(S)/N · I），年化；
+  收益矩阵与收缩结果随风险矩阵缓存（backend/services/risk.py），价格写入时失效；
+- 求解：加速投影梯度（FISTA，回溯步长 + 重启），投影即 projection.project_capped_simplex（精确、O(n log n)），
+  ERC 先用阻尼牛顿解无约束问题作起点，再在上限内用同一投影梯度逼近目标风险预算；均为 NumPy 向量运算，不依赖外部求解器；
+- 持仓数：解中非零权重少于 min(min_positions, 候选数) 时视为不可行并抛 ValueError（propose_portfolio 回落到分数权重）；
+- 最大夏普的预期收益默认取 μ_i = σ_i × score_i / 100（分数越高、单位风险回报越高）；rf=0 时夏普对 μ 的整体缩放不变，
+  因此无需额外标定常数。
+"""
+from __future__ import annotations
+
+from dataclasses import dataclass, field
+from datetime import date
+from typing import Callable, Dict, List, Mapping, Optional, Sequence
+
+import numpy as np
+from sqlalchemy.orm import Session
+
+from backend.services.risk import PERIODS, get_risk_matrix, ledoit_wolf  # noqa: F401
+from .constraints import Constraints
+from .projection import project_capped_simplex
+
+SCHEMES = ("score", "min_variance", "risk_parity", "max_sharpe")
+
+
+@dataclass
+class CovEstimate:
+    symbols: List[str]
+    cov: np.ndarray            # 年化协方差 N×N
+    mean: np.ndarray           # 年化历史平均收益
+    shrinkage: float           # Ledoit-Wolf 收缩强度 δ ∈ [0, 1]
+    n_obs: int
+    missing: List[str] = field(default_factory=list)   # 数据不足：用中位方差、零相关补齐
+
+    @property
+    def vol(self) -> np.ndarray:
+        return np.sqrt(np.diag(self.cov))
+
+
+@dataclass
+class OptimizationResult:
+    scheme: str
+    weights: Dict[str, float]
+    risk_contrib: Dict[str, float]     # 各股票对组合方差的贡献占比
+    exp_vol: float                     # 年化预期波动
+    shrinkage: float
+    feasible: bool                     # 约束是否可行（不可行时已按最小幅度放宽）
+    iterations: int
+
+
+# ---------------- 协方差 ----------------
+
+def estimate_covariance(db: Session, symbols: Sequence[str], asof: Optional[date] = None,
+                        lookback: int = 252, min_obs: int = 60) -> CovEstimate:
+    """
+    取 asof（缺省为这些股票的最新价格日）之前 lookback 个交易日的复权收盘价估计年化协方差。
+    对齐后的收益矩阵与收缩估计来自风险服务的缓存（backend.services.risk.get_risk_matrix）。
+    有效收益少于 min_obs 天的股票记入 missing，方差取其余股票的中位数、与其它股票零相关。
+    """
+    syms = [s.upper() for s in dict.fromkeys(symbols) if s]
+    rm = get_risk_matrix(db, syms, asof, lookback, min_obs=min_obs)
+    cov_u, delta = rm.shrunk
+    mean_u = rm.returns.mean(axis=0)
+
+    n = len(syms)
+    cov = np.diag(np.full(n, np.median(np.diag(cov_u))))
+    mean = np.zeros(n)
+    col = {s: j for j, s in enumerate(rm.symbols)}
+    pos = [i for i, s in enumerate(syms) if s in col]
+    src = [col[syms[i]] for i in pos]
+    cov[np.ix_(pos, pos)] = cov_u[np.ix_(src, src)]
+    mean[pos] = mean_u[src]
+    return CovEstimate(symbols=syms, cov=cov * PERIODS, mean=mean * PERIODS, shrinkage=delta,
+                       n_obs=int(len(rm.returns)), missing=[s for s in syms if s not in col])
+
+
+# ---------------- 求解器 ----------------
+
+def projected_gradient(f: Callable[[np.ndarray], float], grad: Callable[[np.ndarray], np.ndarray],
+                       x0: np.ndarray, project: Callable[[np.ndarray], np.ndarray],
+                       max_iter: int = 3000, tol: float = 1e-9) -> tuple[np.ndarray, int]:
+    """
+    加速投影梯度（FISTA）：外推点 z 上回溯步长，满足 f(y) ≤ f(z) + g·d + |d|²/(2t)；
+    目标值上升时重启动量（保证单调），步长每步尝试放大；位移 < tol 或无动量也无法下降时停止。返回 (解, 迭代次数)。
+    """
+    x = project(np.asarray(x0, dtype=float))
+    fx, step, z, theta = f(x), 1.0, x, 1.0
+    for it in range(1, max_iter + 1):
+        fz, g = f(z), grad(z)
+        while True:
+            y = project(z - step * g)
+            d = y - z
+            fy = f(y)
+            if fy <= fz + g @ d + (d @ d) / (2 * step) + 1e-15:
+                break
+            step *= 0.5
+            if step < 1e-14:
+                return x, it
+        moved = np.abs(y - x).max()
+        if moved < tol:
+            return (y if fy <= fx else x), it
+        if fy > fx + 1e-13 * max(1.0, abs(fx)):     # 动量导致上升：回到 x 重启；无动量仍不降则已收敛
+            if theta == 1.0:
+                return x, it
+            z, theta = x, 1.0
+            continue
+        theta_next = (1.0 + np.sqrt(1.0 + 4.0 * theta * theta)) / 2.0
+        z = y + ((theta - 1.0) / theta_next) * (y - x)
+        x, fx, theta = y, fy, theta_next
+        step *= 1.5
+    return x, max_iter
+
+
+def _projector(max_single: float, sectors: Sequence[str], max_sector: float):
+    state = {"feasible": True}
+
+    def project(v: np.ndarray) -> np.ndarray:
+        res = project_capped_simplex(v, max_single, sectors, max_sector, normalize=False)
+        state["feasible"] = res.feasible
+        return res.weights
+
+    return project, state
+
+
+def min_variance(cov: np.ndarray, project, x0: Optional[np.ndarray] = None):
+    n = len(cov)
+    return projected_gradient(lambda w: w @ cov @ w, lambda w: 2.0 * cov @ w,
+                              np.full(n, 1.0 / n) if x0 is None else x0, project)
+
+
+def max_sharpe(cov: np.ndarray, mu: np.ndarray, project, x0: Optional[np.ndarray] = None):
+    n = len(cov)
+
+    def f(w):
+        return -(mu @ w) / np.sqrt(max(w @ cov @ w, 1e-18))
+
+    def g(w):
+        cw = cov @ w
+        s = np.sqrt(max(w @ cw, 1e-18))
+        return -(mu / s - (mu @ w) * cw / s ** 3)
+
+    return projected_gradient(f, g, np.full(n, 1.0 / n) if x0 is None else x0, project)
+
+
+def risk_parity(cov: np.ndarray, project, budget: Optional[np.ndarray] = None,
+                max_iter: int = 100, tol: float = 1e-12):
+    """
+    等风险贡献：先解凸问题 min ½yᵀΣy - Σ b_i·log y_i（y > 0，其解满足 y_i(Σy)_i = b_i），
+    归一化 w = y / Σy 即为无约束 ERC。该子问题对数障碍项病态、梯度法收敛慢，改用阻尼牛顿（Hessian = Σ + diag(b/y²)），
+    通常 10 步内收敛。
+    上限在迭代内处理：以投影后的 ERC 为起点，在单票 / 行业上限内最小化风险贡献占比与预算的偏差
+    Σ(w_i(Σw)_i / wᵀΣw - b_i)²（上限不起作用时起点即精确 ERC，偏差为 0，直接返回）。
+    """
+    n = len(cov)
+    b = np.full(n, 1.0 / n) if budget is None else np.asarray(budget, dtype=float) / np.sum(budget)
+    f = lambda y: 0.5 * y @ cov @ y - b @ np.log(y)
+    y = 1.0 / np.sqrt(np.diag(cov))
+    y = y / np.sqrt(y @ cov @ y)
+    fy, it = f(y), 0
+    for it in range(1, max_iter + 1):
+        g = cov @ y - b / y
+        d = np.linalg.solve(cov + np.diag(b / y ** 2), g)
+        a = 1.0
+        while np.any(y - a * d <= 0) or f(y - a * d) > fy - 0.25 * a * (g @ d):
+            a *= 0.5
+            if a < 1e-12:
+                break
+        y = y - a * d
+        fy = f(y)
+        if np.abs(a * d).max() < tol * max(1.0, np.abs(y).max()):
+            break
+
+    def dev(w):
+        r = w * (cov @ w)
+        return float(((r / max(r.sum(), 1e-18) - b) ** 2).sum())
+
+    def dev_grad(w):
+        cw = cov @ w
+        r = w * cw
+        s = max(r.sum(), 1e-18)
+        d = r / s - b
+        return 2.0 * ((cw * d + cov @ (w * d)) / s - 2.0 * cw * (r @ d) / s ** 2)
+
+    w, k = projected_gradient(dev, dev_grad, y / y.sum(), project)
+    return w, it + k
+
+
+def optimize_weights(scheme: str, est: CovEstimate, sectors: Mapping[str, str], c: Constraints,
+                     scores: Optional[Mapping[str, float]] = None) -> OptimizationResult:
+    """
+    对 est.symbols 按 scheme 求权重（scheme=score 时按分数比例投影，仅用于对比）。
+    非零权重少于 min(c.min_positions, 股票数) 时抛 ValueError。
+    """
+    if scheme not in SCHEMES:
+        raise ValueError(f"scheme 须为 {SCHEMES} 之一")
+    syms, cov = est.symbols, est.cov
+    project, state = _projector(c.max_single, [sectors.get(s, "Unknown") for s in syms], c.max_sector)
+    s = np.array([float((scores or {}).get(x, 0.0)) for x in syms])
+
+    it = 0
+    if scheme == "min_variance":
+        w, it = min_variance(cov, project)
+    elif scheme == "max_sharpe":
+        mu = est.vol * s / 100.0 if scores else est.mean
+        w, it = max_sharpe(cov, mu, project)
+    elif scheme == "risk_parity":
+        w, it = risk_parity(cov, project)
+    else:
+        w = project_capped_simplex(s if scores else np.ones(len(syms)), c.max_single,
+                                   [sectors.get(x, "Unknown") for x in syms], c.max_sector).weights
+
+    w = np.where(w < 1e-10, 0.0, w)
+    w = w / w.sum()
+    need = min(int(c.min_positions), len(syms))
+    if int((w > 0).sum()) < need:
+        raise ValueError(f"{scheme} 的解只持有 {int((w > 0).sum())} 只，少于最少持仓 {need} 只")
+    cw = cov @ w
+    var = float(w @ cw)
+    return OptimizationResult(scheme=scheme, weights={x: float(v) for x, v in zip(syms, w)},
+                              risk_contrib={x: float(v) for x, v in zip(syms, w * cw / var)} if var > 0 else {},
+                              exp_vol=float(np.sqrt(max(var, 0.0))), shrinkage=est.shrinkage,
+                              feasible=state["feasible"], iterations=it)
+
+
+def optimize_portfolio(db: Session, symbols: Sequence[str], scheme: str, c: Constraints,
+                       sectors: Mapping[str, str], scores: Optional[Mapping[str, float]] = None,
+                       asof: Optional[date] = None, lookback: int = 252) -> OptimizationResult:
+    """估计（或取缓存的）协方差并求解"""
+    if scheme not in SCHEMES:
+        raise ValueError(f"scheme 须为 {SCHEMES} 之一")
+    est = estimate_covariance(db, symbols, asof, lookback)
+    return optimize_weights(scheme, est, sectors, c, scores)
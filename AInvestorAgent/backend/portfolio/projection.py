@@ -0,0 +1,115 @@
+# backend/portfolio/projection.py
+"""
+带单票 / 行业上限的精确权重投影：求离目标权重 t 最近（欧氏距离）的 w，满足
+    Σw = 1，0 ≤ w_i ≤ u，Σ_{i∈行业g} w_i ≤ c_g。
+
+KKT 条件下解的形式为 w_i = clip(t_i - λ - μ_g, 0, u)：
+- 固定 λ 时，行业 g 的总和 S_g(λ) 不超过 c_g 则 μ_g = 0，否则 μ_g 使该行业恰好等于 c_g，
+  等价于行业内的阈值取 max(λ, λ_g*)，其中 S_g(λ_g*) = c_g；
+- 于是 λ 只需解一个单调分段线性方程 Σ_g min(S_g(λ), c_g) = 1。
+两步都用排序后的断点 + 累加斜率求解（water-filling），总复杂度 O(n log n)，结果确定、无迭代。
+约束不可行（Σ_g min(n_g·u, c_g) < 1）时如实报告；allocate 时按最小幅度放宽上限后再投影。
+"""
+from __future__ import annotations
+
+from dataclasses import dataclass, field
+from typing import Dict, List, Mapping, Optional, Sequence, Union
+
+import numpy as np
+
+_EPS = 1e-12
+
+
+@dataclass
+class ProjectionResult:
+    weights: np.ndarray
+    feasible: bool                       # 原始约束是否可行
+    max_single: float                    # 实际使用的单票上限（不可行且放宽时会变大）
+    max_sector: Dict[str, float]         # 实际使用的各行业上限
+    binding_sectors: List[str] = field(default_factory=list)   # 触及上限的行业
+
+
+def solve_shift(t: np.ndarray, u: np.ndarray, total: float) -> float:
+    """
+    求 λ 使 Σ clip(t_i - λ, 0, u_i) = total（左侧关于 λ 单调不增、分段线性）。
+    total ≥ Σu 时返回 -inf（全部顶格），total ≤ 0 时返回 max(t)。
+    """
+    t = np.asarray(t, dtype=float)
+    u = np.maximum(np.asarray(u, dtype=float), 0.0)
+    if t.size == 0 or total >= u.sum() - _EPS:
+        return -np.inf
+    if total <= 0:
+        return float(t.max())
+    # 断点：λ 越过 t_i - u_i 时第 i 项开始随 λ 下降（斜率 -1），越过 t_i 时降到 0（斜率 +1）
+    pts = np.r_[t - u, t]
+    dslope = np.r_[-np.ones_like(t), np.ones_like(t)]
+    order = np.lexsort((dslope, pts))              # 同一点先处理 -1，保证确定性
+    pts, dslope = pts[order], dslope[order]
+    slope = np.cumsum(dslope)                      # (pts[k], pts[k+1]) 上的斜率
+    F = u.sum() + np.r_[0.0, np.cumsum(slope[:-1] * np.diff(pts))]   # F(pts[k])
+    k = int(np.searchsorted(-F, -total, side="right")) - 1           # 最后一个 F(pts[k]) ≥ total
+    if k >= len(pts) - 1 or slope[k] == 0:
+        return float(pts[k])
+    return float(pts[k] + (F[k] - total) / -slope[k])
+
+
+def project_capped_simplex(target: Sequence[float], max_single: float = 1.0,
+                           sectors: Optional[Sequence[str]] = None,
+                           max_sector: Union[float, Mapping[str, float]] = 1.0,
+                           total: float = 1.0, relax: bool = True, normalize: bool = True) -> ProjectionResult:
+    """
+    target: 目标权重（normalize=True 时视为分数比例：负数记 0 并缩放到和为 total；
+    False 时按原值做欧氏投影，供投影梯度法使用）；sectors: 与 target 等长的行业标签；
+    max_sector: 统一上限或 {行业: 上限}。
+    不可行时：relax=True 先把单票上限放到 total/n，再把各行业上限统一抬到刚好可行的最小值；
+    relax=False 则在原约束下尽量分配（权重和 < total，其余视为现金）。
+    """
+    t = np.asarray(target, dtype=float)
+    n = t.size
+    if normalize:
+        t = np.maximum(t, 0.0)
+        if t.sum() > 0:
+            t = t * (total / t.sum())
+    labels = np.asarray(sectors if sectors is not None else ["_"] * n, dtype=object)
+    names, grp = np.unique(labels, return_inverse=True) if n else (np.array([], dtype=object), np.zeros(0, int))
+    caps = np.array([float(max_sector.get(g, 1.0)) if isinstance(max_sector, Mapping) else float(max_sector)
+                     for g in names])
+    u = float(max_single)
+    room = np.bincount(grp, minlength=len(names)) * u
+    feasible = n > 0 and np.minimum(room, caps).sum() >= total - 1e-9
+
+    if not feasible and relax and n:
+        u = max(u, total / n)
+        room = np.bincount(grp, minlength=len(names)) * u
+        if np.minimum(room, caps).sum() < total - 1e-9:
+            # Σ_g min(room_g, c) = total 的最小 c；容量恰好等于 total 时取最大行业容量
+            c_min = room.max() if room.sum() <= total + 1e-9 else -solve_shift(np.zeros(len(names)), room, total)
+            caps = np.maximum(caps, c_min)
+
+    w = _project(t, u, grp, caps, total)
+    sums = np.bincount(grp, weights=w, minlength=len(names))
+    binding = [str(g) for g, s, c in zip(names, sums, caps) if c < 1.0 and s >= c - 1e-9]
+    return ProjectionResult(weights=w, feasible=bool(feasible), max_single=u,
+                            max_sector={str(g): float(c) for g, c in zip(names, caps)},
+                            binding_sectors=binding)
+
+
+def _project(t: np.ndarray, u: float, grp: np.ndarray, caps: np.ndarray, total: float) -> np.ndarray:
+    n = t.size
+    if n == 0:
+        return np.zeros(0)
+    ub = np.full(n, u)
+    # 各行业自身的阈值 λ_g*（行业容量不超过上限的永不触顶，记 -inf）
+    lam_g = np.full(len(caps), -np.inf)
+    order = np.argsort(grp, kind="stable")
+    bounds = np.r_[0, np.cumsum(np.bincount(grp, minlength=len(caps)))]
+    for g in range(len(caps)):
+        m = order[bounds[g]:bounds[g + 1]]
+        if ub[m].sum() > caps[g] + _EPS:
+            lam_g[g] = solve_shift(t[m], ub[m], caps[g])
+    # 行业阈值并入：第 i 项只在 λ ∈ (a_i, t_i) 上随 λ 变化，a_i = max(t_i - u, λ_g*)
+    a = np.maximum(t - ub, lam_g[grp])
+    span = np.maximum(t - a, 0.0)
+    lam = solve_shift(t, span, total)
+    w = np.clip(t - np.maximum(lam, lam_g[grp]), 0.0, ub)
+    return w
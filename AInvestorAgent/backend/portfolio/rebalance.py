@@ -0,0 +1,209 @@
+# backend/portfolio/rebalance.py
+"""
+换手感知的增量调仓：给定当前权重 w0、目标权重 t 与成本 / 税参数，算出实际要调到的权重，而不是每次都全量调到目标。
+
+- full：全量调仓，w = t（原有行为，作为对照）；
+- band：无交易带，|t_i - w0_i| ≤ band 的股票不动，带外的调到目标；
+- l1：min ½‖w - t‖² + κ·Σ c_i|w_i - w0_i|，s.t. Σw = Σt, w ≥ 0。
+  解为非对称软阈值 w_i = w0_i + S(t_i - λ - w0_i)：买入阈值 κ·c_buy，卖出阈值 κ·c_sell（含浮盈对应的税），
+  即“调到无交易带边缘”；λ 使总仓位与目标一致，对所有账户一起向量化二分。
+权重均为占账户总值的比例（余下为现金），成本以权重为单位，乘账户总值即金额。
+"""
+from __future__ import annotations
+
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Mapping, Optional, Sequence, Union
+
+import numpy as np
+from sqlalchemy import func, select
+from sqlalchemy.orm import Session
+
+MODES = ("full", "band", "l1")
+_BISECT_ITERS = 64
+
+
+@dataclass
+class RebalancePlan:
+    weights: np.ndarray          # 调仓后权重（N 或 P×N，同输入）
+    trades: np.ndarray           # weights - current
+    cost: np.ndarray             # 估计交易成本 + 税（权重单位）
+    cost_full: np.ndarray        # 全量调到目标的成本
+    turnover: np.ndarray         # Σ|Δw|
+    turnover_full: np.ndarray
+    tracking: np.ndarray         # 与目标的偏离 Σ|w - t|
+
+    @property
+    def saved(self) -> np.ndarray:
+        return self.cost_full - self.cost
+
+    def summary(self, value: float = 1.0, i: Optional[int] = None) -> Dict[str, float]:
+        """第 i 个账户（单账户时省略）的汇总；value 为账户总值，成本换算成金额"""
+        pick = (lambda x: float(np.asarray(x).reshape(-1)[0] if i is None else x[i]))
+        return {"turnover": round(pick(self.turnover), 6), "turnover_full": round(pick(self.turnover_full), 6),
+                "cost": round(pick(self.cost) * value, 6), "cost_full": round(pick(self.cost_full) * value, 6),
+                "cost_saved": round(pick(self.saved) * value, 6), "tracking": round(pick(self.tracking), 6)}
+
+
+def trade_costs(tc: Union[float, np.ndarray], price: Optional[np.ndarray] = None,
+                cost_basis: Optional[np.ndarray] = None, holding_days: Optional[np.ndarray] = None,
+                short_term_tax_rate: float = 0.0, long_term_tax_rate: float = 0.0):
+    """
+    单位权重的买入 / 卖出成本。卖出额中浮盈占比 g = 1 - 成本/现价（亏损记 0），
+    税 = g × 税率（持有 ≤ 365 天用短期税率）。返回 (c_buy, c_sell)，形状同 price。
+    """
+    tc = np.asarray(tc, dtype=float)
+    if price is None or cost_basis is None:
+        return tc, tc
+    price = np.asarray(price, dtype=float)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        gain = np.where(price > 0, 1.0 - np.asarray(cost_basis, dtype=float) / price, 0.0)
+    gain = np.clip(np.nan_to_num(gain), 0.0, 1.0)
+    days = np.zeros_like(price) if holding_days is None else np.asarray(holding_days, dtype=float)
+    rate = np.where(days > 365, long_term_tax_rate, short_term_tax_rate)
+    return np.broadcast_to(tc, price.shape), tc + gain * rate
+
+
+def _cost(d: np.ndarray, c_buy: np.ndarray, c_sell: np.ndarray) -> np.ndarray:
+    return (np.maximum(d, 0.0) * c_buy + np.maximum(-d, 0.0) * c_sell).sum(axis=-1)
+
+
+def _soft(w0, t, lo, hi, lam):
+    """w(λ) = max(w0 + S(t - λ - w0), 0)，S 为 [-lo, hi] 死区的软阈值；关于 λ 单调不增"""
+    d = t - lam - w0
+    return np.maximum(w0 + np.where(d > hi, d - hi, np.where(d < -lo, d + lo, 0.0)), 0.0)
+
+
+def rebalance_weights(current: np.ndarray, target: np.ndarray, c_buy: Union[float, np.ndarray] = 0.001,
+                      c_sell: Union[float, np.ndarray, None] = None, mode: str = "l1", band: float = 0.02,
+                      aversion: float = 5.0) -> RebalancePlan:
+    """
+    current / target: N 或 P×N（P 个账户一起算）；c_buy / c_sell: 标量或同形状的单位成本（见 trade_costs）。
+    band 只用于 band 模式；aversion 为 l1 模式的成本厌恶系数 κ（阈值 = κ × 成本）。
+    """
+    if mode not in MODES:
+        raise ValueError(f"rebalance mode 须为 {MODES} 之一")
+    w0 = np.atleast_2d(np.asarray(current, dtype=float))
+    t = np.atleast_2d(np.asarray(target, dtype=float))
+    cb = np.broadcast_to(np.asarray(c_buy, dtype=float), w0.shape)
+    cs = cb if c_sell is None else np.broadcast_to(np.asarray(c_sell, dtype=float), w0.shape)
+    total = t.sum(axis=1, keepdims=True)
+
+    if mode == "full":
+        w = t.copy()
+    elif mode == "band":
+        out = np.abs(t - w0) > band
+        w = np.where(out, t, w0)
+        # 带内不动造成的总仓位差，按目标比例摊给带外（要交易的）股票
+        tt = np.where(out, t, 0.0).sum(axis=1, keepdims=True)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            scale = np.where(tt > 0, np.maximum(tt + total - w.sum(axis=1, keepdims=True), 0.0) / tt, 1.0)
+        w = np.where(out, t * scale, w0)
+    else:
+        hi, lo = aversion * cb, aversion * cs
+        # Σw(λ) 单调不增：λ = -(2 + max hi) 时每只至少 +1，λ = 2 + max lo 时全部为 0
+        a = np.full(total.shape, -2.0 - hi.max(initial=0.0))
+        b = np.full(total.shape, 2.0 + lo.max(initial=0.0))
+        for _ in range(_BISECT_ITERS):
+            m = 0.5 * (a + b)
+            big = _soft(w0, t, lo, hi, m).sum(axis=1, keepdims=True) > total
+            a, b = np.where(big, m, a), np.where(big, b, m)
+        w = _soft(w0, t, lo, hi, 0.5 * (a + b))
+
+    d, d_full = w - w0, t - w0
+    squeeze = (lambda x: x[0]) if np.ndim(current) == 1 else (lambda x: x)
+    return RebalancePlan(weights=squeeze(w), trades=squeeze(d),
+                         cost=squeeze(_cost(d, cb, cs)), cost_full=squeeze(_cost(d_full, cb, cs)),
+                         turnover=squeeze(np.abs(d).sum(axis=1)), turnover_full=squeeze(np.abs(d_full).sum(axis=1)),
+                         tracking=squeeze(np.abs(w - t).sum(axis=1)))
+
+
+def latest_prices(db: Session, symbols: Sequence[str]) -> Dict[str, float]:
+    """prices_daily 中各股票最近一个收盘价（一次查询）"""
+    from backend.storage.models import PriceDaily
+
+    if not symbols:
+        return {}
+    last = (select(PriceDaily.symbol, func.max(PriceDaily.date).label("d"))
+            .where(PriceDaily.symbol.in_(list(symbols))).group_by(PriceDaily.symbol).subquery())
+    rows = db.execute(select(PriceDaily.symbol, PriceDaily.close)
+                      .join(last, (PriceDaily.symbol == last.c.symbol) & (PriceDaily.date == last.c.d))).all()
+    return {s: float(c) for s, c in rows if c}
+
+
+def rebalance_accounts(db: Session, targets: Mapping[str, Any], prices: Optional[Mapping[str, float]] = None,
+                       account_ids: Optional[Sequence[str]] = None, mode: str = "l1", tc: float = 0.001,
+                       short_term_tax_rate: float = 0.0, long_term_tax_rate: float = 0.0,
+                       band: float = 0.02, aversion: float = 5.0, now: Optional[datetime] = None) -> Dict[str, Dict[str, Any]]:
+    """
+    对 sim_accounts 中的账户（默认全部）批量生成调仓计划，不下单。
+    targets: 所有账户共用的 {symbol: weight}，或 {account_id: {symbol: weight}}。
+    持仓来自 sim_positions（avg_cost 为成本价），持有天数按该股首笔 BUY（sim_trades）估计；
+    prices 缺省时取 prices_daily 最新收盘价，无价格的股票不参与。
+    返回 {account_id: {total_value, orders, summary}}，orders 中 quantity 按现价折算。
+    """
+    from backend.storage.models import SimAccount, SimPosition, SimTrade
+
+    q = select(SimAccount.account_id, SimAccount.current_cash)
+    if account_ids is not None:
+        q = q.where(SimAccount.account_id.in_(list(account_ids)))
+    accounts = db.execute(q.order_by(SimAccount.account_id)).all()
+    if not accounts:
+        return {}
+    ids = [a for a, _ in accounts]
+    per_account = any(isinstance(v, Mapping) for v in targets.values())
+    tgt = {a: {k.upper(): float(v) for k, v in ((targets.get(a) or {}) if per_account else targets).items()}
+           for a in ids}
+
+    pos = db.execute(select(SimPosition.account_id, SimPosition.symbol, SimPosition.quantity, SimPosition.avg_cost)
+                     .where(SimPosition.account_id.in_(ids), SimPosition.quantity > 0)).all()
+    first_buy = dict(((a, s), d) for a, s, d in db.execute(
+        select(SimTrade.account_id, SimTrade.symbol, func.min(SimTrade.trade_date))
+        .where(SimTrade.account_id.in_(ids), SimTrade.action == "BUY")
+        .group_by(SimTrade.account_id, SimTrade.symbol)).all())
+
+    syms = sorted({s.upper() for _, s, _, _ in pos} | {s for t in tgt.values() for s in t})
+    px = {s.upper(): float(p) for s, p in (prices or {}).items() if p}
+    missing = [s for s in syms if s not in px]
+    if missing:
+        px.update(latest_prices(db, missing))
+    syms = [s for s in syms if px.get(s, 0) > 0]
+    col = {s: j for j, s in enumerate(syms)}
+    row = {a: i for i, a in enumerate(ids)}
+    P, N = len(ids), len(syms)
+    price = np.array([px[s] for s in syms])
+
+    qty, basis, days = np.zeros((P, N)), np.tile(price, (P, 1)), np.zeros((P, N))
+    now = now or datetime.now(timezone.utc)
+    if now.tzinfo is not None:                     # sim_trades.trade_date 为 naive UTC
+        now = now.astimezone(timezone.utc).replace(tzinfo=None)
+    for a, s, n, c in pos:
+        j = col.get(s.upper())
+        if j is None:
+            continue
+        i = row[a]
+        qty[i, j] += float(n)
+        basis[i, j] = float(c or price[j])
+        d = first_buy.get((a, s))
+        days[i, j] = (now - d).days if d is not None else 0.0
+    value = np.array([float(c or 0.0) for _, c in accounts]) + qty @ price
+    with np.errstate(invalid="ignore", divide="ignore"):
+        w0 = np.where(value[:, None] > 0, qty * price / value[:, None], 0.0)
+    T = np.zeros((P, N))
+    for a, t in tgt.items():
+        for s, w in t.items():
+            if s in col:
+                T[row[a], col[s]] = w
+
+    c_buy, c_sell = trade_costs(tc, np.tile(price, (P, 1)), basis, days, short_term_tax_rate, long_term_tax_rate)
+    plan = rebalance_weights(w0, T, c_buy, c_sell, mode=mode, band=band, aversion=aversion)
+
+    out: Dict[str, Dict[str, Any]] = {}
+    for a, i in row.items():
+        orders: List[Dict[str, Any]] = []
+        for j in np.flatnonzero(np.abs(plan.trades[i]) > 1e-8):
+            dw = float(plan.trades[i, j])
+            orders.append({"symbol": syms[j], "side": "BUY" if dw > 0 else "SELL", "weight_delta": round(dw, 8),
+                           "quantity": abs(dw) * value[i] / price[j], "price": float(price[j])})
+        out[a] = {"total_value": float(value[i]), "orders": orders, "summary": plan.summary(float(value[i]), i)}
+    return out
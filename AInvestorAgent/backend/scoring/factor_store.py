@@ -0,0 +1,197 @@
+# backend/scoring/factor_store.py
+"""
+时点因子面板（factors_daily）：按 (symbol, as_of, factor_version) 只存与股票池无关的原始因子，
+回测 / IC 验证直接读预计算结果，不再逐日重算。
+
+- backfill_factors：写路径，计算缺失的 (symbol, date) 格子，并重算最近 refresh_days 天（价格可能被修订）；
+  只 flush 不 commit，由调用方（回测任务、POST /api/validation/factor-backfill）提交；
+- f_momentum 是截面 min-max，不入库：读取时按本次请求的 symbols 归一，同一股票池结果可复现；
+- load_factor_panel：只读，读成 dates × symbols × factors 的 NumPy 数组，缺失为 NaN；
+- factor_panel / get_factor_rows：只读，表中缺失的格子在内存中现算，不写库。
+因子口径与 compute_factors 完全一致，口径变化时升级 FACTOR_VERSION。
+"""
+from __future__ import annotations
+
+from collections import defaultdict
+from dataclasses import dataclass
+from datetime import date, datetime, timedelta
+from typing import Dict, Iterable, List, Optional, Sequence
+
+import numpy as np
+from sqlalchemy import select
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.orm import Session
+
+from backend.storage.models import FactorDaily
+from .scorer import FactorRow, compute_factors_batch
+
+FACTOR_VERSION = "v1"
+FACTOR_FIELDS = ("f_value", "f_quality", "f_momentum_raw", "f_momentum", "f_sentiment")
+STORED_FIELDS = ("f_value", "f_quality", "f_momentum_raw", "f_sentiment")   # 与股票池无关，入库
+REFRESH_DAYS = 7
+
+
+@dataclass
+class FactorPanel:
+    """dates × symbols × factors 因子数组；dates 为升序 datetime64[D]"""
+    dates: np.ndarray
+    symbols: List[str]
+    fields: Sequence[str]
+    values: np.ndarray
+
+    def field(self, name: str) -> np.ndarray:
+        """单个因子的 dates × symbols 矩阵"""
+        return self.values[:, :, list(self.fields).index(name)]
+
+    def rows_at(self, d) -> List[FactorRow]:
+        """某日的 FactorRow 列表（该日无数据返回空列表），可直接交给 aggregate_score"""
+        i = int(np.searchsorted(self.dates, np.datetime64(d, "D")))
+        if i >= len(self.dates) or self.dates[i] != np.datetime64(d, "D"):
+            return []
+        out = []
+        for j, s in enumerate(self.symbols):
+            vals = {f: (None if np.isnan(v) else float(v)) for f, v in zip(self.fields, self.values[i, j])}
+            out.append(FactorRow(symbol=s, **{f: vals.get(f) for f in FACTOR_FIELDS}))
+        return out
+
+
+def _upsert(db: Session, rows: List[Dict], cols: Sequence[str]) -> None:
+    """INSERT ... ON CONFLICT(symbol, as_of, factor_version) DO UPDATE，按 executemany 执行"""
+    if not rows:
+        return
+    t = FactorDaily.__table__
+    stmt = sqlite_insert(t)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[t.c.symbol, t.c.as_of, t.c.factor_version],
+        set_={**{c: stmt.excluded[c] for c in cols}, "updated_at": stmt.excluded.updated_at},
+    )
+    now = datetime.utcnow()
+    db.execute(stmt, [{**r, "updated_at": now} for r in rows])
+
+
+def _existing(db: Session, symbols: Sequence[str], dates: Sequence[date], version: str) -> Dict[date, set]:
+    t = FactorDaily.__table__
+    q = select(t.c.as_of, t.c.symbol).where(
+        t.c.factor_version == version, t.c.as_of.in_(list(dates)), t.c.symbol.in_(list(symbols)))
+    have = defaultdict(set)
+    for d, s in db.execute(q):
+        have[d].add(s)
+    return have
+
+
+def minmax_rows(raw: np.ndarray) -> np.ndarray:
+    """dates × symbols 的原始值逐行 min-max，口径同 _minmax_scale（单个有效值保持原值，全相同记 0.5）"""
+    out = np.full(raw.shape, np.nan)
+    ok = ~np.isnan(raw)
+    n = ok.sum(axis=1)
+    if not n.any():
+        return out
+    with np.errstate(invalid="ignore"):
+        lo = np.nanmin(np.where(ok, raw, np.inf), axis=1, keepdims=True)
+        hi = np.nanmax(np.where(ok, raw, -np.inf), axis=1, keepdims=True)
+        span = hi - lo
+        scaled = np.where(span >= 1e-12, (raw - lo) / np.where(span >= 1e-12, span, 1.0), 0.5)
+    scaled = np.where((n == 1)[:, None], raw, scaled)
+    return np.where(ok, scaled, np.nan)
+
+
+def backfill_factors(db: Session, symbols: Iterable[str], dates: Iterable[date],
+                     version: str = FACTOR_VERSION, verbose: bool = False,
+                     refresh_days: int = REFRESH_DAYS, today: Optional[date] = None) -> int:
+    """
+    补齐 symbols × dates 中缺失的原始因子格子，返回写入的格子数。
+    today（缺省为今天）之前 refresh_days 天内的日期总是重算，更早且已存在的格子不重算。
+    只 flush，不 commit。
+    """
+    syms = [s for s in dict.fromkeys(symbols) if s]
+    days = sorted(set(dates))
+    if not syms or not days:
+        return 0
+    have = _existing(db, syms, days, version)
+    stale_from = (today or date.today()) - timedelta(days=refresh_days)
+
+    written = 0
+    for d in days:
+        todo = syms if d >= stale_from else [s for s in syms if s not in have.get(d, ())]
+        if not todo:
+            continue
+        rows = compute_factors_batch(db, todo, d)
+        _upsert(db, [{"symbol": r.symbol, "as_of": d, "factor_version": version,
+                      **{f: getattr(r, f) for f in STORED_FIELDS}} for r in rows], STORED_FIELDS)
+        written += len(rows)
+        if verbose:
+            print(f"  🧮 {d}: 补算 {len(rows)} 个因子格子")
+    db.flush()
+    return written
+
+
+def load_factor_panel(db: Session, symbols: Sequence[str], start: Optional[date] = None,
+                      end: Optional[date] = None, fields: Sequence[str] = FACTOR_FIELDS,
+                      version: str = FACTOR_VERSION) -> FactorPanel:
+    """
+    一条查询读取 [start, end] 的原始因子，返回 dates × symbols × fields 数组（缺失为 NaN）；
+    f_momentum 按 symbols 这一股票池逐日截面归一。
+    """
+    syms = list(dict.fromkeys(symbols))
+    t = FactorDaily.__table__
+    q = select(t.c.as_of, t.c.symbol, *[t.c[f] for f in STORED_FIELDS]).where(
+        t.c.factor_version == version, t.c.symbol.in_(syms))
+    if start is not None:
+        q = q.where(t.c.as_of >= start)
+    if end is not None:
+        q = q.where(t.c.as_of <= end)
+    rows = db.execute(q).all()
+    if not rows:
+        return FactorPanel(np.array([], dtype="datetime64[D]"), syms, tuple(fields),
+                           np.full((0, len(syms), len(fields)), np.nan))
+
+    cols = list(zip(*rows))
+    dates, ti = np.unique(np.array([str(d) for d in cols[0]], dtype="datetime64[D]"), return_inverse=True)
+    pos = {s: i for i, s in enumerate(syms)}
+    si = np.fromiter((pos[s] for s in cols[1]), dtype=np.int64, count=len(rows))
+    raw = np.full((len(dates), len(syms), len(STORED_FIELDS)), np.nan)
+    raw[ti, si] = np.array([r[2:] for r in rows], dtype=float)  # None -> nan
+    return _with_momentum(FactorPanel(dates, syms, STORED_FIELDS, raw), fields)
+
+
+def _with_momentum(raw: FactorPanel, fields: Sequence[str]) -> FactorPanel:
+    """原始因子面板 → 所需 fields（f_momentum 由 f_momentum_raw 在该面板的股票池内归一）"""
+    cols = {f: raw.field(f) for f in STORED_FIELDS}
+    cols["f_momentum"] = minmax_rows(cols["f_momentum_raw"])
+    values = np.stack([cols[f] for f in fields], axis=-1) if fields else \
+        np.full(raw.values.shape[:2] + (0,), np.nan)
+    return FactorPanel(raw.dates, raw.symbols, tuple(fields), values)
+
+
+def factor_panel(db: Session, symbols: Sequence[str], dates: Sequence[date],
+                 fields: Sequence[str] = FACTOR_FIELDS, version: str = FACTOR_VERSION) -> FactorPanel:
+    """
+    只读：dates × symbols 的因子面板（dates 升序去重）。表中已有的格子直接读，
+    缺失的在内存中按 compute_factors_batch 现算，不写库；供 GET 类接口与 IC 验证使用。
+    """
+    syms = list(dict.fromkeys(symbols))
+    days = sorted(set(dates))
+    fd = np.array([str(d) for d in days], dtype="datetime64[D]")
+    raw = np.full((len(days), len(syms), len(STORED_FIELDS)), np.nan)
+    if days and syms:
+        stored = load_factor_panel(db, syms, days[0], days[-1], STORED_FIELDS, version)
+        idx = np.searchsorted(stored.dates, fd)
+        hit = idx < len(stored.dates)
+        hit[hit] = stored.dates[idx[hit]] == fd[hit]
+        raw[hit] = stored.values[idx[hit]]
+        have = _existing(db, syms, days, version)
+        pos = {s: j for j, s in enumerate(syms)}
+        for i, d in enumerate(days):
+            missing = [s for s in syms if s not in have.get(d, ())]
+            if not missing:
+                continue
+            for r in compute_factors_batch(db, missing, d):
+                raw[i, pos[r.symbol]] = [np.nan if getattr(r, f) is None else getattr(r, f)
+                                         for f in STORED_FIELDS]
+    return _with_momentum(FactorPanel(fd, syms, STORED_FIELDS, raw), fields)
+
+
+def get_factor_rows(db: Session, symbols: Sequence[str], asof: date,
+                    version: str = FACTOR_VERSION) -> List[FactorRow]:
+    """只读：某日的 FactorRow（表中缺失的格子现算、不写库），供回测按调仓日取分"""
+    return factor_panel(db, symbols, [asof], version=version).rows_at(asof)
@@ -0,0 +1,188 @@
+# backend/scoring/ic.py
+"""
+向量化因子 IC 验证：因子值与远期收益都是 dates × symbols 矩阵，
+一次算出每期的 Pearson / Rank IC、IC-IR、多期限衰减曲线与分层（分位数）收益。
+
+- 因子只读 factors_daily（缺失格子在内存中现算，不写库），情绪因子按近 7 天窗口单独取；
+  远期收益来自价格面板，全程只有少量查询；
+- 远期窗口超出最新价格的期次记为 NaN（不用不完整的未来收益）；
+- 每个因子单独取有效样本，截面有效数 < min_obs 的期次 IC 记为 NaN。
+"""
+from __future__ import annotations
+
+from datetime import date, timedelta
+from typing import Dict, List, Sequence
+
+import numpy as np
+import pandas as pd
+from sqlalchemy.orm import Session
+
+from backend.factors.momentum import MOMENTUM_BUFFER_DAYS
+from backend.factors.sentiment import avg_sentiment_batch
+from backend.storage.price_panel import get_price_panel
+from .factor_store import factor_panel
+from .scorer import aggregate_score_matrix
+
+# 验证的因子 -> factors_daily 字段；overall_score 由各因子按 BASE_WEIGHTS 合成
+FACTOR_COLUMNS = {"value": "f_value", "quality": "f_quality",
+                  "momentum": "f_momentum", "sentiment": "f_sentiment"}
+DEFAULT_FACTORS = ("momentum", "sentiment", "overall_score")
+DEFAULT_HORIZONS = (5, 10, 20, 30, 60)
+SENTIMENT_DAYS = 7    # IC 验证的情绪窗口（打分用 30 天，见 compute_factors_batch）
+
+
+# ---------------- 矩阵构建 ----------------
+
+def factor_matrices(db: Session, symbols: Sequence[str], dates: Sequence[date],
+                    factors: Sequence[str] = DEFAULT_FACTORS) -> Dict[str, np.ndarray]:
+    """各因子在 dates × symbols 上的取值（缺失为 NaN），只读"""
+    fp = factor_panel(db, symbols, dates)
+    idx = np.searchsorted(fp.dates, np.array(dates, dtype="datetime64[D]"))
+    base = {k: fp.field(col)[idx] for k, col in FACTOR_COLUMNS.items()}
+    senti = [avg_sentiment_batch(db, symbols, d, days=SENTIMENT_DAYS) for d in dates]
+    base["sentiment"] = np.array([[np.nan if x.get(s) is None else x[s] for s in symbols] for x in senti],
+                                 dtype=float).reshape(len(dates), len(symbols))
+    out = {}
+    for name in factors:
+        out[name] = aggregate_score_matrix(base) / 100.0 if name == "overall_score" else base[name]
+    return out
+
+
+def forward_returns(db: Session, symbols: Sequence[str], dates: Sequence[date],
+                    horizons: Sequence[int]) -> Dict[int, np.ndarray]:
+    """
+    远期收益 close(d + h) / close(d) - 1（日历日，前向填充取 asof 收盘），每个期限一个 dates × symbols 矩阵。
+    价格面板一次读取。
+    """
+    start = min(dates) - timedelta(days=MOMENTUM_BUFFER_DAYS)
+    panel = get_price_panel(db, symbols, start, None)
+    D, S = len(dates), len(symbols)
+    if len(panel.dates) == 0:
+        return {h: np.full((D, S), np.nan) for h in horizons}
+
+    cols = [panel.col(s) for s in symbols]
+    ok = np.array([c is not None for c in cols])
+    ff = np.full((len(panel.dates), S), np.nan)
+    if ok.any():
+        ff[:, ok] = panel.ffill("close")[:, [c for c in cols if c is not None]]
+    last = panel.dates[-1]
+    d0 = np.array(dates, dtype="datetime64[D]")
+    i0 = np.searchsorted(panel.dates, d0, side="right") - 1
+    c0 = np.where((i0 >= 0)[:, None], ff[np.maximum(i0, 0)], np.nan)
+
+    out = {}
+    for h in horizons:
+        d1 = d0 + np.timedelta64(int(h), "D")
+        i1 = np.searchsorted(panel.dates, d1, side="right") - 1
+        c1 = np.where(((i1 >= 0) & (d1 <= last))[:, None], ff[np.maximum(i1, 0)], np.nan)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            out[h] = np.where(c0 > 0, c1 / c0 - 1.0, np.nan)
+    return out
+
+
+# ---------------- IC / 分层 ----------------
+
+def _rank_rows(a: np.ndarray) -> np.ndarray:
+    """逐行平均排名（NaN 保持 NaN）"""
+    return pd.DataFrame(a).rank(axis=1).to_numpy()
+
+
+def ic_series(f: np.ndarray, r: np.ndarray, method: str = "pearson", min_obs: int = 5) -> np.ndarray:
+    """每期截面相关系数；method='rank' 为 Spearman（先逐行排名再求 Pearson）"""
+    m = ~np.isnan(f) & ~np.isnan(r)
+    x = np.where(m, f, np.nan)
+    y = np.where(m, r, np.nan)
+    if method == "rank":
+        x, y = _rank_rows(x), _rank_rows(y)
+    n = m.sum(axis=1)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        dx = np.where(m, x - np.nansum(x, axis=1, keepdims=True) / n[:, None], 0.0)
+        dy = np.where(m, y - np.nansum(y, axis=1, keepdims=True) / n[:, None], 0.0)
+        den = np.sqrt((dx * dx).sum(axis=1) * (dy * dy).sum(axis=1))
+        ic = np.where(den > 0, (dx * dy).sum(axis=1) / den, np.nan)
+    ic[n < min_obs] = np.nan
+    return ic
+
+
+def ic_stats(ic: np.ndarray) -> Dict[str, float]:
+    """IC 均值 / 标准差 / IR / 正 IC 占比（忽略 NaN 期次）"""
+    v = ic[~np.isnan(ic)]
+    if len(v) == 0:
+        return {"ic_mean": 0.0, "ic_std": 0.0, "ic_ir": 0.0, "positive_rate": 0.0, "n_periods": 0}
+    mean, std = float(v.mean()), float(v.std())
+    return {"ic_mean": mean, "ic_std": std, "ic_ir": mean / std if std > 0 else 0.0,
+            "positive_rate": float((v > 0).mean()), "n_periods": int(len(v))}
+
+
+def quantile_returns(f: np.ndarray, r: np.ndarray, quantiles: int = 5) -> Dict[str, object]:
+    """
+    每期按因子值分 quantiles 组（组 0 最低），求各组平均远期收益；
+    返回各组跨期均值与 最高组 - 最低组 的多空价差序列 / 均值。
+    """
+    m = ~np.isnan(f) & ~np.isnan(r)
+    n = m.sum(axis=1)
+    rank = _rank_rows(np.where(m, f, np.nan))
+    with np.errstate(invalid="ignore"):
+        bucket = np.floor((rank - 1) * quantiles / n[:, None])
+    bucket[(n < quantiles)[:, None] | ~m] = np.nan
+
+    means = np.full((f.shape[0], quantiles), np.nan)
+    for q in range(quantiles):
+        in_q = bucket == q
+        cnt = in_q.sum(axis=1)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            means[:, q] = np.where(cnt > 0, np.where(in_q, r, 0.0).sum(axis=1) / cnt, np.nan)
+    spread = means[:, -1] - means[:, 0]
+    valid = ~np.isnan(spread)
+    return {
+        "quantile_means": [None if np.isnan(x) else float(x)
+                           for x in (np.nanmean(means[valid], axis=0) if valid.any()
+                                     else np.full(quantiles, np.nan))],
+        "spread_series": [None if np.isnan(x) else float(x) for x in spread],
+        "spread_mean": float(spread[valid].mean()) if valid.any() else 0.0,
+    }
+
+
+# ---------------- 入口 ----------------
+
+def rebalance_dates(start: date, end: date, step_days: int = 30) -> List[date]:
+    out, d = [], start
+    while d < end:
+        out.append(d)
+        d += timedelta(days=step_days)
+    return out
+
+
+def run_ic_validation(db: Session, symbols: Sequence[str], start: date, end: date,
+                      step_days: int = 30, horizon: int = 30,
+                      decay_horizons: Sequence[int] = DEFAULT_HORIZONS,
+                      factors: Sequence[str] = DEFAULT_FACTORS,
+                      quantiles: int = 5, min_obs: int = 5) -> Dict[str, Dict]:
+    """
+    在 [start, end) 每 step_days 天取一个截面，对 factors 计算：
+    ic_series / ic_mean / ic_std / ic_ir / positive_rate（Pearson，期限 horizon），
+    rank_ic_mean / rank_ic_ir，decay（各期限 IC 均值）与分层收益。
+    """
+    syms = list(dict.fromkeys(symbols))
+    dates = rebalance_dates(start, end, step_days)
+    results = {name: {"ic_series": [], "ic_mean": 0.0, "ic_std": 0.0, "ic_ir": 0.0} for name in factors}
+    if not syms or not dates:
+        return results
+
+    fm = factor_matrices(db, syms, dates, factors)
+    horizons = sorted(set(decay_horizons) | {horizon})
+    fwd = forward_returns(db, syms, dates, horizons)
+
+    for name in factors:
+        f = fm[name]
+        ic = ic_series(f, fwd[horizon], "pearson", min_obs)
+        ric = ic_series(f, fwd[horizon], "rank", min_obs)
+        rs = ic_stats(ric)
+        res = results[name]
+        res.update(ic_stats(ic))
+        res["ic_series"] = [float(x) for x in ic if not np.isnan(x)]
+        res["rank_ic_mean"], res["rank_ic_ir"] = rs["ic_mean"], rs["ic_ir"]
+        res["decay"] = {h: ic_stats(ic_series(f, fwd[h], "pearson", min_obs))["ic_mean"] for h in horizons}
+        q = quantile_returns(f, fwd[horizon], quantiles)
+        res["quantile_means"], res["quantile_spread"] = q["quantile_means"], q["spread_mean"]
+    return results
@@ -1,12 +1,11 @@
 from __future__ import annotations
 from dataclasses import dataclass
-from backend.factors.momentum import momentum_return, _last_close
+from backend.factors.momentum import momentum_return, momentum_returns_batch, _last_close
 from typing import Dict, List, Optional
 from datetime import date
 from sqlalchemy.orm import Session
 
-from backend.factors.momentum import momentum_return
-from backend.factors.sentiment import avg_sentiment_7d
+from backend.factors.sentiment import avg_sentiment_batch
 from backend.storage import models
 
 # 基线权重（可在 .env 或配置中覆盖）
@@ -40,145 +39,108 @@ def _minmax_scale(arr: List[Optional[float]]) -> List[Optional[float]]:
 
 
 def compute_factors(db: Session, symbols: List[str], asof: date) -> List[FactorRow]:
-    rows: List[FactorRow] = []
-    for s in symbols:
-        # 动量和情绪
-        mom_r = momentum_return(db, s, asof, lookback_days=60)
-        senti = avg_sentiment_7d(db, s, asof, days=30)
+    return compute_factors_batch(db, symbols, asof, verbose=True)
 
-        # ⭐ 添加调试输出
-        print(f"  {s} 原始动量返回值={mom_r}")
 
-        # 添加价值和质量因子计算
-        f_value = _compute_value_factor(db, s, asof)
-        f_quality = _compute_quality_factor(db, s, asof)
+def compute_factors_batch(db: Session, symbols: List[str], asof: date,
+                          verbose: bool = False) -> List[FactorRow]:
+    """
+    全市场因子：价格一次区间扫描、基本面一条窗口查询、情绪一条分组聚合，
+    与逐个 symbol 计算的结果一致。
+    """
+    mom_60 = momentum_returns_batch(db, symbols, asof, (60,))[60]
+    senti = avg_sentiment_batch(db, symbols, asof, days=30)
+    funds = _latest_fundamentals(db, symbols)
 
+    rows: List[FactorRow] = []
+    for s in symbols:
+        v = mom_60.get(s)
+        mom_r = None if v is None or np.isnan(v) else float(v)
+        f = funds.get(s)
+        if verbose:
+            print(f"  {s} 原始动量返回值={mom_r}")
+            if f is None:
+                print(f"  ⚠️ {s}: 数据库中无基本面数据")
         rows.append(FactorRow(
             symbol=s,
-            f_value=f_value,
-            f_quality=f_quality,
+            f_value=_value_score(f.pe, f.pb) if f else 0.5,
+            f_quality=_quality_score(f.roe, f.net_margin) if f else 0.5,
             f_momentum_raw=mom_r,  # ⭐ 保存原始值
-            f_sentiment=senti
+            f_sentiment=senti.get(s),
         ))
 
-    # ⭐ 调试：显示缩放前后的动量值
     raw_momentums = [r.f_momentum_raw for r in rows]
-    print(f"\n📊 缩放前动量列表: {raw_momentums}")
-
     scaled = _minmax_scale(raw_momentums)
-    print(f"📊 缩放后动量列表: {scaled}\n")
+    if verbose:
+        print(f"\n📊 缩放前动量列表: {raw_momentums}")
+        print(f"📊 缩放后动量列表: {scaled}\n")
 
     for r, m in zip(rows, scaled):
         r.f_momentum = m
     return rows
 
 
-def _compute_value_factor(db: Session, symbol: str, asof: date) -> float:
-    """计算价值因子(基于 PE/PB)"""
-    from backend.storage.models import Fundamental
+def _latest_fundamentals(db: Session, symbols: List[str]) -> Dict[str, models.Fundamental]:
+    """每个 symbol 最新一条基本面（ROW_NUMBER 窗口查询，一次取回）"""
+    from sqlalchemy import func, select
+    from sqlalchemy.orm import aliased
 
-    fund = db.query(Fundamental).filter(
-        Fundamental.symbol == symbol
-    ).order_by(Fundamental.as_of.desc()).first()
+    F = models.Fundamental
+    syms = list(dict.fromkeys(symbols))
+    if not syms:
+        return {}
+    rn = func.row_number().over(partition_by=F.symbol,
+                                order_by=(F.as_of.desc(), F.id.desc())).label("rn")
+    sub = select(F, rn).where(F.symbol.in_(syms)).subquery()
+    latest = aliased(F, sub)
+    return {f.symbol: f for f in db.execute(select(latest).where(sub.c.rn == 1)).scalars()}
 
-    if not fund:
-        print(f"  ⚠️ {symbol}: 数据库中无基本面数据")
-        return 0.5
 
+def _value_score(pe: Optional[float], pb: Optional[float]) -> float:
+    """价值因子：低 PE / 低 PB 高分；都无效时返回中性 0.5"""
     scores = []
+    if pe and pe > 0:
+        # 极端值：PE > 100 给最低分，< 10 给最高分，正常范围 10-50
+        scores.append(0.0 if pe > 100 else 1.0 if pe < 10 else max(0, min(1, (50 - pe) / 40)))
+    if pb and pb > 0:
+        # PB > 20 多为成长股，正常范围 2-10
+        scores.append(0.0 if pb > 20 else 1.0 if pb < 2 else max(0, min(1, (10 - pb) / 8)))
+    return sum(scores) / len(scores) if scores else 0.5
 
-    # PE因子(低PE高分)
-    if fund.pe and fund.pe > 0:
-        # 处理极端值：TSLA的PE=243太高
-        if fund.pe > 100:
-            pe_score = 0.0  # 估值过高，给最低分
-        elif fund.pe < 10:
-            pe_score = 1.0  # 估值很低，给最高分
-        else:
-            # 正常范围：10-50
-            pe_score = max(0, min(1, (50 - fund.pe) / 40))
-        scores.append(pe_score)
-        print(f"  {symbol} PE={fund.pe:.2f} → PE分数={pe_score:.3f}")
-    else:
-        print(f"  ⚠️ {symbol}: PE数据无效({fund.pe})")
-
-    # PB因子(低PB高分)
-    if fund.pb and fund.pb > 0:
-        # AAPL的PB=57.97太高，说明是成长股
-        if fund.pb > 20:
-            pb_score = 0.0
-        elif fund.pb < 2:
-            pb_score = 1.0
-        else:
-            # 正常范围：2-10
-            pb_score = max(0, min(1, (10 - fund.pb) / 8))
-        scores.append(pb_score)
-        print(f"  {symbol} PB={fund.pb:.2f} → PB分数={pb_score:.3f}")
-    else:
-        print(f"  ⚠️ {symbol}: PB数据无效({fund.pb})")
-
-    if not scores:
-        print(f"  ⚠️ {symbol}: 无有效PE/PB数据，返回中性0.5")
-        return 0.5
 
-    final = sum(scores) / len(scores)
-    print(f"  ✅ {symbol} 价值因子={final:.3f}")
-    return final
+def _pct_score(x: Optional[float], cap: float) -> Optional[float]:
+    """比率（小数或百分比格式）映射到 [0,1]：负值 0，超过 cap% 为 1"""
+    if x is None or x == 0:
+        return None
+    pct = x if x > 1 else x * 100
+    return 0.0 if pct < 0 else 1.0 if pct > cap else max(0, min(1, pct / cap))
 
 
-def _compute_quality_factor(db: Session, symbol: str, asof: date) -> float:
-    """计算质量因子(基于 ROE/净利率)"""
-    from backend.storage.models import Fundamental
+def _quality_score(roe: Optional[float], net_margin: Optional[float]) -> float:
+    """质量因子：ROE（0-30%）与净利率（0-25%）；都无效时返回中性 0.5"""
+    scores = [x for x in (_pct_score(roe, 30), _pct_score(net_margin, 25)) if x is not None]
+    return sum(scores) / len(scores) if scores else 0.5
 
-    fund = db.query(Fundamental).filter(
-        Fundamental.symbol == symbol
-    ).order_by(Fundamental.as_of.desc()).first()
 
+def _compute_value_factor(db: Session, symbol: str, asof: date) -> float:
+    """计算价值因子(基于 PE/PB)"""
+    fund = _latest_fundamentals(db, [symbol]).get(symbol)
     if not fund:
         print(f"  ⚠️ {symbol}: 数据库中无基本面数据")
         return 0.5
+    final = _value_score(fund.pe, fund.pb)
+    print(f"  ✅ {symbol} PE={fund.pe} PB={fund.pb} → 价值因子={final:.3f}")
+    return final
 
-    scores = []
-
-    # ROE因子（注意：数据库里的ROE可能是小数或百分比）
-    if fund.roe is not None and fund.roe != 0:
-        # 判断是小数格式(0.xx)还是百分比格式(xx.xx)
-        roe_pct = fund.roe if fund.roe > 1 else fund.roe * 100
-
-        if roe_pct < 0:
-            roe_score = 0.0  # 负ROE最低分
-        elif roe_pct > 30:
-            roe_score = 1.0  # 超高ROE最高分
-        else:
-            # 正常范围：0-30%
-            roe_score = max(0, min(1, roe_pct / 30))
-        scores.append(roe_score)
-        print(f"  {symbol} ROE={roe_pct:.2f}% → ROE分数={roe_score:.3f}")
-    else:
-        print(f"  ⚠️ {symbol}: ROE数据无效({fund.roe})")
-
-    # 净利率因子
-    if fund.net_margin is not None and fund.net_margin != 0:
-        margin_pct = fund.net_margin if fund.net_margin > 1 else fund.net_margin * 100
-
-        if margin_pct < 0:
-            margin_score = 0.0
-        elif margin_pct > 25:
-            margin_score = 1.0
-        else:
-            # 正常范围：0-25%
-            margin_score = max(0, min(1, margin_pct / 25))
-        scores.append(margin_score)
-        print(f"  {symbol} 净利率={margin_pct:.2f}% → 利润率分数={margin_score:.3f}")
-    else:
-        print(f"  ⚠️ {symbol}: 净利率数据无效({fund.net_margin})")
 
-    if not scores:
-        print(f"  ⚠️ {symbol}: 无有效ROE/净利率数据，返回中性0.5")
+def _compute_quality_factor(db: Session, symbol: str, asof: date) -> float:
+    """计算质量因子(基于 ROE/净利率)"""
+    fund = _latest_fundamentals(db, [symbol]).get(symbol)
+    if not fund:
+        print(f"  ⚠️ {symbol}: 数据库中无基本面数据")
         return 0.5
-
-    final = sum(scores) / len(scores)
-    print(f"  ✅ {symbol} 质量因子={final:.3f}")
+    final = _quality_score(fund.roe, fund.net_margin)
+    print(f"  ✅ {symbol} ROE={fund.roe} 净利率={fund.net_margin} → 质量因子={final:.3f}")
     return final
 
 
@@ -198,6 +160,20 @@ def aggregate_score(row: FactorRow, weights: Dict[str, float]=BASE_WEIGHTS) -> f
         return 50.0  # 完全缺失时给中性分
     return 100.0 * sum(parts) / total_w
 
+def aggregate_score_matrix(f: Dict[str, np.ndarray], weights: Dict[str, float] = BASE_WEIGHTS) -> np.ndarray:
+    """
+    aggregate_score 的矩阵版：f 为 {value/quality/momentum/sentiment: 同形状数组}（缺失为 NaN），
+    返回 0..100；缺失因子不计权重，全缺失为中性 50。
+    """
+    num = den = 0.0
+    for k, w in weights.items():
+        v = f[k]
+        ok = ~np.isnan(v)
+        num = num + np.where(ok, w * v, 0.0)
+        den = den + np.where(ok, w, 0.0)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return np.where(den > 0, 100.0 * num / den, 50.0)
+
 def upsert_scores(db: Session, asof: date, rows: List[FactorRow], version_tag="v0.1"):
     for r in rows:
         score = aggregate_score(r)
@@ -299,7 +275,6 @@ def build_portfolio(
 
 
 # === 因子有效性验证 (追加到现有 scorer.py) ===
-from scipy import stats
 import numpy as np
 
 
@@ -307,144 +282,41 @@ def validate_factor_effectiveness(db: Session, symbols: List[str],
                                   lookback_months: int = 12) -> Dict[str, Dict]:
     """
     验证因子有效性：计算 IC (Information Coefficient)
-    IC = 因子值与未来收益的相关性
+    IC = 因子值与未来收益的相关性；按月截面、未来 1 月收益，
+    由 backend.scoring.ic 以矩阵方式一次算完（另含 Rank IC、衰减曲线、分层收益）。
     """
     from datetime import timedelta
-    import pandas as pd
-
-    results = {
-        'momentum': {'ic_series': [], 'ic_mean': 0.0, 'ic_std': 0.0, 'ic_ir': 0.0},
-        'sentiment': {'ic_series': [], 'ic_mean': 0.0, 'ic_std': 0.0, 'ic_ir': 0.0},
-        'overall_score': {'ic_series': [], 'ic_mean': 0.0, 'ic_std': 0.0, 'ic_ir': 0.0}
-    }
+    from backend.scoring.ic import run_ic_validation
 
+    end_date = date.today()
+    start_date = end_date - timedelta(days=lookback_months * 30)
     try:
-        end_date = date.today()
-        start_date = end_date - timedelta(days=lookback_months * 30)
-
-        # 按月计算IC
-        current_date = start_date
-        while current_date < end_date:
-            next_month = current_date + timedelta(days=30)
-
-            # 获取当月因子值
-            factor_data = []
-            future_returns = []
-
-            for symbol in symbols:
-                # 当月因子
-                mom_factor = momentum_return(db, symbol, current_date, 60)
-                sent_factor = avg_sentiment_7d(db, symbol, current_date, 7)
-
-                # 未来1月收益
-                current_price = _last_close(db, symbol, current_date)
-                future_price = _last_close(db, symbol, next_month)
-
-                if all(x is not None for x in [mom_factor, sent_factor, current_price, future_price]):
-                    future_ret = (future_price / current_price) - 1.0
-
-                    # 计算综合分数
-                    row = FactorRow(symbol, None, None, mom_factor, sent_factor)
-                    scaled_mom = _minmax_scale([mom_factor])[0] or 0.5
-                    row.f_momentum = scaled_mom
-                    overall_score = aggregate_score(row)
-
-                    factor_data.append({
-                        'momentum': scaled_mom,
-                        'sentiment': sent_factor,
-                        'overall_score': overall_score / 100.0  # 归一化到0-1
-                    })
-                    future_returns.append(future_ret)
-
-            # 计算当月IC
-            if len(factor_data) >= 5:  # 至少5只股票
-                for factor_name in ['momentum', 'sentiment', 'overall_score']:
-                    factor_values = [d[factor_name] for d in factor_data]
-                    ic, p_value = stats.pearsonr(factor_values, future_returns)
-                    if not np.isnan(ic):
-                        results[factor_name]['ic_series'].append(ic)
-
-            current_date = next_month
-
-        # 计算统计指标
-        for factor_name in results:
-            ic_series = results[factor_name]['ic_series']
-            if ic_series:
-                results[factor_name]['ic_mean'] = float(np.mean(ic_series))
-                results[factor_name]['ic_std'] = float(np.std(ic_series))
-                results[factor_name]['ic_ir'] = (
-                    results[factor_name]['ic_mean'] / results[factor_name]['ic_std']
-                    if results[factor_name]['ic_std'] > 0 else 0.0
-                )
-                # 正IC占比
-                positive_rate = sum(1 for ic in ic_series if ic > 0) / len(ic_series)
-                results[factor_name]['positive_rate'] = positive_rate
-
+        return run_ic_validation(db, symbols, start_date, end_date, step_days=30, horizon=30)
     except Exception as e:
         print(f"因子有效性验证失败: {e}")
-
-    return results
+        return {k: {'ic_series': [], 'ic_mean': 0.0, 'ic_std': 0.0, 'ic_ir': 0.0}
+                for k in ('momentum', 'sentiment', 'overall_score')}
 
 
 def get_portfolio_risk_metrics(db: Session, weights: List[Dict[str, Any]],
-                               asof: date) -> Dict[str, float]:
+                               asof: Optional[date] = None) -> Dict[str, Any]:
     """
-    计算组合风险指标
+    计算组合风险指标（按日期对齐的收益矩阵来自风险服务缓存，asof 缺省为最新价格日）
     """
-    from backend.factors.risk import calculate_risk_metrics, get_price_series
+    from backend.services.risk import get_risk_matrix, portfolio_risk
 
     portfolio_metrics = {}
 
     try:
-        total_weight = sum(w.get('weight', 0) for w in weights)
-        if total_weight <= 0:
+        w = {}
+        for x in weights:
+            if x.get('symbol') and x.get('weight', 0) > 0:
+                w[x['symbol'].upper()] = w.get(x['symbol'].upper(), 0.0) + float(x['weight'])
+        if not w:
             return portfolio_metrics
-
-        # 获取各股票的历史收益率
-        all_returns = []
-        valid_weights = []
-
-        for w in weights:
-            symbol = w.get('symbol')
-            weight = w.get('weight', 0) / total_weight  # 归一化权重
-
-            if symbol and weight > 0:
-                df = get_price_series(db, symbol, asof, 252)
-                if len(df) >= 30:
-                    prices = df['close'].tolist()
-                    returns = [(prices[i] - prices[i - 1]) / prices[i - 1]
-                               for i in range(1, len(prices))]
-
-                    all_returns.append(np.array(returns) * weight)
-                    valid_weights.append(weight)
-
-        if all_returns:
-            # 计算组合收益率序列
-            min_length = min(len(r) for r in all_returns)
-            portfolio_returns = np.sum([r[:min_length] for r in all_returns], axis=0)
-
-            # 组合风险指标
-            portfolio_metrics['portfolio_volatility'] = float(np.std(portfolio_returns) * np.sqrt(252))
-            portfolio_metrics['portfolio_var_95'] = float(np.percentile(portfolio_returns, 5))
-            portfolio_metrics['portfolio_var_99'] = float(np.percentile(portfolio_returns, 1))
-
-            # 最大回撤（组合层面）
-            cumulative = np.cumprod(1 + portfolio_returns)
-            peak = np.maximum.accumulate(cumulative)
-            drawdown = (cumulative - peak) / peak
-            portfolio_metrics['portfolio_max_drawdown'] = float(np.min(drawdown))
-
-            # 夏普比率
-            excess_return = np.mean(portfolio_returns) * 252 - 0.02  # 假设无风险利率2%
-            portfolio_metrics['portfolio_sharpe'] = (
-                excess_return / portfolio_metrics['portfolio_volatility']
-                if portfolio_metrics['portfolio_volatility'] > 0 else 0.0
-            )
-
-            # 集中度风险
-            portfolio_metrics['concentration_risk'] = float(np.sum(np.array(valid_weights) ** 2))
-
+        rm = get_risk_matrix(db, list(w), asof, lookback=252, min_obs=30)
+        portfolio_metrics = portfolio_risk(rm, w)
     except Exception as e:
         print(f"组合风险指标计算失败: {e}")
 
-    return portfolio_metrics
\ No newline at end of file
+    return portfolio_metrics
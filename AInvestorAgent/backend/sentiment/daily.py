@@ -0,0 +1,151 @@
+# backend/sentiment/daily.py
+"""
+新闻情绪日聚合（sentiment_daily）：每个 (symbol, day) 存 Σsentiment 与条数。
+
+- 打分入库时调用 add_news_scores 增量累加；历史数据 / 其它写入路径用 rebuild_sentiment_daily 重建；
+- 任意回看窗口的均值只是一次小范围读取，且可一次算全市场；
+- half_life（天）给出按日衰减加权的均值：w = 0.5 ** ((asof - day) / half_life)；
+- 回填按 symbol 记在 sentiment_daily_coverage：读取时有新闻却从未回填的 symbol 先整体重建一次
+  （旧库、绕过 add_news_scores 写入的打分都由此补齐，只做一次），之后只读聚合表。
+"""
+from __future__ import annotations
+
+from collections import defaultdict
+from datetime import date, datetime
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+from sqlalchemy import delete, func, insert, select
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.orm import Session
+
+from backend.storage.models import NewsRaw, NewsScore, SentimentDaily, SentimentDailyCoverage
+
+
+def _day(ts) -> Optional[date]:
+    if ts is None:
+        return None
+    if isinstance(ts, datetime):
+        return ts.date()
+    if isinstance(ts, date):
+        return ts
+    try:
+        return datetime.fromisoformat(str(ts).replace("Z", "")).date()
+    except ValueError:
+        return None
+
+
+def add_news_scores(db: Session, items: Iterable[Tuple[str, object, float]]) -> int:
+    """
+    增量累加 (symbol, published_at, sentiment)；同一 (symbol, day) 先在内存合并，
+    再一条 ON CONFLICT DO UPDATE 语句写入。返回涉及的 (symbol, day) 个数。不提交事务。
+    """
+    acc: Dict[Tuple[str, date], List[float]] = defaultdict(lambda: [0.0, 0])
+    for sym, ts, s in items:
+        d = _day(ts)
+        if not sym or d is None or s is None:
+            continue
+        a = acc[(sym, d)]
+        a[0] += float(s)
+        a[1] += 1
+    if not acc:
+        return 0
+
+    t = SentimentDaily.__table__
+    stmt = sqlite_insert(t)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[t.c.symbol, t.c.day],
+        set_={"sum_sent": t.c.sum_sent + stmt.excluded.sum_sent,
+              "n": t.c.n + stmt.excluded.n,
+              "updated_at": stmt.excluded.updated_at},
+    )
+    now = datetime.utcnow()
+    db.execute(stmt, [{"symbol": s, "day": d, "sum_sent": v[0], "n": v[1], "updated_at": now}
+                      for (s, d), v in acc.items()])
+    return len(acc)
+
+
+def rebuild_sentiment_daily(db: Session, symbols: Optional[Sequence[str]] = None) -> int:
+    """
+    由 news_raw × news_scores 整体重建（symbols=None 表示全部），返回写入行数；
+    同时把这些 symbol 记为已回填。不提交事务。
+    """
+    t, cov = SentimentDaily.__table__, SentimentDailyCoverage.__table__
+    d = func.date(NewsRaw.published_at)
+    q = (select(NewsRaw.symbol, d, func.sum(NewsScore.sentiment), func.count(NewsScore.id),
+                func.current_timestamp())
+         .join(NewsScore, NewsScore.news_id == NewsRaw.id)
+         .where(d.is_not(None))
+         .group_by(NewsRaw.symbol, d))
+    clear, unmark = delete(t), delete(cov)
+    covered = select(NewsRaw.symbol, func.current_timestamp()).distinct()
+    if symbols is not None:
+        syms = list(dict.fromkeys(symbols))
+        q = q.where(NewsRaw.symbol.in_(syms))
+        clear = clear.where(t.c.symbol.in_(syms))
+        unmark = unmark.where(cov.c.symbol.in_(syms))
+        covered = covered.where(NewsRaw.symbol.in_(syms))
+    db.execute(clear)
+    res = db.execute(insert(t).from_select(["symbol", "day", "sum_sent", "n", "updated_at"], q))
+    db.execute(unmark)
+    db.execute(insert(cov).from_select(["symbol", "rebuilt_at"], covered))
+    return int(res.rowcount or 0)
+
+
+def ensure_sentiment_daily(db: Session, symbols: Sequence[str]) -> List[str]:
+    """
+    有新闻但从未回填的 symbol 整体重建一次（写进调用方会话，不提交），返回重建的 symbol。
+    一条按 news_raw.symbol 索引的查询判断；没有新闻的 symbol 不做联表。
+    """
+    cov = SentimentDailyCoverage.__table__
+    q = (select(NewsRaw.symbol).distinct()
+         .where(NewsRaw.symbol.in_(list(symbols)), NewsRaw.symbol.not_in(select(cov.c.symbol))))
+    todo = list(db.execute(q).scalars())
+    if todo:
+        rebuild_sentiment_daily(db, todo)
+    return todo
+
+
+def window_sentiment(db: Session, symbols: Sequence[str], since: date, until: Optional[date] = None,
+                     half_life: Optional[float] = None) -> Dict[str, Tuple[Optional[float], int]]:
+    """
+    每个 symbol 在 [since, until] 的情绪均值（-1..1）与条数；无新闻为 (None, 0)。
+    half_life 给定时按日衰减加权（以 until 或今天为基准）。
+    """
+    syms = list(dict.fromkeys(symbols))
+    out: Dict[str, Tuple[Optional[float], int]] = {s: (None, 0) for s in syms}
+    if not syms:
+        return out
+    ensure_sentiment_daily(db, syms)
+    t = SentimentDaily.__table__
+    q = select(t.c.symbol, t.c.day, t.c.sum_sent, t.c.n).where(t.c.symbol.in_(syms), t.c.day >= since)
+    if until is not None:
+        q = q.where(t.c.day <= until)
+    ref = until or date.today()
+
+    num: Dict[str, float] = defaultdict(float)
+    den: Dict[str, float] = defaultdict(float)
+    cnt: Dict[str, int] = defaultdict(int)
+    for sym, d, s, n in db.execute(q):
+        w = 1.0 if half_life is None else 0.5 ** (max((ref - d).days, 0) / half_life)
+        num[sym] += w * s
+        den[sym] += w * n
+        cnt[sym] += n
+    for sym in cnt:
+        if den[sym] > 0:
+            out[sym] = (num[sym] / den[sym], cnt[sym])
+    return out
+
+
+def daily_series(db: Session, symbols: Sequence[str], since: date) -> List[Tuple[date, float, int]]:
+    """symbols 合并后的逐日 (day, 均值, 条数)，按日期升序"""
+    t = SentimentDaily.__table__
+    syms = list(dict.fromkeys(symbols))
+    ensure_sentiment_daily(db, syms)
+    q = (select(t.c.symbol, t.c.day, t.c.sum_sent, t.c.n)
+         .where(t.c.symbol.in_(syms), t.c.day >= since))
+    acc: Dict[date, List[float]] = defaultdict(lambda: [0.0, 0])
+    for _, d, s, n in db.execute(q):
+        acc[d][0] += float(s)
+        acc[d][1] += int(n)
+    return [(d, v[0] / v[1], int(v[1])) for d, v in sorted(acc.items()) if v[1]]
+
@@ -0,0 +1,7 @@
+# backend/services: 路由之间共用的进程内服务（替代对本机 HTTP 接口的回调）
+from .backtest import (run_backtest, run_backtest_async, backtest_holdings, summary_metrics, submit_backtest_job,
+                       run_batch_backtest, load_snapshot_weights)
+from .fundamentals import (get_fundamentals, get_fundamentals_async, lookup_sector, lookup_sectors,
+                           lookup_sectors_async)
+from .risk import get_risk_matrix, portfolio_risk, correlation_summary
+from .var import var_report
@@ -0,0 +1,563 @@
+# backend/services/backtest.py
+"""
+回测服务：/api/backtest/run、/portfolio/propose、/orchestrator/decide 共用的进程内调用入口。
+
+原先 propose / decide 通过 urllib 回调本机 HTTP 接口，会占用 worker、单 worker 部署下还可能自锁；
+现在直接调用 run_backtest()（带结果缓存），异步路由可用 run_backtest_async() 放到线程池执行。
+"""
+from __future__ import annotations
+
+import asyncio
+import sys
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Tuple, Union
+
+import pandas as pd
+from pydantic import BaseModel, Field
+
+# 确保能导入 scripts 模块
+ROOT_DIR = Path(__file__).resolve().parents[2]
+if str(ROOT_DIR) not in sys.path:
+    sys.path.insert(0, str(ROOT_DIR))
+
+from scripts.historical_backtest_simulator import HistoricalBacktestSimulator
+from backend.backtest.cache import backtest_cache_key, cached_backtest
+from backend.portfolio.rebalance import MODES as REBALANCE_MODES
+
+
+# ==================== 请求模型 ====================
+class WeightItem(BaseModel):
+    symbol: str
+    weight: float
+
+
+class RunBacktestReq(BaseModel):
+    # 组合来源（三选一）
+    snapshot_id: Optional[str] = None
+    weights: Optional[List[WeightItem]] = None
+    holdings: Optional[List[Dict[str, Any]]] = None
+
+    # 回测时间窗口
+    window: Optional[str] = None  # "1Y" | "6M" | "252D"
+    window_days: Optional[int] = 252
+
+    # 调仓频率
+    rebalance: Optional[str] = "weekly"  # weekly | monthly | daily
+    max_trades_per_week: Optional[int] = 3  # 暂未使用
+
+    # 基准
+    benchmark_symbol: Optional[str] = "SPY"
+
+    # 成本参数
+    trading_cost: Optional[float] = 0.001  # 交易成本 0.1%
+
+    # 税务参数（用户可调）
+    enable_tax: Optional[bool] = True  # 是否启用税务
+    short_term_tax_rate: Optional[float] = 0.37  # 短期税率 37%
+    long_term_tax_rate: Optional[float] = 0.20  # 长期税率 20%
+
+    # 高级参数
+    initial_capital: Optional[float] = 100000.0
+    enable_factor_optimization: Optional[bool] = False
+    optimization_objective: Optional[str] = "sharpe"
+
+    # 增量调仓：full 每次调到目标；band 无交易带；l1 按成本 / 税只做值得做的交易
+    rebalance_mode: Optional[str] = "full"
+    no_trade_band: Optional[float] = 0.02
+    cost_aversion: Optional[float] = 5.0
+
+    # 稳健性：对回测日收益做重抽样，给出指标分布与置信区间（不影响缓存键）
+    robustness: Optional[bool] = False
+    robustness_paths: Optional[int] = 1000
+    robustness_method: Optional[str] = "stationary"  # stationary | block
+    robustness_block: Optional[float] = 20.0          # 平均 / 固定块长（交易日）
+    robustness_ci: Optional[float] = Field(0.95, gt=0.0, lt=1.0)  # 置信水平，须在 (0, 1) 之间
+
+    # 兼容参数
+    mock: Optional[bool] = False
+
+
+# ==================== 工具函数 ====================
+def parse_window_days(win: Optional[str], fallback: int = 252) -> int:
+    """解析窗口期: 1Y→252, 6M→126, 90D→90"""
+    if not win:
+        return fallback
+    w = win.strip().upper()
+    try:
+        if w.endswith("Y"):
+            return int(round(float(w[:-1]) * 252))
+        if w.endswith("M"):
+            return int(round(float(w[:-1]) * 21))
+        if w.endswith("W"):
+            return int(round(float(w[:-1]) * 5))
+        if w.endswith("D"):
+            return max(int(float(w[:-1])), 5)
+        return max(int(float(w)), 5)
+    except Exception:
+        return fallback
+
+
+def parse_rebalance_freq(rebalance: str) -> str:
+    """转换调仓频率: weekly→W-MON, monthly→MS"""
+    mapping = {
+        "weekly": "W-MON",
+        "monthly": "MS",
+        "daily": "D",
+        "biweekly": "2W-MON"
+    }
+    return mapping.get(rebalance.lower(), "W-MON")
+
+
+def extract_watchlist(req: RunBacktestReq) -> List[str]:
+    """
+    从请求中提取股票池
+    优先级: weights > holdings > snapshot_id
+    """
+    return list(extract_weights(req).keys())
+
+
+def extract_weights(req: RunBacktestReq) -> Dict[str, float]:
+    """合并 weights / holdings 得到 {symbol: weight}（未归一化）"""
+    merged: Dict[str, float] = {}
+
+    # 处理 weights
+    if req.weights:
+        for w in req.weights:
+            if isinstance(w, dict):
+                s = (w.get("symbol") or "").upper().strip()
+                v = float(w.get("weight") or 0.0)
+            else:
+                s = (w.symbol or "").upper().strip()
+                v = float(w.weight or 0.0)
+            if s:
+                merged[s] = merged.get(s, 0.0) + v
+
+    # 处理 holdings
+    if req.holdings:
+        for h in req.holdings:
+            s = str(h.get("symbol", "")).upper().strip()
+            v = float(h.get("weight") or 0.0)
+            if s:
+                merged[s] = merged.get(s, 0.0) + v
+
+    # 处理 snapshot_id（仅在未直接给出权重时）
+    if req.snapshot_id and not merged:
+        from backend.storage.db import SessionLocal
+        with SessionLocal() as db:
+            merged = dict(load_snapshot_weights(db, [req.snapshot_id]).get(req.snapshot_id) or {})
+
+    if not merged:
+        raise ValueError("请提供 weights、holdings 或 snapshot_id")
+
+    # 归一化权重（虽然simulator会重新计算，但这里验证一下）
+    total = sum(max(0.0, v) for v in merged.values())
+    if total <= 0:
+        raise ValueError("权重总和必须大于0")
+
+    return merged
+
+
+def backtest_cache_params(req: RunBacktestReq) -> Dict[str, Any]:
+    """参与缓存键的回测参数（窗口按当天折算成起止日期）"""
+    window_days = parse_window_days(req.window, req.window_days or 252)
+    today = datetime.now()
+    return {
+        "start_date": (today - timedelta(days=window_days)).strftime("%Y-%m-%d"),
+        "end_date": today.strftime("%Y-%m-%d"),
+        "rebalance": parse_rebalance_freq(req.rebalance or "weekly"),
+        "trading_cost": req.trading_cost,
+        "enable_tax": bool(req.enable_tax),
+        "short_term_tax_rate": req.short_term_tax_rate if req.enable_tax else 0.0,
+        "long_term_tax_rate": req.long_term_tax_rate if req.enable_tax else 0.0,
+        "initial_capital": req.initial_capital,
+        "benchmark": req.benchmark_symbol,
+        "enable_factor_optimization": bool(req.enable_factor_optimization),
+        "optimization_objective": req.optimization_objective,
+        "rebalance_mode": req.rebalance_mode or "full",
+        "no_trade_band": req.no_trade_band if req.rebalance_mode == "band" else None,
+        "cost_aversion": req.cost_aversion if req.rebalance_mode == "l1" else None,
+    }
+
+
+def run_full_backtest(req: RunBacktestReq, progress_cb: Optional[Callable[[Dict[str, Any]], None]] = None) -> Dict[str, Any]:
+    """
+    运行完整历史回测
+
+    返回格式兼容前端，包含:
+    - dates: 日期序列
+    - nav: 净值序列
+    - benchmark_nav: 基准净值
+    - drawdown: 回撤序列
+    - metrics: 性能指标（含税务）
+    - trades: 交易明细
+    - params: 回测参数
+    """
+    # 1. 解析参数
+    window_days = parse_window_days(req.window, req.window_days or 252)
+    rebalance_freq = parse_rebalance_freq(req.rebalance or "weekly")
+    watchlist = extract_watchlist(req)
+    trading_cost = req.trading_cost if req.trading_cost is not None else 0.001
+
+    # 2. 计算日期范围
+    end_date = datetime.now().strftime("%Y-%m-%d")
+    start_date = (datetime.now() - timedelta(days=window_days)).strftime("%Y-%m-%d")
+
+    # 3. 打印回测配置
+    print(f"\n{'=' * 60}")
+    print(f"🚀 开始完整回测")
+    print(f"{'=' * 60}")
+    print(f"📊 股票池: {', '.join(watchlist)} ({len(watchlist)}只)")
+    print(f"📅 期间: {start_date} → {end_date} ({window_days}天)")
+    print(f"🔄 调仓: {req.rebalance} ({rebalance_freq})")
+    print(f"💰 初始资金: ${req.initial_capital:,.2f}")
+    print(f"💵 交易成本: {trading_cost * 100:.2f}%")
+    print(f"📈 因子优化: {'启用' if req.enable_factor_optimization else '禁用'}")
+
+    if req.enable_tax:
+        print(f"💸 税务计算: 启用")
+        print(f"   短期税率: {req.short_term_tax_rate * 100:.1f}% (持有≤1年)")
+        print(f"   长期税率: {req.long_term_tax_rate * 100:.1f}% (持有>1年)")
+    else:
+        print(f"💸 税务计算: 禁用")
+
+    # 4. 创建模拟器
+    simulator = HistoricalBacktestSimulator(
+        watchlist=watchlist,
+        initial_capital=req.initial_capital or 100000.0,
+        start_date=start_date,
+        end_date=end_date,
+        short_term_tax_rate=req.short_term_tax_rate if req.enable_tax else 0.0,
+        long_term_tax_rate=req.long_term_tax_rate if req.enable_tax else 0.0,
+        enable_factor_optimization=req.enable_factor_optimization or False,
+        optimization_objective=req.optimization_objective or "sharpe",
+        precompute_scores=True,   # 评分矩阵一次算好、内存分配，不写 scores_daily
+        rebalance_mode=req.rebalance_mode or "full",
+        no_trade_band=req.no_trade_band if req.no_trade_band is not None else 0.02,
+        cost_aversion=req.cost_aversion if req.cost_aversion is not None else 5.0,
+        trading_cost=trading_cost,
+    )
+
+    # 5. 运行回测
+    simulator.run_backtest(rebalance_frequency=rebalance_freq, progress_cb=progress_cb)
+
+    # 6. 获取性能指标
+    metrics = simulator.get_performance_metrics()
+
+    # 7. 格式化历史数据
+    history_df = pd.DataFrame(simulator.history)
+
+    # 8. 格式化交易记录（最多返回200笔）
+    trades_formatted = []
+    for t in simulator.trades[:200]:
+        trades_formatted.append({
+            "date": t["date"].strftime("%Y-%m-%d") if hasattr(t["date"], "strftime") else str(t["date"]),
+            "symbol": t["symbol"],
+            "action": t["action"],
+            "shares": round(t["shares"], 4),
+            "price": round(t["price"], 2),
+            "value": round(t["value"], 2),
+            "tax": round(t.get("tax", 0), 2),
+            "net_value": round(t.get("net_value", t["value"]), 2),
+            "capital_gain": round(t.get("capital_gain", 0), 2) if "capital_gain" in t else None
+        })
+
+    # 9. 构建响应（完全兼容前端）
+    response = {
+        "success": True,
+
+        # 时间序列数据
+        "dates": [d.strftime("%Y-%m-%d") for d in history_df["date"]],
+        "nav": [round(float(x), 6) for x in history_df["nav"].tolist()],
+        "benchmark_nav": [],  # TODO: 添加基准对比
+        "drawdown": [round(float(x), 2) for x in history_df["drawdown"].tolist()],
+
+        # 性能指标（包含税务）
+        "metrics": {
+            # 收益指标
+            "total_return_before_tax": round(metrics["total_return_before_tax"], 2),
+            "total_return_after_tax": round(metrics["total_return_after_tax"], 2),
+            "annualized_return_before_tax": round(metrics["annualized_return_before_tax"], 2),
+            "annualized_return_after_tax": round(metrics["annualized_return_after_tax"], 2),
+
+            # 风险指标
+            "sharpe": round(metrics["sharpe_ratio"], 3),
+            "sharpe_ratio": round(metrics["sharpe_ratio"], 3),  # 兼容两种命名
+            "max_drawdown": round(metrics["max_drawdown"], 2),
+
+            # 交易指标
+            "total_trades": metrics["total_trades"],
+            "win_rate": round(metrics["win_rate"], 2),
+
+            # 税务指标
+            "tax_impact_pct": round(metrics["tax_impact_pct"], 2),
+            "total_tax_paid": round(metrics["total_tax_paid"], 2),
+            "total_capital_gains": round(metrics["total_capital_gains"], 2),
+            "total_capital_losses": round(metrics["total_capital_losses"], 2),
+
+            # 最终价值
+            "final_value_before_tax": round(metrics["final_value_before_tax"], 2),
+            "final_value_after_tax": round(metrics["final_value_after_tax"], 2),
+
+            # 增量调仓：与全量调仓相比的换手与成本（金额）
+            "rebalance": metrics.get("rebalance", {}),
+        },
+
+        # 交易记录
+        "trades": trades_formatted,
+
+        # 回测参数（记录用户设置）
+        "params": {
+            "window": req.window or f"{window_days}D",
+            "window_days": window_days,
+            "cost": trading_cost,
+            "trading_cost": trading_cost,  # 兼容
+            "rebalance": req.rebalance or "weekly",
+            "max_trades_per_week": req.max_trades_per_week or 3,
+            "benchmark": req.benchmark_symbol or "SPY",
+            "enable_tax": req.enable_tax,
+            "short_term_tax_rate": req.short_term_tax_rate if req.enable_tax else 0,
+            "long_term_tax_rate": req.long_term_tax_rate if req.enable_tax else 0,
+            "rebalance_mode": req.rebalance_mode or "full",
+            "initial_capital": req.initial_capital,
+            "start_date": start_date,
+            "end_date": end_date,
+        },
+
+        # 版本标识
+        "version_tag": "full_backtest_with_tax_v1.0",
+        "backtest_id": f"bt_{datetime.now().strftime('%Y%m%d_%H%M%S')}",
+
+        # 调试信息
+        "debug": {
+            "watchlist": watchlist,
+            "total_days": len(history_df),
+            "total_trades": len(simulator.trades),
+            "final_positions": len(simulator.holdings),
+            "rebalance_frequency": rebalance_freq,
+        }
+    }
+    if req.enable_factor_optimization:
+        response["factor_weights"] = simulator.optimized_weights   # 各次重估的日期 / 权重 / 训练目标值
+
+    # 10. 打印结果摘要
+    print(f"\n{'=' * 60}")
+    print(f"✅ 回测完成")
+    print(f"{'=' * 60}")
+    print(f"📊 总交易: {metrics['total_trades']}笔")
+    print(f"💰 税前收益率: {metrics['total_return_before_tax']:.2f}%")
+    print(f"💰 税后收益率: {metrics['total_return_after_tax']:.2f}%")
+    print(f"💸 税务影响: {metrics['tax_impact_pct']:.2f}%")
+    print(f"📉 最大回撤: {metrics['max_drawdown']:.2f}%")
+    print(f"📈 夏普比率: {metrics['sharpe_ratio']:.3f}")
+    print(f"🎯 胜率: {metrics['win_rate']:.1f}%")
+
+    return response
+
+
+def run_backtest(req: Union[RunBacktestReq, Dict[str, Any]], use_cache: bool = True,
+                 progress_cb: Optional[Callable[[Dict[str, Any]], None]] = None) -> Dict[str, Any]:
+    """
+    运行完整历史回测（带结果缓存：同样的归一化权重 / 参数 / 成分股价格版本直接返回上次结果）。
+    参数不合法时抛 ValueError；返回值与 /api/backtest/run 的响应一致，debug.cache 标明是否命中。
+    """
+    if isinstance(req, dict):
+        req = RunBacktestReq(**req)
+    weights = extract_weights(req)
+    if req.robustness and (req.robustness_method or "stationary") not in ("stationary", "block"):
+        raise ValueError("robustness_method 须为 stationary 或 block")
+    if (req.rebalance_mode or "full") not in REBALANCE_MODES:
+        raise ValueError(f"rebalance_mode 须为 {REBALANCE_MODES} 之一")
+    if not use_cache:
+        out, hit = run_full_backtest(req, progress_cb), False
+    else:
+        out, hit = cached_backtest(backtest_cache_params(req), weights, lambda: run_full_backtest(req, progress_cb))
+    out.setdefault("debug", {})["cache"] = "hit" if hit else "miss"
+    if hit:
+        print(f"♻️ 回测缓存命中: {', '.join(weights)}")
+    if req.robustness:
+        out["robustness"] = robustness_report(out, req)
+    return out
+
+
+def robustness_report(result: Dict[str, Any], req: RunBacktestReq) -> Dict[str, Any]:
+    """回测净值 → 重抽样稳健性报告（年化收益 / 夏普 / 最大回撤的分布，小数口径）"""
+    import numpy as np
+    from backend.backtest.robustness import bootstrap_report
+
+    nav = np.asarray(result.get("nav") or [], dtype=float)
+    rets = nav[1:] / nav[:-1] - 1.0 if len(nav) > 1 else nav[:0]
+    n = min(max(int(req.robustness_paths or 1000), 1), 100_000)
+    return bootstrap_report(rets, n_paths=n, method=req.robustness_method or "stationary", block=req.robustness_block or 20.0,
+                            ci=req.robustness_ci if req.robustness_ci is not None else 0.95)
+
+
+async def run_backtest_async(req: Union[RunBacktestReq, Dict[str, Any]], use_cache: bool = True) -> Dict[str, Any]:
+    """在线程池中运行，不阻塞事件循环"""
+    return await asyncio.to_thread(run_backtest, req, use_cache)
+
+
+def submit_backtest_job(req: Union[RunBacktestReq, Dict[str, Any]]):
+    """
+    提交异步回测任务，返回 (Job, 是否合并)。
+    合并键与结果缓存键相同：相同权重 / 参数 / 数据版本的在途任务只跑一次。
+    """
+    from backend.backtest.jobs import get_job_manager
+    from backend.storage.db import SessionLocal
+
+    if isinstance(req, dict):
+        req = RunBacktestReq(**req)
+    weights = extract_weights(req)
+    with SessionLocal() as db:
+        key = backtest_cache_key(db, backtest_cache_params(req), weights)
+    return get_job_manager().submit(key, lambda progress: run_backtest(req, progress_cb=progress))
+
+
+def summary_metrics(result: Optional[Dict[str, Any]]) -> Dict[str, float]:
+    """
+    回测结果 → 快照用的四项指标（小数口径）：ann_return / mdd / sharpe / winrate。
+    模拟器给出的年化、回撤、胜率为百分数，这里换算成小数。
+    """
+    out = {"ann_return": 0.0, "mdd": 0.0, "sharpe": 0.0, "winrate": 0.0}
+    m = (result or {}).get("metrics") if (result or {}).get("success") else None
+    if not m:
+        return out
+    pct = lambda k: float(m.get(k) or 0.0) / 100.0
+    out["ann_return"] = float(m["ann_return"]) if "ann_return" in m else pct("annualized_return_before_tax")
+    out["mdd"] = float(m["mdd"]) if "mdd" in m else pct("max_drawdown")
+    out["sharpe"] = float(m.get("sharpe") or m.get("sharpe_ratio") or 0.0)
+    out["winrate"] = float(m["winrate"]) if "winrate" in m else pct("win_rate")
+    return out
+
+
+def backtest_holdings(holdings: List[Dict[str, Any]], window_days: int = 252, trading_cost: float = 0.001,
+                      rebalance: str = "weekly", benchmark_symbol: str = "SPY") -> Dict[str, float]:
+    """对一组持仓跑一年周频回测，返回 summary_metrics（propose / decide 生成快照时使用）"""
+    result = run_backtest({
+        "holdings": [{"symbol": h["symbol"], "weight": h["weight"]} for h in holdings],
+        "window_days": window_days,
+        "trading_cost": trading_cost,
+        "rebalance": rebalance,
+        "benchmark_symbol": benchmark_symbol,
+    })
+    return summary_metrics(result)
+
+
+# ==================== 多组合批量回测 ====================
+def load_snapshot_weights(db, snapshot_ids: Optional[List[str]] = None, since: Optional[str] = None,
+                          limit: int = 500) -> Dict[str, Dict[str, float]]:
+    """
+    读取 PortfolioSnapshot 的持仓权重 {snapshot_id: {symbol: weight}}。
+    给出 snapshot_ids 时按 id 取，否则取 as_of >= since 的最近 limit 个；payload 解析失败时回落到 holdings_json。
+    """
+    import json
+    from backend.storage.models import PortfolioSnapshot
+
+    q = db.query(PortfolioSnapshot)
+    if snapshot_ids:
+        q = q.filter(PortfolioSnapshot.snapshot_id.in_(list(snapshot_ids)))
+    else:
+        if since:
+            q = q.filter(PortfolioSnapshot.as_of >= since)
+        q = q.order_by(PortfolioSnapshot.created_at.desc()).limit(limit)
+
+    out: Dict[str, Dict[str, float]] = {}
+    for snap in q.all():
+        try:
+            holdings = (json.loads(snap.payload) if snap.payload else {}).get("holdings")
+        except Exception:
+            holdings = None
+        if not holdings and snap.holdings_json:
+            try:
+                holdings = json.loads(snap.holdings_json)
+            except Exception:
+                holdings = None
+        w: Dict[str, float] = {}
+        for h in holdings or []:
+            sym = str(h.get("symbol", "")).upper().strip()
+            if sym:
+                w[sym] = w.get(sym, 0.0) + float(h.get("weight") or 0.0)
+        if w:
+            out[snap.snapshot_id] = w
+    return out
+
+
+def run_batch_backtest(portfolios: Dict[str, Dict[str, float]], window_days: int = 252,
+                       rebalance: str = "weekly", trading_cost: float = 0.001, sort_by: str = "sharpe",
+                       include_nav: bool = True, db=None) -> Dict[str, Any]:
+    """
+    多个组合一次回测：价格面板按全部成分股的并集只读一次，权重堆成 组合 × 股票 矩阵，
+    由 NumPy 内核一次算出全部净值（定期调回各自权重，成本口径同 backtest_engineer）。
+    缺少价格数据的股票从该组合剔除、其余权重重新归一化并记在 missing 里。
+    返回 dates、各组合 nav / metrics，以及按 sort_by 排好的对比表 comparison。
+    """
+    import numpy as np
+    from backend.backtest.engine import run_backtest_batch, simple_returns
+    from backend.backtest.metrics import compute_metrics
+    from backend.backtest.sweep import SORT_KEYS, rebalance_idx
+    from backend.storage.price_panel import ffill, get_price_panel
+
+    if not portfolios:
+        raise ValueError("没有可回测的组合")
+    if sort_by not in SORT_KEYS:
+        raise ValueError(f"sort_by 须为 {SORT_KEYS} 之一")
+    freq = (rebalance or "weekly").lower()
+    if freq not in ("daily", "weekly", "monthly"):
+        raise ValueError("rebalance 须为 daily / weekly / monthly")
+
+    syms = sorted({s.upper() for w in portfolios.values() for s in w})
+    end = datetime.now().date()
+    start = end - timedelta(days=int(window_days))
+    if db is None:
+        from backend.storage.db import SessionLocal
+        with SessionLocal() as s:
+            panel = get_price_panel(s, syms, start - timedelta(days=10), end)
+    else:
+        panel = get_price_panel(db, syms, start - timedelta(days=10), end)
+
+    i0 = int(np.searchsorted(panel.dates, np.datetime64(start, "D")))
+    dates = panel.dates[i0:]
+    closes = ffill(panel.adjusted_close)[i0:]
+    have = {s for s, ok in zip(panel.symbols, ~np.isnan(closes).all(axis=0)) if ok}
+    if len(dates) < 2 or not have:
+        raise ValueError("区间内价格数据不足，无法回测")
+    col = {s: j for j, s in enumerate(panel.symbols)}
+
+    ids = list(portfolios)
+    W = np.zeros((len(ids), len(panel.symbols)))
+    missing: Dict[str, List[str]] = {}
+    for i, pid in enumerate(ids):
+        w = {s.upper(): max(float(v or 0.0), 0.0) for s, v in portfolios[pid].items()}
+        missing[pid] = sorted(s for s in w if s not in have)
+        tot = sum(v for s, v in w.items() if s in have)
+        for s, v in w.items():
+            if s in have and tot > 0:
+                W[i, col[s]] += v / tot
+
+    res = run_backtest_batch(simple_returns(np.nan_to_num(closes)), W, rebalance_idx(dates, freq),
+                             tc=float(trading_cost or 0.0))
+    day_str = [str(d) for d in dates]
+
+    rows, out_ports = [], []
+    for i, pid in enumerate(ids):
+        nav = res.nav[i]
+        m = compute_metrics(nav.tolist(), day_str)
+        row = {"id": pid, "ann_return": m["ann_return"], "sharpe": m["sharpe"], "max_dd": m["max_dd"],
+               "win_rate": m["win_rate"], "turnover": float(res.turnover[i].sum()), "final_nav": float(nav[-1]),
+               "n_holdings": int((W[i] > 0).sum())}
+        rows.append(row)
+        p = {"id": pid, "weights": {s: round(float(W[i, col[s]]), 6) for s in panel.symbols if W[i, col[s]] > 0},
+             "missing": missing[pid], "metrics": m}
+        if include_nav:
+            p["nav"] = np.round(nav, 6).tolist()
+            p["drawdown"] = np.round(res.drawdown[i], 6).tolist()
+        out_ports.append(p)
+
+    comparison = sorted(rows, key=lambda r: r[sort_by], reverse=True)
+    for k, r in enumerate(comparison, 1):
+        r["rank"] = k
+    print(f"📊 批量回测: {len(ids)} 个组合 × {len(panel.symbols)} 只 × {len(dates)} 天")
+    return {"dates": day_str if include_nav else [day_str[0], day_str[-1]],
+            "portfolios": out_ports, "comparison": comparison,
+            "params": {"window_days": int(window_days), "rebalance": freq, "trading_cost": trading_cost,
+                       "sort_by": sort_by, "start_date": day_str[0], "end_date": day_str[-1]}}
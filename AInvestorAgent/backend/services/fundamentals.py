@@ -0,0 +1,69 @@
+# backend/services/fundamentals.py
+"""
+基本面 / 行业查询服务：直接读库，供路由与编排器进程内调用（不再回调本机 /fundamentals 接口）。
+"""
+from __future__ import annotations
+
+import asyncio
+from typing import Any, Dict, Iterable, Optional
+
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+
+from backend.storage.db import SessionLocal
+from backend.storage.models import Fundamental, Symbol
+
+
+def _fundamental_dict(sym: str, f: Fundamental) -> Dict[str, Any]:
+    return {"symbol": sym, "pe": f.pe, "pb": f.pb, "roe": f.roe, "net_margin": f.net_margin,
+            "market_cap": f.market_cap, "sector": f.sector, "industry": f.industry,
+            "as_of": str(f.as_of) if f.as_of else None}
+
+
+def get_fundamentals(symbol: str, db: Optional[Session] = None) -> Optional[Dict[str, Any]]:
+    """最新一期基本面；无数据返回 None"""
+    sym = (symbol or "").upper()
+    if db is None:
+        with SessionLocal() as s:
+            return get_fundamentals(sym, s)
+    f = db.query(Fundamental).filter(Fundamental.symbol == sym).order_by(Fundamental.as_of.desc()).first()
+    return _fundamental_dict(sym, f) if f else None
+
+
+def lookup_sectors(symbols: Iterable[str], db: Optional[Session] = None) -> Dict[str, str]:
+    """
+    批量查行业：优先 symbols 表，其次最新基本面；都没有的不出现在结果里。
+    两条查询完成，不逐只访问。
+    """
+    syms = sorted({(s or "").upper() for s in symbols if s})
+    if not syms:
+        return {}
+    if db is None:
+        with SessionLocal() as s:
+            return lookup_sectors(syms, s)
+    out = {sym: sec.strip() for sym, sec in db.execute(
+        select(Symbol.symbol, Symbol.sector).where(Symbol.symbol.in_(syms))).all()
+        if isinstance(sec, str) and sec.strip() and sec.strip().lower() != "unknown"}
+    rest = [s for s in syms if s not in out]
+    if rest:
+        rows = db.execute(
+            select(Fundamental.symbol, Fundamental.sector)
+            .where(Fundamental.symbol.in_(rest), Fundamental.sector.is_not(None))
+            .order_by(Fundamental.symbol, Fundamental.as_of)
+        ).all()
+        for sym, sec in rows:              # 同一 symbol 按日期升序，最后一条即最新
+            if sec.strip():
+                out[sym] = sec.strip()
+    return out
+
+
+def lookup_sector(symbol: str, db: Optional[Session] = None) -> Optional[str]:
+    return lookup_sectors([symbol], db).get((symbol or "").upper())
+
+
+async def get_fundamentals_async(symbol: str) -> Optional[Dict[str, Any]]:
+    return await asyncio.to_thread(get_fundamentals, symbol)
+
+
+async def lookup_sectors_async(symbols: Iterable[str]) -> Dict[str, str]:
+    return await asyncio.to_thread(lookup_sectors, list(symbols))
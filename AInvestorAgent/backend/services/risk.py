@@ -0,0 +1,216 @@
+# backend/services/risk.py
+"""
+风险服务：按日期对齐的收益矩阵只构建一次，协方差 / 相关矩阵各一次矩阵乘法（BLAS）算出，并带缓存。
+
+- 对齐：价格面板取 asof 之前 lookback 个交易日，先剔除有效价格不足 min_obs 的股票，
+  再只保留其余股票当天都有价格的日期，收益按这些日期逐段计算（不再按位置截断）；
+- 矩：等权或指数加权（halflife 个交易日半衰），cov = Xᵀ X，X = √w ⊙ (R - μ)，无偏修正 1 / (1 - Σw²)；
+- 缓存：按 (股票集合, asof, lookback, halflife, min_obs) LRU 缓存，价格写入的事务结束时随 invalidate_price_panel 失效；
+  get_portfolio_risk_metrics、RiskManager、/api/validation/portfolio-risk 与组合优化器共用；
+  VaR / CVaR 及其分解见 backend/services/var.py。
+"""
+from __future__ import annotations
+
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from datetime import date, timedelta
+from functools import cached_property
+from typing import Any, Dict, List, Mapping, Optional, Sequence, Tuple
+
+import numpy as np
+from sqlalchemy import func, select
+from sqlalchemy.orm import Session
+
+from backend.storage.models import PriceDaily
+from backend.storage.price_panel import ffill, get_price_panel, on_price_invalidate
+
+PERIODS = 252
+RISK_CACHE_SIZE = 64
+
+
+def ledoit_wolf(returns: np.ndarray) -> Tuple[np.ndarray, float]:
+    """T×N 收益 → (收缩协方差, δ)：Σ = δ·μI + (1-δ)·S，δ 按 Ledoit-Wolf (2004) 的最优估计"""
+    X = np.asarray(returns, dtype=float)
+    T, N = X.shape
+    X = X - X.mean(axis=0)
+    S = X.T @ X / T
+    mu = np.trace(S) / N
+    d2 = ((S - mu * np.eye(N)) ** 2).sum()
+    b2 = ((np.einsum("ti,ti->t", X, X) ** 2).sum() - T * (S ** 2).sum()) / T ** 2
+    delta = float(min(max(b2, 0.0), d2) / d2) if d2 > 0 else 1.0
+    return delta * mu * np.eye(N) + (1.0 - delta) * S, delta
+
+
+def ewma_weights(T: int, halflife: Optional[float] = None) -> np.ndarray:
+    """T 个观测的权重（和为 1）：halflife 为空时等权，否则越近越大、每 halflife 天减半"""
+    if not halflife or T == 0:
+        return np.full(T, 1.0 / max(T, 1))
+    w = 0.5 ** (np.arange(T - 1, -1, -1) / float(halflife))
+    return w / w.sum()
+
+
+def moments(R: np.ndarray, halflife: Optional[float] = None) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """T×N 收益 → (均值, 协方差, 相关矩阵)；零波动的股票与其它股票相关记 0"""
+    w = ewma_weights(len(R), halflife)
+    mean = w @ R
+    X = (R - mean) * np.sqrt(w)[:, None]
+    cov = X.T @ X / max(1.0 - float(w @ w), 1e-12)
+    sd = np.sqrt(np.maximum(np.diag(cov), 0.0))
+    inv = np.where(sd > 0, 1.0 / np.where(sd > 0, sd, 1.0), 0.0)
+    corr = np.clip(cov * np.outer(inv, inv), -1.0, 1.0)
+    np.fill_diagonal(corr, 1.0)
+    return mean, cov, corr
+
+
+@dataclass
+class RiskMatrix:
+    symbols: List[str]             # 数据足够的股票（升序）
+    dates: np.ndarray              # 每行收益的结束日
+    returns: np.ndarray            # T×N 日收益
+    mean: np.ndarray               # 日均收益（halflife 非空时为指数加权）
+    cov: np.ndarray                # 日协方差 N×N
+    corr: np.ndarray
+    asof: date
+    lookback: int
+    halflife: Optional[float] = None
+    missing: List[str] = field(default_factory=list)
+
+    @property
+    def vol(self) -> np.ndarray:
+        """年化波动"""
+        return np.sqrt(np.diag(self.cov) * PERIODS)
+
+    @cached_property
+    def shrunk(self) -> Tuple[np.ndarray, float]:
+        """等权收益的 Ledoit-Wolf 收缩协方差（日度）与收缩强度，首次访问时计算"""
+        return ledoit_wolf(self.returns)
+
+    def index(self, symbols: Sequence[str]) -> List[int]:
+        col = {s: j for j, s in enumerate(self.symbols)}
+        return [col[s.upper()] for s in symbols if s and s.upper() in col]
+
+    def weight_vector(self, weights: Mapping[str, float]) -> np.ndarray:
+        """{symbol: 权重} → 与 symbols 对齐的向量（不在矩阵中的股票忽略）"""
+        col = {s: j for j, s in enumerate(self.symbols)}
+        w = np.zeros(len(self.symbols))
+        for s, v in weights.items():
+            j = col.get(str(s).upper())
+            if j is not None:
+                w[j] += float(v)
+        return w
+
+    def covered_weights(self, weights: Mapping[str, float]) -> Tuple[np.ndarray, List[str], float]:
+        """
+        {symbol: 权重}（负权重记 0）→ (只在矩阵内股票上归一化的权重向量, 不在矩阵中被剔除的股票, 矩阵内股票的原权重占比)。
+        矩阵内没有持仓时权重向量全为 0。
+        """
+        pos = {str(s).upper(): max(float(v), 0.0) for s, v in weights.items()}
+        col = set(self.symbols)
+        dropped = sorted(s for s, v in pos.items() if v > 0 and s not in col)
+        total = sum(pos.values())
+        w = self.weight_vector(pos)
+        covered = float(w.sum())
+        return (w / covered if covered > 0 else w), dropped, (covered / total if total > 0 else 0.0)
+
+
+_CACHE: "OrderedDict[tuple, RiskMatrix]" = OrderedDict()
+_LOCK = threading.Lock()
+
+
+def _drop_cached(symbols: Optional[set]) -> None:
+    with _LOCK:
+        for k in [k for k in _CACHE if symbols is None or symbols & set(k[0])]:
+            del _CACHE[k]
+
+
+on_price_invalidate(_drop_cached)
+
+
+def latest_price_date(db: Session, symbols: Sequence[str]) -> Optional[date]:
+    return db.execute(select(func.max(PriceDaily.date)).where(PriceDaily.symbol.in_(list(symbols)))).scalar()
+
+
+def get_risk_matrix(db: Session, symbols: Sequence[str], asof: Optional[date] = None, lookback: int = 252,
+                    halflife: Optional[float] = None, min_obs: int = 60) -> RiskMatrix:
+    """
+    取（或构建并缓存）symbols 在 asof（缺省为这些股票的最新价格日）之前 lookback 个交易日的风险矩阵。
+    没有任何股票满足 min_obs 时抛 ValueError。
+    """
+    syms = sorted({s.upper() for s in symbols if s})
+    if asof is None:
+        asof = latest_price_date(db, syms) if syms else None
+        if asof is None:
+            raise ValueError("价格数据不足，无法计算风险矩阵")
+    key = (tuple(syms), asof, int(lookback), float(halflife) if halflife else None, int(min_obs))
+    with _LOCK:
+        hit = _CACHE.get(key)
+        if hit is not None:
+            _CACHE.move_to_end(key)
+            return hit
+
+    panel = get_price_panel(db, syms, asof - timedelta(days=int(lookback * 1.6) + 10), asof)
+    closes = panel.adjusted_close[-(lookback + 1):]
+    col = {s: j for j, s in enumerate(panel.symbols)}
+    n_ok = np.isfinite(closes).sum(axis=0)
+    use = [s for s in syms if s in col and n_ok[col[s]] >= min_obs]
+    if not use:
+        raise ValueError("价格数据不足，无法计算风险矩阵")
+
+    px = closes[:, [col[s] for s in use]]
+    rows = np.isfinite(px).all(axis=1)                    # 所有股票都有价格的交易日
+    dates = panel.dates[-(lookback + 1):]
+    if rows.sum() >= min_obs:
+        px, dates = px[rows], dates[rows]
+    else:                                                 # 交集太短：前向填充后计算，缺失收益记 0
+        px = ffill(px)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        R = np.nan_to_num(px[1:] / px[:-1] - 1.0, nan=0.0, posinf=0.0, neginf=0.0)
+    mean, cov, corr = moments(R, halflife)
+    rm = RiskMatrix(symbols=use, dates=dates[1:], returns=R, mean=mean, cov=cov, corr=corr, asof=asof,
+                    lookback=int(lookback), halflife=halflife, missing=[s for s in syms if s not in set(use)])
+    with _LOCK:
+        _CACHE[key] = rm
+        while len(_CACHE) > RISK_CACHE_SIZE:
+            _CACHE.popitem(last=False)
+    return rm
+
+
+def correlation_summary(corr: np.ndarray, threshold: float = 0.7) -> Dict[str, float]:
+    """平均 / 最大两两相关，以及相关系数超过 threshold 的股票对占比（每对只计一次）"""
+    n = len(corr)
+    if n < 2:
+        return {}
+    iu = np.triu_indices(n, k=1)
+    pairs = corr[iu]
+    return {"avg_correlation": float(pairs.mean()), "max_correlation": float(pairs.max()),
+            "correlation_risk_ratio": float((pairs > threshold).mean())}
+
+
+def portfolio_risk(rm: RiskMatrix, weights: Mapping[str, float], rf: float = 0.02) -> Dict[str, Any]:
+    """
+    组合层面的风险指标（年化波动、历史 VaR / CVaR、最大回撤、夏普、集中度）。
+    矩阵中没有（价格数据不足）的股票剔除，其余权重重新归一化；剔除的股票与覆盖的权重占比随结果返回。
+    """
+    w, dropped, covered = rm.covered_weights(weights)
+    if not w.any():
+        return {}
+    r = rm.returns @ w
+    vol = float(np.sqrt(max(w @ rm.cov @ w, 0.0) * PERIODS))
+    nav = np.cumprod(1.0 + r)
+    peak = np.maximum.accumulate(np.maximum(nav, 1.0))
+    excess = float(r.mean()) * PERIODS - rf
+    var95, var99 = np.percentile(r, [5, 1])
+    return {
+        "portfolio_volatility": vol,
+        "portfolio_var_95": float(var95),
+        "portfolio_var_99": float(var99),
+        "portfolio_cvar_95": float(r[r <= var95].mean()),
+        "portfolio_cvar_99": float(r[r <= var99].mean()),
+        "portfolio_max_drawdown": float(np.min(nav / peak - 1.0)),
+        "portfolio_sharpe": excess / vol if vol > 0 else 0.0,
+        "concentration_risk": float(np.sum(w ** 2)),
+        "n_obs": int(len(r)),
+        "dropped": dropped,
+        "covered_weight": covered,
+    }
@@ -0,0 +1,155 @@
+# backend/services/var.py
+"""
+组合 VaR / CVaR 引擎（口径同 calculate_var：收益分位数，亏损为负数），输入为风险服务中按日期对齐的收益矩阵与协方差。
+
+- historical：组合在历史情景上的收益 r_p = R·w（horizon > 1 天时用重叠的 h 日累计收益）；
+- parametric：正态近似，VaR = μ_p + z·σ_p，CVaR = μ_p - σ_p·φ(z)/α，z = Φ⁻¹(α)，α = 1 - confidence；
+- monte_carlo：X = μ + Z·Lᵀ（L 为协方差的 Cholesky 因子），默认 10 万条情景，分块生成，
+  第二遍按相同种子重放只取尾部情景，内存不随情景数膨胀。
+分解（Euler，组件之和等于组合值）：参数法用解析梯度 ∂VaR/∂w = μ + z·Σw/σ_p；
+历史 / 模拟法的 CVaR 组件为 w_i·E[X_i | r_p ≤ VaR]，VaR 组件取分位点附近情景的条件均值并按组合 VaR 归一。
+"""
+from __future__ import annotations
+
+from statistics import NormalDist
+from typing import Any, Dict, Mapping, Optional, Sequence
+
+import numpy as np
+
+from .risk import RiskMatrix
+
+METHODS = ("historical", "parametric", "monte_carlo")
+MC_PATHS = 100_000
+MC_MAX_DRAWS = 20_000_000      # 情景数 × 股票数 上限（每遍生成的正态随机数个数），超出时拒绝
+_CHUNK = 20_000
+
+
+def _decompose(w: np.ndarray, x_var: np.ndarray, x_tail: np.ndarray, var: float) -> Dict[str, np.ndarray]:
+    """分位点附近 / 尾部情景的条件均值 → 边际 VaR、VaR 组件（归一到组合 VaR）、CVaR 组件"""
+    comp = w * x_var
+    scale = var / comp.sum() if abs(comp.sum()) > 1e-15 else 1.0
+    return {"marginal_var": x_var * scale, "component_var": comp * scale, "component_cvar": w * x_tail}
+
+
+def _window(n: int) -> int:
+    """分位点附近取 ±m 个情景估计条件均值（m ≈ √n / 2）"""
+    return max(1, int(np.sqrt(n) / 2))
+
+
+def historical_var(R: np.ndarray, w: np.ndarray, confidence: float = 0.95, horizon: int = 1) -> Dict[str, Any]:
+    """T×N 情景收益 + 权重 → 历史法 VaR / CVaR 与分解"""
+    if horizon > 1:
+        S = np.vstack([np.zeros((1, R.shape[1])), np.cumsum(R, axis=0)])
+        R = S[horizon:] - S[:-horizon]
+    rp = R @ w
+    n = len(rp)
+    if n < 2:
+        raise ValueError("历史情景不足，无法计算 VaR")
+    alpha = 1.0 - confidence
+    var = float(np.quantile(rp, alpha))
+    tail = rp <= var
+    order = np.argsort(rp, kind="stable")
+    k, m = int(np.clip(round(alpha * (n - 1)), 0, n - 1)), _window(n)
+    near = order[max(0, k - m): k + m + 1]
+    out = {"var": var, "cvar": float(rp[tail].mean()), "n_scenarios": int(n)}
+    out.update(_decompose(w, R[near].mean(axis=0), R[tail].mean(axis=0), var))
+    return out
+
+
+def parametric_var(mean: np.ndarray, cov: np.ndarray, w: np.ndarray, confidence: float = 0.95,
+                   horizon: int = 1) -> Dict[str, Any]:
+    """均值 / 协方差（日度）→ 正态参数法 VaR / CVaR 与解析分解"""
+    alpha = 1.0 - confidence
+    z = NormalDist().inv_cdf(alpha)
+    mu, C = mean * horizon, cov * horizon
+    cw = C @ w
+    sd = float(np.sqrt(max(w @ cw, 0.0)))
+    es = NormalDist().pdf(z) / alpha
+    g = cw / sd if sd > 0 else np.zeros_like(w)
+    marginal = mu + z * g
+    return {"var": float(w @ mu + z * sd), "cvar": float(w @ mu - es * sd), "volatility": sd,
+            "marginal_var": marginal, "component_var": w * marginal, "component_cvar": w * (mu - es * g)}
+
+
+def cholesky_factor(cov: np.ndarray) -> np.ndarray:
+    """协方差的 Cholesky 因子；半正定（奇异）时逐步加对角扰动，仍失败则用特征分解"""
+    jitter = 0.0
+    scale = float(np.mean(np.diag(cov))) or 1.0
+    for _ in range(6):
+        try:
+            return np.linalg.cholesky(cov + jitter * np.eye(len(cov)))
+        except np.linalg.LinAlgError:
+            jitter = scale * (1e-12 if jitter == 0 else jitter / scale * 100)
+    vals, vecs = np.linalg.eigh(cov)
+    return vecs * np.sqrt(np.maximum(vals, 0.0))
+
+
+def monte_carlo_var(mean: np.ndarray, cov: np.ndarray, w: np.ndarray, confidence: float = 0.95,
+                    horizon: int = 1, n_paths: int = MC_PATHS, seed: Optional[int] = 0) -> Dict[str, Any]:
+    """多元正态模拟 n_paths 条相关情景（Cholesky），返回 VaR / CVaR 与分解"""
+    mu, L = mean * horizon, cholesky_factor(cov * horizon)
+    b = L.T @ w
+    ss = np.random.SeedSequence(seed)
+    seeds = ss.spawn(-(-n_paths // _CHUNK))
+    sizes = [min(_CHUNK, n_paths - i * _CHUNK) for i in range(len(seeds))]
+    N = len(w)
+    # 第一遍：只需 r_p = μ·w + Z·(Lᵀw)
+    rp = np.concatenate([np.random.default_rng(s).standard_normal((m, N)) @ b for s, m in zip(seeds, sizes)])
+    rp += mu @ w
+    alpha = 1.0 - confidence
+    var = float(np.quantile(rp, alpha))
+    tail = rp <= var
+    order = np.argsort(rp, kind="stable")
+    k, h = int(np.clip(round(alpha * (n_paths - 1)), 0, n_paths - 1)), _window(n_paths)
+    near = np.zeros(n_paths, dtype=bool)
+    near[order[max(0, k - h): k + h + 1]] = True
+    # 第二遍：按同样的种子重放，只累加尾部 / 分位点附近情景的 Z
+    z_tail, z_near, i0 = np.zeros(N), np.zeros(N), 0
+    for s, m in zip(seeds, sizes):
+        Z = np.random.default_rng(s).standard_normal((m, N))
+        z_tail += Z[tail[i0:i0 + m]].sum(axis=0)
+        z_near += Z[near[i0:i0 + m]].sum(axis=0)
+        i0 += m
+    x_tail = mu + (z_tail / max(tail.sum(), 1)) @ L.T
+    x_near = mu + (z_near / max(near.sum(), 1)) @ L.T
+    out = {"var": var, "cvar": float(rp[tail].mean()), "n_paths": int(n_paths)}
+    out.update(_decompose(w, x_near, x_tail, var))
+    return out
+
+
+def var_report(rm: RiskMatrix, weights: Mapping[str, float], confidence: float = 0.95, horizon: int = 1,
+               methods: Sequence[str] = METHODS, n_paths: int = MC_PATHS, seed: Optional[int] = 0) -> Dict[str, Any]:
+    """
+    风险矩阵 + {symbol: 权重} → 各方法的 VaR / CVaR 与逐只持仓的边际 VaR、VaR 组件、CVaR 组件。
+    矩阵中没有的股票剔除、其余权重重新归一化（剔除的股票见 dropped）；参数法 / 模拟法使用 rm 的均值与协方差
+    （halflife 非空时为指数加权）。
+    """
+    bad = [m for m in methods if m not in METHODS]
+    if bad:
+        raise ValueError(f"VaR 方法须为 {METHODS} 之一")
+    if not 0.5 < confidence < 1.0:
+        raise ValueError("confidence 须在 (0.5, 1) 之间")
+    if "monte_carlo" in methods and n_paths * len(rm.symbols) > MC_MAX_DRAWS:
+        raise ValueError(f"蒙特卡洛情景数 × 股票数须 ≤ {MC_MAX_DRAWS:,}（{len(rm.symbols)} 只股票最多 "
+                         f"{MC_MAX_DRAWS // max(len(rm.symbols), 1):,} 条情景）")
+    if sum(max(float(v), 0.0) for v in weights.values()) <= 0:
+        raise ValueError("权重之和须为正")
+    w, dropped, covered = rm.covered_weights(weights)
+    if not w.any():
+        raise ValueError("持仓股票均无足够的价格数据，无法计算 VaR")
+    held = np.flatnonzero(w > 0)
+    syms = [rm.symbols[j] for j in held]
+
+    out: Dict[str, Any] = {"confidence": confidence, "horizon": int(horizon), "symbols": syms,
+                           "dropped": dropped, "covered_weight": covered}
+    for m in methods:
+        if m == "historical":
+            res = historical_var(rm.returns, w, confidence, horizon)
+        elif m == "parametric":
+            res = parametric_var(rm.mean, rm.cov, w, confidence, horizon)
+        else:
+            res = monte_carlo_var(rm.mean, rm.cov, w, confidence, horizon, n_paths, seed)
+        for key in ("marginal_var", "component_var", "component_cvar"):
+            res[key] = {s: float(res[key][j]) for s, j in zip(syms, held)}
+        out[m] = {k: (float(v) if isinstance(v, (float, np.floating)) else v) for k, v in res.items()}
+    return out
@@ -13,8 +13,9 @@ logger = logging.getLogger(__name__)
 class TradingEngine:
     """模拟交易引擎"""
 
-    def __init__(self, account_id: str = "default"):
+    def __init__(self, account_id: str = "default", commission_rate: float = 0.001):
         self.account_id = account_id
+        self.commission_rate = commission_rate  # 单边手续费率，调仓计划的成本估计也用它
 
     def get_or_create_account(self, initial_cash: float = 100000.0) -> SimAccount:
         """获取或创建模拟账户"""
@@ -33,7 +34,7 @@ class TradingEngine:
                 db.refresh(account)
             return account
 
-    def _get_latest_price(self, symbol: str) -> float:
+    def get_latest_price(self, symbol: str) -> float:
         """获取股票最新价格"""
         try:
             prices = get_prices_for_symbol(symbol, limit=1)
@@ -53,10 +54,10 @@ class TradingEngine:
 
         # 获取最新价格
         if price is None:
-            price = self._get_latest_price(symbol)
+            price = self.get_latest_price(symbol)
 
         total_amount = quantity * price
-        commission = total_amount * 0.001  # 0.1% 手续费
+        commission = total_amount * self.commission_rate
 
         with Session(engine) as db:
             account = self.get_or_create_account()
@@ -145,7 +146,7 @@ class TradingEngine:
 
             for pos in positions:
                 try:
-                    current_price = self._get_latest_price(pos.symbol)
+                    current_price = self.get_latest_price(pos.symbol)
                     market_value = pos.quantity * current_price
                     unrealized_pnl = market_value - (pos.quantity * pos.avg_cost)
 
@@ -1,42 +1,183 @@
+from dataclasses import dataclass
 from datetime import datetime, timedelta
-from typing import Iterable, List, Dict
-from sqlalchemy import select, func, and_
+from typing import Iterable, List, Dict, Tuple
+from sqlalchemy import event, select, func, and_, or_, tuple_
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
 from sqlalchemy.orm import Session
 from .models import PriceDaily, RunHistory
+from .price_panel import drop_cached_panels, invalidate_price_panel
+from .mmap_store import mirror_price_rows, mmap_backend_enabled
 
-def upsert_prices_daily(db: Session, rows: Iterable[Dict]) -> int:
-    # 1) 取出 ORM 实际列名
+# 批量 upsert 每批行数：10 列 × 500 行 ≈ 5000 个绑定参数，低于 SQLite 默认上限 32766
+BULK_BATCH_SIZE = 500
+
+# “源字段 -> 可能的目标别名”候选（按优先级从左到右）
+_PRICE_ALIAS_MAP = {
+    "dividend_amount": ["dividend_amount", "dividend", "dividendAmount"],
+    "split_coefficient": ["split_coefficient", "split_coef", "splitCoefficient", "splitCoeff"],
+}
+
+
+def _remap_price_row(r: Dict, model_cols: set) -> Dict:
+    """只保留 PriceDaily 实际存在的列；别名字段映射到真实列名，未知字段直接丢弃（避免 invalid kw）"""
+    r2: Dict = {}
+    for k, v in r.items():
+        if k in model_cols:
+            r2[k] = v
+            continue
+        for cand in _PRICE_ALIAS_MAP.get(k, ()):
+            if cand in model_cols:
+                r2[cand] = v
+                break
+    return r2
+
+
+@dataclass
+class UpsertStats:
+    """批量 upsert 结果：新增 / 实际更新 / 内容未变化 的行数"""
+    inserted: int = 0
+    updated: int = 0
+    unchanged: int = 0
+
+    @property
+    def written(self) -> int:
+        """真正写库的行数（新增 + 更新）"""
+        return self.inserted + self.updated
+
+    @property
+    def total(self) -> int:
+        return self.inserted + self.updated + self.unchanged
+
+    def merge(self, other: "UpsertStats") -> "UpsertStats":
+        self.inserted += other.inserted
+        self.updated += other.updated
+        self.unchanged += other.unchanged
+        return self
+
+    def as_dict(self) -> Dict[str, int]:
+        return {"inserted": self.inserted, "updated": self.updated, "unchanged": self.unchanged}
+
+
+def _price_upsert_stmt(update_cols: Tuple[str, ...]):
+    """
+    INSERT ... ON CONFLICT(symbol, date) DO UPDATE ... WHERE 任一列 IS DISTINCT FROM 新值。
+    语句只依赖列集合，按 executemany 执行时 SQLAlchemy 会复用编译缓存。
+    """
+    table = PriceDaily.__table__
+    stmt = sqlite_insert(table)
+    if not update_cols:
+        return stmt.on_conflict_do_nothing(index_elements=[table.c.symbol, table.c.date])
+    return stmt.on_conflict_do_update(
+        index_elements=[table.c.symbol, table.c.date],
+        set_={c: stmt.excluded[c] for c in update_cols},
+        where=or_(*[table.c[c].is_distinct_from(stmt.excluded[c]) for c in update_cols]),
+    )
+
+
+def _on_price_write(db: Session, symbols: Iterable[str], rows: Iterable[Dict]) -> None:
+    """
+    价格写入后：立即剔除本进程面板缓存（同一会话随后读到自己写的数据）；
+    外层事务结束时再通知订阅者（回测 / 风险缓存）——提交或回滚都要，回滚时事务内可能已有读到未提交数据的缓存条目；
+    PRICE_BACKEND=mmap 时写入的行只在提交后同步到内存映射库，回滚不会让两边分叉。
+    """
+    syms = set(symbols)
+    drop_cached_panels(syms)
+    if "price_pending" not in db.info:
+        db.info["price_pending"] = set()
+        db.info["mmap_pending"] = {}
+        event.listen(db, "after_commit", _price_committed)
+        event.listen(db, "after_transaction_end", _price_txn_end)
+    db.info["price_pending"] |= syms
+    if mmap_backend_enabled():
+        db.info["mmap_pending"].update(((r["symbol"], r["date"]), r) for r in rows)
+
+
+def _price_committed(session: Session) -> None:
+    session.info["price_committed"] = True
+
+
+def _price_txn_end(session: Session, transaction) -> None:
+    """外层事务结束：先通知失效，已提交的再镜像到 mmap（失败抛出，由 commit() 的调用方处理）"""
+    if transaction.parent is not None:
+        return
+    pending, rows = session.info.get("price_pending"), session.info.get("mmap_pending")
+    committed = session.info.pop("price_committed", False)
+    if not pending and not rows:
+        return
+    session.info["price_pending"], session.info["mmap_pending"] = set(), {}
+    if pending:
+        invalidate_price_panel(pending)
+    if committed and rows:
+        mirror_price_rows(rows.values())
+
+
+def _upsert_price_batch(db: Session, batch: List[Dict], update_cols: Tuple[str, ...]) -> UpsertStats:
+    """
+    单批写入：一次 (symbol, date) IN (...) 计数得到已存在行数，再执行 upsert；
+    内容相同的行不会被改写，结合 rowcount 拆出 新增/更新/未变化。
+    """
+    table = PriceDaily.__table__
+    keys = [(r["symbol"], r["date"]) for r in batch]
+    existing = int(db.execute(
+        select(func.count()).select_from(table).where(tuple_(table.c.symbol, table.c.date).in_(keys))
+    ).scalar() or 0)
+
+    changed = int(db.execute(_price_upsert_stmt(update_cols), batch).rowcount or 0)
+
+    inserted = len(batch) - existing
+    updated = max(changed - inserted, 0)
+    return UpsertStats(inserted=inserted, updated=updated, unchanged=existing - updated)
+
+
+def bulk_upsert_prices_daily(db: Session, rows: Iterable[Dict],
+                             batch_size: int = BULK_BATCH_SIZE) -> UpsertStats:
+    """
+    集合式 upsert：按批写入 prices_daily（每批一次 executemany），返回 新增/更新/未变化 计数。
+    - 同一批内 (symbol, date) 重复时以最后一条为准；
+    - 只更新行里实际给出的列（与逐行模式一致，缺失列不会被 NULL 覆盖），
+      因此按“列集合”分组后再分批。
+    调用方负责 commit。
+    """
     model_cols = {c.name for c in PriceDaily.__table__.columns}
+    keyed: Dict[Tuple, Dict] = {}
+    for r in rows:
+        r_use = _remap_price_row(r, model_cols)
+        sym = r_use.get("symbol") or r.get("symbol")
+        dt = r_use.get("date") or r.get("date")
+        if not sym or not dt:
+            continue
+        r_use["symbol"], r_use["date"] = sym, dt
+        keyed[(sym, dt)] = r_use
 
-    # 2) 定义“源字段 -> 可能的目标别名”候选（按优先级从左到右）
-    alias_map = {
-        "dividend_amount": ["dividend_amount", "dividend", "dividendAmount"],
-        "split_coefficient": ["split_coefficient", "split_coef", "splitCoefficient", "splitCoeff"],
-    }
-
-    def remap_and_filter(r: Dict) -> Dict:
-        r2: Dict = {}
-        for k, v in r.items():
-            if k in model_cols:
-                r2[k] = v
-                continue
-            # 尝试别名
-            if k in alias_map:
-                for cand in alias_map[k]:
-                    if cand in model_cols:
-                        r2[cand] = v
-                        break
-                else:
-                    # 没找到可用别名就跳过该字段
-                    pass
-            else:
-                # 其它未知字段直接丢弃（避免 invalid kw）
-                pass
-        return r2
+    groups: Dict[Tuple[str, ...], List[Dict]] = {}
+    for r in keyed.values():
+        groups.setdefault(tuple(sorted(r)), []).append(r)
+
+    stats = UpsertStats()
+    size = max(1, int(batch_size))
+    for cols, group in groups.items():
+        update_cols = tuple(c for c in cols if c not in ("symbol", "date"))
+        for i in range(0, len(group), size):
+            stats.merge(_upsert_price_batch(db, group[i:i + size], update_cols))
+    if stats.written:
+        _on_price_write(db, {sym for sym, _ in keyed}, keyed.values())
+    return stats
+
+
+def upsert_prices_daily(db: Session, rows: Iterable[Dict], *, bulk: bool = False) -> int:
+    """
+    逐行 upsert（默认，兼容旧调用）；bulk=True 时走 bulk_upsert_prices_daily，
+    返回实际写入（新增+更新）的行数。
+    """
+    if bulk:
+        return bulk_upsert_prices_daily(db, rows).written
+
+    model_cols = {c.name for c in PriceDaily.__table__.columns}
 
     count = 0
+    touched, written = set(), []
     for r in rows:
-        r_use = remap_and_filter(r)
+        r_use = _remap_price_row(r, model_cols)
         # 主键字段必须在（symbol, date）
         sym = r_use.get("symbol") or r.get("symbol")
         dt = r_use.get("date") or r.get("date")
@@ -52,7 +193,11 @@ def upsert_prices_daily(db: Session, rows: Iterable[Dict]) -> int:
         else:
             obj = PriceDaily(**r_use)
             db.add(obj)
+        touched.add(sym)
+        written.append(r_use)
         count += 1
+    if touched:
+        _on_price_write(db, touched, written)
     return count
 
 
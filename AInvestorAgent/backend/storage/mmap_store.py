@@ -0,0 +1,364 @@
+# backend/storage/mmap_store.py
+"""
+内存映射价格库（db/price_store/）：每个字段一个 float64 文件，按 日期 × symbol 行优先存放，
+配合 meta.json（symbols / 行数 / 容量 / 代次）做索引。
+
+- 新交易日只在文件尾部追加行（扩展文件长度），不重写已有数据；
+- 已有日期的修正（复权重算等）原地覆盖；
+- 插入早于已有区间的日期、或 symbol 超出列容量时，整体重建为新一代文件；
+- 读取方用 np.memmap 只读映射，多个 uvicorn worker / 回测进程共享同一份页缓存。
+meta.json 最后原子替换，读取方只看得到已写完的行；新一代在写锁内完整写好后才发布，
+上一代文件保留到下一次重建时再删，读到旧 meta 的读取方映射时文件仍在（删掉了也会重读 meta 重试）。
+"""
+from __future__ import annotations
+
+import json
+import logging
+import os
+import threading
+from contextlib import contextmanager
+from datetime import date
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Sequence
+
+import numpy as np
+
+from .price_panel import PANEL_FIELDS, PricePanel, _to_day
+
+logger = logging.getLogger(__name__)
+
+try:  # Windows 下没有 fcntl，退化为进程内锁
+    import fcntl
+except ImportError:  # pragma: no cover
+    fcntl = None
+
+ROW_CHUNK = 256          # 追加时按块扩容的行数
+MIN_SYMBOL_CAPACITY = 64
+
+
+def _next_capacity(n: int, minimum: int) -> int:
+    cap = minimum
+    while cap < n:
+        cap *= 2
+    return cap
+
+
+class MmapPriceStore:
+    """单写多读的内存映射价格库"""
+
+    def __init__(self, root: str | os.PathLike):
+        self.root = Path(root)
+        self._meta: Optional[dict] = None
+        self._layout: Optional[tuple] = None
+        self._maps: Dict[str, np.memmap] = {}
+        self._mode = "r"
+        self._lock = threading.RLock()
+
+    # ---------------- 元数据 ----------------
+    @property
+    def meta_path(self) -> Path:
+        return self.root / "meta.json"
+
+    def exists(self) -> bool:
+        return self.meta_path.exists()
+
+    def _file(self, name: str, gen: int) -> Path:
+        return self.root / f"{name}.g{gen}.bin"
+
+    def refresh(self) -> bool:
+        """
+        重新读取 meta.json（很小，每次都读，不依赖 mtime 精度）；
+        代次或容量变化时重新映射。返回是否重新映射。
+        """
+        with self._lock:
+            for attempt in range(2):
+                try:
+                    meta = json.loads(self.meta_path.read_text(encoding="utf-8"))
+                except FileNotFoundError:
+                    self._meta, self._maps = None, {}
+                    return False
+                layout = (meta["generation"], meta["row_capacity"], meta["symbol_capacity"], self._mode)
+                self._meta = meta
+                if layout == self._layout and self._maps:
+                    return False
+                try:
+                    self._open(self._mode)
+                except FileNotFoundError:
+                    # 读 meta 与映射之间写方又重建了两次、旧代已删：重读 meta
+                    self._layout = None
+                    if attempt:
+                        raise
+                    continue
+                self._layout = layout
+                return True
+
+    def _open(self, mode: str) -> None:
+        m = self._meta
+        self._mode = mode
+        if not m or m["row_capacity"] == 0:
+            self._maps = {}
+            return
+        shape2 = (m["row_capacity"], m["symbol_capacity"])
+        self._maps = {"dates": np.memmap(self._file("dates", m["generation"]), dtype="int64",
+                                         mode=mode, shape=(m["row_capacity"],))}
+        for f in PANEL_FIELDS:
+            self._maps[f] = np.memmap(self._file(f, m["generation"]), dtype="float64", mode=mode, shape=shape2)
+
+    def _publish(self, meta: dict) -> None:
+        for mm in self._maps.values():
+            mm.flush()
+        tmp = self.meta_path.with_suffix(".tmp")
+        tmp.write_text(json.dumps(meta, ensure_ascii=False), encoding="utf-8")
+        os.replace(tmp, self.meta_path)
+        self._meta = meta
+
+    # ---------------- 只读访问 ----------------
+    def _dates(self) -> np.ndarray:
+        n = int(self._meta["n_dates"]) if self._meta else 0
+        if not n:
+            return np.array([], dtype="datetime64[D]")
+        return self._maps["dates"][:n].view("datetime64[D]")
+
+    def _field(self, name: str) -> np.ndarray:
+        n = int(self._meta["n_dates"]) if self._meta else 0
+        k = len(self._meta["symbols"]) if self._meta else 0
+        if not n:
+            return np.full((0, k), np.nan)
+        return self._maps[name][:n, :k]
+
+    @property
+    def symbols(self) -> List[str]:
+        self.refresh()
+        return list(self._meta["symbols"]) if self._meta else []
+
+    @property
+    def n_dates(self) -> int:
+        self.refresh()
+        return int(self._meta["n_dates"]) if self._meta else 0
+
+    @property
+    def dates(self) -> np.ndarray:
+        self.refresh()
+        return self._dates()
+
+    def field(self, name: str) -> np.ndarray:
+        """字段的 (n_dates, n_symbols) 只读视图（不拷贝）"""
+        self.refresh()
+        return self._field(name)
+
+    def panel(self, symbols: Optional[Sequence[str]] = None, start=None, end=None) -> PricePanel:
+        """
+        取价格面板。symbols=None 时各字段都是 memmap 视图（零拷贝）；
+        指定 symbols 时只对所需列做一次 gather，库里没有的 symbol 列为 NaN。
+        """
+        with self._lock:
+            self.refresh()
+            all_syms = list(self._meta["symbols"]) if self._meta else []
+            full = PricePanel(self._dates(), all_syms, {f: self._field(f) for f in PANEL_FIELDS})
+        sub = full.slice(start, end)
+        if symbols is None:
+            return sub
+        syms = [s for s in dict.fromkeys(symbols) if s]
+        idx = np.array([sub.col(s) if sub.has(s) else -1 for s in syms], dtype=np.int64)
+        data = {}
+        for f in PANEL_FIELDS:
+            arr = np.full((len(sub.dates), len(syms)), np.nan)
+            ok = idx >= 0
+            if ok.any():
+                arr[:, ok] = sub.data[f][:, idx[ok]]
+            data[f] = arr
+        return PricePanel(sub.dates, syms, data)
+
+    # ---------------- 写入 ----------------
+    @contextmanager
+    def _writer(self):
+        """进程内 + 跨进程（fcntl）写锁；期间以 r+ 打开映射"""
+        self.root.mkdir(parents=True, exist_ok=True)
+        with self._lock, open(self.root / ".lock", "a+") as lf:
+            if fcntl:
+                fcntl.flock(lf, fcntl.LOCK_EX)
+            try:
+                self._mode = "r+"
+                self.refresh()
+                if self._meta is None:
+                    self._meta = {"generation": 0, "symbols": [], "n_dates": 0,
+                                  "row_capacity": 0, "symbol_capacity": MIN_SYMBOL_CAPACITY}
+                yield
+            finally:
+                self._mode = "r"
+                self.refresh()
+                if fcntl:
+                    fcntl.flock(lf, fcntl.LOCK_UN)
+
+    def _grow_rows(self, need: int) -> None:
+        """扩展文件长度（追加空行，不重写已有数据），新行填 NaN"""
+        m = self._meta
+        if need <= m["row_capacity"]:
+            return
+        old, cap = m["row_capacity"], _next_capacity(need, max(ROW_CHUNK, m["row_capacity"]))
+        gen, scap = m["generation"], m["symbol_capacity"]
+        self._maps = {}
+        for name, width in [("dates", 1)] + [(f, scap) for f in PANEL_FIELDS]:
+            with open(self._file(name, gen), "ab") as fh:
+                fh.truncate(cap * width * 8)
+        m["row_capacity"] = cap
+        self._open("r+")
+        for f in PANEL_FIELDS:
+            self._maps[f][old:cap] = np.nan
+
+    def _fill(self, rows: List[Dict]) -> None:
+        """把 rows 写进当前映射（日期与 symbol 须已在 meta 中）；只覆盖行里给出的字段"""
+        m = self._meta
+        dates = self._maps["dates"][: m["n_dates"]].view("datetime64[D]")
+        ri = np.searchsorted(dates, np.array([_to_day(r["date"]) for r in rows], dtype="datetime64[D]"))
+        pos = {s: i for i, s in enumerate(m["symbols"])}
+        ci = np.array([pos[r["symbol"]] for r in rows], dtype=np.int64)
+        for f in PANEL_FIELDS:
+            sel = np.array([f in r for r in rows])
+            if sel.any():
+                vals = np.array([r[f] if r[f] is not None else np.nan for r, s in zip(rows, sel) if s],
+                                dtype=float)
+                self._maps[f][ri[sel], ci[sel]] = vals
+
+    def _rebuild(self, dates: np.ndarray, symbols: List[str], rows: Sequence[Dict] = (),
+                 keep: Optional[Iterable[str]] = None) -> None:
+        """
+        按新的日期集合 / symbol 集合写出新一代文件：keep 中的旧列（缺省为全部旧 symbol）按位置拷入，
+        再写入 rows，最后发布 meta。须在 _writer() 内调用，读取方只会看到完整的新一代。
+        """
+        m = self._meta
+        old_dates = self._dates().copy()
+        keep = set(m["symbols"] if keep is None else keep) & set(symbols)
+        old_cols = [j for j, s in enumerate(m["symbols"]) if s in keep]
+        old = {f: np.array(self._field(f))[:, old_cols] for f in PANEL_FIELDS}
+        gen = m["generation"] + 1
+
+        T, N = len(dates), len(symbols)
+        rcap, scap = _next_capacity(max(T, 1), ROW_CHUNK), _next_capacity(N, MIN_SYMBOL_CAPACITY)
+        d = np.memmap(self._file("dates", gen), dtype="int64", mode="w+", shape=(rcap,))
+        d[:T] = dates.astype("datetime64[D]").astype("int64")
+        d.flush()
+        del d
+        ri = np.searchsorted(dates, old_dates)
+        pos = {s: i for i, s in enumerate(symbols)}
+        ci = np.array([pos[m["symbols"][j]] for j in old_cols], dtype=np.int64)
+        for f in PANEL_FIELDS:
+            mm = np.memmap(self._file(f, gen), dtype="float64", mode="w+", shape=(rcap, scap))
+            mm[:] = np.nan
+            if len(old_dates) and len(old_cols):
+                mm[np.ix_(ri, ci)] = old[f]
+            mm.flush()
+            del mm
+
+        self._meta = {"generation": gen, "symbols": list(symbols), "n_dates": T,
+                      "row_capacity": rcap, "symbol_capacity": scap}
+        self._open("r+")
+        if rows:
+            self._fill(list(rows))
+        self._publish(self._meta)
+        self._drop_generations(before=gen - 1)
+
+    def _drop_generations(self, before: int) -> None:
+        """删除代次 < before 的文件；上一代保留，给读到旧 meta 还没来得及映射的读取方"""
+        for fp in self.root.glob("*.g*.bin"):
+            try:
+                g = int(fp.stem.rsplit(".g", 1)[1])
+            except (IndexError, ValueError):
+                continue
+            if g < before:
+                try:
+                    fp.unlink()
+                except FileNotFoundError:
+                    pass
+
+    def write_rows(self, rows: Iterable[Dict]) -> int:
+        """
+        写入价格行（dict，含 symbol / date 与任意 PANEL_FIELDS 字段）；
+        只覆盖行里给出的字段，与 SQL upsert 语义一致。返回写入行数。
+        """
+        rows = [r for r in rows if r.get("symbol") and r.get("date")]
+        if not rows:
+            return 0
+        with self._writer():
+            m = self._meta
+            in_dates = np.array([_to_day(r["date"]) for r in rows], dtype="datetime64[D]")
+            cur_dates = self._dates()
+            last = cur_dates[-1] if len(cur_dates) else None
+
+            new_syms = [s for s in dict.fromkeys(r["symbol"] for r in rows) if s not in set(m["symbols"])]
+            known = np.isin(in_dates, cur_dates)
+            appended = np.unique(in_dates[~known])
+            needs_rebuild = (last is not None and len(appended) and appended[0] <= last) or \
+                len(m["symbols"]) + len(new_syms) > m["symbol_capacity"]
+
+            if needs_rebuild:
+                self._rebuild(np.union1d(cur_dates, appended), m["symbols"] + new_syms, rows)
+                return len(rows)
+            m["symbols"] = m["symbols"] + new_syms
+            if len(appended):
+                T0 = m["n_dates"]
+                self._grow_rows(T0 + len(appended))
+                self._maps["dates"][T0:T0 + len(appended)] = appended.astype("int64")
+                m["n_dates"] = T0 + len(appended)
+            self._fill(rows)
+            self._publish(dict(m))
+        return len(rows)
+
+    def rebuild_from_db(self, db, symbols: Optional[Iterable[str]] = None) -> int:
+        """
+        从 SQLite 导出（首次建库或修复用），在一次写锁内写好新一代再原子发布。
+        symbols=None 时整库重建；给出 symbols 时只重写这些列，其它 symbol 的数据原样保留。返回写入行数。
+        """
+        from sqlalchemy import select
+        from .models import PriceDaily
+
+        t = PriceDaily.__table__
+        stmt = select(t.c.symbol, t.c.date, *[t.c[f] for f in PANEL_FIELDS])
+        only = None if symbols is None else list(dict.fromkeys(symbols))
+        if only is not None:
+            stmt = stmt.where(t.c.symbol.in_(only))
+        cols = ("symbol", "date") + PANEL_FIELDS
+        rows = [dict(zip(cols, r)) for r in db.execute(stmt).all()]
+        in_dates = np.unique(np.array([_to_day(r["date"]) for r in rows], dtype="datetime64[D]"))
+        with self._writer():
+            m = self._meta
+            if only is None:
+                syms = sorted({r["symbol"] for r in rows})
+                self._rebuild(in_dates, syms, rows, keep=())
+            else:
+                syms = m["symbols"] + [s for s in only if s not in set(m["symbols"])]
+                self._rebuild(np.union1d(self._dates(), in_dates), syms, rows,
+                              keep=[s for s in m["symbols"] if s not in set(only)])
+        return len(rows)
+
+
+# ---------------- 后端选择 ----------------
+
+_STORES: Dict[str, MmapPriceStore] = {}
+
+
+def get_mmap_store(root: Optional[str] = None) -> MmapPriceStore:
+    from backend.core.config import get_settings
+    root = root or get_settings().PRICE_STORE_DIR
+    if root not in _STORES:
+        _STORES[root] = MmapPriceStore(root)
+    return _STORES[root]
+
+
+def mmap_backend_enabled() -> bool:
+    from backend.core.config import get_settings
+    return (get_settings().PRICE_BACKEND or "sqlite").lower() == "mmap"
+
+
+def mirror_price_rows(rows: Iterable[Dict]) -> None:
+    """
+    PRICE_BACKEND=mmap 时把 DAO 已提交的行同步到内存映射库（由 DAO 的提交钩子调用）。
+    失败时记录日志并抛出：数据库已提交而 mmap 库落后，需运行 scripts/build_price_store.py 重建。
+    """
+    if not mmap_backend_enabled():
+        return
+    try:
+        get_mmap_store().write_rows(rows)
+    except Exception:
+        logger.exception("[mmap_store] 同步失败，请运行 scripts/build_price_store.py 重建")
+        raise
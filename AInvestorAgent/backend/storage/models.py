@@ -211,4 +211,66 @@ class SimDailyPnL(Base):
     daily_pnl = Column(Float, default=0)  # 当日盈亏
     cumulative_pnl = Column(Float, default=0)  # 累计盈亏
     return_pct = Column(Float, default=0)  # 当日收益率
-    created_at = Column(DateTime, default=datetime.utcnow)
\ No newline at end of file
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+class IndicatorState(Base):
+    """技术指标流式状态：每个 symbol 一行，payload 为 JSON（见 backend/factors/streaming.py）"""
+    __tablename__ = "indicator_state"
+
+    symbol = Column(String, primary_key=True)
+    last_date = Column(Date, nullable=False)      # 状态已消化到的最后一根 K 线
+    version = Column(String, nullable=False)      # 参数/结构版本，不一致时整体重建
+    payload = Column(Text, nullable=False)
+    updated_at = Column(DateTime, default=datetime.utcnow)
+
+
+class FactorDaily(Base):
+    """时点因子面板：(symbol, as_of, factor_version) 一行，只存原始值；截面归一在读取时按股票池做（见 backend/scoring/factor_store.py）"""
+    __tablename__ = "factors_daily"
+
+    symbol = Column(String, primary_key=True)
+    as_of = Column(Date, primary_key=True)
+    factor_version = Column(String, primary_key=True)
+    f_value = Column(Float, nullable=True)          # 0..1
+    f_quality = Column(Float, nullable=True)        # 0..1
+    f_momentum_raw = Column(Float, nullable=True)   # 60 日收益
+    f_sentiment = Column(Float, nullable=True)      # 0..1
+    updated_at = Column(DateTime, default=datetime.utcnow)
+
+    __table_args__ = (Index("ix_factors_daily_version_asof", "factor_version", "as_of"),)
+
+
+class SentimentDaily(Base):
+    """新闻情绪日聚合：(symbol, day) 一行，打分入库时增量累加（见 backend/sentiment/daily.py）"""
+    __tablename__ = "sentiment_daily"
+
+    symbol = Column(String, primary_key=True)
+    day = Column(Date, primary_key=True)            # date(published_at)
+    sum_sent = Column(Float, nullable=False, default=0.0)   # Σ sentiment（-1..1）
+    n = Column(Integer, nullable=False, default=0)          # 已打分新闻条数
+    updated_at = Column(DateTime, default=datetime.utcnow)
+
+
+class SentimentDailyCoverage(Base):
+    """已由新闻表整体回填过 sentiment_daily 的 symbol；不在表中的 symbol 读取时按需回填"""
+    __tablename__ = "sentiment_daily_coverage"
+
+    symbol = Column(String, primary_key=True)
+    rebuilt_at = Column(DateTime, default=datetime.utcnow)
+
+
+class BacktestSweepResult(Base):
+    """参数扫描回测结果：每个参数组合一行（见 backend/backtest/sweep.py）"""
+    __tablename__ = "backtest_sweep_results"
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    sweep_id = Column(String, index=True, nullable=False)
+    rank = Column(Integer, nullable=True)           # 按 sort_by 排名（1 最优）
+    params = Column(Text, nullable=False)           # JSON
+    sharpe = Column(Float, nullable=True)
+    ann_return = Column(Float, nullable=True)
+    max_dd = Column(Float, nullable=True)
+    win_rate = Column(Float, nullable=True)
+    turnover = Column(Float, nullable=True)
+    final_nav = Column(Float, nullable=True)
+    created_at = Column(DateTime, default=datetime.utcnow)
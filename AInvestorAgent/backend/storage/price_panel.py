@@ -0,0 +1,256 @@
+# backend/storage/price_panel.py
+"""
+列式价格面板：把 prices_daily 一次性读成 dates × symbols 的 NumPy 矩阵，
+供因子 / 风险 / 回测共用，避免逐个 symbol 走 ORM。
+
+- 进程内按数据库（engine）缓存，新的 symbol 或更早的起始日会增量补读；
+- DAO 写入新 K 线时先剔除本进程面板缓存，事务提交后再调用 invalidate_price_panel() 通知订阅者；
+- 其它进程写库无法感知，另有 PANEL_TTL_SECONDS 兜底过期；
+- 依赖价格的其它缓存（如回测结果缓存）可用 on_price_invalidate() 订阅失效通知。
+"""
+from __future__ import annotations
+
+import threading
+import time
+import weakref
+from dataclasses import dataclass, field
+from datetime import date
+from typing import Callable, Dict, Iterable, List, Optional, Sequence
+
+import numpy as np
+import pandas as pd
+from sqlalchemy import String, select, type_coerce
+from sqlalchemy.orm import Session
+
+from .models import PriceDaily
+
+PANEL_FIELDS = ("open", "high", "low", "close", "adjusted_close", "volume")
+PANEL_TTL_SECONDS = 300
+
+
+def _to_day(d) -> np.datetime64:
+    return np.datetime64(d, "D") if not isinstance(d, np.datetime64) else d.astype("datetime64[D]")
+
+
+def ffill(a: np.ndarray) -> np.ndarray:
+    """沿时间轴（axis=0）前向填充 NaN"""
+    if a.size == 0:
+        return a.copy()
+    mask = np.isnan(a)
+    idx = np.where(~mask, np.arange(a.shape[0])[:, None], 0)
+    np.maximum.accumulate(idx, axis=0, out=idx)
+    out = a[idx, np.arange(a.shape[1])[None, :]]
+    # 第一根有效 bar 之前仍保持 NaN
+    out[np.minimum.accumulate(mask, axis=0)] = np.nan
+    return out
+
+
+@dataclass
+class PricePanel:
+    """dates × symbols 价格矩阵；缺失为 NaN，dates 为升序 datetime64[D]"""
+    dates: np.ndarray
+    symbols: List[str]
+    data: Dict[str, np.ndarray] = field(default_factory=dict)
+
+    def __post_init__(self):
+        self._col = {s: i for i, s in enumerate(self.symbols)}
+
+    # ---- 基础访问 ----
+    def __getitem__(self, name: str) -> np.ndarray:
+        return self.data[name]
+
+    @property
+    def close(self) -> np.ndarray:
+        return self.data["close"]
+
+    @property
+    def adjusted_close(self) -> np.ndarray:
+        """复权收盘价；缺失处回落到 close"""
+        adj = self.data["adjusted_close"]
+        return np.where(np.isnan(adj), self.data["close"], adj)
+
+    @property
+    def volume(self) -> np.ndarray:
+        return self.data["volume"]
+
+    def col(self, symbol: str) -> Optional[int]:
+        return self._col.get(symbol)
+
+    def has(self, symbol: str) -> bool:
+        return symbol in self._col
+
+    def asof_index(self, asof) -> int:
+        """<= asof 的最后一行下标；没有则返回 -1"""
+        return int(np.searchsorted(self.dates, _to_day(asof), side="right")) - 1
+
+    # ---- 切片 ----
+    def slice(self, start=None, end=None, symbols: Optional[Sequence[str]] = None) -> "PricePanel":
+        """按日期闭区间 [start, end] 与 symbols 取子面板"""
+        i0 = 0 if start is None else int(np.searchsorted(self.dates, _to_day(start), side="left"))
+        i1 = len(self.dates) if end is None else int(np.searchsorted(self.dates, _to_day(end), side="right"))
+        if symbols is None:
+            syms, cols = list(self.symbols), slice(None)
+        else:
+            syms = [s for s in symbols if s in self._col]
+            cols = [self._col[s] for s in syms]
+        return PricePanel(self.dates[i0:i1], syms, {k: v[i0:i1][:, cols] for k, v in self.data.items()})
+
+    def asof(self, asof) -> "PricePanel":
+        return self.slice(end=asof)
+
+    def ffill(self, name: str = "close") -> np.ndarray:
+        return ffill(self.data[name])
+
+    def last_valid(self, name: str = "close", asof=None) -> Dict[str, Optional[float]]:
+        """每个 symbol 在 asof（含）之前最后一个非空值"""
+        i = len(self.dates) - 1 if asof is None else self.asof_index(asof)
+        if i < 0:
+            return {s: None for s in self.symbols}
+        row = ffill(self.data[name][: i + 1])[-1]
+        return {s: (None if np.isnan(v) else float(v)) for s, v in zip(self.symbols, row)}
+
+    def series(self, symbol: str, start=None, end=None) -> pd.DataFrame:
+        """单个 symbol 的 OHLCV 序列（只保留有 close 的交易日），列同 get_price_series"""
+        j = self._col.get(symbol)
+        if j is None:
+            return pd.DataFrame()
+        sub = self.slice(start, end, [symbol])
+        mask = ~np.isnan(sub.data["close"][:, 0])
+        if not mask.any():
+            return pd.DataFrame()
+        df = pd.DataFrame({k: sub.data[k][mask, 0] for k in ("open", "high", "low", "close", "volume")})
+        df.insert(0, "date", [d.item() for d in sub.dates[mask]])
+        return df
+
+    def to_frame(self, name: str = "close") -> pd.DataFrame:
+        """转为 DataFrame（index 为 date，columns 为 symbol）"""
+        return pd.DataFrame(self.data[name], index=[d.item() for d in self.dates], columns=self.symbols)
+
+
+# ---------------- 读取与缓存 ----------------
+
+def _load_panel(db: Session, symbols: Sequence[str], start: Optional[date]) -> PricePanel:
+    """一条查询读取 symbols 的全部字段"""
+    t = PriceDaily.__table__
+    # 日期按原始 ISO 文本取回，交给 NumPy 解析，省掉逐行构造 date 对象
+    stmt = select(t.c.symbol, type_coerce(t.c.date, String), *[t.c[f] for f in PANEL_FIELDS]).where(t.c.symbol.in_(list(symbols)))
+    if start is not None:
+        stmt = stmt.where(t.c.date >= start)
+    rows = db.execute(stmt).all()
+
+    syms = list(dict.fromkeys(symbols))
+    if not rows:
+        return PricePanel(np.array([], dtype="datetime64[D]"), syms,
+                          {f: np.full((0, len(syms)), np.nan) for f in PANEL_FIELDS})
+
+    cols = list(zip(*rows))
+    raw_dates = np.array(cols[1], dtype="datetime64[D]")
+    dates, ti = np.unique(raw_dates, return_inverse=True)
+    pos = {s: i for i, s in enumerate(syms)}
+    si = np.fromiter((pos[s] for s in cols[0]), dtype=np.int64, count=len(rows))
+
+    data = {}
+    for k, f in enumerate(PANEL_FIELDS):
+        arr = np.full((len(dates), len(syms)), np.nan)
+        arr[ti, si] = np.array(cols[2 + k], dtype=float)  # None -> nan
+        data[f] = arr
+    return PricePanel(dates, syms, data)
+
+
+def _merge_columns(a: PricePanel, b: PricePanel) -> PricePanel:
+    """合并两个 symbol 不相交的面板（日期取并集）"""
+    dates = np.union1d(a.dates, b.dates)
+    ia = np.searchsorted(dates, a.dates)
+    ib = np.searchsorted(dates, b.dates)
+    data = {}
+    for f in PANEL_FIELDS:
+        arr = np.full((len(dates), len(a.symbols) + len(b.symbols)), np.nan)
+        arr[ia, : len(a.symbols)] = a.data[f]
+        arr[ib, len(a.symbols):] = b.data[f]
+        data[f] = arr
+    return PricePanel(dates, a.symbols + b.symbols, data)
+
+
+@dataclass
+class _Entry:
+    panel: PricePanel
+    start: Optional[date]          # None 表示全部历史
+    loaded_at: float
+
+
+# 以 engine 为键（弱引用），engine 释放后对应缓存自动回收
+_CACHE: "weakref.WeakKeyDictionary" = weakref.WeakKeyDictionary()
+_LOCK = threading.RLock()
+
+
+def _cache_key(db: Session):
+    bind = db.get_bind()
+    return getattr(bind, "engine", bind)
+
+
+def get_price_panel(db: Session, symbols: Iterable[str], start: Optional[date] = None,
+                    end: Optional[date] = None) -> PricePanel:
+    """
+    取 symbols 在 [start, end] 的价格面板（start=None 表示全部历史）。
+    命中缓存时不访问数据库；缺的 symbol 只补读缺的部分。
+    Settings.PRICE_BACKEND=mmap 且价格库已建立时直接读内存映射库（页缓存跨进程共享，无需进程内缓存）：
+    mmap 库是主库已提交数据的快照，与 db 绑定的是哪个库无关；db 上有未提交的价格写入时改走 db，
+    以便读到本事务自己写的数据。
+    """
+    syms = [s for s in dict.fromkeys(symbols) if s]
+    from .mmap_store import get_mmap_store, mmap_backend_enabled
+    if mmap_backend_enabled() and not db.info.get("price_pending"):
+        store = get_mmap_store()
+        if store.exists():
+            return store.panel(syms, start, end)
+    key = _cache_key(db)
+    with _LOCK:
+        ent = _CACHE.get(key)
+        if ent is not None and time.time() - ent.loaded_at > PANEL_TTL_SECONDS:
+            ent = None
+        start_ok = ent is not None and (ent.start is None or (start is not None and start >= ent.start))
+
+        if ent is None or not start_ok:
+            # 需要更早的历史：连同已缓存的 symbol 一起从 start 重新读
+            load_syms = syms + ([s for s in ent.panel.symbols if s not in set(syms)] if ent else [])
+            ent = _Entry(_load_panel(db, load_syms, start), start, time.time())
+            _CACHE[key] = ent
+        else:
+            missing = [s for s in syms if not ent.panel.has(s)]
+            if missing:
+                ent.panel = _merge_columns(ent.panel, _load_panel(db, missing, ent.start))
+
+        return ent.panel.slice(start, end, syms)
+
+
+_LISTENERS: List[Callable[[Optional[set]], None]] = []
+
+
+def on_price_invalidate(fn: Callable[[Optional[set]], None]) -> None:
+    """注册失效回调：fn(symbols)，symbols=None 表示全部失效"""
+    if fn not in _LISTENERS:
+        _LISTENERS.append(fn)
+
+
+def drop_cached_panels(symbols: Optional[Iterable[str]] = None) -> None:
+    """只清本模块的面板缓存（不通知订阅者）：symbols=None 清空全部，否则把这些 symbol 从各面板里剔除"""
+    drop = None if symbols is None else set(symbols)
+    with _LOCK:
+        if drop is None:
+            _CACHE.clear()
+        else:
+            for ent in list(_CACHE.values()):
+                keep = [s for s in ent.panel.symbols if s not in drop]
+                if len(keep) != len(ent.panel.symbols):
+                    ent.panel = ent.panel.slice(symbols=keep)
+
+
+def invalidate_price_panel(symbols: Optional[Iterable[str]] = None) -> None:
+    """
+    价格写入提交后调用（DAO 在 after_commit 钩子里调用）：symbols=None 清空全部缓存；
+    否则把这些 symbol 从各缓存面板里剔除，下次访问时重新读取，并通知 on_price_invalidate 订阅者。
+    """
+    drop = None if symbols is None else set(symbols)
+    drop_cached_panels(drop)
+    for fn in list(_LISTENERS):
+        fn(drop)
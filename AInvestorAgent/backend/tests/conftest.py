@@ -1,9 +1,16 @@
 # backend/tests/conftest.py
 import os
 import sqlite3
+from datetime import date, timedelta
+import numpy as np
 import pytest
 from fastapi.testclient import TestClient
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
 from backend.app import app as fastapi_app  # ✅ 避免与 fixture app() 同名
+from backend.storage.db import Base
+from backend.storage.dao import bulk_upsert_prices_daily
 
 DB_PATH = "db/stock.sqlite"
 
@@ -80,3 +87,45 @@ def app():
             "请执行: pip install asgiref>=3.6"
         ) from e
     return AsgiToWsgi(fastapi_app)
+
+
+# ---------------- 内存库（ORM 用例共用） ----------------
+
+@pytest.fixture
+def mem_engine():
+    """内存 SQLite，已建好全部表；StaticPool 让多个会话 / 线程（路由、模拟器）共用同一连接"""
+    eng = create_engine("sqlite://", future=True, poolclass=StaticPool, connect_args={"check_same_thread": False})
+    Base.metadata.create_all(bind=eng)
+    yield eng
+    eng.dispose()
+
+@pytest.fixture
+def mem_sessions(mem_engine):
+    """绑定 mem_engine 的 sessionmaker，可用来替换 SessionLocal"""
+    return sessionmaker(bind=mem_engine, autoflush=False, future=True)
+
+@pytest.fixture
+def mem_db(mem_sessions):
+    db = mem_sessions()
+    yield db
+    db.close()
+
+
+def _seed_closes(db, symbols, closes, start=date(2024, 1, 1), days=None, commit=True):
+    """
+    T×N 收盘价矩阵写入 prices_daily（列对应 symbols，NaN 的格子不写）；
+    日期缺省为 start 起逐个日历日，也可直接给 days。返回日期列表。
+    """
+    closes = np.asarray(closes, dtype=float)
+    days = list(days) if days is not None else [start + timedelta(days=i) for i in range(len(closes))]
+    bulk_upsert_prices_daily(db, [{"symbol": s, "date": d, "close": float(closes[i, k])}
+                                  for k, s in enumerate(symbols) for i, d in enumerate(days)
+                                  if np.isfinite(closes[i, k])])
+    if commit:
+        db.commit()
+    return days
+
+@pytest.fixture
+def seed_closes():
+    """价格播种函数：seed_closes(db, symbols, closes, start=..., days=..., commit=True)"""
+    return _seed_closes
@@ -0,0 +1,403 @@
+import numpy as np
+import pytest
+
+from backend.backtest.engine import run_backtest, weekly_rebalance_idx
+
+
+def _reference(R, W, idx, tc):
+    """逐日逐资产的持仓市值模拟（含现金）"""
+    T, N = R.shape
+    hold = W[0] * (1 - tc * np.abs(W[0]).sum())
+    cash = (1 - W[0].sum()) * (1 - tc * np.abs(W[0]).sum())
+    nav, turn = [hold.sum() + cash], [np.abs(W[0]).sum()]
+    k = 1
+    for t in range(1, T):
+        hold = hold * (1 + R[t])
+        v = hold.sum() + cash
+        to = 0.0
+        if k < len(idx) and idx[k] == t:
+            to = np.abs(W[k] - hold / v).sum()
+            v *= 1 - tc * to
+            hold, cash = W[k] * v, (1 - W[k].sum()) * v
+            k += 1
+        nav.append(v)
+        turn.append(to)
+    return np.array(nav), np.array(turn)
+
+
+def test_drifted_engine_matches_holdings_loop():
+    rng = np.random.default_rng(3)
+    R = rng.normal(0.0005, 0.02, (60, 7))
+    idx = np.array([0, 5, 12, 30, 59])
+    W = rng.random((5, 7)) / 8                    # 权重和 < 1，余下为现金
+    res = run_backtest(R, W, idx, tc=0.002)
+    nav, turn = _reference(R, W, idx, 0.002)
+    assert np.allclose(res.nav, nav, rtol=1e-12) and np.allclose(res.turnover, turn, atol=1e-12)
+    assert np.allclose(res.weights[idx], W) and (res.drawdown <= 0).all()
+    assert np.allclose(res.costs, 0.002 * res.turnover)
+
+
+def _legacy_align(price_map):
+    """BacktestEngineer 改用引擎之前的 _align_by_date（原样保留，作回归基准）"""
+    all_dates = sorted(set(d for s in price_map.values() for d in [p["date"] for p in s]))
+    closes = {sym: [] for sym in price_map}
+    last_val = {sym: None for sym in price_map}
+    idx_by_date = {sym: {p["date"]: p["close"] for p in series} for sym, series in price_map.items()}
+    for d in all_dates:
+        for sym in price_map:
+            v = idx_by_date[sym].get(d, last_val[sym])
+            if v is None:
+                continue
+            closes[sym].append(v)
+            last_val[sym] = v
+    min_len = min(len(v) for v in closes.values()) if closes else 0
+    dates = [d for d in all_dates][-min_len:] if min_len > 0 else []
+    for sym in closes:
+        closes[sym] = closes[sym][-min_len:]
+    return dates, closes
+
+
+def _legacy_portfolio_nav(dates, closes, weights, tc=0.001):
+    """改用引擎之前的 _portfolio_nav 逐日循环（含原 _daily_returns / _rebalance_schedule）"""
+    from datetime import datetime
+    syms = list(weights.keys())
+    tw = sum(weights.values()) or 1.0
+    w_target = {s: weights[s] / tw for s in syms}
+    rets = {s: [0.0 if a == 0 else (b - a) / a for a, b in zip(closes[s][:-1], closes[s][1:])] for s in syms}
+    n = len(dates)
+    rebalance_points, prev_week = set(), None
+    for i, d in enumerate(dates):
+        wk = datetime.fromisoformat(d).isocalendar()[:2]
+        if wk != prev_week:
+            rebalance_points.add(i)
+            prev_week = wk
+
+    nav = [1.0]
+    turnover = sum(abs(w_target[s]) for s in syms)
+    nav[-1] *= (1 - tc * turnover)
+    cur_w = dict(w_target)
+    for t in range(1, n):
+        day_ret = sum(cur_w[s] * rets[s][t-1] for s in syms)
+        nav.append(nav[-1] * (1 + day_ret))
+        if t in rebalance_points:
+            delta = sum(abs(cur_w[s] - w_target[s]) for s in syms)
+            turnover += delta
+            nav[-1] *= (1 - tc * delta)
+            cur_w = dict(w_target)
+
+    dd, peak = [], -1e18
+    for v in nav:
+        peak = max(peak, v)
+        dd.append(0.0 if peak == 0 else (v - peak) / peak)
+    port_daily = [nav[i] / nav[i-1] - 1 for i in range(1, len(nav))]
+    ann = (1 + sum(port_daily) / max(1, len(port_daily))) ** 252 - 1 if port_daily else 0.0
+    vol = (sum((x - (sum(port_daily)/len(port_daily)))**2 for x in port_daily) / max(1, len(port_daily))) ** 0.5 \
+        * (252 ** 0.5) if port_daily else 0.0
+    sharpe = ann / vol if vol > 1e-12 else 0.0
+    win = sum(1 for x in port_daily if x > 0) / max(1, len(port_daily))
+    return {"dates": dates, "nav": [round(x, 6) for x in nav], "drawdown": [round(x, 6) for x in dd],
+            "metrics": {"annualized_return": round(ann, 6), "max_drawdown": round(min(dd) if dd else 0.0, 6),
+                        "sharpe": round(sharpe, 4), "win_rate": round(win, 4), "turnover": round(turnover, 6)}}
+
+
+def test_engine_nav_matches_legacy_portfolio_nav():
+    """固定价格面板：新引擎路径（对齐 + run_backtest）与原 _portfolio_nav 逐日循环的净值一致"""
+    from datetime import date, timedelta
+    from backend.agents.backtest_engineer import _align_by_date, _portfolio_nav
+
+    days = [date(2024, 12, 23) + timedelta(days=i) for i in range(70)]
+    days = [d.isoformat() for d in days if d.weekday() < 5]
+    price_map = {
+        "AAA": [{"date": d, "close": round(100 + 3 * np.sin(i / 4) + 0.2 * i, 4)} for i, d in enumerate(days)],
+        "BBB": [{"date": d, "close": round(50 - 0.15 * i + (i % 5), 4)} for i, d in enumerate(days)
+                if i not in (7, 8, 21)],                                      # 停牌：前值填充
+        "CCC": [{"date": d, "close": round(20 * 1.004 ** i, 4)} for i, d in enumerate(days) if i >= 3],  # 晚上市
+    }
+    weights = {"AAA": 0.5, "BBB": 0.3, "CCC": 0.4}
+
+    dates, closes = _align_by_date(price_map)
+    ref_dates, ref_closes = _legacy_align(price_map)
+    assert dates == ref_dates and all(np.allclose(closes[s], ref_closes[s]) for s in weights)
+
+    new, old = _portfolio_nav(dates, closes, weights, 0.002), _legacy_portfolio_nav(dates, closes, weights, 0.002)
+    assert new["dates"] == old["dates"]
+    assert new["nav"] == old["nav"] and new["drawdown"] == old["drawdown"]
+    for k, v in old["metrics"].items():
+        assert new["metrics"][k] == v, k
+
+
+def test_weekly_rebalance_idx_iso_weeks():
+    dates = ["2024-12-27", "2024-12-30", "2024-12-31", "2025-01-02", "2025-01-06", "2025-01-10"]
+    assert weekly_rebalance_idx(dates).tolist() == [0, 1, 4]
+
+
+def test_simulator_precomputed_schedule_skips_scores_daily(monkeypatch, mem_sessions, seed_closes):
+    from datetime import date
+    from sqlalchemy import func, select
+    from backend.storage.models import ScoreDaily
+    import scripts.historical_backtest_simulator as hbs
+
+    Session = mem_sessions
+    monkeypatch.setattr(hbs, "SessionLocal", Session)
+    syms = [f"S{k}" for k in range(6)]
+    with Session() as db:
+        seed_closes(db, syms, 100 * (1 + 0.001 * np.arange(6)) ** np.arange(200)[:, None])
+
+    sim = hbs.HistoricalBacktestSimulator(syms, start_date="2024-05-01", end_date="2024-07-15",
+                                          precompute_scores=True)
+    days = [date(2024, 5, 6), date(2024, 6, 3), date(2024, 7, 1)]
+    sched = sim.build_score_schedule(days)
+    for d in days:
+        assert sched[d] == sim.calculate_scores_at_date(d)
+        holdings = sim.generate_portfolio_at_date(d)
+        assert holdings and abs(sum(h["weight"] for h in holdings) - 1) < 1e-9
+    with Session() as db:
+        assert db.execute(select(func.count()).select_from(ScoreDaily)).scalar() == 0
+
+
+def test_sweep_pool_matches_inline_and_ranks(mem_db, seed_closes):
+    from datetime import date
+    from sqlalchemy import func, select
+    from backend.storage.models import BacktestSweepResult
+    from backend.backtest.sweep import run_sweep
+
+    db = mem_db
+    rng = np.random.default_rng(5)
+    syms = [f"S{k}" for k in range(8)]
+    seed_closes(db, syms, 100 * np.cumprod(1 + rng.normal(0.0005, 0.02, (260, 8)), axis=0), commit=False)
+
+    grid = {"trading_cost": [0.0, 0.005], "rebalance": ["weekly", "monthly"], "top_n": [3]}
+    a = run_sweep(db, syms, date(2024, 6, 1), date(2024, 9, 16), grid, max_workers=2, verbose=False)
+    b = run_sweep(db, syms, date(2024, 6, 1), date(2024, 9, 16), grid, max_workers=1,
+                  persist=False, verbose=False)
+    assert a["n_configs"] == 4 and [r["params"] for r in a["results"]] == [r["params"] for r in b["results"]]
+    assert np.allclose([r["final_nav"] for r in a["results"]], [r["final_nav"] for r in b["results"]])
+    assert [r["sharpe"] for r in a["results"]] == sorted((r["sharpe"] for r in a["results"]), reverse=True)
+    # 零成本组合的净值不低于同频率高成本组合
+    nav = {(r["params"]["trading_cost"], r["params"]["rebalance"]): r["final_nav"] for r in a["results"]}
+    assert nav[(0.0, "weekly")] > nav[(0.005, "weekly")] and nav[(0.0, "monthly")] > nav[(0.005, "monthly")]
+    assert db.execute(select(func.count()).select_from(BacktestSweepResult)).scalar() == 4
+
+
+def test_backtest_cache_lru_disk_and_price_invalidation(tmp_path, mem_db, seed_closes):
+    from datetime import date
+    from backend.storage.dao import bulk_upsert_prices_daily
+    from backend.storage.price_panel import on_price_invalidate
+    from backend.backtest.cache import BacktestCache, cached_backtest
+
+    db = mem_db
+    seed_closes(db, ["AAA", "BBB"], [[10.0, 10.0]], start=date(2024, 1, 2))
+
+    cache = BacktestCache(max_entries=2, disk_dir=str(tmp_path))
+    on_price_invalidate(cache.invalidate)
+    calls = []
+    run = lambda tag: (lambda: calls.append(tag) or {"nav": [1.0, 1.1], "tag": tag})
+    p = {"window_days": 252, "trading_cost": 0.001}
+
+    a, hit = cached_backtest(p, {"aaa": 2, "BBB": 2}, run("a"), db=db, cache=cache)
+    b, hit2 = cached_backtest(p, {"BBB": 0.5, "AAA": 0.5}, run("b"), db=db, cache=cache)   # 归一化后相同
+    assert (hit, hit2, calls, b["tag"]) == (False, True, ["a"], "a")
+    cached_backtest({**p, "trading_cost": 0.002}, {"AAA": 1}, run("c"), db=db, cache=cache)
+    cached_backtest(p, {"BBB": 1}, run("d"), db=db, cache=cache)              # 挤出最早的 a
+    assert cache.stats()["evictions"] == 1 and len(list(tmp_path.glob("*.json"))) == 3
+
+    fresh = BacktestCache(max_entries=2, disk_dir=str(tmp_path))              # 新进程：磁盘层命中
+    _, hit = cached_backtest(p, {"AAA": 1, "BBB": 1}, run("e"), db=db, cache=fresh)
+    assert hit and fresh.stats()["disk_hits"] == 1
+
+    # AAA 来了新价格：提交后内存与磁盘上的相关条目（c 与磁盘上的 a）失效，键里的数据版本也变了
+    bulk_upsert_prices_daily(db, [{"symbol": "AAA", "date": date(2024, 1, 3), "close": 11.0}])
+    assert cache.stats()["invalidations"] == 0
+    db.commit()
+    assert cache.stats()["invalidations"] == 2 and cache.stats()["entries"] == 1
+    assert len(list(tmp_path.glob("*.json"))) == 1
+    _, hit = cached_backtest(p, {"AAA": 1, "BBB": 1}, run("f"), db=db, cache=fresh)
+    assert not hit and calls[-1] == "f"
+    s = cache.stats()
+    assert (s["hits"], s["misses"]) == (1, 3)
+
+    # 修订历史价格（日期与行数不变）、其它输入表变化都会改变键
+    from backend.backtest.cache import backtest_cache_key
+    from backend.storage.models import Fundamental
+    k0 = backtest_cache_key(db, p, {"BBB": 1})
+    bulk_upsert_prices_daily(db, [{"symbol": "BBB", "date": date(2024, 1, 2), "close": 10.5}])
+    k1 = backtest_cache_key(db, p, {"BBB": 1})
+    db.add(Fundamental(symbol="BBB", as_of=date(2024, 1, 2), pe=20.0))
+    db.flush()
+    assert len({k0, k1, backtest_cache_key(db, p, {"BBB": 1})}) == 3
+    db.commit()                                   # BBB 被修订：剩余条目全部失效
+    assert not list(tmp_path.iterdir())
+    fresh.put("k", {"x": 1}, ["ZZZ"])             # 只在磁盘上（对 cache 而言）的条目也能清掉
+    assert cache.invalidate(None) == 1 and not list(tmp_path.iterdir())
+
+    from backend.storage import price_panel
+    price_panel._LISTENERS.remove(cache.invalidate)
+
+
+def test_metrics_accumulator_streaming_matches_batch():
+    from backend.backtest.metrics import MetricsAccumulator, compute_drawdown
+
+    rng = np.random.default_rng(11)
+    nav = list(np.cumprod(1 + rng.normal(0.0003, 0.015, 500)))
+    nav[100] = None                                   # 缺失值：回撤记 0、不产生收益
+    one, two = MetricsAccumulator(), MetricsAccumulator()
+    dd = [one.update(v, 0.1) for v in nav]
+    dd2 = np.r_[two.extend(nav[:137], np.full(137, 0.1)), two.extend(nav[137:], np.full(363, 0.1))]
+    assert np.allclose(dd, dd2) and np.allclose(dd, compute_drawdown(nav))
+
+    r = np.array([b / a - 1 for a, b in zip(nav[:-1], nav[1:]) if a and b])
+    for acc in (one, two):
+        assert acc.n_ret == len(r) == 497 and abs(acc.max_dd - min(dd)) < 1e-15
+        assert abs(acc.sharpe() - r.mean() / r.std(ddof=1) * np.sqrt(252)) < 1e-9
+        assert abs(acc.win_rate - (r > 0).mean()) < 1e-15 and abs(acc.turnover - 50.0) < 1e-9
+
+
+def test_job_manager_coalesces_streams_and_cancels():
+    import threading
+    import time
+    from backend.backtest.jobs import JobManager
+
+    mgr = JobManager(max_workers=1)
+    gate = threading.Event()
+
+    def work(progress):
+        gate.wait(5)
+        for i in range(3):
+            progress({"rebalance_done": i + 1, "nav": 1.0 + i / 100})
+        return {"nav": [1.0, 1.02]}
+
+    a, merged_a = mgr.submit("k1", work)
+    b, merged_b = mgr.submit("k1", work)                     # 在途相同键 -> 合并
+    c, _ = mgr.submit("k2", work)                            # 单线程池：排队中
+    assert (merged_a, merged_b, b.id) == (False, True, a.id)
+    assert mgr.cancel(c.id).status == "cancelled"
+    gate.set()
+    a.future.result(5)
+    assert a.status == "done" and a.result == {"nav": [1.0, 1.02]} and a.progress["rebalance_done"] == 3
+    assert [e["event"] for e in mgr.events_since(a.id)] == ["queued", "started"] + ["progress"] * 3 + ["done"]
+    assert mgr.submit("k1", work)[1] is False                # 已结束的不再合并
+
+    def slow(progress):
+        while True:
+            progress({"tick": time.time()})
+            time.sleep(0.01)
+
+    d, _ = mgr.submit("k3", slow)
+    while d.status != "running":
+        time.sleep(0.01)
+    mgr.cancel(d.id)
+    d.future.result(5)
+    assert d.status == "cancelled" and mgr.events_since(d.id)[-1]["event"] == "cancelled"
+
+
+def test_simulator_checks_cancel_after_loading_phases(monkeypatch):
+    import pandas as pd
+    import scripts.historical_backtest_simulator as hbs
+    from backend.backtest.jobs import JobCancelled
+
+    sim = hbs.HistoricalBacktestSimulator(["AAA"], start_date="2024-05-01", end_date="2024-05-10",
+                                          precompute_scores=True)
+    idx = pd.to_datetime(["2024-05-06", "2024-05-07"])
+    monkeypatch.setattr(sim, "load_historical_prices", lambda: pd.DataFrame({"AAA": [1.0, 1.0]}, index=idx))
+    monkeypatch.setattr(sim, "build_score_schedule", lambda days: pytest.fail("取消后不应继续计算评分"))
+    phases = []
+
+    def progress(p):
+        phases.append(p.get("phase"))
+        raise JobCancelled("j")
+
+    with pytest.raises(JobCancelled):
+        sim.run_backtest(progress_cb=progress)
+    assert phases == ["prices_loaded"] and sim.history == []
+
+
+def test_walk_forward_tensor_scores_and_no_lookahead():
+    from backend.scoring.scorer import aggregate_score_matrix
+    from backend.backtest.walk_forward import (FACTORS, candidate_weights, score_tensor, topn_weights,
+                                               walk_forward_weights)
+
+    rng = np.random.default_rng(7)
+    F = rng.random((30, 12, 4))
+    F[rng.random(F.shape) < 0.1] = np.nan
+    W = candidate_weights(50, seed=1)
+    S = score_tensor(F, W)
+    for c in (0, 7, 49):
+        ref = aggregate_score_matrix({k: F[..., i] for i, k in enumerate(FACTORS)}, dict(zip(FACTORS, W[c])))
+        assert np.allclose(S[c], ref)
+    P = topn_weights(S, np.ones((30, 12), bool), top_n=5, max_single=0.3)
+    n = (P > 0).sum(-1)
+    assert np.allclose(P.sum(-1), np.minimum(1, 0.3 * n)) and (P <= 0.3 + 1e-9).all() and (n <= 5).all()
+
+    # 动量因子领先下期收益：优化后应偏向 momentum；改动未来收益不影响之前的权重
+    G = 0.02 * (np.nan_to_num(F[..., 2]) - 0.5) + rng.normal(0, 0.002, (30, 12))
+    ok = np.ones((30, 12), bool)
+    Wk, folds = walk_forward_weights(F, G, ok, train_periods=12, refit_every=3, candidates=W, top_n=3)
+    assert folds and folds[0]["k"] == 6 and np.argmax(Wk[-1]) == 2
+    G2 = G.copy()
+    G2[20:] = rng.normal(0, 0.05, (10, 12))
+    Wk2, _ = walk_forward_weights(F, G2, ok, train_periods=12, refit_every=3, candidates=W, top_n=3)
+    assert np.allclose(Wk[:21], Wk2[:21])
+
+
+def test_bootstrap_robustness_distribution():
+    from backend.backtest.robustness import bootstrap_indices, bootstrap_report, path_metrics
+
+    rng = np.random.default_rng(2)
+    for method, block in (("stationary", 5), ("block", 7)):
+        idx = bootstrap_indices(300, 50, method, block, rng)
+        assert idx.shape == (50, 300) and idx.min() >= 0 and idx.max() < 300
+        assert (np.diff(idx, axis=1) % 300 == 1).mean() > 0.7      # 大部分相邻位置在同一块内
+
+    r = rng.normal(0.0008, 0.01, 1260)
+    nav = np.r_[1.0, np.cumprod(1 + r)]
+    m = path_metrics(r[None])
+    assert abs(m["ann_return"][0] - (nav[-1] ** (252 / 1260) - 1)) < 1e-12
+    assert abs(m["max_dd"][0] - (nav / np.maximum.accumulate(nav) - 1).min()) < 1e-12
+    assert abs(m["sharpe"][0] - r.mean() / r.std(ddof=1) * np.sqrt(252)) < 1e-9
+
+    rep = bootstrap_report(r, n_paths=3000, seed=0)
+    assert rep == bootstrap_report(r, n_paths=3000, seed=0)
+    for k in ("ann_return", "sharpe", "max_dd"):
+        assert rep[k]["ci_low"] < rep[k]["point"] < rep[k]["ci_high"]
+    assert 0 <= rep["prob_loss"] < 0.5 and rep["max_dd"]["ci_high"] <= 0
+
+
+def test_robustness_ci_is_validated():
+    from pydantic import ValidationError
+    from backend.services.backtest import RunBacktestReq
+
+    for ci in (0.0, 1.0, 95):
+        with pytest.raises(ValidationError):
+            RunBacktestReq(robustness_ci=ci)
+    assert RunBacktestReq(robustness_ci=0.9).robustness_ci == 0.9
+    assert RunBacktestReq(robustness_ci=None).robustness_ci is None
+
+
+def test_batch_route_rejects_duplicate_ids_and_uniquifies_defaults(client, monkeypatch):
+    from backend.services import backtest as backtest_service
+
+    seen = {}
+    monkeypatch.setattr(backtest_service, "run_batch_backtest", lambda ports, **kw: seen.update(ports) or {})
+    w = [{"symbol": "AAA", "weight": 1.0}]
+    r = client.post("/api/backtest/batch", json={"portfolios": [{"id": "x", "weights": w}, {"id": "x", "weights": w}]})
+    assert r.status_code == 422 and "x" in r.json()["detail"]
+    r = client.post("/api/backtest/batch", json={"portfolios": [{"weights": w}, {"id": "portfolio_1", "weights": w},
+                                                                {"weights": w}]})
+    assert r.status_code == 200 and sorted(seen) == ["portfolio_1", "portfolio_2", "portfolio_3"]
+
+
+def test_simulator_uses_configured_trading_cost():
+    from datetime import date
+    import pandas as pd
+    import scripts.historical_backtest_simulator as hbs
+
+    prices = pd.Series({"AAA": 10.0, "BBB": 20.0})
+    for tc in (0.0, 0.01):
+        sim = hbs.HistoricalBacktestSimulator(["AAA", "BBB"], initial_capital=1000.0, start_date="2024-01-01",
+                                              end_date="2024-02-01", trading_cost=tc)
+        sim.rebalance(date(2024, 1, 2), [{"symbol": "AAA", "weight": 0.5}, {"symbol": "BBB", "weight": 0.4}], prices)
+        assert sim.positions == {"AAA": 50, "BBB": 20}
+        assert abs(sim.cash - (1000.0 - 900.0 * (1 + tc))) < 1e-9
+        sim.rebalance(date(2024, 1, 3), [{"symbol": "BBB", "weight": 0.4}], prices)
+        sell = next(t for t in sim.trades if t["action"] == "SELL" and t["symbol"] == "AAA")
+        assert abs(sell["value"] - 500.0 * (1 - tc)) < 1e-9
@@ -0,0 +1,47 @@
+from datetime import date, timedelta
+from sqlalchemy import create_engine, select, func
+from sqlalchemy.orm import sessionmaker
+
+from backend.storage.db import Base
+from backend.storage.models import PriceDaily
+from backend.storage.dao import bulk_upsert_prices_daily, upsert_prices_daily
+
+
+def _session():
+    eng = create_engine("sqlite:///:memory:", future=True)
+    Base.metadata.create_all(bind=eng)
+    return sessionmaker(bind=eng, autoflush=False, future=True)()
+
+
+def _rows(n, close=100.0):
+    d0 = date(2024, 1, 1)
+    return [{"symbol": "AAPL", "date": d0 + timedelta(days=i), "open": close, "high": close,
+             "low": close, "close": close + i, "volume": 1000, "dividend_amount": 0.0, "junk": 1} for i in range(n)]
+
+
+def test_bulk_upsert_counts_insert_update_unchanged():
+    db = _session()
+    st = bulk_upsert_prices_daily(db, _rows(1200), batch_size=500)
+    assert (st.inserted, st.updated, st.unchanged) == (1200, 0, 0)
+
+    rows = _rows(1205)
+    rows[3]["close"] = -1.0
+    rows[700]["volume"] = 5
+    st = bulk_upsert_prices_daily(db, rows, batch_size=500)
+    assert (st.inserted, st.updated, st.unchanged) == (5, 2, 1198)
+    db.commit()
+
+    assert db.execute(select(func.count()).select_from(PriceDaily)).scalar() == 1205
+    obj = db.get(PriceDaily, ("AAPL", date(2024, 1, 4)))
+    assert obj.close == -1.0 and obj.dividend_amount == 0.0
+
+
+def test_bulk_keeps_missing_columns_like_rowwise():
+    db = _session()
+    upsert_prices_daily(db, _rows(3))
+    db.commit()
+    # 只给 close，不应把 open/volume 覆盖为 NULL
+    n = upsert_prices_daily(db, [{"symbol": "AAPL", "date": date(2024, 1, 1), "close": 1.0}], bulk=True)
+    db.commit()
+    obj = db.get(PriceDaily, ("AAPL", date(2024, 1, 1)))
+    assert n == 1 and obj.close == 1.0 and obj.open == 100.0 and obj.volume == 1000
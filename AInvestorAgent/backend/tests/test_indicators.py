@@ -0,0 +1,44 @@
+import numpy as np
+from backend.factors import indicators as ind
+
+
+def _prices(n, seed=0):
+    rng = np.random.default_rng(seed)
+    return 100 * np.exp(np.cumsum(rng.normal(0, 0.02, n)))
+
+
+def test_window_indicators_match_naive():
+    p = _prices(300)
+    sma = ind.sma(p, 20)
+    bb = ind.bollinger(p, 20, 2.0)
+    for i in (19, 150, 299):
+        w = p[i - 19:i + 1]
+        assert np.isclose(sma[i], np.mean(w), rtol=1e-12)
+        assert np.isclose(bb["upper"][i], np.mean(w) + 2 * np.std(w), rtol=1e-10)
+    assert np.isnan(sma[:19]).all()
+
+
+def test_ema_and_rsi_match_recursion():
+    p = _prices(120, seed=3)
+    e, a = [p[0]], 2 / 13
+    for x in p[1:]:
+        e.append(x * a + e[-1] * (1 - a))
+    assert np.allclose(ind.ema(p, 12), e, rtol=1e-12)
+
+    d = np.diff(p)
+    g, l = np.clip(d, 0, None), np.clip(-d, 0, None)
+    ag, al = g[:14].mean(), l[:14].mean()
+    for i in range(14, len(d)):
+        ag, al = (ag * 13 + g[i]) / 14, (al * 13 + l[i]) / 14
+    assert np.isclose(ind.rsi(p, 14)[-1], 100 - 100 / (1 + ag / al), rtol=1e-10)
+
+
+def test_panel_columns_equal_single_series_with_leading_nan():
+    a, b = _prices(200, 1), _prices(200, 2)
+    b[:50] = np.nan                      # 晚上市
+    panel = ind.compute_indicator_panel(np.column_stack([a, b]))
+    single = ind.compute_indicator_panel(b[50:])
+    for k in ("ma20", "rsi", "macd", "macd_signal", "bb_lower", "volatility"):
+        assert np.isnan(panel[k][:50, 1]).all()
+        assert np.allclose(panel[k][50:, 1], single[k], rtol=1e-9, equal_nan=True), k
+    assert np.allclose(panel["macd"][:, 0], ind.macd(a)["macd"], equal_nan=True)
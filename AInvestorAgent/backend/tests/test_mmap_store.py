@@ -0,0 +1,101 @@
+from datetime import date, timedelta
+import numpy as np
+
+from backend.storage.mmap_store import MmapPriceStore
+
+
+def _rows(sym, d0, n, base):
+    return [{"symbol": sym, "date": d0 + timedelta(days=i), "close": base + i, "volume": 1.0} for i in range(n)]
+
+
+def test_append_restate_and_backfill(tmp_path):
+    w = MmapPriceStore(tmp_path)
+    w.write_rows(_rows("AAA", date(2024, 1, 10), 5, 100))
+    gen0 = w._meta["generation"]
+
+    # 追加新交易日 + 新 symbol：不重建
+    w.write_rows(_rows("AAA", date(2024, 1, 15), 3, 200) + _rows("BBB", date(2024, 1, 12), 2, 50))
+    assert w._meta["generation"] == gen0 and w.n_dates == 8
+
+    r = MmapPriceStore(tmp_path)  # 另一个读取方
+    p = r.panel(["BBB", "AAA", "ZZZ"])
+    assert p.close.shape == (8, 3)
+    assert p.close[2, 0] == 50 and np.isnan(p.close[0, 0]) and np.isnan(p.close[:, 2]).all()
+    assert np.isnan(p["open"]).all()
+
+    # 原地修正已有日期
+    w.write_rows([{"symbol": "AAA", "date": date(2024, 1, 10), "close": 1.0}])
+    assert r.panel(["AAA"]).close[0, 0] == 1.0 and r.panel(["AAA"])["volume"][0, 0] == 1.0
+
+    # 早于已有区间 -> 重建新一代，数据保留
+    w.write_rows(_rows("CCC", date(2024, 1, 1), 2, 9))
+    assert w._meta["generation"] == gen0 + 1
+    p = r.panel(None, start=date(2024, 1, 10), end=date(2024, 1, 10))
+    assert p.symbols == ["AAA", "BBB", "CCC"] and p.close[0].tolist()[0] == 1.0
+    assert str(r.dates[0]) == "2024-01-01" and r.n_dates == 10
+
+
+def test_dao_mirrors_only_committed_rows(tmp_path, monkeypatch):
+    from sqlalchemy import create_engine
+    from sqlalchemy.orm import sessionmaker
+    from backend.core.config import get_settings
+    from backend.storage.db import Base
+    from backend.storage.dao import bulk_upsert_prices_daily
+    from backend.storage.mmap_store import get_mmap_store
+    from backend.storage.price_panel import get_price_panel
+
+    monkeypatch.setattr(get_settings(), "PRICE_BACKEND", "mmap")
+    monkeypatch.setattr(get_settings(), "PRICE_STORE_DIR", str(tmp_path))
+    eng = create_engine("sqlite:///:memory:", future=True)
+    Base.metadata.create_all(bind=eng)
+    db = sessionmaker(bind=eng, autoflush=False, future=True)()
+    store = get_mmap_store()
+
+    bulk_upsert_prices_daily(db, _rows("AAA", date(2024, 1, 10), 3, 100))
+    assert get_price_panel(db, ["AAA"]).close[:, 0].tolist() == [100, 101, 102]   # 未提交：读 db
+    db.rollback()
+    assert not store.exists()                                                       # 回滚不镜像
+
+    bulk_upsert_prices_daily(db, _rows("AAA", date(2024, 1, 10), 2, 7))
+    db.commit()
+    assert store.exists() and store.panel(["AAA"]).close[:, 0].tolist() == [7, 8]
+    assert get_price_panel(db, ["AAA"]).close[:, 0].tolist() == [7, 8]
+
+
+def test_rebuild_from_db_twice_and_subset(tmp_path, monkeypatch, mem_db, seed_closes):
+    from pathlib import Path
+    from sqlalchemy import text
+
+    seed_closes(mem_db, ["AAA", "BBB"], [[1.0, 10.0], [2.0, 20.0], [3.0, 30.0]])
+    w = MmapPriceStore(tmp_path)
+    r = MmapPriceStore(tmp_path)
+    assert w.rebuild_from_db(mem_db) == 6
+    assert w.rebuild_from_db(mem_db) == 6                                   # 已有库再次整库重建
+    assert r.panel(["AAA", "BBB"]).close.tolist() == [[1, 10], [2, 20], [3, 30]]
+    gen = w._meta["generation"]
+
+    # 只重建 AAA：其它 symbol 原样保留
+    w.write_rows([{"symbol": "CCC", "date": date(2024, 1, 2), "close": 5.0}])
+    mem_db.execute(text("UPDATE prices_daily SET close = close * 100 WHERE symbol = 'AAA'"))
+    mem_db.commit()
+    assert w.rebuild_from_db(mem_db, ["AAA"]) == 3
+    p = r.panel(["AAA", "BBB", "CCC"])
+    assert p.close[:, 0].tolist() == [100, 200, 300] and p.close[:, 1].tolist() == [10, 20, 30]
+    assert p.close[1, 2] == 5.0
+    # 上一代文件保留，更早的删除
+    gens = {int(f.stem.rsplit(".g", 1)[1]) for f in tmp_path.glob("*.bin")}
+    assert gens == {w._meta["generation"] - 1, w._meta["generation"]} and w._meta["generation"] == gen + 1
+
+    # 读到旧 meta、但对应代次已被删除的读取方：重读 meta 后映射成功
+    stale = w.meta_path.read_text(encoding="utf-8")
+    w.rebuild_from_db(mem_db)
+    w.rebuild_from_db(mem_db)
+    late = MmapPriceStore(tmp_path)
+    real, calls = Path.read_text, []
+
+    def read_text(self, *a, **kw):
+        calls.append(self)
+        return stale if len(calls) == 1 else real(self, *a, **kw)
+
+    monkeypatch.setattr(Path, "read_text", read_text)
+    assert late.refresh() and late.panel(["BBB"]).close[:, 0].tolist() == [10, 20, 30]
@@ -0,0 +1,146 @@
+import numpy as np
+import pytest
+
+from backend.portfolio.allocator import allocate_from_scores
+from backend.portfolio.constraints import Constraints
+from backend.portfolio.projection import project_capped_simplex
+
+
+def test_capped_simplex_projection_exact_and_feasible():
+    # 单票上限：超出部分按欧氏投影平均摊给未触顶的
+    r = project_capped_simplex([0.5, 0.3, 0.2], max_single=0.4)
+    assert r.feasible and np.allclose(r.weights, [0.4, 0.35, 0.25])
+
+    # 行业上限：A 行业压到 0.5，且单票上限同时满足
+    t = np.array([0.3, 0.25, 0.15, 0.1, 0.1, 0.1])
+    r = project_capped_simplex(t, 0.28, ["A", "A", "A", "B", "C", "C"], 0.5)
+    w = r.weights
+    assert np.isclose(w.sum(), 1) and w.max() <= 0.28 + 1e-12 and np.isclose(w[:3].sum(), 0.5)
+    assert r.binding_sectors == ["A"]
+    # KKT：同一行业内未触边界的股票，调整量相同
+    assert np.allclose((t - w)[:3], (t - w)[0]) and np.allclose((t - w)[4:], (t - w)[3])
+
+    # 不可行：全在同一行业 → 报告并放宽；relax=False 时余下为现金
+    r = project_capped_simplex([0.4, 0.3, 0.3], 0.3, ["X"] * 3, 0.5)
+    assert not r.feasible and np.isclose(r.weights.sum(), 1) and np.isclose(r.max_sector["X"], 1.0)
+    r = project_capped_simplex([0.4, 0.3, 0.3], 0.3, ["X"] * 3, 0.5, relax=False)
+    assert np.isclose(r.weights.sum(), 0.5)
+
+    rng = np.random.default_rng(0)
+    t = rng.random(3000)
+    r = project_capped_simplex(t / t.sum(), 0.002, rng.choice(list("ABCDEFGHIJK"), 3000), 0.1)
+    assert r.feasible and np.isclose(r.weights.sum(), 1) and r.weights.max() <= 0.002 + 1e-12
+
+
+def test_allocate_respects_sector_cap():
+    scores = {"A1": 90, "A2": 85, "A3": 80, "B1": 60, "C1": 55, "C2": 50}
+    sectors = {"A1": "Tech", "A2": "Tech", "A3": "Tech", "B1": "Energy", "C1": "Utilities", "C2": "Utilities"}
+    hs = allocate_from_scores(scores, sectors, Constraints(max_single=0.30, max_sector=0.40, min_positions=3))
+    w = {h["symbol"]: h["weight"] for h in hs}
+    assert abs(sum(w.values()) - 1) < 1e-9 and max(w.values()) <= 0.30 + 1e-9
+    assert w["A1"] + w["A2"] + w["A3"] <= 0.40 + 1e-9
+
+
+def test_covariance_optimizers_under_constraints(mem_db, seed_closes):
+    from datetime import timedelta
+    from backend.storage.dao import bulk_upsert_prices_daily
+    from backend.portfolio.allocator import propose_portfolio
+    from backend.portfolio.optimizer import estimate_covariance, ledoit_wolf, optimize_weights
+    from backend.services.risk import get_risk_matrix
+
+    rng = np.random.default_rng(3)
+    X = rng.normal(0, 0.01, (300, 8)) + rng.normal(0, 0.01, (300, 1)) * np.linspace(0.2, 2, 8)
+    cov, delta = ledoit_wolf(X)
+    Xc = X - X.mean(0)
+    S = Xc.T @ Xc / 300
+    assert 0 < delta < 1 and np.allclose(np.diag(cov).mean(), np.diag(S).mean())
+
+    db = mem_db
+    syms = [f"S{k}" for k in range(8)]
+    asof = seed_closes(db, syms, 100 * np.cumprod(1 + X, axis=0))[-1]
+    est = estimate_covariance(db, syms, asof, lookback=250)
+    rm = get_risk_matrix(db, syms, asof, lookback=250)
+    assert rm is get_risk_matrix(db, syms[::-1], asof, lookback=250)          # 与风险服务共用缓存（按股票集合）
+    sectors = {s: ("A" if k < 4 else "B") for k, s in enumerate(syms)}
+    c = Constraints(max_single=0.25, max_sector=0.6, min_positions=3)
+    scores = {s: 50.0 + 5 * k for k, s in enumerate(syms)}
+
+    res = {k: optimize_weights(k, est, sectors, c, scores) for k in ("min_variance", "risk_parity", "max_sharpe")}
+    for r in res.values():
+        w = np.array([r.weights[s] for s in syms])
+        assert np.isclose(w.sum(), 1) and w.max() <= 0.25 + 1e-9 and w[:4].sum() <= 0.6 + 1e-9
+    # 最小方差的波动不高于其它方案；不受约束的 ERC 各股风险贡献相同
+    assert res["min_variance"].exp_vol <= min(res["risk_parity"].exp_vol, res["max_sharpe"].exp_vol) + 1e-12
+    free = optimize_weights("risk_parity", est, sectors, Constraints(max_single=1.0, max_sector=1.0))
+    assert np.allclose(list(free.risk_contrib.values()), 1 / 8, atol=1e-8)
+    # 上限起作用时在上限内求 ERC：风险贡献比“先无约束 ERC 再投影”更接近等分
+    tight = Constraints(max_single=0.15, max_sector=1.0, min_positions=3)
+    capped = optimize_weights("risk_parity", est, {}, tight)
+    projected = project_capped_simplex([free.weights[s] for s in syms], 0.15).weights
+    rc = lambda w: w * (est.cov @ w) / (w @ est.cov @ w)
+    wc = np.array([capped.weights[s] for s in syms])
+    assert wc.max() <= 0.15 + 1e-9 and ((rc(wc) - 1 / 8) ** 2).sum() < ((rc(projected) - 1 / 8) ** 2).sum()
+    # 解出的持仓数少于 min_positions 时拒绝
+    loose = Constraints(max_single=1.0, max_sector=1.0, min_positions=1)
+    n_mv = sum(v > 0 for v in optimize_weights("min_variance", est, {}, loose).weights.values())
+    assert n_mv < 8
+    with pytest.raises(ValueError):
+        optimize_weights("min_variance", est, {}, Constraints(max_single=1.0, max_sector=1.0, min_positions=n_mv + 1))
+
+    bulk_upsert_prices_daily(db, [{"symbol": "S0", "date": asof + timedelta(days=1), "close": 1.0}])
+    db.commit()
+    assert get_risk_matrix(db, syms, asof, lookback=250) is not rm            # 新价格使缓存失效
+
+    holdings, _ = propose_portfolio(db, syms, c, scores_dict=scores, scheme="min_variance")
+    ref = optimize_weights("min_variance", estimate_covariance(db, syms), {}, c).weights   # 无行业信息 → Unknown
+    assert all(abs(h["weight"] - ref[h["symbol"]]) < 1e-9 for h in holdings)
+    # 零权重的股票不进入持仓；min_positions 不满足时回落到分数权重（全部候选）
+    holdings, _ = propose_portfolio(db, syms, loose, scores_dict=scores, scheme="min_variance")
+    assert 0 < len(holdings) < 8 and all(h["weight"] > 0 for h in holdings)
+    holdings, _ = propose_portfolio(db, syms, Constraints(max_single=1.0, max_sector=1.0, min_positions=8),
+                                    scores_dict=scores, scheme="min_variance")
+    assert len(holdings) == 8
+
+
+def test_incremental_rebalance_bands_and_accounts(mem_db):
+    from datetime import datetime, timedelta, timezone
+    from backend.storage.models import SimAccount, SimPosition, SimTrade
+    from backend.portfolio.rebalance import rebalance_accounts, rebalance_weights, trade_costs
+
+    w0 = np.array([0.30, 0.30, 0.40, 0.0])
+    t = np.array([0.31, 0.20, 0.29, 0.20])
+    full = rebalance_weights(w0, t, mode="full")
+    band = rebalance_weights(w0, t, mode="band", band=0.02)
+    assert np.allclose(full.weights, t) and band.weights[0] == 0.30 and np.isclose(band.weights.sum(), 1)
+
+    # 卖出 C 有大额浮盈税：l1 少卖 C、多卖 B，总仓位不变，成本低于全量调仓
+    c_buy, c_sell = trade_costs(0.001, np.full(4, 100.0), np.array([100, 100, 50, 100]), np.zeros(4), 0.37, 0.2)
+    l1 = rebalance_weights(w0, t, c_buy, c_sell, mode="l1", aversion=1.0)
+    assert np.isclose(l1.weights.sum(), 1) and l1.weights[2] > t[2] + 0.1 and l1.weights[1] < t[1]
+    assert l1.saved > 0 and l1.turnover < full.turnover
+    # 批量：P 个账户一次求解，与逐个计算一致
+    P = rebalance_weights(np.tile(w0, (3, 1)), np.tile(t, (3, 1)), c_buy, c_sell, mode="l1", aversion=1.0)
+    assert np.allclose(P.weights, l1.weights) and np.allclose(P.saved, l1.saved)
+
+    db = mem_db
+    now = datetime(2025, 1, 1)
+    db.add_all([SimAccount(account_id="a", account_name="a", current_cash=0.0),
+                SimAccount(account_id="b", account_name="b", current_cash=1000.0),
+                SimPosition(account_id="a", symbol="X", quantity=10, avg_cost=50.0),
+                SimPosition(account_id="a", symbol="Y", quantity=10, avg_cost=100.0),
+                SimTrade(account_id="a", symbol="X", action="BUY", quantity=10, price=50.0, total_amount=500.0,
+                         trade_date=now - timedelta(days=30))])
+    db.commit()
+    plans = rebalance_accounts(db, {"X": 0.4, "Y": 0.6}, {"X": 100.0, "Y": 100.0}, mode="l1",
+                               short_term_tax_rate=0.37, now=now)
+    assert set(plans) == {"a", "b"} and plans["a"]["total_value"] == 2000.0
+    # 账户 a：X 卖出有税，只在带边缘少量减仓；账户 b 全部是现金，直接买到目标
+    assert plans["a"]["summary"]["turnover"] < 0.2 and plans["a"]["summary"]["cost_saved"] > 0
+    assert {o["symbol"]: o["side"] for o in plans["b"]["orders"]} == {"X": "BUY", "Y": "BUY"}
+    assert np.isclose(sum(o["quantity"] * o["price"] for o in plans["b"]["orders"]), 1000.0)
+    # 带时区的 now 与 naive UTC 的成交日期可比；缺省 now 也不报错
+    aware = rebalance_accounts(db, {"X": 0.4, "Y": 0.6}, {"X": 100.0, "Y": 100.0}, mode="l1",
+                               short_term_tax_rate=0.37, now=now.replace(tzinfo=timezone.utc))
+    assert aware == plans and rebalance_accounts(db, {"X": 0.5}, {"X": 100.0, "Y": 100.0})
+    costly = rebalance_accounts(db, {"X": 0.4, "Y": 0.6}, {"X": 100.0, "Y": 100.0}, mode="full", tc=0.01, now=now)
+    assert np.isclose(costly["b"]["summary"]["cost"], 10.0)
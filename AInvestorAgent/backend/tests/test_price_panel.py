@@ -0,0 +1,64 @@
+from datetime import date, timedelta
+import numpy as np
+from sqlalchemy import create_engine, event
+from sqlalchemy.orm import sessionmaker
+
+from backend.storage.db import Base
+from backend.storage.dao import bulk_upsert_prices_daily
+from backend.storage.price_panel import get_price_panel
+from backend.factors.momentum import _last_close, get_price_series, momentum_return
+
+
+def _session():
+    eng = create_engine("sqlite:///:memory:", future=True)
+    Base.metadata.create_all(bind=eng)
+    stmts = []
+    event.listen(eng, "before_cursor_execute", lambda *a: stmts.append(a[2]))
+    return sessionmaker(bind=eng, autoflush=False, future=True)(), stmts
+
+
+def _rows(sym, n, base, skip=()):
+    d0 = date(2024, 1, 1)
+    return [{"symbol": sym, "date": d0 + timedelta(days=i), "open": base, "high": base, "low": base,
+             "close": base + i, "volume": 10} for i in range(n) if i not in skip]
+
+
+def test_panel_asof_ffill_and_single_query():
+    db, stmts = _session()
+    bulk_upsert_prices_daily(db, _rows("AAA", 10, 100) + _rows("BBB", 10, 50, skip=(5, 6)))
+    db.commit()
+
+    stmts.clear()
+    panel = get_price_panel(db, ["AAA", "BBB"])
+    assert panel.close.shape == (10, 2)
+    assert np.isnan(panel.close[5, 1])
+    # 之后按 symbol 访问全部命中缓存
+    assert _last_close(db, "BBB", date(2024, 1, 7)) == 54.0      # 1/6、1/7 缺失 -> 前向填充
+    assert momentum_return(db, "AAA", date(2024, 1, 10), 9) == 109 / 100 - 1
+    df = get_price_series(db, "BBB", date(2024, 1, 10), 9)
+    assert len(df) == 8 and list(df.columns) == ["date", "open", "high", "low", "close", "volume"]
+    assert len([s for s in stmts if "prices_daily" in s]) == 1
+
+
+def test_panel_invalidated_by_dao_write():
+    db, _ = _session()
+    bulk_upsert_prices_daily(db, _rows("AAA", 3, 100))
+    assert _last_close(db, "AAA", date(2024, 12, 31)) == 102.0
+    bulk_upsert_prices_daily(db, [{"symbol": "AAA", "date": date(2024, 1, 4), "close": 7.0}])
+    assert _last_close(db, "AAA", date(2024, 12, 31)) == 7.0
+
+
+def test_momentum_batch_matches_single():
+    from backend.factors.momentum import momentum_returns_batch
+    db, _ = _session()
+    rows = _rows("AAA", 300, 100, skip=range(100, 140)) + _rows("BBB", 300, 50, skip=(298,))
+    bulk_upsert_prices_daily(db, rows)
+    asof = date(2024, 10, 20)
+    m = momentum_returns_batch(db, ["AAA", "BBB", "ZZZ"], asof, (20, 60, 252))
+    for s in ("AAA", "BBB"):
+        for h in (20, 60, 252):
+            assert m.at[s, h] == momentum_return(db, s, asof, h)
+    assert np.isnan(m.loc["ZZZ"]).all()
+
+    bars = momentum_returns_batch(db, ["BBB"], date(2024, 12, 31), (1, 2), unit="bars")
+    assert bars.at["BBB", 1] == 349 / 347 - 1 and bars.at["BBB", 2] == 349 / 346 - 1
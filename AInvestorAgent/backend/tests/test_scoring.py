@@ -0,0 +1,84 @@
+from datetime import date, datetime
+
+import numpy as np
+import pytest
+from sqlalchemy import event
+
+from backend.storage import models
+from backend.factors.momentum import momentum_return
+from backend.factors.sentiment import avg_sentiment_7d
+from backend.sentiment.daily import rebuild_sentiment_daily
+from backend.scoring.scorer import (compute_factors_batch, _compute_value_factor,
+                                    _compute_quality_factor)
+
+
+@pytest.fixture
+def seeded(mem_engine, mem_db, seed_closes):
+    stmts = []
+    event.listen(mem_engine, "before_cursor_execute", lambda *a: stmts.append(a[2]))
+    db = mem_db
+
+    i, k = np.arange(300)[:, None], np.arange(4)
+    closes = (50 + 10 * k + i * (k + 1) % 37).astype(float)
+    closes[120:, 3] = np.nan                    # OLD 之后停牌，走回退路径
+    seed_closes(db, ["AAA", "BBB", "CCC", "OLD"], closes, commit=False)
+
+    db.add_all([
+        models.Fundamental(symbol="AAA", as_of=date(2024, 1, 1), pe=300, pb=30, roe=0.5, net_margin=0.4),
+        models.Fundamental(symbol="AAA", as_of=date(2024, 6, 1), pe=25, pb=5, roe=0.2, net_margin=-0.1),
+        models.Fundamental(symbol="BBB", as_of=date(2024, 6, 1), pe=None, pb=1.5, roe=35.0, net_margin=None),
+    ])
+    for i, (s, v) in enumerate([("AAA", 0.6), ("AAA", -0.2), ("CCC", 0.1)]):
+        news = models.NewsRaw(symbol=s, title="t", url=f"u{i}", published_at=datetime(2024, 10, 20 + i))
+        news.scores.append(models.NewsScore(sentiment=v))
+        db.add(news)
+    db.flush()
+    rebuild_sentiment_daily(db)
+    db.commit()
+    return db, stmts
+
+
+def test_compute_factors_batch_matches_per_symbol(seeded):
+    db, stmts = seeded
+    syms, asof = ["AAA", "BBB", "CCC", "OLD", "ZZZ"], date(2024, 10, 26)
+
+    stmts.clear()
+    rows = {r.symbol: r for r in compute_factors_batch(db, syms, asof)}
+    assert len(stmts) <= 6        # 价格区间 + 回退 + 基本面 + 情绪（+ 未回填 symbol 的检查），与 symbol 数无关
+
+    for s in syms:
+        r = rows[s]
+        assert r.f_momentum_raw == momentum_return(db, s, asof, 60)
+        assert r.f_sentiment == avg_sentiment_7d(db, s, asof, days=30)
+        assert r.f_value == _compute_value_factor(db, s, asof)
+        assert r.f_quality == _compute_quality_factor(db, s, asof)
+    assert rows["OLD"].f_momentum_raw is not None
+    assert rows["ZZZ"].f_momentum is None
+
+
+def test_factor_store_backfills_only_missing_cells(seeded):
+    from backend.scoring.factor_store import backfill_factors, load_factor_panel, get_factor_rows
+    db, stmts = seeded
+    days = [date(2024, 9, 2), date(2024, 10, 1), date(2024, 10, 26)]
+
+    assert backfill_factors(db, ["AAA", "BBB"], days) == 6
+    assert backfill_factors(db, ["AAA", "BBB"], days) == 0
+    # 新增 symbol 只补它自己的格子；最近 refresh_days 天内的日期总是重算
+    assert backfill_factors(db, ["AAA", "BBB", "CCC"], days) == 3
+    assert backfill_factors(db, ["AAA", "BBB", "CCC"], days, today=date(2024, 10, 30)) == 3
+
+    fp = load_factor_panel(db, ["AAA", "BBB", "CCC", "ZZZ"], days[0], days[-1])
+    assert fp.values.shape == (3, 4, 5)
+    assert np.isnan(fp.values[:, 3]).all()
+    # 动量按请求的股票池归一：入库了 CCC 也不影响 AAA / BBB 两只的结果
+    for universe in (["AAA", "BBB"], ["AAA", "BBB", "CCC"]):
+        ref = {r.symbol: r for r in compute_factors_batch(db, universe, days[-1])}
+        rows = {r.symbol: r for r in get_factor_rows(db, universe, days[-1])}
+        for s, r in ref.items():
+            assert rows[s] == r
+
+    # 读路径不写库：表中没有的格子现算
+    n = db.query(models.FactorDaily).count()
+    rows = {r.symbol: r for r in get_factor_rows(db, ["AAA", "OLD"], days[0])}
+    assert rows["OLD"] == compute_factors_batch(db, ["AAA", "OLD"], days[0])[1]
+    assert db.query(models.FactorDaily).count() == n
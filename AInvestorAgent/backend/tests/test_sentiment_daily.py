@@ -0,0 +1,70 @@
+from datetime import date, datetime
+
+from sqlalchemy import create_engine, select
+from sqlalchemy.orm import sessionmaker
+
+from backend.storage import models
+from backend.storage.db import Base
+from backend.sentiment.daily import (add_news_scores, daily_series, ensure_sentiment_daily,
+                                     rebuild_sentiment_daily, window_sentiment)
+
+NEWS = [("AAA", datetime(2024, 10, 20, 9), 0.6), ("AAA", datetime(2024, 10, 20, 23, 59), -0.2),
+        ("AAA", datetime(2024, 10, 22), 0.1), ("BBB", datetime(2024, 10, 21, 12), -1.0)]
+
+
+def _session():
+    eng = create_engine("sqlite:///:memory:", future=True)
+    Base.metadata.create_all(bind=eng)
+    return sessionmaker(bind=eng, autoflush=False, future=True)()
+
+
+def _dump(db):
+    t = models.SentimentDaily.__table__
+    return sorted(db.execute(select(t.c.symbol, t.c.day, t.c.sum_sent, t.c.n)).all())
+
+
+def test_incremental_matches_rebuild_and_windows():
+    db = _session()
+    # 分两批增量累加
+    add_news_scores(db, NEWS[:2])
+    add_news_scores(db, NEWS[2:])
+    inc = _dump(db)
+
+    for i, (s, ts, v) in enumerate(NEWS):
+        n = models.NewsRaw(symbol=s, title="t", url=f"u{i}", published_at=ts)
+        n.scores.append(models.NewsScore(sentiment=v))
+        db.add(n)
+    db.flush()
+    rebuild_sentiment_daily(db)
+    assert _dump(db) == inc
+    assert inc[0][1] == date(2024, 10, 20) and inc[0][3] == 2
+
+    w = window_sentiment(db, ["AAA", "BBB", "ZZZ"], date(2024, 10, 21))
+    assert w["AAA"] == (0.1, 1) and w["BBB"] == (-1.0, 1) and w["ZZZ"] == (None, 0)
+    # 半衰期 2 天：10-20 的两条权重 0.5，10-22 权重 1
+    m, n = window_sentiment(db, ["AAA"], date(2024, 10, 1), date(2024, 10, 22), half_life=2)["AAA"]
+    assert n == 3 and abs(m - (0.5 * 0.4 + 0.1) / (0.5 * 2 + 1)) < 1e-12
+
+    assert [d for d, _, _ in daily_series(db, ["AAA", "BBB"], date(2024, 10, 21))] == \
+        [date(2024, 10, 21), date(2024, 10, 22)]
+
+
+def test_backfills_never_rebuilt_symbols_once():
+    from backend.factors.sentiment import avg_sentiment_7d
+    db = _session()
+    for i, (s, ts, v) in enumerate(NEWS):
+        n = models.NewsRaw(symbol=s, title="t", url=f"u{i}", published_at=ts)
+        n.scores.append(models.NewsScore(sentiment=v))
+        db.add(n)
+    db.flush()                                      # 旧库：sentiment_daily 还没有回填
+    add_news_scores(db, NEWS[2:3])                  # 只有最近一天被增量累加过（部分覆盖）
+    got = (window_sentiment(db, ["AAA", "BBB", "ZZZ"], date(2024, 10, 1), date(2024, 10, 22), half_life=2),
+           daily_series(db, ["AAA", "BBB"], date(2024, 10, 20)),
+           avg_sentiment_7d(db, "AAA", date(2024, 10, 23)))
+    assert got[0]["AAA"][1] == 3 and got[0]["ZZZ"] == (None, 0)
+    assert ensure_sentiment_daily(db, ["AAA", "BBB", "ZZZ"]) == []     # 已回填；无新闻的 ZZZ 不联表
+
+    rebuild_sentiment_daily(db)
+    assert got == (window_sentiment(db, ["AAA", "BBB", "ZZZ"], date(2024, 10, 1), date(2024, 10, 22), half_life=2),
+                   daily_series(db, ["AAA", "BBB"], date(2024, 10, 20)),
+                   avg_sentiment_7d(db, "AAA", date(2024, 10, 23)))
@@ -0,0 +1,148 @@
+from datetime import date
+
+from backend.storage import models
+from backend.services import lookup_sectors, get_fundamentals, summary_metrics
+
+
+def test_sector_and_fundamentals_lookup_in_process(mem_db):
+    db = mem_db
+    db.add_all([
+        models.Symbol(symbol="AAA", name="A", sector="Energy"),
+        models.Symbol(symbol="BBB", name="B", sector="Unknown"),
+        models.Fundamental(symbol="BBB", as_of=date(2024, 1, 1), sector="Utilities", pe=10.0),
+        models.Fundamental(symbol="BBB", as_of=date(2024, 6, 1), sector="Materials", pe=12.0),
+    ])
+    db.commit()
+    assert lookup_sectors(["aaa", "BBB", "ZZZ"], db) == {"AAA": "Energy", "BBB": "Materials"}
+    f = get_fundamentals("bbb", db)
+    assert f["pe"] == 12.0 and f["as_of"] == "2024-06-01" and get_fundamentals("ZZZ", db) is None
+
+
+def test_summary_metrics_from_simulator_percentages():
+    res = {"success": True, "metrics": {"annualized_return_before_tax": 12.5, "max_drawdown": -8.0,
+                                        "sharpe": 1.2, "win_rate": 55.0}}
+    assert summary_metrics(res) == {"ann_return": 0.125, "mdd": -0.08, "sharpe": 1.2, "winrate": 0.55}
+    assert summary_metrics({"success": False})["sharpe"] == 0.0
+
+
+def test_batch_backtest_snapshots_match_single_engine(mem_db, seed_closes):
+    import json
+    from datetime import timedelta
+    import numpy as np
+    from backend.backtest.engine import run_backtest, simple_returns, weekly_rebalance_idx
+    from backend.services import load_snapshot_weights, run_batch_backtest
+
+    db = mem_db
+    rng = np.random.default_rng(4)
+    syms = ["AAA", "BBB", "CCC", "DDD"]
+    px = 50 * np.cumprod(1 + rng.normal(0.0005, 0.015, (150, 4)), axis=0)
+    today = date.today()
+    days = seed_closes(db, syms, px, start=today - timedelta(days=149), commit=False)
+    db.add_all([
+        models.PortfolioSnapshot(snapshot_id="s1", as_of="2024-01-02",
+                                 payload=json.dumps({"holdings": [{"symbol": "AAA", "weight": 0.6},
+                                                                  {"symbol": "bbb", "weight": 0.4}]})),
+        models.PortfolioSnapshot(snapshot_id="s2", as_of="2024-03-01", payload="not json",
+                                 holdings_json=json.dumps([{"symbol": "CCC", "weight": 1.0},
+                                                           {"symbol": "ZZZ", "weight": 1.0}])),
+    ])
+    db.commit()
+    assert load_snapshot_weights(db, since="2024-02-01") == {"s2": {"CCC": 1.0, "ZZZ": 1.0}}
+
+    ports = load_snapshot_weights(db, ["s1", "s2"])
+    out = run_batch_backtest(ports, window_days=100, trading_cost=0.002, db=db)
+    by_id = {p["id"]: p for p in out["portfolios"]}
+    assert by_id["s2"]["missing"] == ["ZZZ"] and by_id["s2"]["weights"] == {"CCC": 1.0}
+
+    i0 = days.index(today - timedelta(days=100))
+    R = simple_returns(px[i0:])
+    idx = weekly_rebalance_idx(days[i0:])
+    for pid, w in (("s1", [0.6, 0.4, 0, 0]), ("s2", [0, 0, 1.0, 0])):
+        ref = run_backtest(R, np.array(w), idx, tc=0.002)
+        assert np.allclose(by_id[pid]["nav"], ref.nav, atol=1e-6)
+    assert [r["rank"] for r in out["comparison"]] == [1, 2]
+    assert out["comparison"][0]["sharpe"] >= out["comparison"][1]["sharpe"]
+
+
+def test_risk_matrix_date_aligned_and_ewma(mem_db, seed_closes):
+    import numpy as np
+    import pandas as pd
+    from backend.services.risk import correlation_summary, get_risk_matrix, portfolio_risk
+
+    db = mem_db
+    rng = np.random.default_rng(11)
+    px = 100 * np.cumprod(1 + rng.normal(0, 0.01, (120, 3)) @ [[1, 0.5, 0], [0, 1, 0], [0, 0, 1]], axis=0)
+    gap = px.copy()
+    gap[50, 1] = np.nan                                   # BBB 缺一天
+    seed_closes(db, ["AAA", "BBB", "CCC"], gap)
+
+    rm = get_risk_matrix(db, ["CCC", "AAA", "BBB"], lookback=200, min_obs=30)
+    assert rm.symbols == ["AAA", "BBB", "CCC"] and rm.returns.shape == (118, 3)
+    # BBB 缺一天：该日整行剔除，其它股票的收益跨过这一天计算（不按位置错位）
+    ref = pd.DataFrame(px, columns=rm.symbols).drop(index=50).pct_change().dropna()
+    assert np.allclose(rm.returns, ref.values) and np.allclose(rm.cov, ref.cov().values)
+    assert np.allclose(rm.corr, ref.corr().values)
+
+    ew = get_risk_matrix(db, ["AAA", "BBB", "CCC"], lookback=200, halflife=20, min_obs=30)
+    assert ew is not rm and np.allclose(ew.cov, ref.ewm(halflife=20).cov().iloc[-3:].values)
+
+    s = correlation_summary(rm.corr)
+    assert np.isclose(s["max_correlation"], rm.corr[0, 1]) and 0 <= s["correlation_risk_ratio"] <= 1
+    m = portfolio_risk(rm, {"AAA": 1.0, "CCC": 1.0, "ZZZ": 2.0})        # 不在矩阵中的股票剔除，其余重新归一
+    w = np.array([0.5, 0, 0.5])
+    assert np.isclose(m["portfolio_volatility"], np.sqrt(w @ rm.cov @ w * 252))
+    assert m["dropped"] == ["ZZZ"] and np.isclose(m["covered_weight"], 0.5)
+
+    from backend.services.var import var_report
+    v = var_report(rm, {"AAA": 1.0, "CCC": 1.0, "ZZZ": 2.0}, methods=["parametric"])
+    assert v["dropped"] == ["ZZZ"] and np.isclose(v["parametric"]["component_var"]["AAA"]
+                                                  + v["parametric"]["component_var"]["CCC"], v["parametric"]["var"])
+    assert np.isclose(v["parametric"]["var"], var_report(rm, {"AAA": 1, "CCC": 1}, methods=["parametric"])["parametric"]["var"])
+
+    # 有效价格恰好 min_obs 个的股票保留
+    edge = get_risk_matrix(db, ["AAA", "BBB", "CCC"], lookback=200, min_obs=120)
+    assert edge.symbols == ["AAA", "CCC"] and edge.missing == ["BBB"]
+
+
+def test_var_engine_methods_and_euler_decomposition():
+    import numpy as np
+    from backend.services.var import historical_var, monte_carlo_var, parametric_var
+
+    rng = np.random.default_rng(4)
+    A = rng.normal(size=(5, 5))
+    cov, mean = (A @ A.T + np.eye(5)) * 1e-4, rng.normal(0, 5e-4, 5)
+    w = rng.dirichlet(np.ones(5))
+
+    p = parametric_var(mean, cov, w, 0.99)
+    m = monte_carlo_var(mean, cov, w, 0.99, seed=7)
+    assert abs(m["var"] / p["var"] - 1) < 0.02 and abs(m["cvar"] / p["cvar"] - 1) < 0.02
+    assert np.allclose(m["component_cvar"], p["component_cvar"], atol=3e-4)
+    # 组件之和等于组合值；参数法边际 VaR 与数值梯度一致
+    for r in (p, m):
+        assert np.isclose(r["component_var"].sum(), r["var"]) and np.isclose(r["component_cvar"].sum(), r["cvar"])
+    e = 1e-7
+    num = [(parametric_var(mean, cov, w + e * np.eye(5)[i], 0.99)["var"] - p["var"]) / e for i in range(5)]
+    assert np.allclose(num, p["marginal_var"], atol=1e-5)
+
+    R = rng.multivariate_normal(mean, cov, size=500)
+    h = historical_var(R, w, 0.95)
+    rp = R @ w
+    assert np.isclose(h["var"], np.quantile(rp, 0.05)) and np.isclose(h["cvar"], rp[rp <= h["var"]].mean())
+    assert np.isclose(h["component_cvar"].sum(), h["cvar"])
+
+
+def test_portfolio_risk_route_caps_monte_carlo_draws(client, monkeypatch, mem_db, mem_sessions, seed_closes):
+    import numpy as np
+    from backend.storage import db as storage_db
+    from backend.services import var
+
+    monkeypatch.setattr(storage_db, "SessionLocal", mem_sessions)
+    rng = np.random.default_rng(5)
+    seed_closes(mem_db, ["RA", "RB", "RC"], 100 * np.cumprod(1 + rng.normal(0, 0.01, (80, 3)), axis=0))
+
+    body = [{"symbol": s, "weight": 1 / 3} for s in ("RA", "RB", "RC")]
+    monkeypatch.setattr(var, "MC_MAX_DRAWS", 3_000)
+    r = client.post("/api/validation/portfolio-risk?mc_paths=1000&var_methods=monte_carlo", json=body)
+    assert r.status_code == 200 and r.json()["data"]["var"]["monte_carlo"]["n_paths"] == 1000
+    r = client.post("/api/validation/portfolio-risk?mc_paths=1001&var_methods=monte_carlo", json=body)
+    assert r.status_code == 422 and "3,000" in r.json()["detail"]
@@ -0,0 +1,95 @@
+from datetime import date, timedelta
+import numpy as np
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from backend.storage.db import Base
+from backend.storage.dao import bulk_upsert_prices_daily
+from backend.factors import streaming
+from backend.factors.momentum import calculate_technical_indicators, calculate_signal_strength
+
+
+def _session():
+    eng = create_engine("sqlite:///:memory:", future=True)
+    Base.metadata.create_all(bind=eng)
+    return sessionmaker(bind=eng, autoflush=False, future=True)()
+
+
+def _rows(n, seed=0, d0=date(2023, 1, 2)):
+    rng = np.random.default_rng(seed)
+    c = 100 * np.exp(np.cumsum(rng.normal(0, 0.02, n)))
+    return [{"symbol": "AAA", "date": d0 + timedelta(days=i), "open": x, "high": x * 1.01, "low": x * 0.99,
+             "close": x, "volume": 1000 + i} for i, x in enumerate(c) if (d0 + timedelta(days=i)).weekday() < 5]
+
+
+def test_state_matches_full_recompute_and_updates_incrementally(monkeypatch):
+    db = _session()
+    rows = _rows(500)
+    bulk_upsert_prices_daily(db, rows[:-5])
+    asof = rows[-6]["date"]
+    assert streaming.get_indicator_state(db, "AAA", asof) is None   # 无状态：读路径不回放全部历史
+    st = streaming.get_indicator_state(db, "AAA", asof, persist=True)
+    assert st.last_date == asof
+
+    # 逐根追加 5 根新 K 线，与直接从头构建一致
+    bulk_upsert_prices_daily(db, rows[-5:])
+    streaming.apply_new_bars(db, "AAA")
+    db.commit()
+    inc = streaming.get_indicator_state(db, "AAA", rows[-1]["date"])
+    fresh = streaming.SymbolIndicatorState("AAA")
+    streaming._feed(fresh, streaming.get_price_panel(db, ["AAA"]), "AAA")
+    a, b = inc.snapshot(), fresh.snapshot()
+    assert a.keys() == b.keys() and all(np.isclose(a[k], b[k], rtol=1e-9) for k in a)
+
+    # 与 252 日窗口全量重算对比：窗口类指标精确一致，递推类仅差初值衰减
+    end = rows[-1]["date"]
+    ind, sig = calculate_technical_indicators(db, "AAA", end), calculate_signal_strength(db, "AAA", end)
+    from backend.factors import momentum
+    monkeypatch.setattr(momentum, "_streaming_state", lambda *a: None)
+    legacy, legacy_sig = calculate_technical_indicators(db, "AAA", end), calculate_signal_strength(db, "AAA", end)
+    assert ind.keys() == legacy.keys()
+    for k in ("ma5", "ma20", "ma60", "volatility", "price_position", "volume_ratio", "momentum_score"):
+        assert np.isclose(ind[k], legacy[k], rtol=1e-9), k
+    assert abs(ind["rsi"] - legacy["rsi"]) < 1e-3
+    assert sig["rating"] == legacy_sig["rating"]
+
+
+def test_restated_history_rebuilds_state():
+    from backend.storage.models import IndicatorState
+    db = _session()
+    rows = _rows(100)
+    bulk_upsert_prices_daily(db, rows)
+    assert streaming.get_indicator_state(db, "AAA") is None
+    assert db.query(IndicatorState).count() == 0                 # 读路径不写库
+    st = streaming.get_indicator_state(db, "AAA", persist=True)  # 显式持久化：进调用方会话
+    db.commit()
+    assert db.get(IndicatorState, "AAA").last_date == rows[-1]["date"]
+
+    bulk_upsert_prices_daily(db, [{**rows[-1], "close": rows[-1]["close"] * 2}])
+    assert streaming.get_indicator_state(db, "AAA") is None     # 被修正：读路径交给全量重算
+    st2 = streaming.get_indicator_state(db, "AAA", persist=True)
+    assert st2.last_close == rows[-1]["close"] * 2 and st2.n_bars == st.n_bars
+    db.commit()
+    # 窗口中段被修订（最后一根不变）也能发现；入库流程负责重建
+    bulk_upsert_prices_daily(db, [{**rows[-30], "close": rows[-30]["close"] + 1}])
+    assert streaming.get_indicator_state(db, "AAA") is None
+    streaming.apply_new_bars(db, "AAA", restated=True)
+    db.commit()
+    st3 = streaming.get_indicator_state(db, "AAA")
+    assert st3.win_closes[-30][1] == rows[-30]["close"] + 1
+    # 回看历史日期：不使用状态
+    assert streaming.get_indicator_state(db, "AAA", rows[10]["date"]) is None
+
+
+def test_signal_strength_reads_state_once(monkeypatch):
+    from backend.factors import momentum
+    db = _session()
+    rows = _rows(200)
+    bulk_upsert_prices_daily(db, rows)
+    streaming.apply_new_bars(db, "AAA")
+    db.commit()
+    calls = []
+    real = momentum._streaming_state
+    monkeypatch.setattr(momentum, "_streaming_state", lambda *a: calls.append(a) or real(*a))
+    sig = calculate_signal_strength(db, "AAA", rows[-1]["date"])
+    assert sig and len(calls) == 1
@@ -0,0 +1,64 @@
+"""
+prices_daily 写入基准：逐行 upsert vs 集合式批量 upsert（临时 SQLite 文件，不碰业务库）
+用法：
+  python -m scripts.bench_upsert_prices --symbols 20 --days 1000
+"""
+from __future__ import annotations
+import sys
+import tempfile
+import time
+from datetime import date, timedelta
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+if str(ROOT) not in sys.path:
+    sys.path.insert(0, str(ROOT))
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from backend.storage.db import Base
+from backend.storage.dao import upsert_prices_daily, bulk_upsert_prices_daily
+
+
+def _make_rows(n_symbols: int, n_days: int, bump: float = 0.0):
+    d0 = date(2015, 1, 1)
+    rows = []
+    for s in range(n_symbols):
+        sym = f"S{s:04d}"
+        for i in range(n_days):
+            px = 100.0 + s + i * 0.01 + bump
+            rows.append({"symbol": sym, "date": d0 + timedelta(days=i), "open": px, "high": px,
+                         "low": px, "close": px, "adjusted_close": px, "volume": 1000 + i})
+    return rows
+
+
+def _run(label: str, fn, n_symbols: int, n_days: int) -> None:
+    rows = _make_rows(n_symbols, n_days)
+    with tempfile.TemporaryDirectory() as tmp:
+        eng = create_engine(f"sqlite:///{tmp}/bench.sqlite", future=True)
+        Base.metadata.create_all(bind=eng)
+        Session = sessionmaker(bind=eng, autoflush=False, future=True)
+        for phase, data in (("首次写入", rows), ("全量重放", rows), ("局部变化", _make_rows(n_symbols, n_days, bump=0.5))):
+            with Session() as db:
+                t0 = time.perf_counter()
+                res = fn(db, data)
+                db.commit()
+                dt = time.perf_counter() - t0
+            print(f"[{label}] {phase}: {len(data)} 行 {dt:.2f}s ({len(data) / dt:,.0f} rows/s) -> {res}")
+        eng.dispose()
+
+
+def main(argv=None):
+    import argparse
+    ap = argparse.ArgumentParser(description="prices_daily upsert 基准")
+    ap.add_argument("--symbols", type=int, default=10)
+    ap.add_argument("--days", type=int, default=500)
+    args = ap.parse_args(argv)
+
+    _run("逐行", lambda db, r: upsert_prices_daily(db, r), args.symbols, args.days)
+    _run("批量", lambda db, r: bulk_upsert_prices_daily(db, r).as_dict(), args.symbols, args.days)
+
+
+if __name__ == "__main__":
+    main()
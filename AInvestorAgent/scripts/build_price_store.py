@@ -0,0 +1,38 @@
+"""
+从 SQLite 的 prices_daily 全量构建内存映射价格库（db/price_store）。
+用法：
+  python -m scripts.build_price_store
+  python -m scripts.build_price_store --symbols AAPL,MSFT
+启用：在 .env 中设置 PRICE_BACKEND=mmap；之后 DAO 写入会自动追加到价格库。
+"""
+from __future__ import annotations
+import sys
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+if str(ROOT) not in sys.path:
+    sys.path.insert(0, str(ROOT))
+
+from backend.storage.db import SessionLocal
+from backend.storage.mmap_store import get_mmap_store
+
+
+def main(argv=None):
+    import argparse
+    ap = argparse.ArgumentParser(description="构建内存映射价格库")
+    ap.add_argument("--symbols", type=str, default="", help="逗号分隔；默认全部")
+    ap.add_argument("--dir", type=str, default=None, help="价格库目录，默认 Settings.PRICE_STORE_DIR")
+    args = ap.parse_args(argv)
+
+    syms = [s.strip().upper() for s in args.symbols.split(",") if s.strip()] or None
+    store = get_mmap_store(args.dir)
+    t0 = time.perf_counter()
+    with SessionLocal() as db:
+        n = store.rebuild_from_db(db, syms)
+    print(f"[OK] {store.root}: {n} 行, {len(store.symbols)} 个 symbol, "
+          f"{store.n_dates} 个交易日, 用时 {time.perf_counter() - t0:.2f}s")
+
+
+if __name__ == "__main__":
+    main()
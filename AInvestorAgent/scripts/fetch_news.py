@@ -266,6 +266,7 @@ def upsert_news_and_score(db: Session, symbol: str, items: List[Dict[str, Any]],
     scored = 0
     try:
         from backend.sentiment.scorer import classify_polarity
+        from backend.sentiment.daily import add_news_scores
         from datetime import datetime as dt
 
         # 查找该股票所有未打分的新闻（不限于刚插入的）
@@ -291,6 +292,7 @@ def upsert_news_and_score(db: Session, symbol: str, items: List[Dict[str, Any]],
             news_items = db.query(NewsRaw).filter(NewsRaw.id.in_(ids)).all()
 
             # 逐条打分
+            daily = []
             for news in news_items:
                 # 使用classify_polarity计算情绪
                 sentiment = classify_polarity(news.title or "", news.summary or "")
@@ -301,8 +303,11 @@ def upsert_news_and_score(db: Session, symbol: str, items: List[Dict[str, Any]],
                     sentiment=sentiment
                 )
                 db.add(score_record)
+                daily.append((news.symbol, news.published_at, sentiment))
                 scored += 1
 
+            # 同一事务内累加到 sentiment_daily 日聚合
+            add_news_scores(db, daily)
             db.commit()
 
             if debug:
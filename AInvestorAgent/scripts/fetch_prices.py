@@ -8,7 +8,7 @@ import sys
 from pathlib import Path
 from backend.storage.db import SessionLocal
 from backend.storage.models import Base
-from backend.ingestion.loaders import load_daily_from_alpha
+from backend.ingestion.loaders import load_daily_stats_from_alpha
 from backend.storage.dao import record_run
 from backend.storage.db import engine
 import time
@@ -43,16 +43,16 @@ def main(symbols):
         for sym in symbols:
             try:
                 # 先尝试 ADJUSTED
-                n = load_daily_from_alpha(db, sym, adjusted=True, outputsize="compact")
-                print(f"[OK] {sym}: {n} rows upserted (adjusted)")
+                st = load_daily_stats_from_alpha(db, sym, adjusted=True, outputsize="compact")
+                print(f"[OK] {sym}: inserted={st.inserted} updated={st.updated} unchanged={st.unchanged} (adjusted)")
             except AlphaVantageError as e:
                 msg = str(e)
                 # 碰到 ADJUSTED 的 Invalid API call → 自动降级到 DAILY
                 if "TIME_SERIES_DAILY_ADJUSTED" in msg or "Invalid API call" in msg:
                     print(f"[WARN] {sym}: adjusted 不可用，降级为 DAILY")
                     try:
-                        n = load_daily_from_alpha(db, sym, adjusted=False, outputsize="compact")
-                        print(f"[OK] {sym}: {n} rows upserted (daily)")
+                        st = load_daily_stats_from_alpha(db, sym, adjusted=False, outputsize="compact")
+                        print(f"[OK] {sym}: inserted={st.inserted} updated={st.updated} unchanged={st.unchanged} (daily)")
                     except Exception as e2:
                         print(f"[ERROR] {sym}: DAILY 拉取失败 -> {e2}")
                 else:
@@ -19,10 +19,15 @@ import numpy as np
 from pathlib import Path
 
 from backend.storage.db import SessionLocal
-from backend.storage.models import PriceDaily, ScoreDaily
-from backend.scoring.scorer import compute_factors, aggregate_score
-from backend.portfolio.allocator import propose_portfolio
+from backend.storage.models import ScoreDaily
+from backend.storage.price_panel import get_price_panel
+from backend.scoring.scorer import aggregate_score, aggregate_score_matrix
+from backend.scoring.factor_store import backfill_factors, get_factor_rows, load_factor_panel
+from backend.portfolio.allocator import propose_portfolio, allocate_from_scores
+from backend.portfolio.explain import load_symbol_sectors
 from backend.portfolio.constraints import Constraints
+from backend.portfolio.rebalance import rebalance_weights, trade_costs
+from backend.backtest.metrics import MetricsAccumulator
 
 import matplotlib.pyplot as plt
 import matplotlib
@@ -53,7 +58,12 @@ class HistoricalBacktestSimulator:
                  short_term_tax_rate: float = 0.0,
                  long_term_tax_rate: float = 0.0,
                  enable_factor_optimization: bool = False,
-                 optimization_objective: str = "sharpe"):
+                 optimization_objective: str = "sharpe",
+                 precompute_scores: bool = False,
+                 rebalance_mode: str = "full",
+                 no_trade_band: float = 0.02,
+                 cost_aversion: float = 5.0,
+                 trading_cost: float = 0.001):
 
         self.watchlist = [s.upper() for s in watchlist]
         self.initial_capital = initial_capital
@@ -61,6 +71,9 @@ class HistoricalBacktestSimulator:
         self.positions = {}
         self.holdings = {}  # 用于跟踪持有时间
 
+        # 单边交易成本（占成交额比例），买卖与增量调仓的成本估计共用
+        self.trading_cost = trading_cost
+
         # 税务参数
         self.short_term_tax_rate = short_term_tax_rate
         self.long_term_tax_rate = long_term_tax_rate
@@ -68,9 +81,17 @@ class HistoricalBacktestSimulator:
         self.total_capital_gains = 0.0
         self.total_capital_losses = 0.0
 
-        # 优化参数(暂时不用)
+        # 因子权重滚动优化：每个调仓日只用此前已实现的收益挑选权重（需预计算模式，开启时自动启用）
         self.enable_factor_optimization = enable_factor_optimization
         self.optimization_objective = optimization_objective
+        self.optimized_weights: List[Dict] = []
+
+        # 增量调仓：full 全量调到目标；band / l1 只做值得做的交易（见 backend/portfolio/rebalance.py）
+        self.rebalance_mode = rebalance_mode
+        self.no_trade_band = no_trade_band
+        self.cost_aversion = cost_aversion
+        # 每次调仓时“本次若全量调仓”的成本估计之和（两条路径会逐渐分化，累加值只作参考；准确对比需各跑一次）
+        self.rebalance_stats = {"turnover": 0.0, "turnover_full": 0.0, "cost": 0.0, "cost_full": 0.0, "cost_saved": 0.0}
 
         if end_date:
             self.end_date = datetime.strptime(end_date, "%Y-%m-%d").date()
@@ -84,6 +105,12 @@ class HistoricalBacktestSimulator:
 
         self.history = []
         self.trades = []
+        self.metrics = MetricsAccumulator()   # 逐日 O(1) 更新峰值 / 回撤 / 收益矩 / 胜率 / 换手
+
+        # 预计算模式：调仓日 × 股票 的评分矩阵一次算好，组合在内存中分配，不写 scores_daily
+        self.precompute_scores = precompute_scores or enable_factor_optimization
+        self.score_schedule: Dict[date, Dict[str, float]] = {}
+        self.sectors: Dict[str, str] = {}
 
         print(f"📅 回测期间: {self.start_date} → {self.end_date}")
         print(f"📊 股票池: {len(self.watchlist)}只")
@@ -100,33 +127,19 @@ class HistoricalBacktestSimulator:
         print("📥 加载历史价格数据...")
 
         with SessionLocal() as db:
-            query = db.query(PriceDaily).filter(
-                PriceDaily.symbol.in_(self.watchlist),
-                PriceDaily.date >= self.start_date,
-                PriceDaily.date <= self.end_date
-            ).order_by(PriceDaily.date)
+            panel = get_price_panel(db, self.watchlist, self.start_date, self.end_date)
 
-            records = query.all()
+        # 🔧 关键修复: 使用 adjusted_close（缺失时回落到 close）
+        prices_pivot = pd.DataFrame(panel.adjusted_close, index=[d.item() for d in panel.dates],
+                                    columns=panel.symbols)
+        prices_pivot = prices_pivot.dropna(how="all").dropna(axis=1, how="all")
 
-        if not records:
+        if prices_pivot.empty:
             raise ValueError("❌ 未找到历史价格数据!请先运行: python scripts/fetch_prices.py")
 
-        data = []
-        for r in records:
-            # 🔧 关键修复: 使用 adjusted_close
-            adj_close = r.adjusted_close if r.adjusted_close is not None else r.close
-
-            data.append({
-                "date": r.date,
-                "symbol": r.symbol,
-                "adjusted_close": adj_close  # ✅ 使用复权价格
-            })
-
-        df = pd.DataFrame(data)
-
-        # 🔧 修复: 转换为透视表时使用 adjusted_close
-        prices_pivot = df.pivot(index='date', columns='symbol', values='adjusted_close')
-        prices_pivot = prices_pivot.fillna(method='ffill').fillna(method='bfill')
+        prices_pivot.index.name = "date"
+        prices_pivot.columns.name = "symbol"
+        prices_pivot = prices_pivot.ffill().bfill()
 
         print(f"✅ 已加载 {len(prices_pivot)} 个交易日的数据")
         print(f"   覆盖股票: {prices_pivot.columns.tolist()}")
@@ -157,28 +170,88 @@ class HistoricalBacktestSimulator:
         """
         with SessionLocal() as db:
             scores = {}
+            try:
+                # 读 factors_daily 预计算值，缺失格子现算（不写库）
+                rows = {r.symbol: r for r in get_factor_rows(db, self.watchlist, asof_date)}
+            except Exception as e:
+                print(f"   ⚠️ 因子读取失败: {e}")
+                rows = {}
 
             for symbol in self.watchlist:
-                try:
-                    # 🔧 修复: 只传递必需参数
-                    rows = compute_factors(
-                        db,
-                        [symbol],
-                        asof=asof_date
-                    )
+                row = rows.get(symbol)
+                scores[symbol] = float(aggregate_score(row)) if row else 50.0
 
-                    if rows and len(rows) > 0:
-                        row = rows[0]
-                        score = aggregate_score(row)
-                        scores[symbol] = float(score)
-                    else:
-                        scores[symbol] = 50.0
+            return scores
 
-                except Exception as e:
-                    print(f"   ⚠️ {symbol} 评分失败: {e}")
-                    scores[symbol] = 50.0
+    def build_score_schedule(self, trading_dates: List[date]) -> Dict[date, Dict[str, float]]:
+        """
+        一次算出全部调仓日 × 股票的综合评分（factors_daily 补算 + 一次读取 + 矩阵打分），
+        同时加载行业信息，供内存分配使用。
+        """
+        with SessionLocal() as db:
+            backfill_factors(db, self.watchlist, trading_dates)
+            db.commit()
+            fp = load_factor_panel(db, self.watchlist, min(trading_dates), max(trading_dates))
+            self.sectors = load_symbol_sectors(db, self.watchlist)
 
-            return scores
+        fields = {"value": "f_value", "quality": "f_quality", "momentum": "f_momentum", "sentiment": "f_sentiment"}
+        by_date = {d.item(): i for i, d in enumerate(fp.dates)}
+
+        if self.enable_factor_optimization:
+            score = self._optimized_score_matrix(fp, fields, trading_dates)
+            rows = range(len(trading_dates))
+        else:
+            score = aggregate_score_matrix({k: fp.field(f) for k, f in fields.items()})
+            rows = [by_date.get(d) for d in trading_dates]
+
+        schedule = {}
+        for d, i in zip(trading_dates, rows):
+            schedule[d] = {s: (float(score[i, j]) if i is not None else 50.0)
+                           for j, s in enumerate(fp.symbols)}
+        self.score_schedule = schedule
+        print(f"🧮 评分矩阵: {len(trading_dates)} 个调仓日 × {len(self.watchlist)} 只")
+        return schedule
+
+    def _optimized_score_matrix(self, fp, fields: Dict[str, str], trading_dates: List[date]) -> np.ndarray:
+        """
+        滚动优化后的 调仓日 × 股票 评分：因子对齐到调仓日，持有期收益取调仓日（含之前最近交易日）收盘价，
+        由 walk_forward_weights 逐期给出权重（第 k 期只用前 k 期的已实现收益训练）。
+        """
+        from backend.backtest.walk_forward import periods_per_year, scores_with_weights, walk_forward_weights
+
+        by_date = {d.item(): i for i, d in enumerate(fp.dates)}
+        stack = np.stack([fp.field(f) for f in fields.values()], axis=-1)
+        F = np.full((len(trading_dates), len(fp.symbols), len(fields)), np.nan)
+        for k, d in enumerate(trading_dates):
+            if by_date.get(d) is not None:
+                F[k] = stack[by_date[d]]
+
+        with SessionLocal() as db:
+            panel = get_price_panel(db, fp.symbols, min(trading_dates) - timedelta(days=10), max(trading_dates))
+        closes = panel.ffill("close")
+        pos = {s: j for j, s in enumerate(panel.symbols)}
+        cols = [pos.get(s) for s in fp.symbols]
+        at = np.searchsorted(panel.dates, np.array(trading_dates, dtype="datetime64[D]"), side="right") - 1
+        P = np.full((len(trading_dates), len(fp.symbols)), np.nan)
+        for j, c in enumerate(cols):
+            if c is not None:
+                P[at >= 0, j] = closes[at[at >= 0], c]
+        with np.errstate(invalid="ignore", divide="ignore"):
+            G = np.nan_to_num(np.r_[P[1:] / P[:-1] - 1.0, np.zeros((1, P.shape[1]))])
+        tradable = ~np.isnan(P)
+
+        Wk, folds = walk_forward_weights(F, G, tradable, objective=self.optimization_objective,
+                                         ppy=periods_per_year(np.array(trading_dates, dtype="datetime64[D]")))
+        for f in folds:
+            f["date"] = str(trading_dates[f["k"]])
+        self.optimized_weights = folds
+        if folds:
+            w = folds[-1]["weights"]
+            print(f"🎯 因子权重滚动优化（{self.optimization_objective}）: {len(folds)} 次重估，最新 "
+                  + " / ".join(f"{k}={v:.2f}" for k, v in w.items()))
+        else:
+            print("⚠️ 调仓期数不足，因子优化沿用默认权重")
+        return scores_with_weights(F, Wk)
 
     def generate_portfolio_at_date(
             self,
@@ -186,7 +259,10 @@ class HistoricalBacktestSimulator:
             min_score: float = 50.0
     ) -> List[Dict]:
         """生成某个历史日期的组合建议"""
-        scores = self.calculate_scores_at_date(asof_date)
+        if self.precompute_scores and asof_date in self.score_schedule:
+            scores = self.score_schedule[asof_date]
+        else:
+            scores = self.calculate_scores_at_date(asof_date)
 
         candidates = [
             {"symbol": sym, "score": score}
@@ -203,6 +279,16 @@ class HistoricalBacktestSimulator:
                 reverse=True
             )[:8]
 
+        constraints = Constraints(
+            max_single=0.30,
+            max_sector=0.50,
+            min_positions=3,
+            max_positions=10
+        )
+        if self.precompute_scores:
+            return allocate_from_scores({c["symbol"]: c["score"] for c in candidates},
+                                        self.sectors, constraints)
+
         with SessionLocal() as db:
             # 🔧 修复: 使用 merge 而不是 add,避免唯一约束冲突
             for c in candidates:
@@ -236,13 +322,6 @@ class HistoricalBacktestSimulator:
 
             db.commit()
 
-            constraints = Constraints(
-                max_single=0.30,
-                max_sector=0.50,
-                min_positions=3,
-                max_positions=10
-            )
-
             holdings, _ = propose_portfolio(
                 db,
                 [c["symbol"] for c in candidates],
@@ -273,6 +352,9 @@ class HistoricalBacktestSimulator:
 
         print(f"   💼 调仓前: 总价值=${total_value:,.2f}, 现金=${self.cash:,.2f}, 持仓=${holdings_value:,.2f}")
 
+        if self.rebalance_mode != "full" and total_value > 0:
+            new_holdings = self._incremental_targets(current_date, new_holdings, prices, total_value)
+
         # 清仓不在新组合中的股票
         for symbol in list(self.positions.keys()):
             if symbol not in [h["symbol"] for h in new_holdings]:
@@ -301,7 +383,7 @@ class HistoricalBacktestSimulator:
                     else:
                         self.total_capital_losses += abs(capital_gain)
 
-                    proceeds = shares * price * 0.999 - tax  # 0.1%交易成本 + 税
+                    proceeds = shares * price * (1 - self.trading_cost) - tax  # 交易成本 + 税
                     self.cash += proceeds
 
                     self.trades.append({
@@ -310,7 +392,7 @@ class HistoricalBacktestSimulator:
                         "action": "SELL",
                         "shares": shares,
                         "price": price,
-                        "value": shares * price * 0.999,
+                        "value": shares * price * (1 - self.trading_cost),
                         "tax": tax,
                         "capital_gain": capital_gain,
                         "holding_days": holding_days
@@ -331,7 +413,7 @@ class HistoricalBacktestSimulator:
                 print(f"   ⚠️ {symbol} 价格为0,跳过")
                 continue
 
-            target_shares = int(target_value / price)
+            target_shares = int(target_value / price + 1e-9)   # 容差：权重未变的持仓不因浮点误差少算一股
             current_shares = self.positions.get(symbol, 0)
 
             if target_shares == current_shares:
@@ -341,7 +423,7 @@ class HistoricalBacktestSimulator:
             trade_value = abs(diff) * price
 
             if diff > 0:  # 买入
-                cost = trade_value * 1.001  # 0.1%交易成本
+                cost = trade_value * (1 + self.trading_cost)  # 交易成本
                 if self.cash >= cost:
                     self.positions[symbol] = target_shares
                     self.cash -= cost
@@ -397,7 +479,7 @@ class HistoricalBacktestSimulator:
                 else:
                     self.total_capital_losses += abs(capital_gain)
 
-                proceeds = trade_value * 0.999 - tax  # 0.1%交易成本 + 税
+                proceeds = trade_value * (1 - self.trading_cost) - tax  # 交易成本 + 税
                 self.positions[symbol] = target_shares
                 self.cash += proceeds
 
@@ -414,7 +496,7 @@ class HistoricalBacktestSimulator:
                     "action": "SELL",
                     "shares": abs(diff),
                     "price": price,
-                    "value": trade_value * 0.999,
+                    "value": trade_value * (1 - self.trading_cost),
                     "tax": tax,
                     "capital_gain": capital_gain,
                     "holding_days": holding_days
@@ -431,6 +513,30 @@ class HistoricalBacktestSimulator:
         if value_change > total_value * 0.02:  # 变化超过2%
             print(f"   ⚠️ 调仓后价值变化: ${value_change:.2f} ({value_change / value_before * 100:.2f}%)")
 
+    def _incremental_targets(self, current_date: date, new_holdings: List[Dict], prices: pd.Series,
+                             total_value: float) -> List[Dict]:
+        """
+        按成本 / 税把目标权重改成增量调仓后的权重（含暂不卖出的旧持仓），并累计与全量调仓相比的成本节省
+        """
+        symbols = list(dict.fromkeys([h["symbol"] for h in new_holdings] + list(self.positions)))
+        symbols = [s for s in symbols if prices.get(s, 0) > 0]
+        px = np.array([float(prices.get(s)) for s in symbols])
+        w0 = np.array([self.positions.get(s, 0) for s in symbols]) * px / total_value
+        tgt = {h["symbol"]: h["weight"] for h in new_holdings}
+        t = np.array([tgt.get(s, 0.0) for s in symbols])
+        basis = np.array([self.holdings.get(s, {}).get("cost_basis", p) for s, p in zip(symbols, px)])
+        days = np.array([(current_date - self.holdings.get(s, {}).get("purchase_date", current_date)).days
+                         for s in symbols])
+        c_buy, c_sell = trade_costs(self.trading_cost, px, basis, days, self.short_term_tax_rate, self.long_term_tax_rate)
+        plan = rebalance_weights(w0, t, c_buy, c_sell, mode=self.rebalance_mode,
+                                 band=self.no_trade_band, aversion=self.cost_aversion)
+        for k, v in plan.summary(total_value).items():
+            if k in self.rebalance_stats:
+                self.rebalance_stats[k] += v
+        print(f"   🔄 增量调仓({self.rebalance_mode}): 换手 {plan.turnover:.1%} (全量 {plan.turnover_full:.1%}), "
+              f"预计节省成本 ${plan.saved * total_value:,.2f}")
+        return [{"symbol": s, "weight": float(w)} for s, w in zip(symbols, plan.weights) if w > 1e-9]
+
     def calculate_portfolio_value(self, prices: pd.Series) -> float:
         """
         计算组合总市值
@@ -442,20 +548,38 @@ class HistoricalBacktestSimulator:
         )
         return self.cash + holdings_value
 
-    def run_backtest(self, rebalance_frequency: str = 'W-MON'):
+    def run_backtest(self, rebalance_frequency: str = 'W-MON', progress_cb=None):
         """
         运行回测
         🔧 修复: 使用复权价格
+        progress_cb: 价格加载完、评分 / 因子准备完各回调一次 {phase}，之后每个调仓日收盘后回调
+                     {date, rebalance_done, rebalance_total, nav}；回调抛出的异常会中止回测（用于取消异步任务）
         """
         print("🚀 开始历史回测...")
 
         prices_df = self.load_historical_prices()
+        if progress_cb is not None:
+            progress_cb({"phase": "prices_loaded", "trading_days": len(prices_df)})
         trading_dates = self.get_trading_dates(prices_df, rebalance_frequency)
 
+        if self.precompute_scores:
+            self.build_score_schedule(trading_dates)
+        else:
+            # 一次性补齐全部调仓日的因子，之后逐日只读表
+            with SessionLocal() as db:
+                n = backfill_factors(db, self.watchlist, trading_dates)
+                db.commit()
+            print(f"🧮 因子面板补算 {n} 个格子")
+        if progress_cb is not None:
+            progress_cb({"phase": "scores_ready", "rebalance_total": len(trading_dates)})
+
         print(f"\n{'=' * 70}")
         print(f"开始逐日模拟 ({len(prices_df)} 个交易日)")
         print(f"{'=' * 70}\n")
 
+        week_of = {d: i + 1 for i, d in enumerate(trading_dates)}
+        self.metrics = MetricsAccumulator()
+
         for idx, current_date_idx in enumerate(prices_df.index):
             if isinstance(current_date_idx, pd.Timestamp):
                 current_date = current_date_idx.date()
@@ -467,8 +591,9 @@ class HistoricalBacktestSimulator:
             prices_today = prices_df.loc[current_date_idx]
 
             # 检查是否需要调仓
-            if current_date in trading_dates:
-                week_num = trading_dates.index(current_date) + 1
+            n_trades = len(self.trades)
+            if current_date in week_of:
+                week_num = week_of[current_date]
                 print(f"📅 第{week_num}周 - {current_date}")
 
                 try:
@@ -487,15 +612,10 @@ class HistoricalBacktestSimulator:
             total_value = self.calculate_portfolio_value(prices_today)
             nav = total_value / self.initial_capital
 
-            # 🔧 修复: 计算回撤 (应该 <= 0)
-            if len(self.history) > 0:
-                # 历史最高净值
-                peak_nav = max([h["nav"] for h in self.history] + [nav])
-            else:
-                peak_nav = nav
-
-            # 回撤 = (当前净值 - 峰值) / 峰值 * 100，结果应该 <= 0
-            drawdown = ((nav - peak_nav) / peak_nav * 100) if peak_nav > 0 else 0.0
+            # 回撤 = (当前净值 - 历史峰值) / 峰值 * 100，结果应该 <= 0；换手 = 当日成交额 / 总市值
+            traded = sum(t["value"] for t in self.trades[n_trades:])
+            turnover = traded / total_value if total_value > 0 else 0.0
+            drawdown = self.metrics.update(nav, turnover) * 100
 
             self.history.append({
                 "date": current_date,
@@ -506,12 +626,23 @@ class HistoricalBacktestSimulator:
                 "drawdown": drawdown
             })
 
+            if progress_cb is not None and current_date in week_of:
+                progress_cb({"date": current_date.isoformat(), "rebalance_done": week_of[current_date],
+                             "rebalance_total": len(trading_dates), "nav": round(nav, 6)})
+
         print(f"\n{'=' * 70}")
         print("✅ 回测完成")
         print(f"{'=' * 70}\n")
 
         self.generate_report()
 
+    def _history_metrics(self) -> MetricsAccumulator:
+        """逐日累加器；history 不是由 run_backtest 逐日生成时按 history 重建一次"""
+        if self.metrics.n != len(self.history):
+            self.metrics = MetricsAccumulator()
+            self.metrics.extend([h["nav"] for h in self.history])
+        return self.metrics
+
     def get_performance_metrics(self) -> Dict:
         """
         计算性能指标(包含税务)
@@ -555,19 +686,11 @@ class HistoricalBacktestSimulator:
         ann_return_after_tax = (pow(final_value_after_tax / self.initial_capital,
                                     365 / days) - 1) * 100 if days > 0 else 0
 
-        # 回撤
-        df['peak'] = df['nav'].cummax()
-        df['drawdown'] = (df['nav'] - df['peak']) / df['peak'] * 100
-        max_drawdown = df['drawdown'].min()
-
-        # 夏普比率
-        df['return'] = df['nav'].pct_change()
-        sharpe = df['return'].mean() / df['return'].std() * np.sqrt(252) if df['return'].std() > 0 else 0
-
-        # 胜率
-        wins = (df['return'] > 0).sum()
-        total = len(df['return'].dropna())
-        win_rate = wins / total * 100 if total > 0 else 0
+        # 回撤 / 夏普比率 / 胜率（累加器已逐日算好）
+        acc = self._history_metrics()
+        max_drawdown = acc.max_dd * 100
+        sharpe = acc.sharpe()
+        win_rate = acc.win_rate * 100
 
         # 税务影响
         tax_impact_pct = (total_return_before_tax - total_return_after_tax)
@@ -586,7 +709,9 @@ class HistoricalBacktestSimulator:
             "total_capital_gains": float(self.total_capital_gains),
             "total_capital_losses": float(self.total_capital_losses),
             "final_value_before_tax": float(final_value_before_tax),
-            "final_value_after_tax": float(final_value_after_tax)
+            "final_value_after_tax": float(final_value_after_tax),
+            "rebalance_mode": self.rebalance_mode,
+            "rebalance": {k: round(float(v), 2) for k, v in self.rebalance_stats.items()}
         }
 
     def generate_report(self):
@@ -604,17 +729,11 @@ class HistoricalBacktestSimulator:
         final_nav = df['nav'].iloc[-1]
         total_return = (final_nav / initial_nav - 1) * 100
 
-        # 🔧 修复: 正确计算回撤
-        df['peak'] = df['nav'].cummax()
-        df['drawdown'] = (df['nav'] - df['peak']) / df['peak'] * 100
-        max_drawdown = df['drawdown'].min()
-
-        df['return'] = df['nav'].pct_change()
-        sharpe = df['return'].mean() / df['return'].std() * np.sqrt(252) if df['return'].std() > 0 else 0
-
-        wins = (df['return'] > 0).sum()
-        total = len(df['return'].dropna())
-        winrate = wins / total * 100 if total > 0 else 0
+        # 🔧 修复: 正确计算回撤（history 中已逐日记录，指标取累加器）
+        acc = self._history_metrics()
+        max_drawdown = acc.max_dd * 100
+        sharpe = acc.sharpe()
+        winrate = acc.win_rate * 100
 
         print("=" * 70)
         print("📊 回测结果")
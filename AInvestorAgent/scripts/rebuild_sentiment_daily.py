@@ -0,0 +1,38 @@
+"""
+由 news_raw × news_scores 重建 sentiment_daily 日聚合。
+读取时从未回填的 symbol 会自动回填一次；本脚本用于一次性预热全库，或在已回填后由其它途径改写了打分时强制重建。
+用法：
+  python -m scripts.rebuild_sentiment_daily
+  python -m scripts.rebuild_sentiment_daily --symbols AAPL,MSFT
+之后 fetch_news 打分时会自动增量累加。
+"""
+from __future__ import annotations
+import sys
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+if str(ROOT) not in sys.path:
+    sys.path.insert(0, str(ROOT))
+
+from backend.storage.db import SessionLocal, Base, engine
+from backend.sentiment.daily import rebuild_sentiment_daily
+
+
+def main(argv=None):
+    import argparse
+    ap = argparse.ArgumentParser(description="重建情绪日聚合表")
+    ap.add_argument("--symbols", type=str, default="", help="逗号分隔；默认全部")
+    args = ap.parse_args(argv)
+
+    syms = [s.strip().upper() for s in args.symbols.split(",") if s.strip()] or None
+    Base.metadata.create_all(bind=engine)
+    t0 = time.perf_counter()
+    with SessionLocal() as db:
+        n = rebuild_sentiment_daily(db, syms)
+        db.commit()
+    print(f"[OK] sentiment_daily: {n} 行, 用时 {time.perf_counter() - t0:.2f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,67 @@
+"""
+参数扫描回测（多进程）。
+用法：
+  python -m scripts.run_sweep --symbols AAPL,MSFT,NVDA --start 2023-01-01 --end 2024-12-31 \
+      --trading-cost 0.0005,0.001,0.002 --rebalance weekly,monthly --max-single 0.2,0.3 --top-n 5,10
+  python -m scripts.run_sweep --symbols ... --sort-by max_dd --workers 4
+结果写入 backtest_sweep_results（同一 sweep_id）。
+"""
+from __future__ import annotations
+import sys
+from datetime import date
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+if str(ROOT) not in sys.path:
+    sys.path.insert(0, str(ROOT))
+
+from backend.storage.db import SessionLocal
+from backend.backtest.sweep import run_sweep
+
+
+def _floats(s: str):
+    return [float(x) for x in s.split(",") if x.strip()]
+
+
+def _strs(s: str):
+    return [x.strip() for x in s.split(",") if x.strip()]
+
+
+def main(argv=None):
+    import argparse
+    ap = argparse.ArgumentParser(description="参数扫描回测")
+    ap.add_argument("--symbols", type=str, required=True, help="逗号分隔")
+    ap.add_argument("--start", type=str, required=True)
+    ap.add_argument("--end", type=str, default=date.today().isoformat())
+    ap.add_argument("--trading-cost", type=str, default="0.001")
+    ap.add_argument("--rebalance", type=str, default="weekly", help="weekly,monthly,daily")
+    ap.add_argument("--max-single", type=str, default="0.30")
+    ap.add_argument("--max-sector", type=str, default="0.50")
+    ap.add_argument("--top-n", type=str, default="10")
+    ap.add_argument("--weights", type=str, default="v1.0.0", help="WEIGHTS 版本，逗号分隔")
+    ap.add_argument("--sort-by", type=str, default="sharpe", choices=["sharpe", "max_dd", "ann_return"])
+    ap.add_argument("--workers", type=int, default=None, help="默认 CPU 核数")
+    ap.add_argument("--show", type=int, default=10, help="打印前 N 名")
+    args = ap.parse_args(argv)
+
+    grid = {
+        "trading_cost": _floats(args.trading_cost),
+        "rebalance": _strs(args.rebalance),
+        "max_single": _floats(args.max_single),
+        "max_sector": _floats(args.max_sector),
+        "top_n": [int(x) for x in _floats(args.top_n)],
+        "weights_version": _strs(args.weights),
+    }
+    syms = _strs(args.symbols.upper())
+    with SessionLocal() as db:
+        out = run_sweep(db, syms, date.fromisoformat(args.start), date.fromisoformat(args.end),
+                        grid, sort_by=args.sort_by, max_workers=args.workers)
+
+    print(f"\nsweep_id={out['sweep_id']}  组合={out['n_configs']}  用时={out['elapsed']:.2f}s")
+    for r in out["results"][: args.show]:
+        print(f"#{r['rank']:>3}  sharpe={r['sharpe']:>7.3f}  ann={r['ann_return']:>7.2%}  "
+              f"mdd={r['max_dd']:>7.2%}  turnover={r['turnover']:>6.2f}  {r['params']}")
+
+
+if __name__ == "__main__":
+    main()